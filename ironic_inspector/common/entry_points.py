@@ -0,0 +1,52 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Modules the entry points are expected to import only on first use.
+
+Checked by the unit tests and by tools/benchmarks/import_time.py.
+"""
+
+import collections
+
+
+_NOT_FOR_DBSYNC = ['flask', 'futurist', 'ironicclient', 'keystonemiddleware',
+                   'oslo_middleware', 'swiftclient']
+
+# Entry point module -> packages and modules it must only import on first use
+ENTRY_POINTS = collections.OrderedDict([
+    # ironic-inspector
+    ('ironic_inspector.main', ['ironic_inspector.common.swift',
+                               'ironic_inspector.firewall',
+                               'ironic_inspector.introspect',
+                               'ironic_inspector.process',
+                               'ironic_inspector.rules',
+                               'jsonpath_rw', 'jsonschema',
+                               'keystonemiddleware', 'swiftclient']),
+    # ironic-inspector-dbsync
+    ('ironic_inspector.dbsync', _NOT_FOR_DBSYNC),
+    # database models loaded by the migrations
+    ('ironic_inspector.db', _NOT_FOR_DBSYNC),
+])
+
+
+def unexpected_imports(entry_point, modules):
+    """Find modules imported by an entry point too early.
+
+    :param entry_point: entry point module name, a key of ENTRY_POINTS
+    :param modules: names of all modules loaded by the entry point
+    :returns: sorted list of packages and modules from ENTRY_POINTS which
+              were loaded
+    """
+    return sorted(name for name in ENTRY_POINTS.get(entry_point, ())
+                  if any(module == name or module.startswith(name + '.')
+                         for module in modules))
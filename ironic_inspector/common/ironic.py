@@ -11,15 +11,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import socket
+import threading
 
 from ironicclient import client
 from ironicclient import exceptions as ironic_exc
 import netaddr
 from oslo_config import cfg
+from oslo_utils import timeutils
+from oslo_utils import uuidutils
+import six
 
 from ironic_inspector.common.i18n import _, _LW
 from ironic_inspector.common import keystone
+from ironic_inspector import metrics
 from ironic_inspector import utils
 
 CONF = cfg.CONF
@@ -61,6 +67,25 @@ IRONIC_OPTS = [
                default=30,
                help=_('Maximum number of retries in case of conflict error '
                       '(HTTP 409).')),
+    cfg.IntOpt('max_concurrency',
+               default=8, min=1,
+               help=_('Maximum number of concurrent requests to Ironic when '
+                      'processing one node, e.g. when updating its ports.')),
+    cfg.IntOpt('cache_ttl',
+               default=0, min=0,
+               help=_('Time in seconds for which Ironic nodes and their '
+                      'ports fetched during introspection are kept in '
+                      'memory and reused instead of fetching them again. '
+                      'Nodes updated by ironic-inspector are refreshed in '
+                      'the cache, but changes made by other clients may '
+                      'not be seen until the entry expires. Starting '
+                      'introspection always fetches the node from Ironic. '
+                      'Set to 0 (the default) to disable the cache.')),
+    cfg.IntOpt('cache_size',
+               default=1000, min=1,
+               help=_('Maximum number of nodes kept in the cache, least '
+                      'recently used nodes are dropped first. See '
+                      'cache_ttl.')),
 ]
 
 
@@ -68,6 +93,10 @@ CONF.register_opts(IRONIC_OPTS, group=IRONIC_GROUP)
 keystone.register_auth_opts(IRONIC_GROUP)
 
 IRONIC_SESSION = None
+# API version -> client, only for clients without a user token
+_CLIENTS = {}
+# Client managers with calls recorded in metrics
+METERED_MANAGERS = frozenset(['chassis', 'driver', 'node', 'port'])
 
 
 class NotFound(utils.Error):
@@ -78,13 +107,166 @@ class NotFound(utils.Error):
         super(NotFound, self).__init__(msg, code, *args, **kwargs)
 
 
+class _ObjectCache(object):
+    """Cache of Ironic nodes and their ports by node UUID.
+
+    Entries expire after [ironic]cache_ttl seconds, at most
+    [ironic]cache_size least recently used entries are kept.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # UUID -> _CacheEntry, the most recently used last
+        self._entries = collections.OrderedDict()
+
+    @property
+    def enabled(self):
+        return CONF.ironic.cache_ttl > 0
+
+    def _get(self, uuid):
+        """Get a valid entry, must be called with the lock."""
+        entry = self._entries.pop(uuid, None)
+        if entry is None or entry.expires_at <= timeutils.now():
+            return None
+        self._entries[uuid] = entry
+        return entry
+
+    def _set(self, uuid, node=None, ports=None):
+        """Create or update an entry, must be called with the lock."""
+        entry = self._get(uuid)
+        if entry is None:
+            entry = _CacheEntry(timeutils.now() + CONF.ironic.cache_ttl)
+            self._entries[uuid] = entry
+            while len(self._entries) > CONF.ironic.cache_size:
+                self._entries.popitem(last=False)
+        if node is not None:
+            entry.node = node
+        if ports is not None:
+            entry.ports = ports
+
+    def get_node(self, uuid):
+        """Get a cached node or None.
+
+        The node object is shared, it must not be modified.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._get(uuid)
+            return entry.node if entry is not None else None
+
+    def get_ports(self, uuid):
+        """Get a copy of the cached dict MAC -> port of a node or None.
+
+        The port objects are shared, they must not be modified.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._get(uuid)
+            if entry is not None and entry.ports is not None:
+                return dict(entry.ports)
+
+    def store_node(self, node):
+        """Cache a node.
+
+        The node is ignored if the cached copy has a newer ``updated_at``,
+        e.g. when responses to concurrent requests arrive out of order.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._get(node.uuid)
+            if (entry is not None and entry.node is not None and
+                    _is_older(node, entry.node)):
+                return
+            self._set(node.uuid, node=node)
+
+    def store_ports(self, uuid, ports):
+        """Cache a dict MAC -> port of a node."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._set(uuid, ports=dict(ports))
+
+    def invalidate(self, uuid):
+        """Drop the node and its ports from the cache."""
+        with self._lock:
+            self._entries.pop(uuid, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class _CacheEntry(object):
+    __slots__ = ('expires_at', 'node', 'ports')
+
+    def __init__(self, expires_at):
+        self.expires_at = expires_at
+        self.node = None
+        self.ports = None
+
+
+def _is_older(node, other):
+    """Whether node has an older updated_at than other."""
+    updated_at = getattr(node, 'updated_at', None)
+    other_updated_at = getattr(other, 'updated_at', None)
+    if not (isinstance(updated_at, six.string_types) and
+            isinstance(other_updated_at, six.string_types)):
+        return False
+    return updated_at < other_updated_at
+
+
+CACHE = _ObjectCache()
+
+
+class _MeteredManager(object):
+    """Proxy of a client manager recording duration and errors of calls."""
+
+    def __init__(self, manager, name):
+        self._manager = manager
+        self._name = name
+
+    def __getattr__(self, attr):
+        value = getattr(self._manager, attr)
+        if not callable(value):
+            return value
+
+        call = '%s.%s' % (self._name, attr)
+
+        @six.wraps(value)
+        def _metered(*args, **kwargs):
+            with metrics.measure('ironic_request_duration_seconds',
+                                 errors='ironic_request_errors_total',
+                                 call=call):
+                return value(*args, **kwargs)
+
+        return _metered
+
+
+class _MeteredClient(object):
+    """Proxy of an Ironic client recording calls of its managers."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        value = getattr(self._client, name)
+        if name in METERED_MANAGERS:
+            return _MeteredManager(value, name)
+        return value
+
+
 def reset_ironic_session():
-    """Reset the global session variable.
+    """Reset the global session variable, the cached clients and objects.
 
     Mostly useful for unit tests.
     """
     global IRONIC_SESSION
     IRONIC_SESSION = None
+    _CLIENTS.clear()
+    CACHE.clear()
 
 
 def get_ipmi_address(node):
@@ -117,7 +299,13 @@ def get_ipmi_address(node):
 
 def get_client(token=None,
                api_version=DEFAULT_IRONIC_API_VERSION):  # pragma: no cover
-    """Get Ironic client instance."""
+    """Get Ironic client instance.
+
+    Clients not using a user token are cached per API version.
+    """
+    if token is None and api_version in _CLIENTS:
+        return _CLIENTS[api_version]
+
     # NOTE: To support standalone ironic without keystone
     if CONF.ironic.auth_strategy == 'noauth':
         args = {'token': 'noauth',
@@ -140,7 +328,10 @@ def get_client(token=None,
     args['os_ironic_api_version'] = api_version
     args['max_retries'] = CONF.ironic.max_retries
     args['retry_interval'] = CONF.ironic.retry_interval
-    return client.Client(1, **args)
+    cli = _MeteredClient(client.Client(1, **args))
+    if token is None:
+        _CLIENTS[api_version] = cli
+    return cli
 
 
 def check_provision_state(node, with_credentials=False):
@@ -172,24 +363,39 @@ def dict_to_capabilities(caps_dict):
                      if value is not None])
 
 
-def get_node(node_id, ironic=None, **kwargs):
+def get_node(node_id, ironic=None, cached=False, **kwargs):
     """Get a node from Ironic.
 
+    Nodes fetched without any arguments are stored in the cache, see
+    [ironic]cache_ttl. The cached node object is shared by all callers until
+    it expires, it must be treated as read-only: change the node through the
+    Ironic API, e.g. NodeInfo.patch, never in place.
+
     :param node_id: node UUID or name.
     :param ironic: ironic client instance.
+    :param cached: whether a node UUID can be looked up in the cache first.
     :param kwargs: arguments to pass to Ironic client.
     :raises: Error on failure
     """
+    if cached and not kwargs and uuidutils.is_uuid_like(node_id):
+        node = CACHE.get_node(node_id)
+        if node is not None:
+            return node
+
     ironic = ironic if ironic is not None else get_client()
 
     try:
-        return ironic.node.get(node_id, **kwargs)
+        node = ironic.node.get(node_id, **kwargs)
     except ironic_exc.NotFound:
         raise NotFound(node_id)
     except ironic_exc.HttpError as exc:
         raise utils.Error(_("Cannot get node %(node)s: %(exc)s") %
                           {'node': node_id, 'exc': exc})
 
+    if not kwargs:
+        CACHE.store_node(node)
+    return node
+
 
 def list_opts():
     return keystone.add_auth_options(IRONIC_OPTS, IRONIC_GROUP)
@@ -17,11 +17,10 @@ import json
 
 from oslo_config import cfg
 import six
-from swiftclient import client as swift_client
-from swiftclient import exceptions as swift_exceptions
 
 from ironic_inspector.common.i18n import _
 from ironic_inspector.common import keystone
+from ironic_inspector import metrics
 from ironic_inspector import utils
 
 CONF = cfg.CONF
@@ -68,6 +67,11 @@ def reset_swift_session():
     SWIFT_SESSION = None
 
 
+def _measure(call):
+    return metrics.measure('swift_request_duration_seconds',
+                           errors='swift_request_errors_total', call=call)
+
+
 class SwiftAPI(object):
     """API for communicating with Swift."""
 
@@ -77,6 +81,11 @@ class SwiftAPI(object):
         Authentification is loaded from config file.
         """
         global SWIFT_SESSION
+
+        # swiftclient is only imported when Swift is actually used, most
+        # deployments do not store introspection data in it
+        from swiftclient import client as swift_client
+
         if not SWIFT_SESSION:
             SWIFT_SESSION = keystone.get_session(SWIFT_GROUP)
         # TODO(pas-ha): swiftclient does not support keystone sessions ATM.
@@ -115,8 +124,11 @@ class SwiftAPI(object):
         :returns: The Swift UUID of the object
         :raises: utils.Error, if any operation with Swift fails.
         """
+        from swiftclient import exceptions as swift_exceptions
+
         try:
-            self.connection.put_container(container)
+            with _measure('put_container'):
+                self.connection.put_container(container)
         except swift_exceptions.ClientException as e:
             err_msg = (_('Swift failed to create container %(container)s. '
                          'Error was: %(error)s') %
@@ -128,10 +140,11 @@ class SwiftAPI(object):
             headers['X-Delete-After'] = CONF.swift.delete_after
 
         try:
-            obj_uuid = self.connection.put_object(container,
-                                                  object,
-                                                  data,
-                                                  headers=headers)
+            with _measure('put_object'):
+                obj_uuid = self.connection.put_object(container,
+                                                      object,
+                                                      data,
+                                                      headers=headers)
         except swift_exceptions.ClientException as e:
             err_msg = (_('Swift failed to create object %(object)s in '
                          'container %(container)s. Error was: %(error)s') %
@@ -148,8 +161,11 @@ class SwiftAPI(object):
         :returns: Swift object
         :raises: utils.Error, if the Swift operation fails.
         """
+        from swiftclient import exceptions as swift_exceptions
+
         try:
-            headers, obj = self.connection.get_object(container, object)
+            with _measure('get_object'):
+                headers, obj = self.connection.get_object(container, object)
         except swift_exceptions.ClientException as e:
             err_msg = (_('Swift failed to get object %(object)s in '
                          'container %(container)s. Error was: %(error)s') %
@@ -159,6 +175,20 @@ class SwiftAPI(object):
         return obj
 
 
+def object_name(uuid, suffix=None):
+    """Get the name of the Swift object with introspection data.
+
+    :param uuid: UUID of the Ironic node that the data came from
+    :param suffix: optional suffix to add to the underlying swift
+                   object name
+    :returns: Swift object name
+    """
+    swift_object_name = '%s-%s' % (OBJECT_NAME_PREFIX, uuid)
+    if suffix is not None:
+        swift_object_name = '%s-%s' % (swift_object_name, suffix)
+    return swift_object_name
+
+
 def store_introspection_data(data, uuid, suffix=None):
     """Uploads introspection data to Swift.
 
@@ -169,9 +199,7 @@ def store_introspection_data(data, uuid, suffix=None):
     :returns: name of the Swift object that the data is stored in
     """
     swift_api = SwiftAPI()
-    swift_object_name = '%s-%s' % (OBJECT_NAME_PREFIX, uuid)
-    if suffix is not None:
-        swift_object_name = '%s-%s' % (swift_object_name, suffix)
+    swift_object_name = object_name(uuid, suffix)
     swift_api.create_object(swift_object_name, json.dumps(data))
     return swift_object_name
 
@@ -185,10 +213,7 @@ def get_introspection_data(uuid, suffix=None):
     :returns: Swift object with the introspection data
     """
     swift_api = SwiftAPI()
-    swift_object_name = '%s-%s' % (OBJECT_NAME_PREFIX, uuid)
-    if suffix is not None:
-        swift_object_name = '%s-%s' % (swift_object_name, suffix)
-    return swift_api.get_object(swift_object_name)
+    return swift_api.get_object(object_name(uuid, suffix))
 
 
 def list_opts():
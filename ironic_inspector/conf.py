@@ -12,7 +12,6 @@
 # limitations under the License.
 
 from oslo_config import cfg
-from oslo_middleware import cors
 
 from ironic_inspector.common.i18n import _
 
@@ -38,9 +37,62 @@ FIREWALL_OPTS = [
                default=15,
                help=_('Amount of time in seconds, after which repeat periodic '
                       'update of firewall.')),
+    cfg.BoolOpt('update_on_change',
+                default=False,
+                help=_('Update firewall rules shortly after a change that '
+                       'can affect them: a node starting or finishing '
+                       'introspection, a node removal or a port creation. '
+                       'Changes happening within update_delay seconds are '
+                       'coalesced into one update. The periodic update then '
+                       'only serves as a safety net, e.g. for ports created '
+                       'in Ironic directly, and runs every '
+                       'safety_net_update_period seconds instead of '
+                       'firewall_update_period.')),
+    cfg.FloatOpt('update_delay',
+                 default=1.0,
+                 min=0,
+                 help=_('Delay (in seconds) between a change and the '
+                        'firewall update triggered by it, when '
+                        'update_on_change is enabled.')),
+    cfg.IntOpt('update_request_timeout',
+               default=120,
+               min=1,
+               help=_('Time in seconds an API worker waits for a firewall '
+                      'update run by the worker managing the firewall when '
+                      'several API workers are used. Introspection of the '
+                      'nodes requiring the update fails after it.')),
+    cfg.IntOpt('safety_net_update_period',
+               default=300,
+               help=_('Amount of time in seconds, after which repeat periodic '
+                      'update of firewall when update_on_change is '
+                      'enabled.')),
     cfg.StrOpt('firewall_chain',
                default='ironic-inspector',
                help=_('iptables chain name to use.')),
+    cfg.StrOpt('driver',
+               default='iptables',
+               help=_('Firewall driver to use, the name of an entry point '
+                      'in the "ironic_inspector.firewall.drivers" namespace. '
+                      'Shipped drivers: "iptables" runs '
+                      'a separate iptables command for every rule, '
+                      '"iptables_restore" builds the whole chain in memory '
+                      'and loads it with a single "iptables-restore '
+                      '--noflush" call, which is considerably faster with '
+                      'a large number of ports. "ipset" keeps blacklisted '
+                      'MAC addresses in an ipset of type hash:mac named '
+                      'after the firewall_chain option and only adds or '
+                      'removes the changed addresses on update; it requires '
+                      'ipset 6.21 or newer. "recording" only keeps the '
+                      'requested state in memory and is intended for '
+                      'testing and benchmarking.')),
+    cfg.IntOpt('ports_page_size',
+               default=1000,
+               min=0,
+               help=_('Number of Ironic ports to fetch with one request '
+                      'when updating the firewall. Ports are processed '
+                      'page by page, so that they are never all loaded in '
+                      'memory at the same time. Setting it to 0 fetches '
+                      'all ports at once.')),
     cfg.ListOpt('ethoib_interfaces',
                 default=[],
                 help=_('List of Etherent Over InfiniBand interfaces '
@@ -119,6 +171,12 @@ PROCESSING_OPTS = [
     cfg.StrOpt('store_data_location',
                help=_('Name of the key to store the location of stored data '
                       'in the extra column of the Ironic database.')),
+    cfg.BoolOpt('store_timings',
+                default=False,
+                help=_('Whether to store durations of processing phases '
+                       'for every node and return them in the introspection '
+                       'status API. Requires one more database write per '
+                       'node.')),
     cfg.BoolOpt('disk_partitioning_spacing',
                 default=True,
                 help=_('Whether to leave 1 GiB of disk size untouched for '
@@ -141,6 +199,96 @@ PROCESSING_OPTS = [
     cfg.BoolOpt('power_off',
                 default=True,
                 help=_('Whether to power off a node after introspection.')),
+    cfg.BoolOpt('async_continue',
+                default=False,
+                help=_('Whether to only look up the node when receiving '
+                       'data from the ramdisk and to process the data in '
+                       'background, returning HTTP 202 right away. The '
+                       'outcome is available through the introspection '
+                       'status API. Data with new IPMI credentials is '
+                       'always processed in the request.')),
+    cfg.IntOpt('continue_queue_size',
+               default=100, min=1,
+               help=_('Maximum number of ramdisk callbacks being processed '
+                      'or waiting to be processed in background when '
+                      'async_continue is set. Further callbacks are '
+                      'rejected with HTTP 503.')),
+    cfg.IntOpt('continue_retry_after',
+               default=10, min=0,
+               help=_('Number of seconds the ramdisk is asked to wait in the '
+                      'Retry-After header before retrying a callback '
+                      'rejected because the queue is full.')),
+    cfg.BoolOpt('durable_jobs',
+                default=False,
+                help=_('Whether to record processing, powering off and '
+                       'finishing nodes and reapplying run in background in '
+                       'the database, so that they are resumed by any '
+                       'ironic-inspector process if the process running '
+                       'them stops. Introspection data is not recorded, '
+                       'interrupted processing reloads the unprocessed data '
+                       'from Swift, without "[processing] store_data = '
+                       'swift" it fails the introspection.')),
+    cfg.IntOpt('job_lease_time',
+               default=60, min=3,
+               help=_('Number of seconds after which a background job is '
+                      'considered abandoned and resumed, unless the '
+                      'process running it renews its lease. The lease is '
+                      'renewed every third of this time.')),
+    cfg.IntOpt('job_max_attempts',
+               default=3, min=1,
+               help=_('Maximum number of times a background job is run '
+                      'before the introspection is failed.')),
+]
+
+LOCKING_OPTS = [
+    cfg.StrOpt('backend',
+               default='internal',
+               help=_('Backend of the per-node locks, the name of an entry '
+                      'point in the "ironic_inspector.locking.backends" '
+                      'namespace. Shipped backends: "internal" only '
+                      'serializes work on a node within one process and is '
+                      'only suitable when a single ironic-inspector process '
+                      'uses the database. "file" uses lock files in '
+                      '[oslo_concurrency]lock_path and is suitable for '
+                      'several processes on one host. "database" keeps '
+                      'locks in the database and is suitable for processes '
+                      'on several hosts sharing it.')),
+    cfg.IntOpt('lease_time',
+               default=30, min=3,
+               help=_('Time in seconds after which a lock held by a stopped '
+                      'process can be taken over, only used by the '
+                      '"database" backend. Locks held by running processes '
+                      'are renewed every third of this time.')),
+    cfg.FloatOpt('retry_interval',
+                 default=0.5, min=0.01,
+                 help=_('Interval in seconds between attempts to acquire a '
+                        'lock held by another process, only used by the '
+                        '"database" backend.')),
+]
+
+COORDINATION_OPTS = [
+    cfg.BoolOpt('partition_periodic_tasks',
+                default=False,
+                help=_('Split periodic work on nodes (timeouts, removal of '
+                       'nodes deleted from Ironic, resuming of background '
+                       'jobs) between all ironic-inspector processes using '
+                       'the same database. Processes register themselves in '
+                       'the database and every node is handled by one of '
+                       'them, chosen using a consistent hash ring.')),
+    cfg.IntOpt('heartbeat_interval',
+               default=10, min=1,
+               help=_('Interval in seconds between updates of the '
+                      'registration of this process and of the hash ring.')),
+    cfg.IntOpt('member_timeout',
+               default=60, min=2,
+               help=_('Time in seconds after the last update after which a '
+                      'process is considered stopped and its nodes are '
+                      'handled by the other processes.')),
+    cfg.IntOpt('vnodes',
+               default=64, min=1,
+               help=_('Number of points every process is placed on the hash '
+                      'ring with. More points give a more even split of '
+                      'nodes at the cost of a larger ring.')),
 ]
 
 SERVICE_OPTS = [
@@ -150,12 +298,51 @@ SERVICE_OPTS = [
     cfg.PortOpt('listen_port',
                 default=5050,
                 help=_('Port to listen on.')),
+    cfg.IntOpt('api_workers',
+               default=0, min=0,
+               help=_('Number of API worker processes sharing the listening '
+                      'socket. The first worker also runs the periodic '
+                      'tasks and manages the firewall. Node locks have to '
+                      'be valid between processes (see [locking]backend) '
+                      'with more than one worker, the look up index is '
+                      'disabled then. 0 runs the API in the main process '
+                      'using the development server of Flask.')),
+    cfg.BoolOpt('wsgi_keep_alive',
+                default=True,
+                help=_('Whether API workers keep client connections open '
+                       'between requests (HTTP keep-alive).')),
+    cfg.IntOpt('client_socket_timeout',
+               default=900, min=0,
+               help=_('Timeout in seconds for operations on client '
+                      'connections of API workers, idle keep-alive '
+                      'connections are closed after it. 0 means to wait '
+                      'forever.')),
+    cfg.IntOpt('max_connections',
+               default=1000, min=1,
+               help=_('Maximum number of client connections served by one '
+                      'API worker at the same time, further connections '
+                      'wait in the listening socket backlog.')),
+    cfg.IntOpt('max_header_line',
+               default=16384, min=1,
+               help=_('Maximum length of a request header line accepted by '
+                      'API workers.')),
+    cfg.IntOpt('graceful_shutdown_timeout',
+               default=60, min=0,
+               help=_('Time in seconds an API worker waits for requests and '
+                      'background work in progress on stop or reload before '
+                      'exiting anyway. 0 means to wait forever.')),
     cfg.StrOpt('auth_strategy',
                default='keystone',
                choices=('keystone', 'noauth'),
                help=_('Authentication method used on the ironic-inspector '
                       'API. Either "noauth" or "keystone" are currently valid '
                       'options. "noauth" will disable all authentication.')),
+    cfg.BoolOpt('metrics_require_auth',
+                default=False,
+                help=_('Whether the /metrics endpoint requires '
+                       'authentication like the rest of the API. By default '
+                       'it is served without it like the API root, so that '
+                       'Prometheus can scrape it without a Keystone token.')),
     cfg.IntOpt('timeout',
                default=3600,
                help=_('Timeout after which introspection is considered '
@@ -169,6 +356,15 @@ SERVICE_OPTS = [
                default=60,
                help=_('Amount of time in seconds, after which repeat clean up '
                       'of timed out nodes and old nodes status information.')),
+    cfg.BoolOpt('lookup_index',
+                default=False,
+                help=_('Keep look up attributes (MAC and BMC addresses) of '
+                       'nodes on introspection in memory, so that looking up '
+                       'nodes and listing active MAC addresses does not '
+                       'require database queries. The index is reloaded '
+                       'from the database every clean_up_period seconds. '
+                       'Only enable it if the database is used by a single '
+                       'ironic-inspector process.')),
     cfg.BoolOpt('use_ssl',
                 default=False,
                 help=_('SSL Enabled/Disabled')),
@@ -207,6 +403,8 @@ SERVICE_OPTS = [
 cfg.CONF.register_opts(SERVICE_OPTS)
 cfg.CONF.register_opts(FIREWALL_OPTS, group='firewall')
 cfg.CONF.register_opts(PROCESSING_OPTS, group='processing')
+cfg.CONF.register_opts(LOCKING_OPTS, group='locking')
+cfg.CONF.register_opts(COORDINATION_OPTS, group='coordination')
 
 
 def list_opts():
@@ -214,6 +412,8 @@ def list_opts():
         ('', SERVICE_OPTS),
         ('firewall', FIREWALL_OPTS),
         ('processing', PROCESSING_OPTS),
+        ('locking', LOCKING_OPTS),
+        ('coordination', COORDINATION_OPTS),
     ]
 
 
@@ -224,6 +424,8 @@ def set_config_defaults():
 
 def set_cors_middleware_defaults():
     """Update default configuration options for oslo.middleware."""
+    from oslo_middleware import cors
+
     # TODO(krotscheck): Update with https://review.openstack.org/#/c/285368/
     cfg.set_defaults(
         cors.CORS_OPTS,
@@ -22,13 +22,17 @@ from oslo_db import options as db_opts
 from oslo_db.sqlalchemy import models
 from oslo_db.sqlalchemy import session as db_session
 from oslo_db.sqlalchemy import types as db_types
+from oslo_utils import timeutils
 from sqlalchemy import (Boolean, Column, DateTime, Enum, ForeignKey,
-                        Integer, String, Text)
+                        Index, Integer, String, Text)
+from sqlalchemy.dialects import mysql
+from sqlalchemy import event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import orm
 
 from ironic_inspector import conf  # noqa
 from ironic_inspector import introspection_state as istate
+from ironic_inspector import metrics
 
 
 class ModelBase(models.ModelBase):
@@ -67,6 +71,10 @@ class Node(Base):
 
 class Attribute(Base):
     __tablename__ = 'attributes'
+    # Covers look up of node UUID by attributes without reading the table
+    __table_args__ = (
+        Index('ix_attributes_name_value_uuid', 'name', 'value', 'uuid'),
+        ModelBase.__table_args__)
     name = Column(String(255), primary_key=True)
     value = Column(String(255), primary_key=True)
     uuid = Column(String(36), ForeignKey('nodes.uuid'))
@@ -127,6 +135,45 @@ class RuleAction(Base):
         return res
 
 
+class Job(Base):
+    __tablename__ = 'jobs'
+    # Covers look up of jobs with expired leases
+    __table_args__ = (
+        Index('ix_jobs_lease_expires_at', 'lease_expires_at'),
+        ModelBase.__table_args__)
+    id = Column(Integer, primary_key=True)
+    uuid = Column(String(36), ForeignKey('nodes.uuid'), nullable=False)
+    stage = Column(String(255), nullable=False)
+    # JSON encoded arguments of the stage, may contain introspection data
+    data = Column(Text().with_variant(mysql.LONGTEXT(), 'mysql'))
+    created_at = Column(DateTime, nullable=False)
+    owner = Column(String(36))
+    lease_expires_at = Column(DateTime, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+
+
+class Lock(Base):
+    __tablename__ = 'locks'
+    name = Column(String(255), primary_key=True)
+    owner = Column(String(36), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+
+class Member(Base):
+    __tablename__ = 'members'
+    id = Column(String(36), primary_key=True)
+    host = Column(String(255))
+    heartbeat_at = Column(DateTime, nullable=False)
+
+
+# Counters incremented on every change of data cached by the processes,
+# e.g. introspection rules
+class Generation(Base):
+    __tablename__ = 'generations'
+    name = Column(String(255), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+
 def init():
     """Initialize the database."""
     return get_session()
@@ -157,9 +204,33 @@ def create_facade_lazily():
     global _FACADE
     if _FACADE is None:
         _FACADE = db_session.EngineFacade.from_config(cfg.CONF)
+        _measure_queries(_FACADE.get_engine())
     return _FACADE
 
 
+def _measure_queries(engine):
+    """Record duration of every query executed by the engine in metrics."""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context,
+                              executemany):
+        conn.info.setdefault('query_watches', []).append(
+            timeutils.StopWatch().start())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context,
+                             executemany):
+        watch = conn.info['query_watches'].pop()
+        metrics.observe('db_query_duration_seconds', watch.elapsed(),
+                        statement=statement.split(None, 1)[0].upper())
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        if context.connection is not None:
+            watches = context.connection.info.get('query_watches')
+            if watches:
+                watches.pop()
+
+
 @contextlib.contextmanager
 def ensure_transaction(session=None):
     session = session or get_session()
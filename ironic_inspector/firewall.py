@@ -11,49 +11,46 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import contextlib
 import os
 import re
-import subprocess
+import time
 
+import eventlet
+from eventlet.green import socket
+from eventlet import queue
 from eventlet import semaphore
 from oslo_config import cfg
 from oslo_log import log
 
-from ironic_inspector.common.i18n import _LE, _LW
+from ironic_inspector.common.i18n import _, _LE
 from ironic_inspector.common import ironic as ir_utils
+from ironic_inspector import metrics
 from ironic_inspector import node_cache
+from ironic_inspector.plugins import base as plugins_base
+from ironic_inspector import utils
 
 
 CONF = cfg.CONF
 LOG = log.getLogger("ironic_inspector.firewall")
-NEW_CHAIN = None
-CHAIN = None
-INTERFACE = None
 LOCK = semaphore.BoundedSemaphore()
-BASE_COMMAND = None
 BLACKLIST_CACHE = None
 ENABLED = True
-EMAC_REGEX = 'EMAC=([0-9a-f]{2}(:[0-9a-f]{2}){5}) IMAC=.*'
+# Whether an update requested by mark_dirty() is waiting to be run
+_UPDATE_PENDING = False
+# Matches a line of the EoIB neighbours file, capturing EMAC and IMAC
+NEIGH_REGEX = re.compile(r'EMAC=([0-9a-f]{2}(?::[0-9a-f]{2}){5}) IMAC=(\S+)')
+# Parsed neighbours files: file name -> (content, InfiniBand GUID -> EMAC)
+_NEIGHS_CACHE = {}
+# Address of the socket of the process managing the firewall, set in the
+# other API worker processes
+_UPDATE_REQUESTS_ADDRESS = None
+# Replies to a forwarded update request
+_UPDATE_DONE = b'1'
+_UPDATE_FAILED = b'0'
 
 
-def _iptables(*args, **kwargs):
-    # NOTE(dtantsur): -w flag makes it wait for xtables lock
-    cmd = BASE_COMMAND + args
-    ignore = kwargs.pop('ignore', False)
-    LOG.debug('Running iptables %s', args)
-    kwargs['stderr'] = subprocess.STDOUT
-    try:
-        subprocess.check_output(cmd, **kwargs)
-    except subprocess.CalledProcessError as exc:
-        output = exc.output.replace('\n', '. ')
-        if ignore:
-            LOG.debug('Ignoring failed iptables %(args)s: %(output)s',
-                      {'args': args, 'output': output})
-        else:
-            LOG.error(_LE('iptables %(iptables)s failed: %(exc)s'),
-                      {'iptables': args, 'exc': output})
-            raise
+def _driver():
+    return plugins_base.firewall_driver_manager().driver
 
 
 def init():
@@ -64,37 +61,9 @@ def init():
     if not CONF.firewall.manage_firewall:
         return
 
-    global INTERFACE, CHAIN, NEW_CHAIN, BASE_COMMAND, BLACKLIST_CACHE
+    global BLACKLIST_CACHE
     BLACKLIST_CACHE = None
-    INTERFACE = CONF.firewall.dnsmasq_interface
-    CHAIN = CONF.firewall.firewall_chain
-    NEW_CHAIN = CHAIN + '_temp'
-    BASE_COMMAND = ('sudo', 'ironic-inspector-rootwrap',
-                    CONF.rootwrap_config, 'iptables',)
-
-    # -w flag makes iptables wait for xtables lock, but it's not supported
-    # everywhere yet
-    try:
-        with open(os.devnull, 'wb') as null:
-            subprocess.check_call(BASE_COMMAND + ('-w', '-h'),
-                                  stderr=null, stdout=null)
-    except subprocess.CalledProcessError:
-        LOG.warning(_LW('iptables does not support -w flag, please update '
-                        'it to at least version 1.4.21'))
-    else:
-        BASE_COMMAND += ('-w',)
-
-    _clean_up(CHAIN)
-    # Not really needed, but helps to validate that we have access to iptables
-    _iptables('-N', CHAIN)
-
-
-def _clean_up(chain):
-    _iptables('-D', 'INPUT', '-i', INTERFACE, '-p', 'udp',
-              '--dport', '67', '-j', chain,
-              ignore=True)
-    _iptables('-F', chain, ignore=True)
-    _iptables('-X', chain, ignore=True)
+    _driver().init()
 
 
 def clean_up():
@@ -102,8 +71,7 @@ def clean_up():
     if not CONF.firewall.manage_firewall:
         return
 
-    _clean_up(CHAIN)
-    _clean_up(NEW_CHAIN)
+    _driver().clean_up()
 
 
 def _should_enable_dhcp():
@@ -116,26 +84,6 @@ def _should_enable_dhcp():
             CONF.processing.node_not_found_hook)
 
 
-@contextlib.contextmanager
-def _temporary_chain(chain, main_chain):
-    """Context manager to operate on a temporary chain."""
-    # Clean up a bit to account for possible troubles on previous run
-    _clean_up(chain)
-    _iptables('-N', chain)
-
-    yield
-
-    # Swap chains
-    _iptables('-I', 'INPUT', '-i', INTERFACE, '-p', 'udp',
-              '--dport', '67', '-j', chain)
-    _iptables('-D', 'INPUT', '-i', INTERFACE, '-p', 'udp',
-              '--dport', '67', '-j', main_chain,
-              ignore=True)
-    _iptables('-F', main_chain, ignore=True)
-    _iptables('-X', main_chain, ignore=True)
-    _iptables('-E', chain, main_chain)
-
-
 def _disable_dhcp():
     """Disable DHCP completely."""
     global ENABLED, BLACKLIST_CACHE
@@ -147,9 +95,7 @@ def _disable_dhcp():
     LOG.debug('No nodes on introspection and node_not_found_hook is '
               'not set - disabling DHCP')
     BLACKLIST_CACHE = None
-    with _temporary_chain(NEW_CHAIN, CHAIN):
-        # Blacklist everything
-        _iptables('-A', NEW_CHAIN, '-j', 'REJECT')
+    _driver().update_filters(None)
 
     ENABLED = False
 
@@ -162,7 +108,7 @@ def update_filters(ironic=None):
 
     This function is called from both introspection initialization code and
     from periodic task. This function is supposed to be resistant to unexpected
-    iptables state.
+    firewall state.
 
     ``init()`` function must be called once before any call to this function.
     This function is using ``eventlet`` semaphore to serialize access from
@@ -170,29 +116,36 @@ def update_filters(ironic=None):
 
     Does nothing, if firewall management is disabled in configuration.
 
+    In the API worker processes not managing the firewall, the update is
+    run by the process managing it, this function returns once it finishes.
+
     :param ironic: Ironic client instance, optional.
+    :raises: Error if a forwarded update failed or timed out
     """
-    global BLACKLIST_CACHE, ENABLED
-
     if not CONF.firewall.manage_firewall:
         return
 
-    assert INTERFACE is not None
+    if _UPDATE_REQUESTS_ADDRESS is not None:
+        _request_update()
+    else:
+        _update_filters(ironic)
+
+
+def _update_filters(ironic=None):
+    global BLACKLIST_CACHE, ENABLED
+
     ironic = ir_utils.get_client() if ironic is None else ironic
-    with LOCK:
+    with LOCK, metrics.measure('firewall_update_duration_seconds'):
         if not _should_enable_dhcp():
             _disable_dhcp()
             return
 
-        ports_active = ironic.port.list(limit=0, fields=['address', 'extra'])
-        macs_active = set(p.address for p in ports_active)
-        to_blacklist = macs_active - node_cache.active_macs()
-        ib_mac_mapping = (
-            _ib_mac_to_rmac_mapping(to_blacklist, ports_active))
+        to_blacklist, ib_ports = _blacklist_from_ports(ironic)
+        ib_mac_mapping = _ib_mac_to_rmac_mapping(to_blacklist, ib_ports)
 
         if (BLACKLIST_CACHE is not None and
                 to_blacklist == BLACKLIST_CACHE and not ib_mac_mapping):
-            LOG.debug('Not updating iptables - no changes in MAC list %s',
+            LOG.debug('Not updating firewall - no changes in MAC list %s',
                       to_blacklist)
             return
 
@@ -200,18 +153,177 @@ def update_filters(ironic=None):
         # Force update on the next iteration if this attempt fails
         BLACKLIST_CACHE = None
 
-        with _temporary_chain(NEW_CHAIN, CHAIN):
-            # - Blacklist active macs, so that nova can boot them
-            for mac in to_blacklist:
-                mac = ib_mac_mapping.get(mac) or mac
-                _iptables('-A', NEW_CHAIN, '-m', 'mac',
-                          '--mac-source', mac, '-j', 'DROP')
-            # - Whitelist everything else
-            _iptables('-A', NEW_CHAIN, '-j', 'ACCEPT')
+        _driver().update_filters({ib_mac_mapping.get(mac) or mac
+                                  for mac in to_blacklist})
 
-        # Cache result of successful iptables update
+        # Cache result of successful firewall update
         ENABLED = True
         BLACKLIST_CACHE = to_blacklist
+        metrics.set_gauge('firewall_blacklisted_macs', len(to_blacklist))
+
+
+def _list_ports(ironic, fields):
+    """Iterate over all Ironic ports, fetching them page by page.
+
+    :param ironic: Ironic client instance.
+    :param fields: list of port fields to fetch.
+    """
+    page_size = CONF.firewall.ports_page_size
+    if not page_size:
+        for port in ironic.port.list(limit=0, fields=fields):
+            yield port
+        return
+
+    # The marker is the UUID of the last port on the previous page
+    fields = list(fields) + ['uuid']
+    marker = None
+    while True:
+        ports = ironic.port.list(limit=page_size, marker=marker,
+                                 fields=fields)
+        for port in ports:
+            yield port
+        if len(ports) < page_size:
+            return
+        marker = ports[-1].uuid
+
+
+def _blacklist_from_ports(ironic):
+    """Find MAC's of ports, that should not get access to DHCP.
+
+    :param ironic: Ironic client instance.
+    :returns: tuple (set of MAC's to blacklist, list of blacklisted ports
+              with an InfiniBand client ID). The latter is only populated
+              when ``ethoib_interfaces`` is set.
+    """
+    fields = ['address']
+    with_ib = bool(CONF.firewall.ethoib_interfaces)
+    if with_ib:
+        fields.append('extra')
+
+    macs_whitelisted = node_cache.active_macs()
+    to_blacklist = set()
+    ib_ports = []
+    for port in _list_ports(ironic, fields):
+        if port.address in macs_whitelisted:
+            continue
+        to_blacklist.add(port.address)
+        if with_ib and port.extra.get('client-id'):
+            ib_ports.append(port)
+    return to_blacklist, ib_ports
+
+
+def mark_dirty():
+    """Request a firewall update after a change that can affect it.
+
+    The update is run in background after the ``[firewall] update_delay``
+    seconds, all changes happening in the meantime are covered by the same
+    update.
+
+    Does nothing, if firewall management or ``[firewall] update_on_change``
+    is disabled in configuration.
+    """
+    global _UPDATE_PENDING
+
+    if not (CONF.firewall.manage_firewall and
+            CONF.firewall.update_on_change):
+        return
+
+    if _UPDATE_PENDING:
+        LOG.debug('Firewall update is already pending')
+        return
+
+    _UPDATE_PENDING = True
+    try:
+        utils.executor().submit(_delayed_update)
+    except Exception:
+        # Otherwise no further updates would ever be scheduled
+        _UPDATE_PENDING = False
+        raise
+
+
+def _delayed_update():
+    global _UPDATE_PENDING
+
+    time.sleep(CONF.firewall.update_delay)
+    # Changes from now on require another update
+    _UPDATE_PENDING = False
+    try:
+        update_filters()
+    except Exception:
+        LOG.exception(_LE('Update of firewall rules failed'))
+
+
+def forward_updates(address):
+    """Forward firewall updates of this process to another process.
+
+    Used by the API worker processes not managing the firewall, the process
+    managing it has to call serve_update_requests() with a socket listening
+    on the same address.
+
+    :param address: path of a UNIX socket
+    """
+    global _UPDATE_REQUESTS_ADDRESS
+
+    _UPDATE_REQUESTS_ADDRESS = address
+
+
+def _request_update():
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONF.firewall.update_request_timeout)
+    try:
+        sock.connect(_UPDATE_REQUESTS_ADDRESS)
+        reply = sock.recv(1)
+    except socket.timeout:
+        raise utils.Error(_('Firewall update was not finished in %d seconds')
+                          % CONF.firewall.update_request_timeout)
+    except socket.error as exc:
+        raise utils.Error(_('Failed to request a firewall update: %s') % exc)
+    finally:
+        sock.close()
+
+    if reply != _UPDATE_DONE:
+        raise utils.Error(_('Firewall update failed, see the logs of the '
+                            'API worker managing the firewall'))
+
+
+def serve_update_requests(sock):
+    """Update the firewall on requests from other processes.
+
+    Every connection is a request, it is answered once an update started
+    after accepting it finishes. Requests accepted while an update is
+    running are covered by one more update.
+
+    :param sock: listening UNIX socket
+    """
+    requests = queue.LightQueue()
+    eventlet.spawn_n(_run_requested_updates, requests)
+    while True:
+        conn, _addr = sock.accept()
+        requests.put(conn)
+
+
+def _run_requested_updates(requests):
+    while True:
+        conns = [requests.get()]
+        while not requests.empty():
+            conns.append(requests.get_nowait())
+
+        try:
+            _update_filters()
+        except Exception:
+            LOG.exception(_LE('Update of firewall rules failed'))
+            reply = _UPDATE_FAILED
+        else:
+            reply = _UPDATE_DONE
+
+        for conn in conns:
+            try:
+                conn.sendall(reply)
+            except socket.error:
+                # The requester has given up waiting
+                pass
+            finally:
+                conn.close()
 
 
 def _ib_mac_to_rmac_mapping(blacklist_macs, ports_active):
@@ -229,21 +341,13 @@ def _ib_mac_to_rmac_mapping(blacklist_macs, ports_active):
 
     :param blacklist_macs: List of InfiniBand baremetal hosts macs to
                            blacklist.
-    :param ports_active: list of active ironic ports
+    :param ports_active: list of blacklisted ironic ports with a client-id
     :return baremetal InfiniBand to remote mac on ironic node mapping
     """
-    ethoib_interfaces = CONF.firewall.ethoib_interfaces
     ib_mac_to_remote_mac = {}
-    for interface in ethoib_interfaces:
-        neighs_file = (
-            os.path.join('/sys/class/net', interface, 'eth/neighs'))
-        try:
-            with open(neighs_file, 'r') as fd:
-                data = fd.read()
-        except IOError:
-            LOG.error(
-                _LE('Interface %s is not Ethernet Over InfiniBand; '
-                    'Skipping ...'), interface)
+    for interface in CONF.firewall.ethoib_interfaces:
+        guid_to_emac = _get_neighs(interface)
+        if guid_to_emac is None:
             continue
         for port in ports_active:
             if port.address in blacklist_macs:
@@ -251,9 +355,49 @@ def _ib_mac_to_rmac_mapping(blacklist_macs, ports_active):
                 if client_id:
                     # Note(moshele): The last 8 bytes in the client-id is
                     # the baremetal node InfiniBand GUID
-                    guid = client_id[-23:]
-                    p = re.compile(EMAC_REGEX + guid)
-                    match = p.search(data)
-                    if match:
-                        ib_mac_to_remote_mac[port.address] = match.group(1)
+                    emac = guid_to_emac.get(client_id[-23:])
+                    if emac:
+                        ib_mac_to_remote_mac[port.address] = emac
     return ib_mac_to_remote_mac
+
+
+def _get_neighs(interface):
+    """Get the neighbours table of an EoIB interface.
+
+    The neighbours file is read on every call, but only parsed when its
+    content changes: the modification time of files in sysfs is not
+    updated on changes, so it cannot be relied upon.
+
+    :param interface: EoIB interface name.
+    :returns: dict InfiniBand GUID -> EoIB MAC, None if the interface is not
+              an EoIB one.
+    """
+    neighs_file = os.path.join('/sys/class/net', interface, 'eth/neighs')
+    try:
+        with open(neighs_file, 'r') as fd:
+            data = fd.read()
+    except IOError:
+        LOG.error(
+            _LE('Interface %s is not Ethernet Over InfiniBand; '
+                'Skipping ...'), interface)
+        return
+
+    cached = _NEIGHS_CACHE.get(neighs_file)
+    if cached is None or cached[0] != data:
+        cached = _NEIGHS_CACHE[neighs_file] = (data, _parse_neighs(data))
+    return cached[1]
+
+
+def _parse_neighs(data):
+    """Parse the content of an EoIB neighbours file.
+
+    :param data: file content, lines in the format
+                 ``EMAC=<EoIB MAC> IMAC=<InfiniBand address>``.
+    :returns: dict InfiniBand GUID -> EoIB MAC. The GUID is the last 8
+              bytes of the InfiniBand address.
+    """
+    guid_to_emac = {}
+    for match in NEIGH_REGEX.finditer(data):
+        # The first entry wins in case of duplicates
+        guid_to_emac.setdefault(match.group(2)[-23:], match.group(1))
+    return guid_to_emac
@@ -0,0 +1,121 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Partitioning of periodic work on nodes between running processes.
+
+With [coordination]partition_periodic_tasks every process records itself in
+the members table and updates the record every
+[coordination]heartbeat_interval seconds. Processes, whose record was not
+updated for [coordination]member_timeout seconds, are considered stopped.
+Nodes are split between the live processes using a consistent hash ring, so
+that adding or removing a process only moves a fraction of the nodes.
+"""
+
+import bisect
+import datetime
+import hashlib
+import socket
+
+from oslo_config import cfg
+from oslo_utils import timeutils
+from oslo_utils import uuidutils
+
+from ironic_inspector.common.i18n import _LI
+from ironic_inspector import db
+from ironic_inspector import utils
+
+
+CONF = cfg.CONF
+LOG = utils.getProcessingLogger(__name__)
+
+# ID of this process in the members table
+MEMBER_ID = uuidutils.generate_uuid()
+# Ring of the live members, None until the first heartbeat
+_RING = None
+
+
+def _hash(key):
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest(), 16)
+
+
+class HashRing(object):
+    """Consistent hash ring.
+
+    Every member is placed on the ring at several points, a key belongs to
+    the member at the first point following the hash of the key.
+    """
+
+    def __init__(self, members, vnodes):
+        self.members = frozenset(members)
+        points = sorted((_hash('%s-%d' % (member, index)), member)
+                        for member in self.members
+                        for index in range(vnodes))
+        self._hashes = [point[0] for point in points]
+        self._members = [point[1] for point in points]
+
+    def get_member(self, key):
+        """Get the member a key belongs to.
+
+        :param key: string key, e.g. node UUID
+        :returns: member
+        """
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._members[index]
+
+
+def heartbeat():
+    """Record that this process is alive and update the ring."""
+    global _RING
+
+    now = timeutils.utcnow()
+    threshold = now - datetime.timedelta(
+        seconds=CONF.coordination.member_timeout)
+    with db.ensure_transaction() as session:
+        updated = db.model_query(db.Member, session=session).filter_by(
+            id=MEMBER_ID).update({'heartbeat_at': now})
+        if not updated:
+            db.Member(id=MEMBER_ID, host=socket.gethostname(),
+                      heartbeat_at=now).save(session)
+        db.model_query(db.Member, session=session).filter(
+            db.Member.heartbeat_at < threshold).delete()
+        members = [row.id for row in
+                   db.model_query(db.Member.id, session=session)]
+
+    ring = HashRing(members, CONF.coordination.vnodes)
+    if _RING is None or ring.members != _RING.members:
+        LOG.info(_LI('Periodic work is split between %(count)d processes: '
+                     '%(members)s'),
+                 {'count': len(members), 'members': sorted(members)})
+    _RING = ring
+
+
+def leave():
+    """Remove this process from the ring, e.g. on shut down."""
+    global _RING
+
+    _RING = None
+    with db.ensure_transaction() as session:
+        db.model_query(db.Member, session=session).filter_by(
+            id=MEMBER_ID).delete()
+
+
+def owns(uuid):
+    """Check whether periodic work on a node is done by this process.
+
+    Always true if partitioning is disabled or before the first heartbeat.
+
+    :param uuid: node UUID
+    """
+    if not CONF.coordination.partition_periodic_tasks or _RING is None:
+        return True
+    return _RING.get_member(uuid) == MEMBER_ID
@@ -20,7 +20,7 @@ import time
 from eventlet import semaphore
 from oslo_config import cfg
 
-from ironic_inspector.common.i18n import _, _LI, _LW
+from ironic_inspector.common.i18n import _, _LE, _LI, _LW
 from ironic_inspector.common import ironic as ir_utils
 from ironic_inspector import firewall
 from ironic_inspector import introspection_state as istate
@@ -92,7 +92,11 @@ def introspect(node_id, new_ipmi_credentials=None, token=None):
                                                bmc_address=bmc_address,
                                                ironic=ironic)
     node_info.set_option('new_ipmi_credentials', new_ipmi_credentials)
+    _submit(node_info, _background_introspect, ironic, node_info)
 
+
+def _submit(node_info, func, *args, **kwargs):
+    """Run a function in background, failing introspection on errors."""
     def _handle_exceptions(fut):
         try:
             fut.result()
@@ -104,11 +108,108 @@ def introspect(node_id, new_ipmi_credentials=None, token=None):
             LOG.exception(msg, node_info=node_info)
             node_info.finished(error=msg)
 
-    future = utils.executor().submit(_background_introspect, ironic, node_info)
+    future = utils.executor().submit(func, *args, **kwargs)
     future.add_done_callback(_handle_exceptions)
 
 
-def _background_introspect(ironic, node_info):
+def introspect_many(node_ids, token=None):
+    """Initiate hardware properties introspection for several nodes.
+
+    Nodes are validated concurrently, stored in the cache with one
+    transaction and whitelisted with one firewall update, after which they
+    are powered on as in introspect(). Setting IPMI credentials is not
+    supported.
+
+    :param node_ids: list of node UUIDs or names
+    :param token: authentication token
+    :returns: list of dicts with keys ``node`` (the requested UUID or name),
+              ``uuid`` (node UUID or None if the node was not found) and
+              ``error`` (error message or None), in the order of node_ids
+    """
+    ironic = ir_utils.get_client(token)
+    results = [{'node': node_id, 'uuid': None, 'error': None}
+               for node_id in node_ids]
+    futures = [utils.executor().submit(_validate, ironic, result)
+               for result in results]
+
+    nodes = {}
+    for result, future in zip(results, futures):
+        node_id = result['node']
+        try:
+            node, attributes = future.result()
+        except utils.Error as exc:
+            result['error'] = str(exc)
+            continue
+        except Exception as exc:
+            LOG.exception(_LE('Unexpected exception during validation of '
+                              'node %s'), node_id)
+            result['error'] = _('Unexpected exception during validation: '
+                                '%s') % exc
+            continue
+
+        if node.uuid in nodes:
+            result['error'] = _('Node %s is requested more than '
+                                'once') % node.uuid
+        else:
+            nodes[node.uuid] = attributes
+
+    started = node_cache.start_introspection_many(nodes, ironic=ironic)
+    node_infos = []
+    for result in results:
+        if result['error'] or result['uuid'] not in started:
+            continue
+        outcome = started.pop(result['uuid'])
+        if isinstance(outcome, utils.Error):
+            result['error'] = str(outcome)
+        else:
+            node_infos.append(outcome)
+
+    if node_infos:
+        utils.executor().submit(_background_introspect_many, ironic,
+                                node_infos)
+    return results
+
+
+def _validate(ironic, result):
+    """Validate that a node can be introspected.
+
+    :param result: result dict for the node, its ``uuid`` is set as soon as
+                   the node is found
+    :returns: tuple (Ironic node, dict of look up attributes)
+    :raises: Error
+    """
+    node = ir_utils.get_node(result['node'], ironic=ironic)
+    result['uuid'] = node.uuid
+    ir_utils.check_provision_state(node)
+
+    validation = ironic.node.validate(node.uuid)
+    if not validation.power['result']:
+        msg = _('Failed validation of power interface, reason: %s')
+        raise utils.Error(msg % validation.power['reason'], node_info=node)
+
+    macs = [p.address for p in ironic.node.list_ports(node.uuid, limit=0)]
+    return node, {'bmc_address': ir_utils.get_ipmi_address(node),
+                  node_cache.MACS_ATTRIBUTE: macs}
+
+
+def _background_introspect_many(ironic, node_infos):
+    LOG.info(_LI('Whitelisting MAC\'s of %d nodes on the firewall'),
+             len(node_infos))
+    try:
+        firewall.update_filters(ironic)
+    except Exception as exc:
+        LOG.exception(_LE('Failed to update firewall filters'))
+        for node_info in node_infos:
+            node_info.finished(
+                error=_('Failed to update firewall filters: %s') % exc)
+        return
+
+    for node_info in node_infos:
+        _submit(node_info, _background_introspect, ironic, node_info,
+                whitelisted=True)
+
+
+def _background_introspect(ironic, node_info, whitelisted=False):
     global _LAST_INTROSPECTION_TIME
 
     if not node_info.options.get('new_ipmi_credentials'):
@@ -125,20 +226,23 @@ def _background_introspect(ironic, node_info):
 
     node_info.acquire_lock()
     try:
-        _background_introspect_locked(node_info, ironic)
+        _background_introspect_locked(node_info, ironic,
+                                      whitelisted=whitelisted)
     finally:
         node_info.release_lock()
 
 
 @node_cache.fsm_transition(istate.Events.wait)
-def _background_introspect_locked(node_info, ironic):
-    # TODO(dtantsur): pagination
-    macs = list(node_info.ports())
-    if macs:
-        node_info.add_attribute(node_cache.MACS_ATTRIBUTE, macs)
-        LOG.info(_LI('Whitelisting MAC\'s %s on the firewall'), macs,
-                 node_info=node_info)
-        firewall.update_filters(ironic)
+def _background_introspect_locked(node_info, ironic, whitelisted=False):
+    # MAC's are already stored and whitelisted by introspect_many()
+    if not whitelisted:
+        # TODO(dtantsur): pagination
+        macs = list(node_info.ports())
+        if macs:
+            node_info.add_attribute(node_cache.MACS_ATTRIBUTE, macs)
+            LOG.info(_LI('Whitelisting MAC\'s %s on the firewall'), macs,
+                     node_info=node_info)
+            firewall.update_filters(ironic)
 
     attrs = node_info.attributes
     if CONF.processing.node_not_found_hook is None and not attrs:
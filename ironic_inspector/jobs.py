@@ -0,0 +1,232 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Background stages of introspection recorded in the database.
+
+With [processing]durable_jobs every stage submitted here is stored in the
+jobs table together with its arguments and a lease. The process running the
+stage renews the lease until the stage is over and deletes the job then.
+Jobs with expired leases, e.g. because the process running them was
+stopped, are claimed and run again by resume().
+"""
+
+import datetime
+import json
+
+import eventlet
+from oslo_config import cfg
+from oslo_utils import timeutils
+from oslo_utils import uuidutils
+
+from ironic_inspector.common.i18n import _, _LE, _LI, _LW
+from ironic_inspector import db
+from ironic_inspector import hash_ring
+from ironic_inspector import introspection_state as istate
+from ironic_inspector import node_cache
+from ironic_inspector import utils
+
+CONF = cfg.CONF
+LOG = utils.getProcessingLogger(__name__)
+
+# Owner of the leases taken by this process
+OWNER = uuidutils.generate_uuid()
+# Stage name -> function accepting NodeInfo and the stage arguments
+_HANDLERS = {}
+
+
+def register(stage):
+    """Decorator registering a function running a stage.
+
+    The function is called with a NodeInfo object, locked by the caller of
+    submit() or by resume(), and the keyword arguments passed to submit().
+    It has to record its outcome in the node status, exceptions are only
+    logged. It may be run again for the same node after a restart.
+
+    :param stage: stage name, stored in the database
+    """
+    def outer(func):
+        _HANDLERS[stage] = func
+        return func
+    return outer
+
+
+def submit(stage, node_info, local_kwargs=None, **kwargs):
+    """Run a stage for a node in background.
+
+    The lock of node_info, if any, is released when the stage is over.
+
+    :param stage: registered stage name
+    :param node_info: NodeInfo object
+    :param local_kwargs: optional dict of arguments of the stage, which are
+                         not stored in the database, e.g. large data. The
+                         stage is run without them when resumed.
+    :param kwargs: JSON serializable arguments of the stage
+    :returns: future of the stage
+    """
+    job_id = None
+    if CONF.processing.durable_jobs:
+        job_id = _create(stage, node_info.uuid, kwargs)
+    if local_kwargs:
+        kwargs = dict(kwargs, **local_kwargs)
+    return utils.executor().submit(_run, job_id, stage, node_info, kwargs)
+
+
+def _lease_expires_at():
+    return timeutils.utcnow() + datetime.timedelta(
+        seconds=CONF.processing.job_lease_time)
+
+
+def _create(stage, uuid, kwargs):
+    with db.ensure_transaction() as session:
+        job = db.Job(uuid=uuid, stage=stage, data=json.dumps(kwargs),
+                     created_at=timeutils.utcnow(), owner=OWNER,
+                     lease_expires_at=_lease_expires_at(), attempts=1)
+        job.save(session)
+        return job.id
+
+
+def _delete(job_id):
+    with db.ensure_transaction() as session:
+        db.model_query(db.Job, session=session).filter_by(
+            id=job_id, owner=OWNER).delete()
+
+
+def _renew(job_id):
+    """Renew the lease of a job.
+
+    :returns: whether the lease is still owned by this process
+    """
+    with db.ensure_transaction() as session:
+        return bool(db.model_query(db.Job, session=session).filter_by(
+            id=job_id, owner=OWNER).update(
+                {'lease_expires_at': _lease_expires_at()}))
+
+
+def _heartbeat(job_id, node_info):
+    interval = CONF.processing.job_lease_time / 3.0
+    while True:
+        eventlet.sleep(interval)
+        try:
+            if not _renew(job_id):
+                LOG.warning(_LW('Lease of background job %s was taken over '
+                                'by another process'), job_id,
+                            node_info=node_info)
+                return
+        except Exception:
+            LOG.exception(_LE('Failed to renew the lease of background '
+                              'job %s'), job_id, node_info=node_info)
+
+
+def _run(job_id, stage, node_info, kwargs):
+    heartbeat = None
+    if job_id is not None:
+        heartbeat = eventlet.spawn(_heartbeat, job_id, node_info)
+    try:
+        _HANDLERS[stage](node_info, **kwargs)
+    except Exception:
+        LOG.exception(_LE('Unexpected exception in background stage %s'),
+                      stage, node_info=node_info)
+    finally:
+        node_info.release_lock()
+        if heartbeat is not None:
+            heartbeat.kill()
+        if job_id is not None:
+            try:
+                _delete(job_id)
+            except Exception:
+                LOG.exception(_LE('Failed to delete background job %s'),
+                              job_id, node_info=node_info)
+
+
+def _claim(job):
+    """Take the expired lease of a job.
+
+    :returns: whether the lease was taken, another process may be faster
+    """
+    with db.ensure_transaction() as session:
+        return bool(db.model_query(db.Job, session=session).filter(
+            db.Job.id == job.id,
+            db.Job.lease_expires_at == job.lease_expires_at).update(
+                {'owner': OWNER,
+                 'lease_expires_at': _lease_expires_at(),
+                 'attempts': job.attempts + 1},
+                synchronize_session=False))
+
+
+def resume():
+    """Run again the jobs with expired leases.
+
+    Jobs of nodes handled by other processes (see hash_ring.owns), of
+    nodes locked by someone else, of unknown stages or run more than
+    [processing]job_max_attempts times are not run.
+
+    :returns: number of resumed jobs
+    """
+    if not CONF.processing.durable_jobs:
+        return 0
+
+    jobs = db.model_query(db.Job).filter(
+        db.Job.lease_expires_at < timeutils.utcnow()).all()
+    resumed = 0
+    for job in jobs:
+        if not hash_ring.owns(job.uuid):
+            continue
+
+        try:
+            node_info = node_cache.get_node(job.uuid, locked=False)
+        except utils.Error:
+            LOG.warning(_LW('Dropping background job %(job)s of node '
+                            '%(node)s which is no longer in the cache'),
+                        {'job': job.id, 'node': job.uuid})
+            db.model_query(db.Job).filter_by(id=job.id).delete()
+            continue
+
+        if not node_info.acquire_lock(blocking=False):
+            continue
+
+        try:
+            if not _claim(job):
+                continue
+
+            if job.stage not in _HANDLERS:
+                LOG.error(_LE('Dropping background job %(job)s of unknown '
+                              'stage %(stage)s'),
+                          {'job': job.id, 'stage': job.stage},
+                          node_info=node_info)
+                _delete(job.id)
+                continue
+
+            if job.attempts >= CONF.processing.job_max_attempts:
+                _delete(job.id)
+                try:
+                    node_info.fsm_event(istate.Events.error)
+                except utils.NodeStateInvalidEvent:
+                    pass
+                node_info.finished(
+                    error=_('Background stage %(stage)s was interrupted '
+                            '%(attempts)d times') %
+                    {'stage': job.stage, 'attempts': job.attempts})
+                continue
+
+            LOG.info(_LI('Resuming interrupted background stage %s'),
+                     job.stage, node_info=node_info)
+            utils.executor().submit(_run, job.id, job.stage, node_info,
+                                    json.loads(job.data or '{}'))
+            # The lock is now released by _run
+            node_info = None
+            resumed += 1
+        finally:
+            if node_info is not None:
+                node_info.release_lock()
+
+    return resumed
@@ -25,20 +25,20 @@ from futurist import periodics
 from oslo_config import cfg
 from oslo_log import log
 from oslo_utils import uuidutils
+import six
 import werkzeug
 
 from ironic_inspector import api_tools
 from ironic_inspector import db
 from ironic_inspector.common.i18n import _, _LC, _LE, _LI, _LW
 from ironic_inspector.common import ironic as ir_utils
-from ironic_inspector.common import swift
 from ironic_inspector import conf  # noqa
-from ironic_inspector import firewall
-from ironic_inspector import introspect
+from ironic_inspector import hash_ring
+from ironic_inspector import jobs
+from ironic_inspector import metrics
 from ironic_inspector import node_cache
 from ironic_inspector.plugins import base as plugins_base
-from ironic_inspector import process
-from ironic_inspector import rules
+from ironic_inspector import server
 from ironic_inspector import utils
 
 CONF = cfg.CONF
@@ -51,8 +51,10 @@ MINIMUM_API_VERSION = (1, 0)
 # TODO(dtantsur): set to the current version as soon we move setting IPMI
 # credentials support completely.
 DEFAULT_API_VERSION = (1, 8)
-CURRENT_API_VERSION = (1, 9)
+CURRENT_API_VERSION = (1, 12)
 _LOGGING_EXCLUDED_KEYS = ('logs',)
+# Hash ring key of the process synchronizing the node cache with Ironic
+_SYNC_WITH_IRONIC_KEY = 'sync_with_ironic'
 
 
 def _get_version():
@@ -85,6 +87,10 @@ def convert_exceptions(func):
     def wrapper(*args, **kwargs):
         try:
             return func(*args, **kwargs)
+        except utils.ServiceUnavailable as exc:
+            res = error_response(exc, exc.http_code)
+            res.headers['Retry-After'] = str(exc.retry_after)
+            return res
         except utils.Error as exc:
             return error_response(exc, exc.http_code)
         except werkzeug.exceptions.HTTPException as exc:
@@ -193,17 +199,29 @@ def version_root(version):
 @app.route('/v1/continue', methods=['POST'])
 @convert_exceptions
 def api_continue():
-    data = flask.request.get_json(force=True)
-    if not isinstance(data, dict):
-        raise utils.Error(_('Invalid data: expected a JSON object, got %s') %
-                          data.__class__.__name__)
+    from ironic_inspector import process
+
+    with metrics.measure('continue_duration_seconds'):
+        data = flask.request.get_json(force=True)
+        if not isinstance(data, dict):
+            raise utils.Error(_('Invalid data: expected a JSON object, '
+                                'got %s') % data.__class__.__name__)
 
-    logged_data = {k: (v if k not in _LOGGING_EXCLUDED_KEYS else '<hidden>')
-                   for k, v in data.items()}
-    LOG.debug("Received data from the ramdisk: %s", logged_data,
-              data=data)
+        logged_data = {k: (v if k not in _LOGGING_EXCLUDED_KEYS
+                           else '<hidden>')
+                       for k, v in data.items()}
+        LOG.debug("Received data from the ramdisk: %s", logged_data,
+                  data=data)
 
-    return flask.jsonify(process.process(data))
+        # Pass the request body as is, so that it's not copied before
+        # processing
+        if CONF.processing.async_continue:
+            result, queued = process.process_async(
+                data, raw_data=flask.request.get_data())
+            return flask.jsonify(result), 202 if queued else 200
+
+        return flask.jsonify(process.process(
+            data, raw_data=flask.request.get_data()))
 
 
 # TODO(sambetts) Add API discovery for this endpoint
@@ -213,6 +231,8 @@ def api_introspection(node_id):
     utils.check_auth(flask.request)
 
     if flask.request.method == 'POST':
+        from ironic_inspector import introspect
+
         new_ipmi_password = flask.request.args.get('new_ipmi_password',
                                                    type=str,
                                                    default=None)
@@ -234,14 +254,20 @@ def api_introspection(node_id):
         return '', 202
     else:
         node_info = node_cache.get_node(node_id)
-        return flask.json.jsonify(generate_introspection_status(node_info))
+        status = generate_introspection_status(node_info)
+        if CONF.processing.store_timings:
+            status['timings'] = node_info.options.get('timings')
+        return flask.json.jsonify(status)
 
 
-@app.route('/v1/introspection', methods=['GET'])
+@app.route('/v1/introspection', methods=['GET', 'POST'])
 @convert_exceptions
 def api_introspection_statuses():
     utils.check_auth(flask.request)
 
+    if flask.request.method == 'POST':
+        return _api_introspection_many()
+
     nodes = node_cache.get_node_list(
         marker=api_tools.marker_field(),
         limit=api_tools.limit_field(default=CONF.api_max_limit)
@@ -253,10 +279,39 @@ def api_introspection_statuses():
     return flask.json.jsonify(data)
 
 
+def _api_introspection_many():
+    if _get_version() < (1, 10):
+        raise utils.Error(_('Starting introspection of several nodes '
+                            'requires API version 1.10 or newer'))
+
+    data = flask.request.get_json(force=True)
+    node_ids = data.get('nodes') if isinstance(data, dict) else None
+    if (not isinstance(node_ids, list) or not node_ids or
+            not all(isinstance(node_id, six.string_types)
+                    for node_id in node_ids)):
+        raise utils.Error(_('Invalid data: expected a JSON object with '
+                            '"nodes" key containing a non-empty list of '
+                            'node UUIDs or names'))
+    if len(node_ids) > CONF.api_max_limit:
+        raise utils.Error(_('Too many nodes requested: %(count)d, at most '
+                            '%(max)d nodes can be introspected at once') %
+                          {'count': len(node_ids), 'max': CONF.api_max_limit})
+
+    from ironic_inspector import introspect
+
+    results = introspect.introspect_many(
+        node_ids, token=flask.request.headers.get('X-Auth-Token'))
+    res = flask.json.jsonify(nodes=results)
+    res.status_code = 202
+    return res
+
+
 @app.route('/v1/introspection/<node_id>/abort', methods=['POST'])
 @convert_exceptions
 def api_introspection_abort(node_id):
     utils.check_auth(flask.request)
+    from ironic_inspector import introspect
+
     introspect.abort(node_id, token=flask.request.headers.get('X-Auth-Token'))
     return '', 202
 
@@ -267,6 +322,8 @@ def api_introspection_data(node_id):
     utils.check_auth(flask.request)
 
     if CONF.processing.store_data == 'swift':
+        from ironic_inspector.common import swift
+
         if not uuidutils.is_uuid_like(node_id):
             node = ir_utils.get_node(node_id, fields=['uuid'])
             node_id = node.uuid
@@ -289,6 +346,8 @@ def api_introspection_reapply(node_id):
                                 'supported yet'), code=400)
 
     if CONF.processing.store_data == 'swift':
+        from ironic_inspector import process
+
         process.reapply(node_id)
         return '', 202
     else:
@@ -311,6 +370,7 @@ def rule_repr(rule, short):
 @convert_exceptions
 def api_rules():
     utils.check_auth(flask.request)
+    from ironic_inspector import rules
 
     if flask.request.method == 'GET':
         res = [rule_repr(rule, short=True) for rule in rules.get_all()]
@@ -337,6 +397,7 @@ def api_rules():
 @convert_exceptions
 def api_rule(uuid):
     utils.check_auth(flask.request)
+    from ironic_inspector import rules
 
     if flask.request.method == 'GET':
         rule = rules.get(uuid)
@@ -346,12 +407,29 @@ def api_rule(uuid):
         return '', 204
 
 
+@app.route('/v1/timings', methods=['GET'])
+@convert_exceptions
+def api_timings():
+    utils.check_auth(flask.request)
+    return flask.jsonify(timings=metrics.phase_histograms())
+
+
+@app.route('/metrics', methods=['GET'])
+@convert_exceptions
+def api_metrics():
+    if CONF.metrics_require_auth:
+        utils.check_auth(flask.request)
+    return metrics.render(), 200, {'Content-Type': metrics.CONTENT_TYPE}
+
+
 @app.errorhandler(404)
 def handle_404(error):
     return error_response(error, code=404)
 
 
 def periodic_update():  # pragma: no cover
+    from ironic_inspector import firewall
+
     try:
         firewall.update_filters()
     except Exception:
@@ -359,6 +437,8 @@ def periodic_update():  # pragma: no cover
 
 
 def periodic_clean_up():  # pragma: no cover
+    from ironic_inspector import firewall
+
     try:
         if node_cache.clean_up():
             firewall.update_filters()
@@ -367,7 +447,29 @@ def periodic_clean_up():  # pragma: no cover
         LOG.exception(_LE('Periodic clean up of node cache failed'))
 
 
+def periodic_heartbeat():  # pragma: no cover
+    try:
+        hash_ring.heartbeat()
+    except Exception:
+        LOG.exception(_LE('Periodic update of the hash ring failed'))
+
+
+def periodic_resume_jobs():  # pragma: no cover
+    # Registers the handlers of the background stages
+    from ironic_inspector import process  # noqa
+
+    try:
+        jobs.resume()
+    except Exception:
+        LOG.exception(_LE('Periodic resume of background jobs failed'))
+
+
 def sync_with_ironic():
+    # Every process listing all Ironic nodes would multiply the load on
+    # Ironic, only one of them does it for the whole cache
+    if not hash_ring.owns(_SYNC_WITH_IRONIC_KEY):
+        return
+
     ironic = ir_utils.get_client()
     # TODO(yuikotakada): pagination
     ironic_nodes = ironic.node.list(limit=0)
@@ -408,6 +510,7 @@ def create_ssl_context():
 
 class Service(object):
     _periodics_worker = None
+    _background = False
 
     def setup_logging(self, args):
         log.register_options(CONF)
@@ -428,7 +531,13 @@ class Service(object):
         LOG.debug("Configuration:")
         CONF.log_opt_values(LOG, log.DEBUG)
 
-    def init(self):
+    def init(self, background=True):
+        """Initialize the service.
+
+        :param background: whether to run the periodic tasks and manage
+                           the firewall in this process. Only one of the
+                           API worker processes does it.
+        """
         if CONF.auth_strategy != 'noauth':
             utils.add_auth_middleware(app)
         else:
@@ -440,6 +549,9 @@ class Service(object):
                             '"[processing] store_data" option if this is not '
                             'the desired behavior'))
         elif CONF.processing.store_data == 'swift':
+            # Registers the [swift] options
+            from ironic_inspector.common import swift  # noqa
+
             LOG.info(_LI('Introspection data will be stored in Swift in the '
                          'container %s'), CONF.swift.container)
 
@@ -459,26 +571,71 @@ class Service(object):
 
         LOG.info(_LI('Enabled processing hooks: %s'), hooks)
 
+        try:
+            plugins_base.lock_backend_manager()
+        except Exception as exc:
+            LOG.critical(_LC('Lock backend %(backend)s failed to load: '
+                             '%(error)s'),
+                         {'backend': CONF.locking.backend, 'error': exc})
+            sys.exit(1)
+
+        if background:
+            self._init_background()
+
+    def _init_background(self):
+        from ironic_inspector import firewall
+
+        self._background = True
+
+        if CONF.coordination.partition_periodic_tasks:
+            hash_ring.heartbeat()
+
         if CONF.firewall.manage_firewall:
             firewall.init()
 
+        if CONF.firewall.update_on_change:
+            firewall_update_period = CONF.firewall.safety_net_update_period
+        else:
+            firewall_update_period = CONF.firewall.firewall_update_period
         periodic_update_ = periodics.periodic(
-            spacing=CONF.firewall.firewall_update_period,
+            spacing=firewall_update_period,
             enabled=CONF.firewall.manage_firewall
         )(periodic_update)
         periodic_clean_up_ = periodics.periodic(
             spacing=CONF.clean_up_period
         )(periodic_clean_up)
+        periodic_resume_jobs_ = periodics.periodic(
+            spacing=CONF.processing.job_lease_time,
+            enabled=CONF.processing.durable_jobs,
+            run_immediately=True
+        )(periodic_resume_jobs)
+        periodic_heartbeat_ = periodics.periodic(
+            spacing=CONF.coordination.heartbeat_interval,
+            enabled=CONF.coordination.partition_periodic_tasks
+        )(periodic_heartbeat)
 
         self._periodics_worker = periodics.PeriodicWorker(
             callables=[(periodic_update_, None, None),
-                       (periodic_clean_up_, None, None)],
+                       (periodic_clean_up_, None, None),
+                       (periodic_resume_jobs_, None, None),
+                       (periodic_heartbeat_, None, None)],
             executor_factory=periodics.ExistingExecutor(utils.executor()))
         utils.executor().submit(self._periodics_worker.start)
 
     def shutdown(self):
         LOG.debug('Shutting down')
 
+        if self._background:
+            self._shutdown_background()
+
+        if utils.executor().alive:
+            utils.executor().shutdown(wait=True)
+
+        LOG.info(_LI('Shut down successfully'))
+
+    def _shutdown_background(self):
+        from ironic_inspector import firewall
+
         firewall.clean_up()
 
         if self._periodics_worker is not None:
@@ -486,14 +643,23 @@ class Service(object):
             self._periodics_worker.wait()
             self._periodics_worker = None
 
-        if utils.executor().alive:
-            utils.executor().shutdown(wait=True)
+        if CONF.coordination.partition_periodic_tasks:
+            try:
+                hash_ring.leave()
+            except Exception:
+                LOG.exception(_LE('Failed to remove this process from the '
+                                  'hash ring'))
 
-        LOG.info(_LI('Shut down successfully'))
+        self._background = False
 
     def run(self, args, application):
         self.setup_logging(args)
 
+        if CONF.api_workers:
+            server.Launcher(self, application,
+                            ssl_context=create_ssl_context()).run()
+            return
+
         app_kwargs = {'host': CONF.listen_address,
                       'port': CONF.listen_port}
 
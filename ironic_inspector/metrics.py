@@ -0,0 +1,332 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-memory metrics in the Prometheus text exposition format.
+
+With several API worker processes every worker records its own values and
+writes them to a file in a directory common to all workers, see share().
+Any worker then reports the values of all of them.
+"""
+
+import contextlib
+import errno
+import json
+import os
+import threading
+
+from oslo_utils import timeutils
+import six
+
+from ironic_inspector import timing
+from ironic_inspector import utils
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+PREFIX = 'ironic_inspector_'
+
+# Metric name -> (type, description)
+METRICS = {
+    'introspection_started_total': (
+        'counter', 'Number of started introspections.'),
+    'introspection_finished_total': (
+        'counter', 'Number of introspections finished successfully by the '
+        'state they were finished in.'),
+    'introspection_errored_total': (
+        'counter', 'Number of introspections finished with an error by the '
+        'state they were finished in.'),
+    'continue_duration_seconds': (
+        'histogram', 'Duration of ramdisk callback requests.'),
+    'continue_queue_length': (
+        'gauge', 'Number of ramdisk callbacks being processed or waiting '
+        'to be processed in background.'),
+    'processing_phase_duration_seconds': (
+        'histogram', 'Duration of introspection data processing phases.'),
+    'executor_queued_tasks': (
+        'gauge', 'Number of background tasks waiting for a free worker.'),
+    'executor_active_workers': (
+        'gauge', 'Number of workers running background tasks.'),
+    'firewall_update_duration_seconds': (
+        'histogram', 'Duration of firewall updates.'),
+    'firewall_blacklisted_macs': (
+        'gauge', 'Number of MAC addresses blacklisted by the last firewall '
+        'update.'),
+    'db_query_duration_seconds': (
+        'histogram', 'Duration of database queries by statement type.'),
+    'ironic_request_duration_seconds': (
+        'histogram', 'Duration of Ironic API calls.'),
+    'ironic_request_errors_total': (
+        'counter', 'Number of failed Ironic API calls.'),
+    'swift_request_duration_seconds': (
+        'histogram', 'Duration of Swift API calls.'),
+    'swift_request_errors_total': (
+        'counter', 'Number of failed Swift API calls.'),
+}
+
+# Metric name -> dict of sorted label pairs -> value or timing.Histogram
+_VALUES = {}
+_LOCK = threading.Lock()
+# Tuple (directory, index of this worker) when values are shared between
+# API workers
+_SHARED = None
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def increment(name, value=1, **labels):
+    """Increment a counter.
+
+    :param name: metric name without the prefix
+    :param value: increment
+    :param labels: metric labels
+    """
+    with _LOCK:
+        values = _VALUES.setdefault(name, {})
+        key = _key(labels)
+        values[key] = values.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    """Set value of a gauge.
+
+    :param name: metric name without the prefix
+    :param value: new value
+    :param labels: metric labels
+    """
+    with _LOCK:
+        _VALUES.setdefault(name, {})[_key(labels)] = value
+
+
+def observe(name, value, **labels):
+    """Record a duration in a histogram.
+
+    :param name: metric name without the prefix
+    :param value: duration in seconds
+    :param labels: metric labels
+    """
+    with _LOCK:
+        values = _VALUES.setdefault(name, {})
+        key = _key(labels)
+        try:
+            histogram = values[key]
+        except KeyError:
+            histogram = values[key] = timing.Histogram()
+        histogram.observe(value)
+
+
+@contextlib.contextmanager
+def measure(name, errors=None, **labels):
+    """Context manager recording its duration in a histogram.
+
+    :param name: histogram name without the prefix
+    :param errors: optional name of a counter to increment on exceptions
+    :param labels: metric labels
+    """
+    watch = timeutils.StopWatch().start()
+    try:
+        yield
+    except Exception:
+        if errors is not None:
+            increment(errors, **labels)
+        raise
+    finally:
+        observe(name, watch.elapsed(), **labels)
+
+
+def reset():
+    """Drop all recorded values."""
+    with _LOCK:
+        _VALUES.clear()
+
+
+def _executor_gauges():
+    """Get statistics of the background executor."""
+    executor = utils.executor()
+    return {'executor_queued_tasks': {(): executor.queued},
+            'executor_active_workers': {(): executor.active}}
+
+
+def _escape(value):
+    return (six.text_type(value).replace('\\', r'\\')
+            .replace('\n', r'\n').replace('"', r'\"'))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value))
+                             for (name, value) in labels)
+
+
+def _format_value(value):
+    if value is None:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_histogram(name, labels, histogram):
+    lines = []
+    for bucket in histogram['buckets']:
+        bucket_labels = labels + (('le', _format_value(bucket['le'])),)
+        lines.append('%s_bucket%s %d' % (name, _format_labels(bucket_labels),
+                                         bucket['count']))
+    lines.append('%s_sum%s %s' % (name, _format_labels(labels),
+                                  _format_value(histogram['sum'])))
+    lines.append('%s_count%s %d' % (name, _format_labels(labels),
+                                    histogram['count']))
+    return lines
+
+
+def _values():
+    """Get all values of this process, histograms converted to dicts."""
+    with _LOCK:
+        values = {name: {key: (value.as_dict()
+                               if isinstance(value, timing.Histogram)
+                               else value)
+                         for (key, value) in metric.items()}
+                  for (name, metric) in _VALUES.items()}
+    values.update(_executor_gauges())
+    values['processing_phase_duration_seconds'] = {
+        (('phase', phase),): histogram
+        for (phase, histogram) in timing.histograms().items()}
+    return values
+
+
+def share(directory, worker):
+    """Share values of this API worker with the other workers.
+
+    Afterwards render() and phase_histograms() return values of all workers
+    which called share() with the same directory. Values of other workers
+    are as recent as their last dump().
+
+    :param directory: directory common to all workers
+    :param worker: index of this worker, stable across restarts
+    """
+    global _SHARED
+    _SHARED = (directory, str(worker))
+    dump()
+
+
+def dump():
+    """Write values of this worker to its file in the shared directory."""
+    directory, worker = _SHARED
+    data = {name: [[list(key), value] for (key, value) in metric.items()]
+            for (name, metric) in _values().items()}
+    path = os.path.join(directory, '%s.json' % worker)
+    # Renaming makes sure other workers never read a partial file
+    with open(path + '.tmp', 'w') as fp:
+        json.dump(data, fp)
+    os.rename(path + '.tmp', path)
+
+
+def remove_shared(directory, workers):
+    """Remove files of workers with index equal to or above the given one.
+
+    :param directory: directory passed to share()
+    :param workers: number of workers still running
+    """
+    for name in os.listdir(directory):
+        worker, ext = os.path.splitext(name)
+        if ext == '.json' and int(worker) >= workers:
+            os.unlink(os.path.join(directory, name))
+
+
+def _load(path):
+    try:
+        with open(path) as fp:
+            data = json.load(fp)
+    except EnvironmentError as exc:
+        # The worker may have been removed in the meantime
+        if exc.errno == errno.ENOENT:
+            return {}
+        raise
+    return {name: {tuple(tuple(label) for label in key): value
+                   for (key, value) in metric}
+            for (name, metric) in data.items()}
+
+
+def _worker_values():
+    """Get values of all workers.
+
+    :returns: dict worker index (None if not shared) -> values
+    """
+    if _SHARED is None:
+        return {None: _values()}
+
+    directory, worker = _SHARED
+    result = {}
+    for name in os.listdir(directory):
+        index, ext = os.path.splitext(name)
+        if ext == '.json' and index != worker:
+            result[index] = _load(os.path.join(directory, name))
+    result[worker] = _values()
+    return result
+
+
+def _add_histograms(first, second):
+    return {'count': first['count'] + second['count'],
+            'sum': first['sum'] + second['sum'],
+            'min': min(first['min'], second['min']),
+            'max': max(first['max'], second['max']),
+            'buckets': [{'le': bucket1['le'],
+                         'count': bucket1['count'] + bucket2['count']}
+                        for (bucket1, bucket2) in zip(first['buckets'],
+                                                      second['buckets'])]}
+
+
+def phase_histograms():
+    """Get histograms of the processing phases of all API workers.
+
+    :returns: dict phase name -> histogram as returned by
+              timing.histograms(), summed up over the workers
+    """
+    result = {}
+    for values in _worker_values().values():
+        for key, histogram in values.get('processing_phase_duration_seconds',
+                                         {}).items():
+            phase = dict(key)['phase']
+            if phase in result:
+                histogram = _add_histograms(result[phase], histogram)
+            result[phase] = histogram
+    return result
+
+
+def render():
+    """Render all metrics in the Prometheus text exposition format.
+
+    If values are shared between API workers, every series is labeled with
+    the index of its ``worker``.
+
+    :returns: text
+    """
+    values = {}
+    for worker, worker_values in _worker_values().items():
+        extra = () if worker is None else (('worker', worker),)
+        for name, metric in worker_values.items():
+            for key, value in metric.items():
+                values.setdefault(name, {})[key + extra] = value
+
+    lines = []
+    for name in sorted(METRICS):
+        metric_type, description = METRICS[name]
+        full_name = PREFIX + name
+        lines.append('# HELP %s %s' % (full_name, description))
+        lines.append('# TYPE %s %s' % (full_name, metric_type))
+        for key, value in sorted(values.get(name, {}).items()):
+            if metric_type == 'histogram':
+                lines.extend(_format_histogram(full_name, key, value))
+            else:
+                lines.append('%s%s %s' % (full_name, _format_labels(key),
+                                          _format_value(value)))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,47 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Add jobs
+
+Revision ID: 3c7b6ea3a25e
+Revises: 8ae167f0065e
+Create Date: 2026-10-16 14:02:51.730942
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3c7b6ea3a25e'
+down_revision = '8ae167f0065e'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+def upgrade():
+    op.create_table(
+        'jobs',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('uuid', sa.String(36), sa.ForeignKey('nodes.uuid'),
+                  nullable=False),
+        sa.Column('stage', sa.String(255), nullable=False),
+        sa.Column('data', sa.Text().with_variant(mysql.LONGTEXT(), 'mysql')),
+        sa.Column('created_at', sa.DateTime, nullable=False),
+        sa.Column('owner', sa.String(36)),
+        sa.Column('lease_expires_at', sa.DateTime, nullable=False),
+        sa.Column('attempts', sa.Integer, nullable=False),
+        mysql_ENGINE='InnoDB',
+        mysql_DEFAULT_CHARSET='UTF8'
+    )
+    op.create_index('ix_jobs_lease_expires_at', 'jobs', ['lease_expires_at'])
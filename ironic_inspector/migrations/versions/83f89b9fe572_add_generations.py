@@ -0,0 +1,39 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Add generations
+
+Revision ID: 83f89b9fe572
+Revises: c0cd6dacb7e9
+Create Date: 2026-10-16 20:41:12.503418
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '83f89b9fe572'
+down_revision = 'c0cd6dacb7e9'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    generations = op.create_table(
+        'generations',
+        sa.Column('name', sa.String(255), primary_key=True),
+        sa.Column('value', sa.Integer, nullable=False),
+        mysql_ENGINE='InnoDB',
+        mysql_DEFAULT_CHARSET='UTF8'
+    )
+    op.bulk_insert(generations, [{'name': 'rules', 'value': 0}])
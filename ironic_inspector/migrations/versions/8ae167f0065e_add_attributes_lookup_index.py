@@ -0,0 +1,32 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Add look up index on attributes
+
+Revision ID: 8ae167f0065e
+Revises: d00d6e3f38c4
+Create Date: 2026-10-16 10:12:43.518214
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8ae167f0065e'
+down_revision = 'd00d6e3f38c4'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+
+
+def upgrade():
+    op.create_index('ix_attributes_name_value_uuid', 'attributes',
+                    ['name', 'value', 'uuid'])
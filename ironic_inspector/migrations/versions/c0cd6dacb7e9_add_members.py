@@ -0,0 +1,39 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Add members
+
+Revision ID: c0cd6dacb7e9
+Revises: e20e972ba7c0
+Create Date: 2026-10-16 16:05:42.091377
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c0cd6dacb7e9'
+down_revision = 'e20e972ba7c0'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'members',
+        sa.Column('id', sa.String(36), primary_key=True),
+        sa.Column('host', sa.String(255)),
+        sa.Column('heartbeat_at', sa.DateTime, nullable=False),
+        mysql_ENGINE='InnoDB',
+        mysql_DEFAULT_CHARSET='UTF8'
+    )
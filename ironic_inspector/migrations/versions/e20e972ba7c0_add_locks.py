@@ -0,0 +1,39 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Add locks
+
+Revision ID: e20e972ba7c0
+Revises: 3c7b6ea3a25e
+Create Date: 2026-10-16 15:21:07.418203
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e20e972ba7c0'
+down_revision = '3c7b6ea3a25e'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'locks',
+        sa.Column('name', sa.String(255), primary_key=True),
+        sa.Column('owner', sa.String(36), nullable=False),
+        sa.Column('expires_at', sa.DateTime, nullable=False),
+        mysql_ENGINE='InnoDB',
+        mysql_DEFAULT_CHARSET='UTF8'
+    )
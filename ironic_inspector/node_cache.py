@@ -18,10 +18,12 @@ import copy
 import datetime
 import json
 import six
+import sys
+import threading
 
 from automaton import exceptions as automaton_errors
+import eventlet
 from ironicclient import exceptions
-from oslo_concurrency import lockutils
 from oslo_config import cfg
 from oslo_db import exception as db_exc
 from oslo_db.sqlalchemy import utils as db_utils
@@ -30,12 +32,15 @@ from oslo_utils import reflection
 from oslo_utils import timeutils
 from oslo_utils import uuidutils
 from sqlalchemy.orm import exc as orm_errors
-from sqlalchemy import text
+from sqlalchemy import sql
 
 from ironic_inspector import db
 from ironic_inspector.common.i18n import _, _LE, _LW, _LI
 from ironic_inspector.common import ironic as ir_utils
+from ironic_inspector import hash_ring
 from ironic_inspector import introspection_state as istate
+from ironic_inspector import metrics
+from ironic_inspector.plugins import base as plugins_base
 from ironic_inspector import utils
 
 
@@ -47,18 +52,126 @@ LOG = utils.getProcessingLogger(__name__)
 
 MACS_ATTRIBUTE = 'mac'
 _LOCK_TEMPLATE = 'node-%s'
-_SEMAPHORES = lockutils.Semaphores()
 
 
 def _get_lock(uuid):
-    """Get lock object for a given node UUID."""
-    return lockutils.internal_lock(_LOCK_TEMPLATE % uuid,
-                                   semaphores=_SEMAPHORES)
+    """Get lock object for a given node UUID.
+
+    The lock comes from the backend set by [locking]backend.
+    """
+    return plugins_base.lock_backend_manager().driver.get_lock(
+        _LOCK_TEMPLATE % uuid)
 
 
+@contextlib.contextmanager
 def _get_lock_ctx(uuid):
     """Get context manager yielding a lock object for a given node UUID."""
-    return lockutils.lock(_LOCK_TEMPLATE % uuid, semaphores=_SEMAPHORES)
+    lock = _get_lock(uuid)
+    lock.acquire()
+    try:
+        yield lock
+    finally:
+        lock.release()
+
+
+class _LookupIndex(object):
+    """In-memory index of look up attributes of nodes on introspection.
+
+    Mirrors the attributes table. It is loaded from the database on first
+    usage, updated after every successful change of the table made by this
+    process and reloaded on every clean up to fix possible discrepancies.
+    Only used if the lookup_index option is enabled.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # attribute name -> attribute value -> set of node UUID's
+        self._by_name = None
+        # node UUID -> set of (attribute name, attribute value)
+        self._by_uuid = None
+
+    def _load(self):
+        by_name = {}
+        by_uuid = {}
+        rows = db.model_query(db.Attribute.name, db.Attribute.value,
+                              db.Attribute.uuid)
+        for row in rows:
+            by_name.setdefault(row.name, {}).setdefault(
+                row.value, set()).add(row.uuid)
+            by_uuid.setdefault(row.uuid, set()).add((row.name, row.value))
+        return by_name, by_uuid
+
+    def _ensure_loaded(self):
+        if self._by_name is None:
+            self._by_name, self._by_uuid = self._load()
+
+    def reload(self):
+        """Reload the index from the database."""
+        if not CONF.lookup_index:
+            self._by_name = self._by_uuid = None
+            return
+
+        # The lock is held while reading the database, so that updates
+        # committed after the read are applied to the new index
+        with self._lock:
+            old = self._by_name
+            self._by_name, self._by_uuid = self._load()
+        if old is not None and old != self._by_name:
+            LOG.warning(_LW('In-memory look up index was out of sync with '
+                            'the database, reloaded'))
+
+    def add(self, uuid, name, values):
+        """Add attribute values of a node, already committed to the DB."""
+        if not CONF.lookup_index:
+            return
+
+        with self._lock:
+            # Not loaded yet, the values will be loaded from the database
+            if self._by_name is None:
+                return
+            for value in values:
+                self._by_name.setdefault(name, {}).setdefault(
+                    value, set()).add(uuid)
+                self._by_uuid.setdefault(uuid, set()).add((name, value))
+
+    def remove(self, uuid):
+        """Remove all attributes of a node, already removed from the DB."""
+        if not CONF.lookup_index:
+            return
+
+        with self._lock:
+            if self._by_name is None:
+                return
+            for name, value in self._by_uuid.pop(uuid, ()):
+                values = self._by_name.get(name, {})
+                uuids = values.get(value, set())
+                uuids.discard(uuid)
+                if not uuids:
+                    values.pop(value, None)
+
+    def find(self, attributes):
+        """Find UUID's of nodes matching any of the attributes.
+
+        :param attributes: dict attribute name -> list of values.
+        :returns: set of node UUID's.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            found = set()
+            for name, values in attributes.items():
+                known = self._by_name.get(name, {})
+                for value in values:
+                    found.update(known.get(value, ()))
+            return found
+
+    def values(self, name):
+        """Get all values of an attribute."""
+        with self._lock:
+            self._ensure_loaded()
+            return set(self._by_name.get(name, ()))
+
+
+_LOOKUP_INDEX = _LookupIndex()
 
 
 class NodeInfo(object):
@@ -90,6 +203,14 @@ class NodeInfo(object):
         # Whether lock was acquired using this NodeInfo object
         self._locked = lock is not None
         self._fsm = None
+        # Serializes node updates, see patch()
+        self._patch_lock = threading.Lock()
+        # Patches buffered by batch_patches() and node fields with them
+        # applied, None when not batching
+        self._pending_patches = None
+        self._pending_fields = None
+        # Counter incremented by finished() once the final state is known
+        self._finished_metric = None
 
     def __del__(self):
         if self._locked:
@@ -187,6 +308,10 @@ class NodeInfo(object):
     def _set_state(self, value):
         self._commit(state=value)
         self._state = value
+        if (self._finished_metric is not None and
+                value in (istate.States.finished, istate.States.error)):
+            metrics.increment(self._finished_metric, state=value)
+            self._finished_metric = None
 
     def _get_fsm(self):
         """Get an fsm instance initialized with self.state."""
@@ -276,7 +401,8 @@ class NodeInfo(object):
     def finished(self, error=None):
         """Record status for this node.
 
-        Also deletes look up attributes from the cache.
+        Also deletes look up attributes from the cache and drops the node
+        from the cache of Ironic objects.
 
         :param error: error message
         """
@@ -292,32 +418,64 @@ class NodeInfo(object):
             db.model_query(db.Option, session=session).filter_by(
                 uuid=self.uuid).delete()
 
+        _LOOKUP_INDEX.remove(self.uuid)
+        ir_utils.CACHE.invalidate(self.uuid)
+        _firewall_changed()
+        metric = ('introspection_errored_total' if error
+                  else 'introspection_finished_total')
+        if self.state in (istate.States.finished, istate.States.error):
+            metrics.increment(metric, state=self.state)
+        else:
+            # The final state is set by the transition following this call
+            self._finished_metric = metric
+
     def add_attribute(self, name, value, session=None):
         """Store look up attribute for a node in the database.
 
         :param name: attribute name
         :param value: attribute value or list of possible values
-        :param session: optional existing database session
+        :param session: optional existing database session, the caller is
+                        responsible for updating the look up index then
         :raises: Error if attributes values are already in database
         """
         if not isinstance(value, list):
             value = [value]
 
+        self._add_attributes({name: value}, session=session)
+
+    def _add_attributes(self, attributes, session=None):
+        """Store several look up attributes with one INSERT statement.
+
+        :param attributes: dict attribute name -> list of values
+        :param session: optional existing database session, the caller is
+                        responsible for updating the look up index then
+        :raises: Error if attributes values are already in database
+        """
+        rows = [{'name': name, 'value': v, 'uuid': self.uuid}
+                for (name, value) in sorted(attributes.items())
+                for v in value]
+        if not rows:
+            return
+
+        own_transaction = session is None
         with db.ensure_transaction(session) as session:
             try:
-                for v in value:
-                    db.Attribute(name=name, value=v, uuid=self.uuid).save(
-                        session)
+                session.bulk_insert_mappings(db.Attribute, rows)
             except db_exc.DBDuplicateEntry as exc:
                 LOG.error(_LE('Database integrity error %s during '
                               'adding attributes'), exc, node_info=self)
                 raise utils.Error(_(
-                    'Some or all of %(name)s\'s %(value)s are already '
-                    'on introspection') % {'name': name, 'value': value},
+                    'Some or all of %s are already on introspection') %
+                    ', '.join('%s\'s %s' % item
+                              for item in sorted(attributes.items())),
                     node_info=self)
             # Invalidate attributes so they're loaded on next usage
             self._attributes = None
 
+        if own_transaction:
+            for (name, value) in attributes.items():
+                _LOOKUP_INDEX.add(self.uuid, name, value)
+
     @classmethod
     def from_row(cls, row, ironic=None, lock=None, node=None):
         """Construct NodeInfo from a database row."""
@@ -338,15 +496,27 @@ class NodeInfo(object):
         self._version_id = None
 
     def node(self, ironic=None):
-        """Get Ironic node object associated with the cached node record."""
+        """Get Ironic node object associated with the cached node record.
+
+        Updates buffered by batch_patches() are reflected in the result.
+        The node may come from the cache of Ironic objects shared between
+        NodeInfo instances, see [ironic]cache_ttl, so it must not be
+        modified in place, use patch() and the update_* methods.
+        """
         if self._node is None:
             ironic = ironic or self.ironic
-            self._node = ir_utils.get_node(self.uuid, ironic=ironic)
+            self._node = ir_utils.get_node(self.uuid, ironic=ironic,
+                                           cached=True)
+        if self._pending_fields:
+            return _PendingNode(self._node, self._pending_fields)
         return self._node
 
     def create_ports(self, ports, ironic=None):
         """Create one or several ports for this node.
 
+        Ports are created concurrently, at most ``[ironic]max_concurrency``
+        at a time.
+
         :param ports: List of ports with all their attributes
                       e.g  [{'mac': xx, 'ip': xx, 'client_id': None},
                             {'mac': xx, 'ip': None, 'client_id': None}]
@@ -355,6 +525,7 @@ class NodeInfo(object):
         :param ironic: Ironic client to use instead of self.ironic
         """
         existing_macs = []
+        new_ports = {}
         for port in ports:
             mac = port
             extra = {}
@@ -364,8 +535,8 @@ class NodeInfo(object):
                 if client_id:
                     extra = {'client-id': client_id}
 
-            if mac not in self.ports():
-                self._create_port(mac, ironic=ironic, extra=extra)
+            if mac not in self.ports() and mac not in new_ports:
+                new_ports[mac] = extra
             else:
                 existing_macs.append(mac)
 
@@ -373,51 +544,181 @@ class NodeInfo(object):
             LOG.warning(_LW('Did not create ports %s as they already exist'),
                         existing_macs, node_info=self)
 
+        if new_ports:
+            self._create_ports(new_ports, ironic=ironic)
+
+    def _create_ports(self, new_ports, ironic=None):
+        """Create ports concurrently.
+
+        :param new_ports: dict MAC -> port extra
+        :param ironic: Ironic client to use instead of self.ironic
+        """
+        ironic = ironic or self.ironic
+        pool = eventlet.GreenPool(CONF.ironic.max_concurrency)
+        threads = [(mac, pool.spawn(self._create_port, mac, ironic=ironic,
+                                    extra=extra))
+                   for (mac, extra) in sorted(new_ports.items())]
+
+        conflicts = []
+        created = False
+        error = None
+        for mac, thread in threads:
+            try:
+                port = thread.wait()
+            except Exception:
+                error = error or sys.exc_info()
+                continue
+
+            if port is None:
+                conflicts.append(mac)
+            else:
+                created = True
+                if self._ports is not None:
+                    self._ports[mac] = port
+
+        if conflicts:
+            LOG.warning(_LW('Ports %s already exist, skipping'),
+                        conflicts, node_info=self)
+            # NOTE(dtantsur): we didn't get port objects back, so we have to
+            # reload ports on next access
+            self._ports = None
+            ir_utils.CACHE.invalidate(self.uuid)
+        elif created:
+            ir_utils.CACHE.store_ports(self.uuid, self._ports)
+        if created:
+            _firewall_changed()
+        if error is not None:
+            six.reraise(*error)
+
     def ports(self, ironic=None):
         """Get Ironic port objects associated with the cached node record.
 
-        This value is cached as well, use invalidate_cache() to clean.
+        This value is cached as well, use invalidate_cache() to clean. It may
+        come from the cache of Ironic objects shared between NodeInfo
+        instances, see [ironic]cache_ttl.
 
         :return: dict MAC -> port object
         """
+        if self._ports is None:
+            self._ports = ir_utils.CACHE.get_ports(self.uuid)
         if self._ports is None:
             ironic = ironic or self.ironic
             self._ports = {p.address: p for p in
                            ironic.node.list_ports(self.uuid, limit=0)}
+            ir_utils.CACHE.store_ports(self.uuid, self._ports)
         return self._ports
 
     def _create_port(self, mac, ironic=None, extra=None):
+        """Create a port.
+
+        :returns: the new port or None if it already exists
+        """
         ironic = ironic or self.ironic
         try:
-            port = ironic.port.create(
+            return ironic.port.create(
                 node_uuid=self.uuid, address=mac, extra=extra)
         except exceptions.Conflict:
-            LOG.warning(_LW('Port %s already exists, skipping'),
-                        mac, node_info=self)
-            # NOTE(dtantsur): we didn't get port object back, so we have to
-            # reload ports on next access
-            self._ports = None
-        else:
-            self._ports[mac] = port
+            return None
 
     def patch(self, patches, ironic=None):
         """Apply JSON patches to a node.
 
-        Refreshes cached node instance.
+        Refreshes cached node instance. Inside batch_patches() the patches
+        are only recorded and applied to the cached node instance.
 
         :param patches: JSON patches to apply
         :param ironic: Ironic client to use instead of self.ironic
         :raises: ironicclient exceptions
         """
-        ironic = ironic or self.ironic
         # NOTE(aarefiev): support path w/o ahead forward slash
         # as Ironic cli does
         for patch in patches:
             if patch.get('path') and not patch['path'].startswith('/'):
                 patch['path'] = '/' + patch['path']
 
+        # Hooks may patch the node concurrently, make sure that the cached
+        # node is the result of the last update
+        with self._patch_lock:
+            if self._pending_patches is not None:
+                LOG.debug('Delaying node update with patches %s', patches,
+                          node_info=self)
+                node = self.node(ironic)
+                for patch in patches:
+                    _apply_patch(node, self._pending_fields, patch)
+                self._pending_patches.append(patches)
+            else:
+                self._update(patches, ironic)
+
+    def _update(self, patches, ironic=None):
+        """Send JSON patches to Ironic, must be called with the patch lock."""
+        ironic = ironic or self.ironic
         LOG.debug('Updating node with patches %s', patches, node_info=self)
         self._node = ironic.node.update(self.uuid, patches)
+        ir_utils.CACHE.store_node(self._node)
+
+    @contextlib.contextmanager
+    def batch_patches(self, ironic=None):
+        """Context manager combining node updates into one PATCH request.
+
+        Patches passed to patch() and the methods using it are buffered in
+        order and sent to Ironic on exit. Until then node() returns the node
+        with the buffered patches applied. If Ironic rejects the combined
+        request as invalid, the patches are sent one call at a time, so that
+        the error is raised for the update that caused it. If an exception
+        is raised inside the context, the buffered patches are still sent
+        before it is re-raised, errors sending them are only logged.
+
+        Nested calls are no-op.
+
+        :param ironic: Ironic client to use instead of self.ironic
+        :raises: ironicclient exceptions
+        """
+        if self._pending_patches is not None:
+            yield
+            return
+
+        self._pending_patches = []
+        self._pending_fields = {}
+        try:
+            yield
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                # Updates made before the failure, e.g. by the hooks that
+                # succeeded, are kept as without batching
+                try:
+                    self._send_pending_patches(ironic)
+                except Exception:
+                    LOG.exception(_LE('Failed to apply node updates made '
+                                      'before the failure'), node_info=self)
+                    # The cached node has the updates applied
+                    self._node = None
+        else:
+            self._send_pending_patches(ironic)
+        finally:
+            with self._patch_lock:
+                self._pending_patches = None
+                self._pending_fields = None
+
+    def _send_pending_patches(self, ironic=None):
+        """Stop buffering patches and send the buffered ones to Ironic."""
+        with self._patch_lock:
+            pending = self._pending_patches
+            self._pending_patches = None
+            self._pending_fields = None
+            if not pending:
+                return
+
+            try:
+                self._update([patch for patches in pending
+                              for patch in patches], ironic)
+            except exceptions.BadRequest as exc:
+                if len(pending) == 1:
+                    raise
+                LOG.warning(_LW('Failed to update the node with the '
+                                'combined patch: %s, applying updates one '
+                                'by one'), exc, node_info=self)
+                for patches in pending:
+                    self._update(patches, ironic)
 
     def patch_port(self, port, patches, ironic=None):
         """Apply JSON patches to a port.
@@ -436,6 +737,7 @@ class NodeInfo(object):
                   node_info=self)
         new_port = ironic.port.update(port.uuid, patches)
         ports[port.address] = new_port
+        ir_utils.CACHE.store_ports(self.uuid, ports)
 
     def update_properties(self, ironic=None, **props):
         """Update properties on a node.
@@ -474,6 +776,7 @@ class NodeInfo(object):
 
         ironic.port.delete(port.uuid)
         del ports[port.address]
+        ir_utils.CACHE.store_ports(self.uuid, ports)
 
     def get_by_path(self, path):
         """Get field value by ironic-style path (e.g. /extra/foo).
@@ -519,6 +822,66 @@ class NodeInfo(object):
             self.patch([{'op': op, 'path': path, 'value': value}], ironic)
 
 
+class _PendingNode(object):
+    """Ironic node with delayed updates applied.
+
+    :param node: Ironic node object
+    :param fields: dict field name -> updated value
+    """
+
+    def __init__(self, node, fields):
+        self._node = node
+        self._fields = fields
+
+    def __getattr__(self, name):
+        try:
+            return self._fields[name]
+        except KeyError:
+            return getattr(self._node, name)
+
+    def to_dict(self):
+        return dict(self._node.to_dict(), **copy.deepcopy(self._fields))
+
+
+def _apply_patch(node, fields, patch):
+    """Apply one JSON patch to the updated node fields.
+
+    :param node: node object to take values of the fields not updated yet
+    :param fields: dict field name -> updated value, modified in place
+    :param patch: JSON patch with "add", "replace" or "remove" operation
+    """
+    path = [item.replace('~1', '/').replace('~0', '~')
+            for item in patch['path'].strip('/').split('/')]
+    field = path[0]
+    if len(path) == 1:
+        fields[field] = (None if patch['op'] == 'remove'
+                         else copy.deepcopy(patch['value']))
+        return
+
+    if field not in fields:
+        fields[field] = copy.deepcopy(getattr(node, field))
+    target = fields[field]
+    for item in path[1:-1]:
+        if isinstance(target, list):
+            target = target[int(item)]
+        else:
+            target = target.setdefault(item, {})
+
+    key = path[-1]
+    if isinstance(target, list):
+        index = len(target) if key == '-' else int(key)
+        if patch['op'] == 'remove':
+            target.pop(index)
+        elif patch['op'] == 'add':
+            target.insert(index, copy.deepcopy(patch['value']))
+        else:
+            target[index] = copy.deepcopy(patch['value'])
+    elif patch['op'] == 'remove':
+        target.pop(key, None)
+    else:
+        target[key] = copy.deepcopy(patch['value'])
+
+
 def triggers_fsm_error_transition(errors=(Exception,),
                                   no_errors=(utils.NodeStateInvalidEvent,
                                              utils.NodeStateRaceCondition)):
@@ -668,7 +1031,9 @@ def start_introspection(uuid, **kwargs):
             state = istate.States.starting
         else:
             state = node_info.state
-        return add_node(uuid, state, **kwargs)
+        node_info = add_node(uuid, state, **kwargs)
+    metrics.increment('introspection_started_total')
+    return node_info
 
 
 def add_node(uuid, state, **attributes):
@@ -684,20 +1049,181 @@ def add_node(uuid, state, **attributes):
     :returns: NodeInfo
     """
     started_at = timeutils.utcnow()
+    ironic = attributes.pop('ironic', None)
+    attributes = _normalize_attributes(attributes)
     with db.ensure_transaction() as session:
-        _delete_node(uuid)
+        _delete_node(uuid, session=session)
         db.Node(uuid=uuid, state=state, started_at=started_at).save(session)
 
         node_info = NodeInfo(uuid=uuid, state=state, started_at=started_at,
-                             ironic=attributes.pop('ironic', None))
-        for (name, value) in attributes.items():
-            if not value:
-                continue
-            node_info.add_attribute(name, value, session=session)
+                             ironic=ironic)
+        node_info._add_attributes(attributes, session=session)
 
+    for (name, value) in attributes.items():
+        _LOOKUP_INDEX.add(uuid, name, value)
+    _firewall_changed()
     return node_info
 
 
+def _normalize_attributes(attributes):
+    """Convert attribute values to lists, skipping empty values."""
+    return {name: value if isinstance(value, list) else [value]
+            for (name, value) in attributes.items() if value}
+
+
+def start_introspection_many(nodes, ironic=None):
+    """Start the introspection of several nodes at once.
+
+    Equivalent to calling start_introspection() for every node, except that
+    the start transitions are checked with one query, and all node records
+    and their look up attributes are stored in one transaction. A failure
+    for one node does not prevent the others from being started. Like in
+    start_introspection(), nodes changed by somebody else after checking
+    their transitions are not started, NodeStateRaceCondition with HTTP
+    code 409 is returned for them.
+
+    :param nodes: dict Ironic node UUID -> dict of attributes known about
+                  this node (like macs, BMC etc)
+    :param ironic: Ironic client instance
+    :returns: dict Ironic node UUID -> NodeInfo on success or Error
+    """
+    results = {}
+    if not nodes:
+        return results
+
+    states = {}
+    current = {}
+    versions = {}
+    for row in db.model_query(db.Node.uuid, db.Node.state,
+                              db.Node.version_id).filter(
+            db.Node.uuid.in_(list(nodes))):
+        versions[row.uuid] = row.version_id
+        current[row.uuid] = row.state
+    for uuid in nodes:
+        state = current.get(uuid)
+        if state is None:
+            states[uuid] = istate.States.starting
+            continue
+
+        # check that the start transition is possible
+        fsm = istate.FSM.copy(shallow=True)
+        fsm.initialize(start_state=state)
+        try:
+            fsm.process_event(istate.Events.start)
+        except automaton_errors.NotFound as exc:
+            results[uuid] = utils.NodeStateInvalidEvent(
+                _('Invalid event: %s') % exc, log_level='warning',
+                node_info=NodeInfo(uuid, state=state))
+        else:
+            states[uuid] = fsm.current_state
+
+    attributes = {uuid: _normalize_attributes(nodes[uuid])
+                  for uuid in states}
+    for (uuid, error) in _find_attribute_conflicts(attributes).items():
+        del states[uuid]
+        results[uuid] = utils.Error(
+            _('Some or all of %s are already on introspection') %
+            ', '.join('%s\'s %s' % item for item in sorted(error)),
+            node_info=NodeInfo(uuid))
+
+    if not states:
+        return results
+
+    started_at = timeutils.utcnow()
+    try:
+        with db.ensure_transaction() as session:
+            # The same optimistic concurrency check as in _commit(), the
+            # rows are locked until the end of the transaction
+            locked = dict(db.model_query(
+                db.Node.uuid, db.Node.version_id, session=session).filter(
+                    db.Node.uuid.in_(sorted(states))).with_for_update())
+            for uuid in sorted(states):
+                if locked.get(uuid) != versions.get(uuid):
+                    del states[uuid]
+                    results[uuid] = utils.NodeStateRaceCondition(
+                        node_info=NodeInfo(uuid), code=409)
+            uuids = sorted(states)
+            if not uuids:
+                return results
+
+            for model in (db.Attribute, db.Option, db.Job, db.Node):
+                db.model_query(model, session=session).filter(
+                    model.uuid.in_(uuids)).delete(synchronize_session=False)
+            session.bulk_insert_mappings(
+                db.Node, [{'uuid': uuid, 'state': states[uuid],
+                           'started_at': started_at,
+                           'version_id': uuidutils.generate_uuid()}
+                          for uuid in uuids])
+            session.bulk_insert_mappings(
+                db.Attribute, [{'name': name, 'value': v, 'uuid': uuid}
+                               for uuid in uuids
+                               for (name, value) in
+                               sorted(attributes[uuid].items())
+                               for v in value])
+    except db_exc.DBDuplicateEntry as exc:
+        # Somebody has just started introspection of a node with the same
+        # attributes, give up on the whole batch
+        LOG.error(_LE('Database integrity error %s during adding nodes'), exc)
+        for uuid in uuids:
+            results[uuid] = utils.Error(
+                _('Some or all of %s are already on introspection') %
+                ', '.join('%s\'s %s' % item
+                          for item in sorted(attributes[uuid].items())),
+                node_info=NodeInfo(uuid))
+        return results
+
+    for uuid in uuids:
+        _LOOKUP_INDEX.remove(uuid)
+        for (name, value) in attributes[uuid].items():
+            _LOOKUP_INDEX.add(uuid, name, value)
+        results[uuid] = NodeInfo(uuid=uuid, state=states[uuid],
+                                 started_at=started_at, ironic=ironic)
+    metrics.increment('introspection_started_total', len(uuids))
+    _firewall_changed()
+    return results
+
+
+def _find_attribute_conflicts(attributes):
+    """Find look up attributes already used by other nodes.
+
+    :param attributes: dict node UUID -> dict attribute name -> list of values
+    :returns: dict node UUID -> set of conflicting (name, value) pairs for
+              nodes that cannot be stored. Attributes of nodes from
+              ``attributes`` do not count as the records of these nodes get
+              replaced. Of several new nodes sharing a value, the one with the
+              smallest UUID wins.
+    """
+    by_name = {}
+    for value in attributes.values():
+        for (name, v) in value.items():
+            by_name.setdefault(name, set()).update(v)
+    if not by_name:
+        return {}
+
+    query = db.model_query(db.Attribute.name, db.Attribute.value).filter(
+        sql.or_(*[sql.and_(db.Attribute.name == name,
+                           db.Attribute.value.in_(sorted(values)))
+                  for (name, values) in sorted(by_name.items())]),
+        ~db.Attribute.uuid.in_(sorted(attributes)))
+    existing = set(query)
+
+    conflicts = {}
+    owners = {}
+    for uuid in sorted(attributes):
+        pairs = {(name, v) for (name, value) in attributes[uuid].items()
+                 for v in value}
+        conflicting = pairs & existing
+        if not conflicting:
+            conflicting = {pair for pair in pairs
+                           if owners.get(pair, uuid) != uuid}
+        if conflicting:
+            conflicts[uuid] = conflicting
+        else:
+            owners.update((pair, uuid) for pair in pairs)
+
+    return conflicts
+
+
 def delete_nodes_not_in_list(uuids):
     """Delete nodes which don't exist in Ironic node UUIDs.
 
@@ -719,10 +1245,19 @@ def _delete_node(uuid, session=None):
     :param session: optional existing database session
     """
     with db.ensure_transaction(session) as session:
-        for model in (db.Attribute, db.Option, db.Node):
+        for model in (db.Attribute, db.Option, db.Job, db.Node):
             db.model_query(model,
                            session=session).filter_by(uuid=uuid).delete()
 
+    _LOOKUP_INDEX.remove(uuid)
+    _firewall_changed()
+
+
+def _firewall_changed():
+    # Imported here to avoid a circular import
+    from ironic_inspector import firewall
+    firewall.mark_dirty()
+
 
 def introspection_active():
     """Check if introspection is active for at least one node."""
@@ -733,6 +1268,8 @@ def introspection_active():
 
 def active_macs():
     """List all MAC's that are on introspection right now."""
+    if CONF.lookup_index:
+        return _LOOKUP_INDEX.values(MACS_ATTRIBUTE)
     return ({x.value for x in db.model_query(db.Attribute.value).
             filter_by(name=MACS_ATTRIBUTE)})
 
@@ -790,7 +1327,8 @@ def find_node(**attributes):
     """
     ironic = attributes.pop('ironic', None)
     # NOTE(dtantsur): sorting is not required, but gives us predictability
-    found = set()
+    conditions = []
+    lookup = {}
 
     for (name, value) in sorted(attributes.items()):
         if not value:
@@ -801,15 +1339,19 @@ def find_node(**attributes):
 
         LOG.debug('Trying to use %s of value %s for node look up',
                   name, value)
-        value_list = []
-        for v in value:
-            value_list.append("name='%s' AND value='%s'" % (name, v))
-        stmt = ('select distinct uuid from attributes where ' +
-                ' OR '.join(value_list))
-        rows = (db.model_query(db.Attribute.uuid).from_statement(
-            text(stmt)).all())
-        if rows:
-            found.update(item.uuid for item in rows)
+        conditions.append(sql.and_(db.Attribute.name == name,
+                                   db.Attribute.value.in_(value)))
+        lookup[name] = value
+
+    found = set()
+    if lookup and CONF.lookup_index:
+        found = _LOOKUP_INDEX.find(lookup)
+    # A miss in the index is confirmed against the database, in case the
+    # index is not in sync
+    if conditions and not found:
+        rows = (db.model_query(db.Attribute.uuid)
+                .filter(sql.or_(*conditions)).distinct().all())
+        found.update(item.uuid for item in rows)
 
     if not found:
         raise utils.NotFoundInCacheError(_(
@@ -848,11 +1390,14 @@ def find_node(**attributes):
 def clean_up():
     """Clean up the cache.
 
-    * Finish introspection for timed out nodes.
+    * Finish introspection for timed out nodes handled by this process.
     * Drop outdated node status information.
+    * Reload the in-memory look up index, if enabled.
 
     :return: list of timed out node UUID's
     """
+    _LOOKUP_INDEX.reload()
+
     status_keep_threshold = (timeutils.utcnow() - datetime.timedelta(
                              seconds=CONF.node_status_keep_time))
 
@@ -868,7 +1413,8 @@ def clean_up():
         uuids = [row.uuid for row in
                  db.model_query(db.Node.uuid, session=session).filter(
                      db.Node.started_at < threshold,
-                     db.Node.finished_at.is_(None)).all()]
+                     db.Node.finished_at.is_(None)).all()
+                 if hash_ring.owns(row.uuid)]
     if not uuids:
         return []
 
@@ -31,6 +31,20 @@ LOG = log.getLogger(__name__)
 class ProcessingHook(object):  # pragma: no cover
     """Abstract base class for introspection data processing hooks."""
 
+    reads = None
+    """Names of the things read by before_update.
+
+    A collection of strings: ``data.<key>`` for introspection data keys,
+    ``node.<field>`` for Ironic node fields (e.g. ``node.properties``) and
+    ``ports`` for the node's Ironic ports. Together with ``writes`` allows
+    running before_update concurrently with hooks it does not depend on.
+    None means unknown, such a hook is run strictly in the configured order.
+    """
+
+    writes = None
+    """Names of the things changed by before_update, same format as ``reads``.
+    """
+
     def before_processing(self, introspection_data, **kwargs):
         """Hook to run before any other data processing.
 
@@ -49,7 +63,10 @@ class ProcessingHook(object):  # pragma: no cover
         just before the node is updated with the data.
 
         :param introspection_data: processed data from the ramdisk.
-        :param node_info: NodeInfo instance.
+        :param node_info: NodeInfo instance. The Ironic node and ports it
+                          returns may be shared with other requests and
+                          must not be modified in place, use its patch and
+                          update methods instead.
         :param kwargs: used for extensibility without breaking existing hooks.
         :returns: nothing.
 
@@ -100,15 +117,28 @@ class RuleConditionPlugin(WithValidation):  # pragma: no cover
     ALLOW_NONE = False
     """Whether this condition accepts None when field is not found."""
 
+    def compile(self, params, **kwargs):
+        """Prepare params for checking many fields.
+
+        Called once when a rule is loaded. If the result is not None, it is
+        passed to every check() call of the rule as the ``compiled`` keyword
+        argument, e.g. to avoid parsing a regular expression for every node.
+
+        :param params: parameters as a dictionary
+        :param kwargs: used for extensibility without breaking existing plugins
+        :returns: any object or None, the default implementation returns None
+        """
+
     @abc.abstractmethod
     def check(self, node_info, field, params, **kwargs):
         """Check if condition holds for a given field.
 
         :param node_info: NodeInfo object
         :param field: field value
-        :param params: parameters as a dictionary, changing it here will change
-                       what will be stored in database
-        :param kwargs: used for extensibility without breaking existing plugins
+        :param params: parameters as a dictionary, changes are not stored
+        :param kwargs: used for extensibility without breaking existing
+                       plugins, contains ``compiled`` if compile() returned
+                       something
         :raises ValueError: on unacceptable field value
         :returns: True if check succeeded, otherwise False
         """
@@ -143,10 +173,60 @@ class RuleActionPlugin(WithValidation):  # pragma: no cover
         """
 
 
+@six.add_metaclass(abc.ABCMeta)
+class FirewallDriver(object):  # pragma: no cover
+    """Abstract base class for firewall drivers.
+
+    A firewall driver opens the DHCP port for machines on introspection and
+    for unknown machines, while keeping it closed for blacklisted MAC's.
+    Calls to the driver are serialized by the caller.
+    """
+
+    @abc.abstractmethod
+    def init(self):
+        """Initialize the firewall, called once on start up."""
+
+    @abc.abstractmethod
+    def update_filters(self, blacklist):
+        """Replace the firewall rules.
+
+        :param blacklist: set of MAC addresses to deny access to DHCP,
+                          everything else is allowed. If None, access to
+                          DHCP is denied for all machines.
+        :raises: any exception on failure, the next call will be made with
+                 the complete state anyway.
+        """
+
+    @abc.abstractmethod
+    def clean_up(self):
+        """Remove all firewall rules, called once before exiting."""
+
+
+@six.add_metaclass(abc.ABCMeta)
+class LockBackend(object):  # pragma: no cover
+    """Abstract base class for lock backends.
+
+    A lock backend provides the per-node locks. Locks with the same name
+    have to exclude each other in all processes using the same database.
+    """
+
+    @abc.abstractmethod
+    def get_lock(self, name):
+        """Get a lock object.
+
+        :param name: lock name
+        :returns: lock object with ``acquire(blocking=True)`` method,
+                  returning whether the lock was acquired, and ``release()``
+                  method. The object is only used by one thread at a time.
+        """
+
+
 _HOOKS_MGR = None
 _NOT_FOUND_HOOK_MGR = None
 _CONDITIONS_MGR = None
 _ACTIONS_MGR = None
+_FIREWALL_DRIVER_MGR = None
+_LOCK_BACKEND_MGR = None
 
 
 def missing_entrypoints_callback(names):
@@ -175,6 +255,32 @@ def processing_hooks_manager(*args):
     return _HOOKS_MGR
 
 
+def _hooks_conflict(first, second):
+    """Check whether the second hook has to run after the first one."""
+    if any(names is None for names in (first.reads, first.writes,
+                                       second.reads, second.writes)):
+        return True
+    return bool(set(first.writes) & (set(second.reads) | set(second.writes))
+                or set(first.reads) & set(second.writes))
+
+
+def processing_hooks_dependencies(hooks):
+    """Build dependencies between processing hooks.
+
+    A hook depends on every previous hook (in the configured order) that
+    changes something it reads or changes, or reads something it changes.
+    Hooks not declaring ``reads`` and ``writes`` depend on all previous hooks
+    and all following hooks depend on them.
+
+    :param hooks: list of hook objects in the configured order
+    :returns: list of sets, the n-th set contains indexes of the hooks the
+              n-th hook depends on
+    """
+    return [{index for index, previous in enumerate(hooks[:current])
+             if _hooks_conflict(previous, hook)}
+            for current, hook in enumerate(hooks)]
+
+
 def node_not_found_hook_manager(*args):
     global _NOT_FOUND_HOOK_MGR
     if _NOT_FOUND_HOOK_MGR is None:
@@ -213,5 +319,27 @@ def rule_actions_manager():
     return _ACTIONS_MGR
 
 
+def firewall_driver_manager():
+    """Create a Stevedore driver manager for the firewall driver."""
+    global _FIREWALL_DRIVER_MGR
+    if _FIREWALL_DRIVER_MGR is None:
+        _FIREWALL_DRIVER_MGR = stevedore.DriverManager(
+            'ironic_inspector.firewall.drivers',
+            name=CONF.firewall.driver,
+            invoke_on_load=True)
+    return _FIREWALL_DRIVER_MGR
+
+
+def lock_backend_manager():
+    """Create a Stevedore driver manager for the lock backend."""
+    global _LOCK_BACKEND_MGR
+    if _LOCK_BACKEND_MGR is None:
+        _LOCK_BACKEND_MGR = stevedore.DriverManager(
+            'ironic_inspector.locking.backends',
+            name=CONF.locking.backend,
+            invoke_on_load=True)
+    return _LOCK_BACKEND_MGR
+
+
 class MissingHookError(KeyError):
     """Exception when hook is not found when processing it."""
@@ -53,6 +53,9 @@ LOG = utils.getProcessingLogger(__name__)
 class CapabilitiesHook(base.ProcessingHook):
     """Processing hook for detecting capabilities."""
 
+    reads = ('data.inventory', 'node.properties')
+    writes = ('node.properties',)
+
     def _detect_boot_mode(self, inventory, node_info, data=None):
         boot_mode = inventory.get('boot', {}).get('current_boot_mode')
         if boot_mode is not None:
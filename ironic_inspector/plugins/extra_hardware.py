@@ -32,6 +32,9 @@ EDEPLOY_ITEM_SIZE = 4
 class ExtraHardwareHook(base.ProcessingHook):
     """Processing hook for saving extra hardware information in Swift."""
 
+    reads = ('data.data',)
+    writes = ('data.data', 'data.extra', 'node.extra')
+
     def _store_extra_hardware(self, name, data):
         """Handles storing the extra hardware data from the ramdisk"""
         swift_api = swift.SwiftAPI()
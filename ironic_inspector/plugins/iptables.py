@@ -0,0 +1,276 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Firewall drivers based on iptables."""
+
+import contextlib
+import os
+import subprocess
+
+from oslo_config import cfg
+from oslo_log import log
+
+from ironic_inspector.common.i18n import _LE, _LW
+from ironic_inspector.plugins import base
+
+
+CONF = cfg.CONF
+LOG = log.getLogger('ironic_inspector.plugins.iptables')
+
+
+def _rootwrap(command):
+    return ('sudo', 'ironic-inspector-rootwrap', CONF.rootwrap_config,
+            command)
+
+
+def _run_with_input(cmd, data):
+    """Run a command feeding data to its standard input.
+
+    :raises: subprocess.CalledProcessError on non-zero exit code
+    """
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            universal_newlines=True)
+    output = proc.communicate(data)[0]
+    if proc.returncode:
+        LOG.error(_LE('%(cmd)s failed: %(output)s'),
+                  {'cmd': ' '.join(cmd), 'output': output.replace('\n', '. ')})
+        raise subprocess.CalledProcessError(proc.returncode, cmd, output)
+
+
+class IptablesDriver(base.FirewallDriver):
+    """Firewall driver running a separate iptables command for every rule.
+
+    Rules are installed to a temporary chain, which then replaces the main
+    chain attached to the INPUT chain for DHCP requests on the dnsmasq
+    interface.
+    """
+
+    def __init__(self):
+        self.interface = None
+        self.chain = None
+        self.new_chain = None
+        self.base_command = None
+
+    def init(self):
+        self.interface = CONF.firewall.dnsmasq_interface
+        self.chain = CONF.firewall.firewall_chain
+        self.new_chain = self.chain + '_temp'
+        self.base_command = _rootwrap('iptables')
+
+        # -w flag makes iptables wait for xtables lock, but it's not supported
+        # everywhere yet
+        try:
+            with open(os.devnull, 'wb') as null:
+                subprocess.check_call(self.base_command + ('-w', '-h'),
+                                      stderr=null, stdout=null)
+        except subprocess.CalledProcessError:
+            LOG.warning(_LW('iptables does not support -w flag, please update '
+                            'it to at least version 1.4.21'))
+        else:
+            self.base_command += ('-w',)
+
+        self._clean_up(self.chain)
+        # Not really needed, but helps to validate that we have access to
+        # iptables
+        self._iptables('-N', self.chain)
+
+    def _iptables(self, *args, **kwargs):
+        # NOTE(dtantsur): -w flag makes it wait for xtables lock
+        cmd = self.base_command + args
+        ignore = kwargs.pop('ignore', False)
+        LOG.debug('Running iptables %s', args)
+        kwargs['stderr'] = subprocess.STDOUT
+        try:
+            subprocess.check_output(cmd, **kwargs)
+        except subprocess.CalledProcessError as exc:
+            output = exc.output.replace('\n', '. ')
+            if ignore:
+                LOG.debug('Ignoring failed iptables %(args)s: %(output)s',
+                          {'args': args, 'output': output})
+            else:
+                LOG.error(_LE('iptables %(iptables)s failed: %(exc)s'),
+                          {'iptables': args, 'exc': output})
+                raise
+
+    def _clean_up(self, chain):
+        self._iptables('-D', 'INPUT', '-i', self.interface, '-p', 'udp',
+                       '--dport', '67', '-j', chain,
+                       ignore=True)
+        self._iptables('-F', chain, ignore=True)
+        self._iptables('-X', chain, ignore=True)
+
+    def clean_up(self):
+        self._clean_up(self.chain)
+        self._clean_up(self.new_chain)
+
+    def _fill_chain(self, chain, rules):
+        """Create a chain and append rules to it.
+
+        :param chain: chain name, the chain must not exist.
+        :param rules: list of tuples with iptables arguments for every rule,
+                      excluding the leading ``-A <chain>``.
+        """
+        self._iptables('-N', chain)
+        for rule in rules:
+            self._iptables('-A', chain, *rule)
+
+    @contextlib.contextmanager
+    def _temporary_chain(self):
+        """Context manager to operate on a temporary chain.
+
+        Yields a list, rules for the temporary chain should be appended to it
+        as tuples of iptables arguments (excluding the leading
+        ``-A <chain>``). The chain is populated with these rules on exit,
+        then swapped with the main chain.
+        """
+        chain, main_chain = self.new_chain, self.chain
+        # Clean up a bit to account for possible troubles on previous run
+        self._clean_up(chain)
+
+        rules = []
+        yield rules
+        self._fill_chain(chain, rules)
+
+        # Swap chains
+        self._iptables('-I', 'INPUT', '-i', self.interface, '-p', 'udp',
+                       '--dport', '67', '-j', chain)
+        self._iptables('-D', 'INPUT', '-i', self.interface, '-p', 'udp',
+                       '--dport', '67', '-j', main_chain,
+                       ignore=True)
+        self._iptables('-F', main_chain, ignore=True)
+        self._iptables('-X', main_chain, ignore=True)
+        self._iptables('-E', chain, main_chain)
+
+    def update_filters(self, blacklist):
+        assert self.interface is not None
+        with self._temporary_chain() as rules:
+            if blacklist is None:
+                # Blacklist everything
+                rules.append(('-j', 'REJECT'))
+                return
+
+            # - Blacklist active macs, so that nova can boot them
+            for mac in sorted(blacklist):
+                rules.append(('-m', 'mac', '--mac-source', mac,
+                              '-j', 'DROP'))
+            # - Whitelist everything else
+            rules.append(('-j', 'ACCEPT'))
+
+
+class IptablesRestoreDriver(IptablesDriver):
+    """Firewall driver loading the whole chain with one iptables-restore."""
+
+    def __init__(self):
+        super(IptablesRestoreDriver, self).__init__()
+        self.restore_command = None
+
+    def init(self):
+        self.restore_command = _rootwrap('iptables-restore')
+        super(IptablesRestoreDriver, self).init()
+
+    def _iptables_restore(self, lines):
+        """Load rules into the filter table with a single iptables-restore.
+
+        The table is not flushed, only the chains declared in ``lines`` are.
+
+        :param lines: list of lines in iptables-save format, without the table
+                      header and the COMMIT footer.
+        """
+        LOG.debug('Running iptables-restore with %d lines', len(lines))
+        _run_with_input(self.restore_command + ('--noflush',),
+                        '\n'.join(['*filter'] + lines + ['COMMIT', '']))
+
+    def _fill_chain(self, chain, rules):
+        lines = [':%s - [0:0]' % chain]
+        lines.extend(' '.join(('-A', chain) + rule) for rule in rules)
+        self._iptables_restore(lines)
+
+
+class IpsetDriver(IptablesDriver):
+    """Firewall driver keeping blacklisted MAC's in an ipset.
+
+    The chain only contains a rule matching the set, so only the difference
+    with the previous successful update is applied on every update.
+    """
+
+    def __init__(self):
+        super(IpsetDriver, self).__init__()
+        self.ipset = None
+        self.ipset_command = None
+        # MAC's currently stored in the ipset, None if unknown
+        self.cache = None
+
+    def init(self):
+        self.ipset = CONF.firewall.firewall_chain
+        self.ipset_command = _rootwrap('ipset')
+        self.cache = None
+        super(IpsetDriver, self).init()
+
+    def _ipset_restore(self, lines):
+        """Run several ipset commands with a single ipset call.
+
+        :param lines: list of ipset commands in the "ipset save" format.
+        """
+        LOG.debug('Running ipset restore with %d lines', len(lines))
+        _run_with_input(self.ipset_command + ('-exist', 'restore'),
+                        '\n'.join(lines + ['']))
+
+    def clean_up(self):
+        super(IpsetDriver, self).clean_up()
+        # The set can only be destroyed when no rules reference it
+        try:
+            self._ipset_restore(['destroy %s' % self.ipset])
+        except subprocess.CalledProcessError as exc:
+            LOG.debug('Ignoring failed ipset destroy %(name)s: %(output)s',
+                      {'name': self.ipset, 'output': exc.output})
+
+    def update_filters(self, blacklist):
+        """Update the ipset with blacklisted MAC's.
+
+        If the content of the set is not known (on start up, after DHCP was
+        disabled or after a failure), the set is rebuilt from scratch and
+        atomically swapped with the existing one, and the chain referencing
+        it is recreated.
+        """
+        old_blacklist, self.cache = self.cache, None
+        if blacklist is None:
+            super(IpsetDriver, self).update_filters(None)
+            return
+
+        if old_blacklist is None:
+            new_set = self.ipset + '_temp'
+            lines = ['create %s hash:mac' % self.ipset,
+                     'create %s hash:mac' % new_set,
+                     'flush %s' % new_set]
+            lines.extend('add %s %s' % (new_set, mac)
+                         for mac in sorted(blacklist))
+            lines.extend(['swap %s %s' % (new_set, self.ipset),
+                          'destroy %s' % new_set])
+            self._ipset_restore(lines)
+
+            with self._temporary_chain() as rules:
+                # - Blacklist MAC's from the set, so that nova can boot them
+                rules.append(('-m', 'set', '--match-set', self.ipset, 'src',
+                              '-j', 'DROP'))
+                # - Whitelist everything else
+                rules.append(('-j', 'ACCEPT'))
+        else:
+            lines = ['add %s %s' % (self.ipset, mac)
+                     for mac in sorted(blacklist - old_blacklist)]
+            lines.extend('del %s %s' % (self.ipset, mac)
+                         for mac in sorted(old_blacklist - blacklist))
+            if lines:
+                self._ipset_restore(lines)
+
+        self.cache = set(blacklist)
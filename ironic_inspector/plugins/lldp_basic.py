@@ -31,6 +31,9 @@ class LLDPBasicProcessingHook(base.ProcessingHook):
        Store parsed data back to the ironic-inspector database.
     """
 
+    reads = ('data.inventory', 'data.all_interfaces')
+    writes = ('data.all_interfaces',)
+
     def _parse_lldp_tlvs(self, tlvs, node_info):
         """Parse LLDP TLVs into dictionary of name/value pairs
 
@@ -14,10 +14,13 @@
 """Generic LLDP Processing Hook"""
 
 import binascii
+import sys
 
+import eventlet
 from ironicclient import exc as client_exc
 import netaddr
 from oslo_config import cfg
+import six
 
 from ironic_inspector.common.i18n import _LW, _LE
 from ironic_inspector.common import ironic
@@ -50,6 +53,9 @@ class GenericLocalLinkConnectionHook(base.ProcessingHook):
     fields on the Ironic port that represents that NIC.
     """
 
+    reads = ('data.inventory', 'data.all_interfaces', 'ports')
+    writes = ('ports',)
+
     def _get_local_link_patch(self, tlv_type, tlv_value, port):
         try:
             data = bytearray(binascii.unhexlify(tlv_value))
@@ -92,6 +98,7 @@ class GenericLocalLinkConnectionHook(base.ProcessingHook):
 
         ironic_ports = node_info.ports()
 
+        updates = []
         for iface in inventory['interfaces']:
             if iface['name'] not in introspection_data['all_interfaces']:
                 continue
@@ -117,18 +124,35 @@ class GenericLocalLinkConnectionHook(base.ProcessingHook):
                 if patch is not None:
                     patches.append(patch)
 
+            if patches:
+                updates.append((port, patches))
+
+        if not updates:
+            return
+
+        # NOTE(sambetts) We need a newer version of Ironic API for this
+        # transaction, so use a different ironic client and explicitly
+        # pass it into the function.
+        cli = ironic.get_client(api_version=REQUIRED_IRONIC_VERSION)
+        pool = eventlet.GreenPool(CONF.ironic.max_concurrency)
+        threads = [pool.spawn(node_info.patch_port, ironic_port,
+                              port_patches, ironic=cli)
+                   for (ironic_port, port_patches) in updates]
+
+        not_acceptable = False
+        error = None
+        for thread in threads:
             try:
-                # NOTE(sambetts) We need a newer version of Ironic API for this
-                # transaction, so create a new ironic client and explicitly
-                # pass it into the function.
-                cli = ironic.get_client(api_version=REQUIRED_IRONIC_VERSION)
-                node_info.patch_port(port, patches, ironic=cli)
+                thread.wait()
             except client_exc.NotAcceptable:
-                LOG.error(_LE("Unable to set Ironic port local link "
-                              "connection information because Ironic does not "
-                              "support the required version"),
-                          node_info=node_info, data=introspection_data)
-                # NOTE(sambetts) May as well break out out of the loop here
-                # because Ironic version is not going to change for the other
-                # interfaces.
-                break
+                not_acceptable = True
+            except Exception:
+                error = error or sys.exc_info()
+
+        if not_acceptable:
+            LOG.error(_LE("Unable to set Ironic port local link "
+                          "connection information because Ironic does not "
+                          "support the required version"),
+                      node_info=node_info, data=introspection_data)
+        if error is not None:
+            six.reraise(*error)
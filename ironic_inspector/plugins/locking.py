@@ -0,0 +1,196 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Backends of the per-node locks."""
+
+import datetime
+
+import eventlet
+from oslo_concurrency import lockutils
+from oslo_config import cfg
+from oslo_db import exception as db_exc
+from oslo_log import log
+from oslo_utils import timeutils
+from oslo_utils import uuidutils
+
+from ironic_inspector.common.i18n import _, _LE, _LW
+from ironic_inspector import db
+from ironic_inspector.plugins import base
+from ironic_inspector import utils
+
+
+CONF = cfg.CONF
+LOG = log.getLogger(__name__)
+LOCK_FILE_PREFIX = 'ironic-inspector-'
+
+
+class InternalLockBackend(base.LockBackend):
+    """Locks only valid within the current process."""
+
+    def __init__(self):
+        self._semaphores = lockutils.Semaphores()
+
+    def get_lock(self, name):
+        return lockutils.internal_lock(name, semaphores=self._semaphores)
+
+
+class _CombinedLock(object):
+    """Lock acquiring a process-local lock before an inter-process one.
+
+    Inter-process locks are not safe to use from several threads of one
+    process, and waiting on a local lock is cheaper anyway.
+    """
+
+    def __init__(self, local, remote):
+        self._local = local
+        self._remote = remote
+
+    def acquire(self, blocking=True):
+        if not self._local.acquire(blocking):
+            return False
+
+        try:
+            acquired = self._remote.acquire(blocking)
+        except Exception:
+            self._local.release()
+            raise
+
+        if not acquired:
+            self._local.release()
+        return acquired
+
+    def release(self):
+        try:
+            self._remote.release()
+        finally:
+            self._local.release()
+
+
+class FileLockBackend(base.LockBackend):
+    """Locks using files in [oslo_concurrency]lock_path.
+
+    Valid for all processes on the current host. The lock files are not
+    removed.
+    """
+
+    def __init__(self):
+        if not CONF.oslo_concurrency.lock_path:
+            raise utils.Error(_('[oslo_concurrency]lock_path has to be set '
+                                'to use the "file" lock backend'))
+        self._internal = InternalLockBackend()
+
+    def get_lock(self, name):
+        return _CombinedLock(
+            self._internal.get_lock(name),
+            lockutils.external_lock(name, lock_file_prefix=LOCK_FILE_PREFIX,
+                                    lock_path=CONF.oslo_concurrency.lock_path))
+
+
+class _DatabaseLock(object):
+    def __init__(self, backend, name):
+        self._backend = backend
+        self._name = name
+
+    def acquire(self, blocking=True):
+        while not self._backend.try_acquire(self._name):
+            if not blocking:
+                return False
+            eventlet.sleep(CONF.locking.retry_interval)
+        return True
+
+    def release(self):
+        self._backend.release(self._name)
+
+
+class DatabaseLockBackend(base.LockBackend):
+    """Locks stored as rows of the locks table.
+
+    Valid for all processes using the same database. A lock is a row with
+    the lock name as the primary key and an expiration time, which is
+    renewed while the lock is held. Locks left by stopped processes are
+    taken over once they expire.
+    """
+
+    def __init__(self):
+        self.owner = uuidutils.generate_uuid()
+        self._internal = InternalLockBackend()
+        # Names of locks held by this process
+        self._held = set()
+        self._heartbeat = None
+
+    def get_lock(self, name):
+        return _CombinedLock(self._internal.get_lock(name),
+                             _DatabaseLock(self, name))
+
+    def _expires_at(self):
+        return timeutils.utcnow() + datetime.timedelta(
+            seconds=CONF.locking.lease_time)
+
+    def try_acquire(self, name):
+        """Try to acquire a lock without waiting.
+
+        :param name: lock name
+        :returns: whether the lock was acquired
+        """
+        expires_at = self._expires_at()
+        try:
+            with db.ensure_transaction() as session:
+                db.Lock(name=name, owner=self.owner,
+                        expires_at=expires_at).save(session)
+        except db_exc.DBDuplicateEntry:
+            with db.ensure_transaction() as session:
+                taken = db.model_query(db.Lock, session=session).filter(
+                    db.Lock.name == name,
+                    db.Lock.expires_at < timeutils.utcnow()).update(
+                        {'owner': self.owner, 'expires_at': expires_at},
+                        synchronize_session=False)
+            if not taken:
+                return False
+            LOG.warning(_LW('Took over expired lock %s'), name)
+
+        self._held.add(name)
+        if self._heartbeat is None:
+            self._heartbeat = eventlet.spawn(self._renew)
+        return True
+
+    def release(self, name):
+        """Release a lock held by this process.
+
+        :param name: lock name
+        """
+        self._held.discard(name)
+        try:
+            with db.ensure_transaction() as session:
+                db.model_query(db.Lock, session=session).filter_by(
+                    name=name, owner=self.owner).delete()
+        except Exception:
+            LOG.exception(_LE('Failed to release lock %(name)s, it will '
+                              'expire in %(lease)d seconds'),
+                          {'name': name, 'lease': CONF.locking.lease_time})
+
+    def _renew(self):
+        interval = CONF.locking.lease_time / 3.0
+        try:
+            while self._held:
+                eventlet.sleep(interval)
+                if not self._held:
+                    break
+                try:
+                    with db.ensure_transaction() as session:
+                        db.model_query(db.Lock, session=session).filter_by(
+                            owner=self.owner).update(
+                                {'expires_at': self._expires_at()})
+                except Exception:
+                    LOG.exception(_LE('Failed to renew locks'))
+        finally:
+            self._heartbeat = None
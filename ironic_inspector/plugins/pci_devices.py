@@ -66,6 +66,9 @@ class PciDevicesHook(base.ProcessingHook):
     """
     aliases = _parse_pci_alias_entry()
 
+    reads = ('data.pci_devices', 'node.properties')
+    writes = ('node.properties',)
+
     def _found_pci_devices_count(self, found_pci_devices):
         return collections.Counter([(dev['vendor_id'], dev['product_id'])
                                     for dev in found_pci_devices
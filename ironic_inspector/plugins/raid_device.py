@@ -43,6 +43,10 @@ class RaidDeviceDetection(base.ProcessingHook):
     the plugin needs to take precedence over the standard plugin.
     """
 
+    reads = ('data.inventory', 'data.block_devices', 'node.properties',
+             'node.extra')
+    writes = ('node.properties', 'node.extra')
+
     def _get_serials(self, data):
         if 'inventory' in data:
             return [x['serial'] for x in data['inventory'].get('disks', ())
@@ -0,0 +1,55 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-memory firewall driver for testing and benchmarking."""
+
+from oslo_log import log
+
+from ironic_inspector.plugins import base
+
+
+LOG = log.getLogger('ironic_inspector.plugins.recording')
+
+
+class RecordingDriver(base.FirewallDriver):
+    """Firewall driver only recording the requested state.
+
+    Nothing is changed on the host, so neither root access nor netfilter is
+    required. Every call is appended to ``calls`` as a tuple of the method
+    name and its arguments, the last requested blacklist is available as
+    ``blacklist``. Not suitable for production: DHCP is left unprotected and
+    ``calls`` grows without limit.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.blacklist = None
+        self.calls = []
+
+    def init(self):
+        self.calls.append(('init',))
+        self.enabled = True
+        self.blacklist = None
+
+    def update_filters(self, blacklist):
+        assert self.enabled
+        if blacklist is not None:
+            blacklist = frozenset(blacklist)
+        LOG.debug('Recording blacklist %s', blacklist)
+        self.calls.append(('update_filters', blacklist))
+        self.blacklist = blacklist
+
+    def clean_up(self):
+        self.calls.append(('clean_up',))
+        self.enabled = False
+        self.blacklist = None
@@ -81,9 +81,13 @@ class NetCondition(base.RuleConditionPlugin):
         except netaddr.AddrFormatError as exc:
             raise ValueError('invalid value: %s' % exc)
 
-    def check(self, node_info, field, params, **kwargs):
-        network = netaddr.IPNetwork(params['value'])
-        return netaddr.IPAddress(field) in network
+    def compile(self, params, **kwargs):
+        return netaddr.IPNetwork(params['value'])
+
+    def check(self, node_info, field, params, compiled=None, **kwargs):
+        if compiled is None:
+            compiled = self.compile(params)
+        return netaddr.IPAddress(field) in compiled
 
 
 class ReCondition(base.RuleConditionPlugin):
@@ -95,16 +99,26 @@ class ReCondition(base.RuleConditionPlugin):
 
 
 class MatchesCondition(ReCondition):
-    def check(self, node_info, field, params, **kwargs):
+    def compile(self, params, **kwargs):
         regexp = params['value']
         if regexp[-1] != '$':
             regexp += '$'
-        return re.match(regexp, str(field)) is not None
+        return re.compile(regexp)
+
+    def check(self, node_info, field, params, compiled=None, **kwargs):
+        if compiled is None:
+            compiled = self.compile(params)
+        return compiled.match(str(field)) is not None
 
 
 class ContainsCondition(ReCondition):
-    def check(self, node_info, field, params, **kwargs):
-        return re.search(params['value'], str(field)) is not None
+    def compile(self, params, **kwargs):
+        return re.compile(params['value'])
+
+    def check(self, node_info, field, params, compiled=None, **kwargs):
+        if compiled is None:
+            compiled = self.compile(params)
+        return compiled.search(str(field)) is not None
 
 
 class FailAction(base.RuleActionPlugin):
@@ -40,6 +40,9 @@ class RootDiskSelectionHook(base.ProcessingHook):
     might not be updated.
     """
 
+    reads = ('data.inventory', 'node.properties')
+    writes = ('data.root_disk',)
+
     def before_update(self, introspection_data, node_info, **kwargs):
         """Detect root disk from root device hints and IPA inventory."""
         hints = node_info.node().properties.get('root_device')
@@ -76,6 +79,9 @@ class SchedulerHook(base.ProcessingHook):
 
     KEYS = ('cpus', 'cpu_arch', 'memory_mb', 'local_gb')
 
+    reads = ('data.inventory', 'data.root_disk', 'node.properties')
+    writes = tuple('data.%s' % key for key in KEYS) + ('node.properties',)
+
     def before_update(self, introspection_data, node_info, **kwargs):
         """Update node with scheduler properties."""
         inventory = utils.get_inventory(introspection_data,
@@ -126,6 +132,9 @@ class SchedulerHook(base.ProcessingHook):
 class ValidateInterfacesHook(base.ProcessingHook):
     """Hook to validate network interfaces."""
 
+    reads = ('data.all_interfaces', 'data.macs', 'ports')
+    writes = ('ports',)
+
     def __init__(self):
         if CONF.processing.add_ports not in conf.VALID_ADD_PORTS_VALUES:
             LOG.critical(_LC('Accepted values for [processing]add_ports are '
@@ -278,6 +287,8 @@ class ValidateInterfacesHook(base.ProcessingHook):
 class RamdiskErrorHook(base.ProcessingHook):
     """Hook to process error send from the ramdisk."""
 
+    reads = writes = ()
+
     def before_processing(self, introspection_data, **kwargs):
         error = introspection_data.get('error')
         if error:
@@ -13,9 +13,10 @@
 
 """Handling introspection data from the ramdisk."""
 
-import copy
 import datetime
 import os
+import sys
+import threading
 
 import eventlet
 import json
@@ -23,15 +24,19 @@ import json
 from oslo_config import cfg
 from oslo_serialization import base64
 from oslo_utils import excutils
+import six
 
 from ironic_inspector.common.i18n import _, _LE, _LI, _LW
 from ironic_inspector.common import ironic as ir_utils
 from ironic_inspector.common import swift
 from ironic_inspector import firewall
 from ironic_inspector import introspection_state as istate
+from ironic_inspector import jobs
+from ironic_inspector import metrics
 from ironic_inspector import node_cache
 from ironic_inspector.plugins import base as plugins_base
 from ironic_inspector import rules
+from ironic_inspector import timing
 from ironic_inspector import utils
 
 CONF = cfg.CONF
@@ -44,6 +49,39 @@ _STORAGE_EXCLUDED_KEYS = {'logs'}
 _UNPROCESSED_DATA_STORE_SUFFIX = 'UNPROCESSED'
 
 
+class _ContinueQueue(object):
+    """Counter of ramdisk callbacks processed in background."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.length = 0
+
+    def reserve(self):
+        """Reserve a place in the queue.
+
+        :raises: ServiceUnavailable if the queue is full
+        """
+        with self._lock:
+            full = self.length >= CONF.processing.continue_queue_size
+            if not full:
+                self.length += 1
+                metrics.set_gauge('continue_queue_length', self.length)
+        if full:
+            raise utils.ServiceUnavailable(
+                _('Too many introspection data submissions are being '
+                  'processed, try again later'),
+                retry_after=CONF.processing.continue_retry_after)
+
+    def release(self):
+        """Release a place reserved in the queue."""
+        with self._lock:
+            self.length -= 1
+            metrics.set_gauge('continue_queue_length', self.length)
+
+
+_CONTINUE_QUEUE = _ContinueQueue()
+
+
 def _store_logs(introspection_data, node_info):
     logs = introspection_data.get('logs')
     if not logs:
@@ -113,7 +151,8 @@ def _find_node_info(introspection_data, failures):
         failures.append(_('Look up error: %s') % exc)
 
 
-def _run_pre_hooks(introspection_data, failures):
+def _run_pre_hooks(introspection_data, failures, timings=None):
+    timings = timings or timing.NodeTimings()
     hooks = plugins_base.processing_hooks_manager()
     for hook_ext in hooks:
         LOG.debug('Running pre-processing hook %s', hook_ext.name,
@@ -121,7 +160,8 @@ def _run_pre_hooks(introspection_data, failures):
         # NOTE(dtantsur): catch exceptions, so that we have changes to update
         # node introspection status after look up
         try:
-            hook_ext.obj.before_processing(introspection_data)
+            with timings.measure('pre_hook.%s' % hook_ext.name):
+                hook_ext.obj.before_processing(introspection_data)
         except utils.Error as exc:
             LOG.error(_LE('Hook %(hook)s failed, delaying error report '
                           'until node look up: %(error)s'),
@@ -165,9 +205,18 @@ def _store_data(node_info, data, suffix=None):
                           'value': swift_object_name}])
 
 
-def _store_unprocessed_data(node_info, data):
+def _store_unprocessed_data(node_info, raw_data):
+    """Store the unprocessed data.
+
+    :param node_info: NodeInfo instance
+    :param raw_data: introspection data serialized as JSON (bytes or string)
+    """
     # runs in background
+    data = None
     try:
+        if isinstance(raw_data, bytes):
+            raw_data = raw_data.decode('utf-8')
+        data = json.loads(raw_data)
         _store_data(node_info, data,
                     suffix=_UNPROCESSED_DATA_STORE_SUFFIX)
     except Exception:
@@ -190,15 +239,151 @@ def _get_unprocessed_data(uuid):
         raise utils.Error(_('Swift support is disabled'), code=400)
 
 
-def process(introspection_data):
+def process(introspection_data, raw_data=None):
     """Process data from the ramdisk.
 
     This function heavily relies on the hooks to do the actual data processing.
+
+    :param introspection_data: data from the ramdisk, modified in place
+    :param raw_data: the same data serialized as JSON, e.g. the request body;
+                     stored as the unprocessed data instead of a copy of
+                     introspection_data
     """
-    unprocessed_data = copy.deepcopy(introspection_data)
+    node_info, timings = _prepare(introspection_data, raw_data)
+    return _process_prepared(node_info, introspection_data, timings)
+
+
+def process_async(introspection_data, raw_data=None):
+    """Look up the node and process data from the ramdisk in background.
+
+    Only pre-processing hooks and node look up are run in the calling
+    thread. Data with new IPMI credentials is processed synchronously, since
+    the ramdisk expects the credentials in the response.
+
+    :param introspection_data: data from the ramdisk, modified in place
+    :param raw_data: see process()
+    :returns: tuple (result, whether processing continues in background)
+    :raises: ServiceUnavailable if [processing]continue_queue_size callbacks
+             are already being processed in background
+    """
+    _CONTINUE_QUEUE.reserve()
+    queued = False
+    try:
+        node_info, timings = _prepare(introspection_data, raw_data)
+        if node_info.options.get('new_ipmi_credentials'):
+            return (_process_prepared(node_info, introspection_data,
+                                      timings), False)
+
+        job_kwargs = {'timings': dict(timings.phases)}
+        if CONF.processing.store_data == 'swift':
+            # Only a reference to the unprocessed data stored by _prepare is
+            # recorded in the job, the data is reloaded if it is resumed
+            job_kwargs['unprocessed_data'] = swift.object_name(
+                node_info.uuid, _UNPROCESSED_DATA_STORE_SUFFIX)
+        try:
+            future = jobs.submit(
+                'process', node_info,
+                local_kwargs={'introspection_data': introspection_data},
+                **job_kwargs)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                node_info.release_lock()
+        queued = True
+        future.add_done_callback(lambda fut: _CONTINUE_QUEUE.release())
+    finally:
+        if not queued:
+            _CONTINUE_QUEUE.release()
+
+    LOG.info(_LI('Processing of the data will continue in background'),
+             node_info=node_info, data=introspection_data)
+    return {'uuid': node_info.uuid}, True
+
+
+@jobs.register('process')
+def _process_in_background(node_info, introspection_data=None, timings=None,
+                           unprocessed_data=None):
+    if node_info.finished_at is not None:
+        LOG.info(_LI('Processing was already finished'),
+                 node_info=node_info, data=introspection_data)
+        return
+
+    if introspection_data is None:
+        # Resumed by another process or after a restart
+        try:
+            introspection_data = _reload_unprocessed_data(node_info,
+                                                          unprocessed_data)
+        except utils.Error as exc:
+            # Already logged by Error
+            node_info.fsm_event(istate.Events.error)
+            node_info.finished(error=str(exc))
+            return
+
+    # The processing stage was interrupted by a restart if the state has
+    # already changed
+    resume = node_info.state == istate.States.processing
+    if resume:
+        LOG.info(_LI('Resuming interrupted processing'),
+                 node_info=node_info, data=introspection_data)
+    try:
+        # Look up and pre-processing hooks were measured by the caller
+        _process_prepared(node_info, introspection_data,
+                          timing.NodeTimings(timings), resume=resume,
+                          finish_in_background=False)
+    except Exception as exc:
+        if not isinstance(exc, utils.Error):
+            LOG.exception(_LE('Unexpected exception during processing in '
+                              'background'), node_info=node_info,
+                          data=introspection_data)
+        # Make the failure visible in the introspection status
+        if node_info.finished_at is None:
+            node_info.finished(error=str(exc))
+
+
+def _reload_unprocessed_data(node_info, swift_object):
+    """Load the stored unprocessed data and run pre-processing hooks on it.
+
+    :param swift_object: name of the Swift object with the data or None
+    :returns: introspection data
+    :raises: Error
+    """
+    if swift_object is None:
+        raise utils.Error(_('Introspection data of the interrupted processing '
+                            'is not available, it is only stored with '
+                            '[processing]store_data = swift'),
+                          node_info=node_info)
+
+    try:
+        introspection_data = json.loads(
+            swift.SwiftAPI().get_object(swift_object))
+    except Exception as exc:
+        raise utils.Error(_('Unable to load the introspection data of the '
+                            'interrupted processing from Swift: %s') % exc,
+                          node_info=node_info)
+
     failures = []
     _run_pre_hooks(introspection_data, failures)
-    node_info = _find_node_info(introspection_data, failures)
+    if failures:
+        raise utils.Error(_('Pre-processing failures detected resuming '
+                            'processing:\n%s') % '\n'.join(failures),
+                          node_info=node_info, data=introspection_data)
+    return introspection_data
+
+
+def _prepare(introspection_data, raw_data):
+    """Run pre-processing hooks, find and lock the node.
+
+    :returns: tuple (NodeInfo, NodeTimings)
+    :raises: Error
+    """
+    if raw_data is None and CONF.processing.store_data == 'swift':
+        # Hooks modify introspection_data in place, serializing it is much
+        # cheaper than a deep copy
+        raw_data = json.dumps(introspection_data)
+    timings = timing.NodeTimings()
+    failures = []
+    _run_pre_hooks(introspection_data, failures, timings=timings)
+    with timings.measure('lookup'):
+        node_info = _find_node_info(introspection_data, failures)
     if node_info:
         # Locking is already done in find_node() but may be not done in a
         # node_not_found hook
@@ -209,6 +394,7 @@ def process(introspection_data):
                 'pre-processing hooks:\n%s') % '\n'.join(failures)
         if node_info is not None:
             node_info.finished(error='\n'.join(failures))
+            _store_timings(node_info, timings)
         _store_logs(introspection_data, node_info)
         raise utils.Error(msg, node_info=node_info, data=introspection_data)
 
@@ -224,9 +410,21 @@ def process(introspection_data):
     # Note(mkovacik): store data now when we're sure that a background
     # thread won't race with other process() or introspect.abort()
     # call
-    utils.executor().submit(_store_unprocessed_data, node_info,
-                            unprocessed_data)
+    if raw_data is not None and CONF.processing.store_data == 'swift':
+        utils.executor().submit(_store_unprocessed_data, node_info, raw_data)
+    return node_info, timings
+
+
+def _process_prepared(node_info, introspection_data, timings, resume=False,
+                      finish_in_background=True):
+    """Process data of a found and locked node.
 
+    :param resume: whether processing of the data was already started and
+                   interrupted
+    :param finish_in_background: whether to power off and finish the node in
+                                 background instead of before returning
+    """
+    process_node = _resume_process_node if resume else _process_node
     try:
         node = node_info.node()
     except ir_utils.NotFound as exc:
@@ -235,9 +433,13 @@ def process(introspection_data):
             _store_logs(introspection_data, node_info)
 
     try:
-        result = _process_node(node_info, node, introspection_data)
+        result = process_node(node_info, node, introspection_data,
+                              timings=timings,
+                              finish_in_background=finish_in_background)
     except utils.Error as exc:
-        node_info.finished(error=str(exc))
+        if node_info.finished_at is None:
+            node_info.finished(error=str(exc))
+        _store_timings(node_info, timings)
         with excutils.save_and_reraise_exception():
             _store_logs(introspection_data, node_info)
     except Exception as exc:
@@ -246,6 +448,7 @@ def process(introspection_data):
                 '%(error)s') % {'exc_class': exc.__class__.__name__,
                                 'error': exc}
         node_info.finished(error=msg)
+        _store_timings(node_info, timings)
         _store_logs(introspection_data, node_info)
         raise utils.Error(msg, node_info=node_info, data=introspection_data,
                           code=500)
@@ -255,29 +458,101 @@ def process(introspection_data):
     return result
 
 
-def _run_post_hooks(node_info, introspection_data):
-    hooks = plugins_base.processing_hooks_manager()
+def _store_timings(node_info, timings):
+    """Store durations of processing phases of a node, if enabled."""
+    if not CONF.processing.store_timings:
+        return
 
-    for hook_ext in hooks:
-        LOG.debug('Running post-processing hook %s', hook_ext.name,
-                  node_info=node_info, data=introspection_data)
-        hook_ext.obj.before_update(introspection_data, node_info)
+    try:
+        node_info.set_option('timings', timings.phases)
+    except Exception:
+        LOG.exception(_LE('Failed to store processing timings'),
+                      node_info=node_info)
+
+
+def _run_post_hooks(node_info, introspection_data, timings=None):
+    """Run post-processing hooks.
+
+    Hooks are run concurrently unless they depend on each other, see
+    processing_hooks_dependencies. After a failure no new hooks are started,
+    the first failure in the configured order is re-raised.
+    """
+    timings = timings or timing.NodeTimings()
+    hooks = list(plugins_base.processing_hooks_manager())
+    dependencies = plugins_base.processing_hooks_dependencies(
+        [hook_ext.obj for hook_ext in hooks])
+    threads = []
+    failed = []
+
+    def _run(hook_ext, depends_on):
+        try:
+            for index in depends_on:
+                threads[index].wait()
+            if failed:
+                return
+            LOG.debug('Running post-processing hook %s', hook_ext.name,
+                      node_info=node_info, data=introspection_data)
+            with timings.measure('post_hook.%s' % hook_ext.name):
+                hook_ext.obj.before_update(introspection_data, node_info)
+        except Exception:
+            failed.append(hook_ext.name)
+            raise
+
+    pool = eventlet.GreenPool(max(len(hooks), 1))
+    for hook_ext, depends_on in zip(hooks, dependencies):
+        threads.append(pool.spawn(_run, hook_ext, depends_on))
+
+    error = None
+    for thread in threads:
+        try:
+            thread.wait()
+        except Exception:
+            error = error or sys.exc_info()
+    if error is not None:
+        six.reraise(*error)
 
 
 @node_cache.fsm_transition(istate.Events.process, reentrant=False)
-def _process_node(node_info, node, introspection_data):
+def _process_node(node_info, node, introspection_data, timings=None,
+                  finish_in_background=True):
+    return _run_processing(node_info, node, introspection_data,
+                           timings=timings,
+                           finish_in_background=finish_in_background)
+
+
+@node_cache.triggers_fsm_error_transition()
+def _resume_process_node(node_info, node, introspection_data, timings=None,
+                         finish_in_background=True):
+    # The node is already in the processing state
+    return _run_processing(node_info, node, introspection_data,
+                           timings=timings,
+                           finish_in_background=finish_in_background)
+
+
+def _run_processing(node_info, node, introspection_data, timings=None,
+                    finish_in_background=True):
+    timings = timings or timing.NodeTimings()
     # NOTE(dtantsur): repeat the check in case something changed
     ir_utils.check_provision_state(node)
     interfaces = introspection_data.get('interfaces')
-    node_info.create_ports(list(interfaces.values()))
-    _run_post_hooks(node_info, introspection_data)
-    _store_data(node_info, introspection_data)
-
+    with timings.measure('create_ports'):
+        node_info.create_ports(list(interfaces.values()))
     ironic = ir_utils.get_client()
-    firewall.update_filters(ironic)
-
-    node_info.invalidate_cache()
-    rules.apply(node_info, introspection_data)
+    # Send all node updates made by hooks and rules in one request
+    with node_info.batch_patches():
+        _run_post_hooks(node_info, introspection_data, timings=timings)
+        with timings.measure('store_data'):
+            _store_data(node_info, introspection_data)
+
+        if not CONF.firewall.update_on_change:
+            # Otherwise the update is triggered by creating ports and
+            # finishing
+            with timings.measure('firewall_update'):
+                firewall.update_filters(ironic)
+
+        node_info.invalidate_cache()
+        with timings.measure('rules_apply'):
+            rules.apply(node_info, introspection_data)
 
     resp = {'uuid': node.uuid}
 
@@ -290,9 +565,11 @@ def _process_node(node_info, node, introspection_data):
         resp['ipmi_setup_credentials'] = True
         resp['ipmi_username'] = new_username
         resp['ipmi_password'] = new_password
+    elif finish_in_background:
+        jobs.submit('finish', node_info, timings=dict(timings.phases))
     else:
-        utils.executor().submit(_finish, node_info, ironic, introspection_data,
-                                power_off=CONF.processing.power_off)
+        _finish(node_info, ironic, introspection_data,
+                power_off=CONF.processing.power_off, timings=timings)
 
     return resp
 
@@ -331,7 +608,18 @@ def _finish_set_ipmi_credentials(node_info, ironic, node, introspection_data,
     raise utils.Error(msg, node_info=node_info, data=introspection_data)
 
 
-def _finish_common(node_info, ironic, introspection_data, power_off=True):
+def _finish_common(node_info, ironic, introspection_data, power_off=True,
+                   timings=None):
+    timings = timings or timing.NodeTimings()
+    try:
+        with timings.measure('finish'):
+            _power_off_and_finish(node_info, ironic, introspection_data,
+                                  power_off=power_off)
+    finally:
+        _store_timings(node_info, timings)
+
+
+def _power_off_and_finish(node_info, ironic, introspection_data, power_off):
     if power_off:
         LOG.debug('Forcing power off of node %s', node_info.uuid)
         try:
@@ -361,6 +649,22 @@ def _finish_common(node_info, ironic, introspection_data, power_off=True):
 _finish = node_cache.fsm_transition(istate.Events.finish)(_finish_common)
 
 
+@jobs.register('finish')
+def _finish_in_background(node_info, timings=None):
+    if node_info.finished_at is not None:
+        LOG.info(_LI('Introspection was already finished'),
+                 node_info=node_info)
+        return
+
+    try:
+        _finish(node_info, ir_utils.get_client(), None,
+                power_off=CONF.processing.power_off,
+                timings=timing.NodeTimings(timings))
+    except utils.Error:
+        # Already recorded in the node status
+        pass
+
+
 def reapply(node_ident):
     """Re-apply introspection steps.
 
@@ -383,9 +687,10 @@ def reapply(node_ident):
         raise utils.Error(_('Node locked, please, try again later'),
                           node_info=node_info, code=409)
 
-    utils.executor().submit(_reapply, node_info)
+    jobs.submit('reapply', node_info)
 
 
+@jobs.register('reapply')
 def _reapply(node_info):
     # runs in background
     try:
@@ -410,14 +715,16 @@ def _reapply(node_info):
         node_info.finished(error=msg)
         return
 
+    timings = timing.NodeTimings()
     try:
-        _reapply_with_data(node_info, introspection_data)
+        _reapply_with_data(node_info, introspection_data, timings=timings)
     except Exception as exc:
         node_info.finished(error=str(exc))
+        _store_timings(node_info, timings)
         return
 
     _finish(node_info, ironic, introspection_data,
-            power_off=False)
+            power_off=False, timings=timings)
 
     LOG.info(_LI('Successfully reapplied introspection on stored '
                  'data'), node_info=node_info, data=introspection_data)
@@ -425,17 +732,22 @@ def _reapply(node_info):
 
 @node_cache.fsm_event_before(istate.Events.reapply)
 @node_cache.triggers_fsm_error_transition()
-def _reapply_with_data(node_info, introspection_data):
+def _reapply_with_data(node_info, introspection_data, timings=None):
+    timings = timings or timing.NodeTimings()
     failures = []
-    _run_pre_hooks(introspection_data, failures)
+    _run_pre_hooks(introspection_data, failures, timings=timings)
     if failures:
         raise utils.Error(_('Pre-processing failures detected reapplying '
                             'introspection on stored data:\n%s') %
                           '\n'.join(failures), node_info=node_info)
 
     interfaces = introspection_data.get('interfaces')
-    node_info.create_ports(list(interfaces.values()))
-    _run_post_hooks(node_info, introspection_data)
-    _store_data(node_info, introspection_data)
-    node_info.invalidate_cache()
-    rules.apply(node_info, introspection_data)
+    with timings.measure('create_ports'):
+        node_info.create_ports(list(interfaces.values()))
+    with node_info.batch_patches():
+        _run_post_hooks(node_info, introspection_data, timings=timings)
+        with timings.measure('store_data'):
+            _store_data(node_info, introspection_data)
+        node_info.invalidate_cache()
+        with timings.measure('rules_apply'):
+            rules.apply(node_info, introspection_data)
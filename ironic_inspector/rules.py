@@ -14,8 +14,6 @@
 
 """Support for introspection rules."""
 
-import jsonpath_rw as jsonpath
-import jsonschema
 from oslo_db import exception as db_exc
 from oslo_utils import timeutils
 from oslo_utils import uuidutils
@@ -31,6 +29,10 @@ from ironic_inspector import utils
 LOG = utils.getProcessingLogger(__name__)
 _CONDITIONS_SCHEMA = None
 _ACTIONS_SCHEMA = None
+# Name of the counter in the generations table changed with the rules
+_GENERATION = 'rules'
+# Rules used by apply(): tuple (generation, list of IntrospectionRule)
+_RULES_CACHE = None
 
 
 def conditions_schema():
@@ -102,12 +104,19 @@ def actions_schema():
 class IntrospectionRule(object):
     """High-level class representing an introspection rule."""
 
-    def __init__(self, uuid, conditions, actions, description):
-        """Create rule object from database data."""
+    def __init__(self, uuid, conditions, actions, description,
+                 json_paths=None):
+        """Create rule object from database data.
+
+        :param json_paths: optional dict JSON path -> parsed expression
+                           shared by several rules, see _parse_json_path
+        """
         self._uuid = uuid
         self._conditions = conditions
         self._actions = actions
         self._description = description
+        self._json_paths = json_paths
+        self._compiled_conditions = None
 
     def as_dict(self, short=False):
         result = {
@@ -134,18 +143,22 @@ class IntrospectionRule(object):
         """
         LOG.debug('Checking rule "%s"', self.description,
                   node_info=node_info, data=data)
-        ext_mgr = plugins_base.rule_conditions_manager()
-        for cond in self._conditions:
-            scheme, path = _parse_path(cond.field)
+        if self._compiled_conditions is None:
+            self._compiled_conditions = self._compile_conditions()
 
-            if scheme == 'node':
+        for cond in self._compiled_conditions:
+            if cond.scheme == 'node':
                 source_data = node_info.node().to_dict()
-            elif scheme == 'data':
+            elif cond.scheme == 'data':
                 source_data = data
 
-            field_values = jsonpath.parse(path).find(source_data)
-            field_values = [x.value for x in field_values]
-            cond_ext = ext_mgr[cond.op].obj
+            field_values = [x.value for x in cond.path.find(source_data)]
+            cond_ext = cond.plugin
+            kwargs = {}
+            if cond.compiled is not None:
+                kwargs['compiled'] = cond.compiled
+            # Compiled rules are reused for other nodes
+            params = cond.params.copy()
 
             if not field_values:
                 if cond_ext.ALLOW_NONE:
@@ -161,7 +174,7 @@ class IntrospectionRule(object):
                     return False
 
             for value in field_values:
-                result = cond_ext.check(node_info, value, cond.params)
+                result = cond_ext.check(node_info, value, params, **kwargs)
                 if cond.invert:
                     result = not result
 
@@ -182,6 +195,19 @@ class IntrospectionRule(object):
                  node_info=node_info, data=data)
         return True
 
+    def _compile_conditions(self):
+        """Parse JSON paths and prepare condition plugins."""
+        ext_mgr = plugins_base.rule_conditions_manager()
+        result = []
+        for cond in self._conditions:
+            scheme, path = _parse_path(cond.field)
+            plugin = ext_mgr[cond.op].obj
+            result.append(_CompiledCondition(
+                cond, scheme, _parse_json_path(path, self._json_paths),
+                plugin,
+                plugin.compile(cond.params.copy())))
+        return result
+
     def apply_actions(self, node_info, rollback=False, data=None):
         """Run actions on a node.
 
@@ -201,8 +227,11 @@ class IntrospectionRule(object):
         ext_mgr = plugins_base.rule_actions_manager()
         for act in self._actions:
             ext = ext_mgr[act.action].obj
+            # Formatting must not change the rule, it is reused for other
+            # nodes
+            params = act.params.copy()
             for formatted_param in ext.FORMATTED_PARAMS:
-                value = act.params.get(formatted_param)
+                value = params.get(formatted_param)
                 if not value or not isinstance(value, six.string_types):
                     continue
 
@@ -210,23 +239,39 @@ class IntrospectionRule(object):
                 # data format specifications.
                 # TODO(aarefiev): simple verify on import rule time.
                 try:
-                    act.params[formatted_param] = value.format(data=data)
+                    params[formatted_param] = value.format(data=data)
                 except KeyError as e:
                     raise utils.Error(_('Invalid formatting variable key '
                                         'provided: %s') % e,
                                       node_info=node_info, data=data)
 
             LOG.debug('Running %(what)s action `%(action)s %(params)s`',
-                      {'action': act.action, 'params': act.params,
+                      {'action': act.action, 'params': params,
                        'what': method},
                       node_info=node_info, data=data)
-            getattr(ext, method)(node_info, act.params)
+            getattr(ext, method)(node_info, params)
 
         LOG.debug('Successfully applied %s',
                   'rollback actions' if rollback else 'actions',
                   node_info=node_info, data=data)
 
 
+class _CompiledCondition(object):
+    __slots__ = ('field', 'op', 'multiple', 'invert', 'params', 'scheme',
+                 'path', 'plugin', 'compiled')
+
+    def __init__(self, cond, scheme, path, plugin, compiled):
+        self.field = cond.field
+        self.op = cond.op
+        self.multiple = cond.multiple
+        self.invert = cond.invert
+        self.params = dict(cond.params)
+        self.scheme = scheme
+        self.path = path
+        self.plugin = plugin
+        self.compiled = compiled
+
+
 def _parse_path(path):
     """Parse path, extract scheme and path.
 
@@ -248,6 +293,26 @@ def _parse_path(path):
     return scheme, path
 
 
+def _parse_json_path(path, cache=None):
+    """Parse a JSON path.
+
+    Parsing is slow, since jsonpath_rw builds a new parser every time.
+
+    :param path: JSON path
+    :param cache: optional dict JSON path -> parsed expression to reuse the
+                  result for the same path
+    """
+    if cache is not None and path in cache:
+        return cache[path]
+
+    import jsonpath_rw as jsonpath
+
+    expression = jsonpath.parse(path)
+    if cache is not None:
+        cache[path] = expression
+    return expression
+
+
 def create(conditions_json, actions_json, uuid=None,
            description=None):
     """Create a new rule in database.
@@ -270,6 +335,8 @@ def create(conditions_json, actions_json, uuid=None,
               {'uuid': uuid, 'descr': description,
                'conditions': conditions_json, 'actions': actions_json})
 
+    import jsonschema
+
     try:
         jsonschema.validate(conditions_json, conditions_schema())
     except jsonschema.ValidationError as exc:
@@ -295,7 +362,7 @@ def create(conditions_json, actions_json, uuid=None,
                                 'values are node:// or data://') % scheme)
         # verify field as JSON path
         try:
-            jsonpath.parse(path)
+            _parse_json_path(path)
         except Exception as exc:
             raise utils.Error(_('Unable to parse field JSON path %(field)s: '
                                 '%(error)s') % {'field': field, 'error': exc})
@@ -346,12 +413,14 @@ def create(conditions_json, actions_json, uuid=None,
                                                   params=params))
 
             rule.save(session)
+            _bump_generation(session)
     except db_exc.DBDuplicateEntry as exc:
         LOG.error(_LE('Database integrity error %s when '
                       'creating a rule'), exc)
         raise utils.Error(_('Rule with UUID %s already exists') % uuid,
                           code=409)
 
+    _invalidate_cache()
     LOG.info(_LI('Created rule %(uuid)s with description "%(descr)s"'),
              {'uuid': uuid, 'descr': description})
     return IntrospectionRule(uuid=uuid,
@@ -372,12 +441,17 @@ def get(uuid):
                              description=rule.description)
 
 
-def get_all():
-    """List all rules."""
+def get_all(json_paths=None):
+    """List all rules.
+
+    :param json_paths: optional dict JSON path -> parsed expression shared
+                       by the rules when compiling their conditions
+    """
     query = db.model_query(db.Rule).order_by(db.Rule.created_at)
     return [IntrospectionRule(uuid=rule.uuid, actions=rule.actions,
                               conditions=rule.conditions,
-                              description=rule.description)
+                              description=rule.description,
+                              json_paths=json_paths)
             for rule in query]
 
 
@@ -392,7 +466,9 @@ def delete(uuid):
                  .filter_by(uuid=uuid).delete())
         if not count:
             raise utils.Error(_('Rule %s was not found') % uuid, code=404)
+        _bump_generation(session)
 
+    _invalidate_cache()
     LOG.info(_LI('Introspection rule %s was deleted'), uuid)
 
 
@@ -402,13 +478,51 @@ def delete_all():
         db.model_query(db.RuleAction, session=session).delete()
         db.model_query(db.RuleCondition, session=session).delete()
         db.model_query(db.Rule, session=session).delete()
+        _bump_generation(session)
 
+    _invalidate_cache()
     LOG.info(_LI('All introspection rules were deleted'))
 
 
+def _bump_generation(session):
+    """Record a change of the rules for all processes."""
+    updated = db.model_query(db.Generation, session=session).filter_by(
+        name=_GENERATION).update({'value': db.Generation.value + 1},
+                                 synchronize_session=False)
+    if not updated:
+        # The row is created by the migrations, but not by create_all()
+        db.Generation(name=_GENERATION, value=1).save(session)
+
+
+def _invalidate_cache():
+    global _RULES_CACHE
+    _RULES_CACHE = None
+
+
+def _get_cached():
+    """Get all rules, reloading them only if they changed.
+
+    The rules are compiled on first use and kept until any process changes
+    them, which is detected by the generation counter in the database. Rules
+    often share JSON paths, so they are parsed once for all of them and
+    dropped together with the rules.
+    """
+    global _RULES_CACHE
+
+    # A change between reading the generation and the rules only causes one
+    # more reload later
+    generation = db.model_query(db.Generation.value).filter_by(
+        name=_GENERATION).scalar()
+    cache = _RULES_CACHE
+    if cache is None or cache[0] != generation:
+        cache = (generation, get_all(json_paths={}))
+        _RULES_CACHE = cache
+    return cache[1]
+
+
 def apply(node_info, data):
     """Apply rules to a node."""
-    rules = get_all()
+    rules = _get_cached()
     if not rules:
         LOG.debug('No custom introspection rules to apply',
                   node_info=node_info, data=data)
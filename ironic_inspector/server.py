@@ -0,0 +1,342 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Multi-process WSGI server used when [DEFAULT]api_workers is set.
+
+The parent process opens the listening socket and forks the API worker
+processes, which accept connections on it and serve them with the eventlet
+WSGI server. The first worker runs the periodic tasks and manages the
+firewall, the other ones forward firewall updates to it through a UNIX
+socket and wait for them to finish. Metrics of all workers are shared
+through files in the same temporary directory as the socket.
+
+Signals handled by the parent process:
+
+* SIGTERM and SIGINT stop the workers gracefully and exit.
+* SIGHUP reloads the configuration files and gracefully replaces the
+  workers.
+"""
+
+import errno
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+import eventlet
+from eventlet import hubs
+from eventlet import wsgi
+from oslo_config import cfg
+from oslo_log import log
+from oslo_utils import netutils
+
+from ironic_inspector.common.i18n import _LC, _LE, _LI, _LW
+from ironic_inspector import metrics
+
+
+CONF = cfg.CONF
+LOG = log.getLogger(__name__)
+
+# Index of the worker running periodic tasks and managing the firewall
+DESIGNATED_WORKER = 0
+# Workers exiting sooner after start are restarted with a delay
+_MIN_WORKER_LIFETIME = 1
+# How often a worker checks whether it was asked to stop
+_STOP_POLL_INTERVAL = 0.2
+# How often a worker writes its metrics for the other workers
+_METRICS_DUMP_INTERVAL = 5
+# Time for the replaced designated worker to clean up the firewall after
+# [DEFAULT]graceful_shutdown_timeout before it is killed on reload
+_DESIGNATED_EXIT_GRACE = 30
+
+
+class Launcher(object):
+    """Parent process of the API workers.
+
+    :param service: main.Service object
+    :param application: WSGI application
+    :param ssl_context: optional SSL context to wrap the socket with
+    """
+
+    def __init__(self, service, application, ssl_context=None):
+        self.service = service
+        self.application = application
+        self.ssl_context = ssl_context
+        # PID -> (worker index, generation, start time)
+        self.workers = {}
+        # Incremented on every reload, workers of older generations are
+        # not restarted
+        self.generation = 0
+        self._socket = None
+        self._firewall_socket = None
+        self._firewall_address = None
+        self._metrics_dir = None
+        self._stop_requested = False
+        self._stopping = False
+        self._reload_requested = False
+        # PID and kill deadline of the replaced designated worker, the new
+        # one is started once it exits
+        self._replaced_designated = None
+        self._server = None
+        self._server_stop_requested = False
+
+    def run(self):
+        """Start the workers and wait for them to exit."""
+        self.check_config()
+
+        family = socket.AF_INET
+        if netutils.is_valid_ipv6(CONF.listen_address):
+            family = socket.AF_INET6
+        self._socket = eventlet.listen(
+            (CONF.listen_address, CONF.listen_port), family=family)
+        if self.ssl_context is not None:
+            self._socket = self.ssl_context.wrap_socket(self._socket,
+                                                        server_side=True)
+
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        signal.signal(signal.SIGHUP, self._request_reload)
+
+        self._metrics_dir = tempfile.mkdtemp(prefix='ironic-inspector-')
+        try:
+            self._firewall_address = os.path.join(self._metrics_dir,
+                                                  'firewall.sock')
+            self._firewall_socket = eventlet.listen(self._firewall_address,
+                                                    family=socket.AF_UNIX)
+            LOG.info(_LI('Starting %(count)d API workers on '
+                         '%(host)s:%(port)s'),
+                     {'count': CONF.api_workers,
+                      'host': CONF.listen_address,
+                      'port': CONF.listen_port})
+            for index in range(CONF.api_workers):
+                self._start_worker(index)
+
+            self._wait()
+        finally:
+            shutil.rmtree(self._metrics_dir, ignore_errors=True)
+        LOG.info(_LI('All API workers exited'))
+
+    @staticmethod
+    def check_config():
+        """Validate the configuration for several worker processes."""
+        if CONF.api_workers <= 1:
+            return
+
+        if CONF.locking.backend == 'internal':
+            LOG.critical(_LC('Several API workers require node locks valid '
+                             'between processes, set [locking]backend to '
+                             '"file" or "database"'))
+            sys.exit(1)
+
+        if CONF.lookup_index:
+            LOG.warning(_LW('The look up index is only valid within one '
+                            'process, disabling it since several API '
+                            'workers are used'))
+            CONF.set_override('lookup_index', False)
+
+    def _request_stop(self, signum, frame):
+        self._stop_requested = True
+
+    def _request_reload(self, signum, frame):
+        self._reload_requested = True
+
+    def _wait(self):
+        while self.workers:
+            if self._stop_requested and not self._stopping:
+                self._stopping = True
+                LOG.info(_LI('Stopping API workers'))
+                for pid in self.workers:
+                    _kill(pid)
+
+            if self._reload_requested and not self._stopping:
+                self._reload_requested = False
+                self._reload()
+
+            if self._replaced_designated is not None:
+                pid, deadline = self._replaced_designated
+                if deadline is not None and time.time() > deadline:
+                    LOG.warning(_LW('API worker %(index)d (PID %(pid)d) did '
+                                    'not exit on reload, killing it'),
+                                {'index': DESIGNATED_WORKER, 'pid': pid})
+                    _kill(pid, signal.SIGKILL)
+                    self._replaced_designated = (pid, None)
+
+            self._reap()
+            time.sleep(0.1)
+
+    def _reap(self):
+        """Handle exited workers, restarting them if needed."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as exc:
+                if exc.errno == errno.ECHILD:
+                    return
+                raise
+
+            if not pid:
+                return
+
+            try:
+                index, generation, started_at = self.workers.pop(pid)
+            except KeyError:
+                continue
+
+            if self._stopping or generation != self.generation:
+                LOG.info(_LI('API worker %(index)d (PID %(pid)d) exited'),
+                         {'index': index, 'pid': pid})
+                if (self._replaced_designated is not None and
+                        pid == self._replaced_designated[0]):
+                    self._replaced_designated = None
+                    if not self._stopping:
+                        self._start_worker(DESIGNATED_WORKER)
+                continue
+
+            LOG.error(_LE('API worker %(index)d (PID %(pid)d) exited '
+                          'unexpectedly with status %(status)d, restarting'),
+                      {'index': index, 'pid': pid, 'status': status})
+            if time.time() - started_at < _MIN_WORKER_LIFETIME:
+                time.sleep(_MIN_WORKER_LIFETIME)
+            self._start_worker(index)
+
+    def _reload(self):
+        LOG.info(_LI('Reloading configuration and restarting API workers'))
+        CONF.reload_config_files()
+        old_workers = dict(self.workers)
+        self.generation += 1
+
+        for index in range(CONF.api_workers):
+            if index != DESIGNATED_WORKER:
+                self._start_worker(index)
+
+        for pid, (index, _gen, _started) in old_workers.items():
+            _kill(pid)
+            # The designated worker manages the firewall and cleans it up on
+            # exit, the new one is started by _reap() once the old one exits
+            if (index == DESIGNATED_WORKER and
+                    self._replaced_designated is None):
+                self._replaced_designated = (pid, time.time() +
+                                             _designated_exit_timeout())
+
+        if self._replaced_designated is None:
+            self._start_worker(DESIGNATED_WORKER)
+
+        # Metrics of workers which are not restarted must not be reported
+        metrics.remove_shared(self._metrics_dir, CONF.api_workers)
+
+    def _start_worker(self, index):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = (index, self.generation, time.time())
+            LOG.info(_LI('Started API worker %(index)d with PID %(pid)d'),
+                     {'index': index, 'pid': pid})
+            return
+
+        # The event hub of the parent process must not be shared
+        hubs.use_hub()
+        status = 0
+        try:
+            self._run_worker(index)
+        except SystemExit as exc:
+            if exc.code is not None:
+                status = exc.code if isinstance(exc.code, int) else 1
+        except BaseException:
+            LOG.exception(_LE('API worker %d failed'), index)
+            status = 1
+        os._exit(status)
+
+    def _run_worker(self, index):
+        from ironic_inspector import firewall
+
+        signal.signal(signal.SIGTERM, self._request_worker_stop)
+        # These are handled by the parent process
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+        designated = index == DESIGNATED_WORKER
+        if not designated:
+            firewall.forward_updates(self._firewall_address)
+
+        metrics.share(self._metrics_dir, index)
+        eventlet.spawn_n(self._dump_metrics)
+
+        self.service.init(background=designated)
+        try:
+            if designated and CONF.firewall.manage_firewall:
+                eventlet.spawn_n(firewall.serve_update_requests,
+                                 self._firewall_socket)
+            self._serve()
+        finally:
+            self.service.shutdown()
+
+    def _dump_metrics(self):
+        # A new worker with the same index may be running once this one is
+        # asked to stop, it must not be overwritten
+        while True:
+            eventlet.sleep(_METRICS_DUMP_INTERVAL)
+            if self._server_stop_requested:
+                return
+            try:
+                metrics.dump()
+            except Exception:
+                LOG.exception(_LE('Failed to write metrics of API worker'))
+
+    def _serve(self):
+        wsgi.MAX_HEADER_LINE = CONF.max_header_line
+        self._server = eventlet.spawn(
+            wsgi.server, self._socket, self.application,
+            log=LOG,
+            custom_pool=eventlet.GreenPool(CONF.max_connections),
+            keepalive=CONF.wsgi_keep_alive,
+            socket_timeout=CONF.client_socket_timeout or None,
+            debug=False)
+        # Greenthreads cannot be switched from a signal handler, so the
+        # stop request is only recorded there and checked here
+        while not (self._server_stop_requested or self._server.dead):
+            eventlet.sleep(_STOP_POLL_INTERVAL)
+
+        if not self._server.dead:
+            if CONF.graceful_shutdown_timeout:
+                eventlet.spawn_after(CONF.graceful_shutdown_timeout,
+                                     _force_exit)
+            # The server stops accepting connections and waits for the
+            # requests in progress
+            self._server.kill(SystemExit)
+        self._server.wait()
+
+    def _request_worker_stop(self, signum, frame):
+        self._server_stop_requested = True
+
+
+def _kill(pid, sig=signal.SIGTERM):
+    try:
+        os.kill(pid, sig)
+    except OSError as exc:
+        if exc.errno != errno.ESRCH:
+            raise
+
+
+def _designated_exit_timeout():
+    """Time to wait for the replaced designated worker before killing it."""
+    if not CONF.graceful_shutdown_timeout:
+        return float('inf')
+    return CONF.graceful_shutdown_timeout + _DESIGNATED_EXIT_GRACE
+
+
+def _force_exit():
+    LOG.warning(_LW('Requests were not finished in %d seconds, exiting'),
+                CONF.graceful_shutdown_timeout)
+    os._exit(1)
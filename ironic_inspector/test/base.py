@@ -15,7 +15,6 @@ import datetime
 
 import futurist
 import mock
-from oslo_concurrency import lockutils
 from oslo_config import cfg
 from oslo_config import fixture as config_fixture
 from oslo_log import log
@@ -24,12 +23,17 @@ from oslo_utils import uuidutils
 from oslotest import base as test_base
 
 from ironic_inspector.common import i18n
+from ironic_inspector.common import ironic as ir_utils
 # Import configuration options
 from ironic_inspector import conf  # noqa
 from ironic_inspector import db
+from ironic_inspector import hash_ring
 from ironic_inspector import introspection_state as istate
+from ironic_inspector import metrics
 from ironic_inspector import node_cache
 from ironic_inspector.plugins import base as plugins_base
+from ironic_inspector import rules
+from ironic_inspector import timing
 from ironic_inspector import utils
 
 CONF = cfg.CONF
@@ -49,13 +53,21 @@ class BaseTest(test_base.BaseTestCase):
         engine.connect()
         self.addCleanup(db.get_engine().dispose)
         plugins_base._HOOKS_MGR = None
-        node_cache._SEMAPHORES = lockutils.Semaphores()
+        plugins_base._FIREWALL_DRIVER_MGR = None
+        plugins_base._LOCK_BACKEND_MGR = None
+        hash_ring._RING = None
+        rules._RULES_CACHE = None
+        node_cache._LOOKUP_INDEX = node_cache._LookupIndex()
+        ir_utils.reset_ironic_session()
+        timing.reset()
+        metrics.reset()
         for name in ('_', '_LI', '_LW', '_LE', '_LC'):
             patch = mock.patch.object(i18n, name, lambda s: s)
             patch.start()
             # 'p=patch' magic is due to how closures work
             self.addCleanup(lambda p=patch: p.stop())
-        utils._EXECUTOR = futurist.SynchronousExecutor(green=True)
+        utils._EXECUTOR = utils._CountingExecutor(
+            futurist.SynchronousExecutor(green=True))
 
     def init_test_conf(self):
         CONF.reset()
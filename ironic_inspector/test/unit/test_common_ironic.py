@@ -16,10 +16,14 @@ import socket
 import unittest
 
 from ironicclient import client
+from ironicclient import exceptions
 from oslo_config import cfg
+from oslo_utils import timeutils
+from oslo_utils import uuidutils
 
 from ironic_inspector.common import ironic as ir_utils
 from ironic_inspector.common import keystone
+from ironic_inspector import metrics
 from ironic_inspector.test import base
 from ironic_inspector import utils
 
@@ -69,6 +73,163 @@ class TestGetClient(base.BaseTest):
                 'retry_interval': CONF.ironic.retry_interval}
         mock_client.assert_called_once_with(1, **args)
 
+    def test_get_client_cached(self, mock_client, mock_load, mock_opts):
+        cli = ir_utils.get_client()
+        self.assertIs(cli, ir_utils.get_client())
+        self.assertEqual(1, mock_client.call_count)
+
+        other = ir_utils.get_client(api_version='1.19')
+        self.assertIsNot(cli, other)
+        self.assertIs(other, ir_utils.get_client(api_version='1.19'))
+        self.assertEqual(2, mock_client.call_count)
+
+        ir_utils.reset_ironic_session()
+        self.assertIsNot(cli, ir_utils.get_client())
+        self.assertEqual(3, mock_client.call_count)
+
+    def test_get_client_with_token_not_cached(self, mock_client, mock_load,
+                                              mock_opts):
+        ir_utils.get_client('token')
+        ir_utils.get_client('token')
+        self.assertEqual(2, mock_client.call_count)
+
+
+class TestMeteredClient(base.BaseTest):
+    def setUp(self):
+        super(TestMeteredClient, self).setUp()
+        self.client = mock.Mock(spec=['node', 'http_client'])
+        self.metered = ir_utils._MeteredClient(self.client)
+
+    def test_call(self):
+        self.client.node.get.return_value = mock.sentinel.node
+        self.assertIs(mock.sentinel.node, self.metered.node.get('uuid'))
+        self.client.node.get.assert_called_once_with('uuid')
+        self.assertEqual(1, metrics._VALUES['ironic_request_duration_seconds'][
+            (('call', 'node.get'),)].count)
+        self.assertNotIn('ironic_request_errors_total', metrics._VALUES)
+
+    def test_error(self):
+        self.client.node.update.side_effect = RuntimeError('boom')
+        self.assertRaises(RuntimeError, self.metered.node.update, 'uuid', [])
+        self.assertEqual(1, metrics._VALUES['ironic_request_errors_total'][
+            (('call', 'node.update'),)])
+
+    def test_not_metered(self):
+        self.assertIs(self.client.http_client, self.metered.http_client)
+
+
+class TestObjectCache(base.BaseTest):
+    def setUp(self):
+        super(TestObjectCache, self).setUp()
+        CONF.set_override('cache_ttl', 60, 'ironic')
+        self.uuid = uuidutils.generate_uuid()
+        self.cache = ir_utils.CACHE
+        self.node = mock.Mock(uuid=self.uuid,
+                              updated_at='2016-01-01T00:00:00+00:00')
+
+    def test_disabled(self):
+        CONF.set_override('cache_ttl', 0, 'ironic')
+        self.cache.store_node(self.node)
+        self.cache.store_ports(self.uuid, {'mac': 'port'})
+        self.assertIsNone(self.cache.get_node(self.uuid))
+        self.assertIsNone(self.cache.get_ports(self.uuid))
+
+    def test_node_and_ports(self):
+        self.assertIsNone(self.cache.get_node(self.uuid))
+        self.cache.store_node(self.node)
+        self.assertIs(self.node, self.cache.get_node(self.uuid))
+        self.assertIsNone(self.cache.get_ports(self.uuid))
+
+        ports = {'mac': 'port'}
+        self.cache.store_ports(self.uuid, ports)
+        cached = self.cache.get_ports(self.uuid)
+        self.assertEqual(ports, cached)
+        # Copies are stored and returned
+        cached['mac2'] = 'port2'
+        ports['mac3'] = 'port3'
+        self.assertEqual({'mac': 'port'}, self.cache.get_ports(self.uuid))
+        self.assertIs(self.node, self.cache.get_node(self.uuid))
+
+    @mock.patch.object(timeutils, 'now', autospec=True)
+    def test_expired(self, mock_now):
+        mock_now.return_value = 100
+        self.cache.store_node(self.node)
+        mock_now.return_value = 159
+        self.assertIs(self.node, self.cache.get_node(self.uuid))
+        mock_now.return_value = 160
+        self.assertIsNone(self.cache.get_node(self.uuid))
+
+    def test_lru(self):
+        CONF.set_override('cache_size', 2, 'ironic')
+        nodes = [mock.Mock(uuid='uuid%d' % i, updated_at=None)
+                 for i in range(3)]
+        self.cache.store_node(nodes[0])
+        self.cache.store_node(nodes[1])
+        # Mark node 0 as recently used
+        self.cache.get_node('uuid0')
+        self.cache.store_node(nodes[2])
+        self.assertIs(nodes[0], self.cache.get_node('uuid0'))
+        self.assertIsNone(self.cache.get_node('uuid1'))
+        self.assertIs(nodes[2], self.cache.get_node('uuid2'))
+
+    def test_older_node_ignored(self):
+        self.cache.store_node(self.node)
+        older = mock.Mock(uuid=self.uuid,
+                          updated_at='2015-01-01T00:00:00+00:00')
+        self.cache.store_node(older)
+        self.assertIs(self.node, self.cache.get_node(self.uuid))
+
+        newer = mock.Mock(uuid=self.uuid,
+                          updated_at='2017-01-01T00:00:00+00:00')
+        self.cache.store_node(newer)
+        self.assertIs(newer, self.cache.get_node(self.uuid))
+
+    def test_invalidate(self):
+        self.cache.store_node(self.node)
+        self.cache.store_ports(self.uuid, {'mac': 'port'})
+        self.cache.invalidate(self.uuid)
+        self.assertIsNone(self.cache.get_node(self.uuid))
+        self.assertIsNone(self.cache.get_ports(self.uuid))
+
+    def test_reset_ironic_session(self):
+        self.cache.store_node(self.node)
+        ir_utils.reset_ironic_session()
+        self.assertIsNone(self.cache.get_node(self.uuid))
+
+
+class TestGetNode(base.BaseTest):
+    def setUp(self):
+        super(TestGetNode, self).setUp()
+        CONF.set_override('cache_ttl', 60, 'ironic')
+        self.uuid = uuidutils.generate_uuid()
+        self.ironic = mock.Mock()
+        self.node = mock.Mock(uuid=self.uuid, updated_at=None)
+        self.ironic.node.get.return_value = self.node
+
+    def test_cached(self):
+        self.assertIs(self.node, ir_utils.get_node(self.uuid,
+                                                   ironic=self.ironic))
+        self.assertIs(self.node, ir_utils.get_node(self.uuid,
+                                                   ironic=self.ironic,
+                                                   cached=True))
+        self.ironic.node.get.assert_called_once_with(self.uuid)
+
+    def test_not_cached_by_default(self):
+        ir_utils.get_node(self.uuid, ironic=self.ironic)
+        ir_utils.get_node(self.uuid, ironic=self.ironic)
+        self.assertEqual(2, self.ironic.node.get.call_count)
+
+    def test_fields_not_cached(self):
+        ir_utils.get_node(self.uuid, ironic=self.ironic, fields=['uuid'])
+        ir_utils.get_node(self.uuid, ironic=self.ironic, cached=True)
+        self.assertEqual(2, self.ironic.node.get.call_count)
+
+    def test_not_found(self):
+        self.ironic.node.get.side_effect = exceptions.NotFound()
+        self.assertRaises(ir_utils.NotFound, ir_utils.get_node, self.uuid,
+                          ironic=self.ironic, cached=True)
+        self.assertIsNone(ir_utils.CACHE.get_node(self.uuid))
+
 
 class TestGetIpmiAddress(base.BaseTest):
     def test_ipv4_in_resolves(self):
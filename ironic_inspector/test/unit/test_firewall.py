@@ -13,26 +13,37 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import os
+import socket
 import subprocess
+import time
 
+import eventlet
+from eventlet import queue
+import fixtures
 import mock
 from oslo_config import cfg
+import six
 
 from ironic_inspector.common import ironic as ir_utils
 from ironic_inspector import firewall
 from ironic_inspector import introspection_state as istate
+from ironic_inspector import metrics
 from ironic_inspector import node_cache
+from ironic_inspector.plugins import iptables
 from ironic_inspector.test import base as test_base
+from ironic_inspector import utils
 
 
 CONF = cfg.CONF
+NEW_CHAIN = 'ironic-inspector_temp'
 IB_DATA = """
 EMAC=02:00:02:97:00:01 IMAC=97:fe:80:00:00:00:00:00:00:7c:fe:90:03:00:29:26:52
 EMAC=02:00:00:61:00:02 IMAC=61:fe:80:00:00:00:00:00:00:7c:fe:90:03:00:29:24:4f
 """
 
 
-@mock.patch.object(firewall, '_iptables')
+@mock.patch.object(iptables.IptablesDriver, '_iptables')
 @mock.patch.object(ir_utils, 'get_client')
 @mock.patch.object(subprocess, 'check_call')
 class TestFirewall(test_base.NodeTest):
@@ -63,7 +74,7 @@ class TestFirewall(test_base.NodeTest):
 
         expected = ('sudo', 'ironic-inspector-rootwrap', rootwrap_path,
                     'iptables', '-w')
-        self.assertEqual(expected, firewall.BASE_COMMAND)
+        self.assertEqual(expected, firewall._driver().base_command)
 
     def test_init_args_old_iptables(self, mock_call, mock_get_client,
                                     mock_iptables):
@@ -85,7 +96,7 @@ class TestFirewall(test_base.NodeTest):
 
         expected = ('sudo', 'ironic-inspector-rootwrap', rootwrap_path,
                     'iptables',)
-        self.assertEqual(expected, firewall.BASE_COMMAND)
+        self.assertEqual(expected, firewall._driver().base_command)
 
     def test_init_kwargs(self, mock_call, mock_get_client, mock_iptables):
         firewall.init()
@@ -114,18 +125,18 @@ class TestFirewall(test_base.NodeTest):
             ('-X', CONF.firewall.firewall_chain),
             ('-N', CONF.firewall.firewall_chain),
             ('-D', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
-             '67', '-j', firewall.NEW_CHAIN),
-            ('-F', firewall.NEW_CHAIN),
-            ('-X', firewall.NEW_CHAIN),
-            ('-N', firewall.NEW_CHAIN),
-            ('-A', firewall.NEW_CHAIN, '-j', 'ACCEPT'),
+             '67', '-j', NEW_CHAIN),
+            ('-F', NEW_CHAIN),
+            ('-X', NEW_CHAIN),
+            ('-N', NEW_CHAIN),
+            ('-A', NEW_CHAIN, '-j', 'ACCEPT'),
             ('-I', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
-             '67', '-j', firewall.NEW_CHAIN),
+             '67', '-j', NEW_CHAIN),
             ('-D', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
              '67', '-j', CONF.firewall.firewall_chain),
             ('-F', CONF.firewall.firewall_chain),
             ('-X', CONF.firewall.firewall_chain),
-            ('-E', firewall.NEW_CHAIN, CONF.firewall.firewall_chain)
+            ('-E', NEW_CHAIN, CONF.firewall.firewall_chain)
         ]
 
         firewall.update_filters()
@@ -181,21 +192,21 @@ class TestFirewall(test_base.NodeTest):
             ('-X', CONF.firewall.firewall_chain),
             ('-N', CONF.firewall.firewall_chain),
             ('-D', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
-             '67', '-j', firewall.NEW_CHAIN),
-            ('-F', firewall.NEW_CHAIN),
-            ('-X', firewall.NEW_CHAIN),
-            ('-N', firewall.NEW_CHAIN),
+             '67', '-j', NEW_CHAIN),
+            ('-F', NEW_CHAIN),
+            ('-X', NEW_CHAIN),
+            ('-N', NEW_CHAIN),
             # Blacklist
-            ('-A', firewall.NEW_CHAIN, '-m', 'mac', '--mac-source',
+            ('-A', NEW_CHAIN, '-m', 'mac', '--mac-source',
              inactive_mac[0], '-j', 'DROP'),
-            ('-A', firewall.NEW_CHAIN, '-j', 'ACCEPT'),
+            ('-A', NEW_CHAIN, '-j', 'ACCEPT'),
             ('-I', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
-             '67', '-j', firewall.NEW_CHAIN),
+             '67', '-j', NEW_CHAIN),
             ('-D', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
              '67', '-j', CONF.firewall.firewall_chain),
             ('-F', CONF.firewall.firewall_chain),
             ('-X', CONF.firewall.firewall_chain),
-            ('-E', firewall.NEW_CHAIN, CONF.firewall.firewall_chain)
+            ('-E', NEW_CHAIN, CONF.firewall.firewall_chain)
         ]
 
         firewall.update_filters(mock_get_client)
@@ -226,21 +237,21 @@ class TestFirewall(test_base.NodeTest):
 
         update_filters_expected_args = [
             ('-D', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
-             '67', '-j', firewall.NEW_CHAIN),
-            ('-F', firewall.NEW_CHAIN),
-            ('-X', firewall.NEW_CHAIN),
-            ('-N', firewall.NEW_CHAIN),
+             '67', '-j', NEW_CHAIN),
+            ('-F', NEW_CHAIN),
+            ('-X', NEW_CHAIN),
+            ('-N', NEW_CHAIN),
             # Blacklist
-            ('-A', firewall.NEW_CHAIN, '-m', 'mac', '--mac-source',
+            ('-A', NEW_CHAIN, '-m', 'mac', '--mac-source',
              inactive_mac[0], '-j', 'DROP'),
-            ('-A', firewall.NEW_CHAIN, '-j', 'ACCEPT'),
+            ('-A', NEW_CHAIN, '-j', 'ACCEPT'),
             ('-I', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
-             '67', '-j', firewall.NEW_CHAIN),
+             '67', '-j', NEW_CHAIN),
             ('-D', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
              '67', '-j', CONF.firewall.firewall_chain),
             ('-F', CONF.firewall.firewall_chain),
             ('-X', CONF.firewall.firewall_chain),
-            ('-E', firewall.NEW_CHAIN, CONF.firewall.firewall_chain)
+            ('-E', NEW_CHAIN, CONF.firewall.firewall_chain)
         ]
 
         mock_iptables.side_effect = [None, None, RuntimeError()]
@@ -273,18 +284,18 @@ class TestFirewall(test_base.NodeTest):
             ('-X', CONF.firewall.firewall_chain),
             ('-N', CONF.firewall.firewall_chain),
             ('-D', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
-             '67', '-j', firewall.NEW_CHAIN),
-            ('-F', firewall.NEW_CHAIN),
-            ('-X', firewall.NEW_CHAIN),
-            ('-N', firewall.NEW_CHAIN),
-            ('-A', firewall.NEW_CHAIN, '-j', 'ACCEPT'),
+             '67', '-j', NEW_CHAIN),
+            ('-F', NEW_CHAIN),
+            ('-X', NEW_CHAIN),
+            ('-N', NEW_CHAIN),
+            ('-A', NEW_CHAIN, '-j', 'ACCEPT'),
             ('-I', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
-             '67', '-j', firewall.NEW_CHAIN),
+             '67', '-j', NEW_CHAIN),
             ('-D', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
              '67', '-j', CONF.firewall.firewall_chain),
             ('-F', CONF.firewall.firewall_chain),
             ('-X', CONF.firewall.firewall_chain),
-            ('-E', firewall.NEW_CHAIN, CONF.firewall.firewall_chain)
+            ('-E', NEW_CHAIN, CONF.firewall.firewall_chain)
         ]
 
         firewall.update_filters()
@@ -309,18 +320,18 @@ class TestFirewall(test_base.NodeTest):
             ('-X', CONF.firewall.firewall_chain),
             ('-N', CONF.firewall.firewall_chain),
             ('-D', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
-             '67', '-j', firewall.NEW_CHAIN),
-            ('-F', firewall.NEW_CHAIN),
-            ('-X', firewall.NEW_CHAIN),
-            ('-N', firewall.NEW_CHAIN),
-            ('-A', firewall.NEW_CHAIN, '-j', 'REJECT'),
+             '67', '-j', NEW_CHAIN),
+            ('-F', NEW_CHAIN),
+            ('-X', NEW_CHAIN),
+            ('-N', NEW_CHAIN),
+            ('-A', NEW_CHAIN, '-j', 'REJECT'),
             ('-I', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
-             '67', '-j', firewall.NEW_CHAIN),
+             '67', '-j', NEW_CHAIN),
             ('-D', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
              '67', '-j', CONF.firewall.firewall_chain),
             ('-F', CONF.firewall.firewall_chain),
             ('-X', CONF.firewall.firewall_chain),
-            ('-E', firewall.NEW_CHAIN, CONF.firewall.firewall_chain)
+            ('-E', NEW_CHAIN, CONF.firewall.firewall_chain)
         ]
 
         firewall.update_filters()
@@ -345,7 +356,7 @@ class TestFirewall(test_base.NodeTest):
         mock_iptables.reset_mock()
         firewall.update_filters()
 
-        mock_iptables.assert_any_call('-A', firewall.NEW_CHAIN, '-j', 'ACCEPT')
+        mock_iptables.assert_any_call('-A', NEW_CHAIN, '-j', 'ACCEPT')
         self.assertEqual({'foobar'}, firewall.BLACKLIST_CACHE)
 
     def test_update_filters_infiniband(
@@ -371,21 +382,21 @@ class TestFirewall(test_base.NodeTest):
             ('-X', CONF.firewall.firewall_chain),
             ('-N', CONF.firewall.firewall_chain),
             ('-D', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
-             '67', '-j', firewall.NEW_CHAIN),
-            ('-F', firewall.NEW_CHAIN),
-            ('-X', firewall.NEW_CHAIN),
-            ('-N', firewall.NEW_CHAIN),
+             '67', '-j', NEW_CHAIN),
+            ('-F', NEW_CHAIN),
+            ('-X', NEW_CHAIN),
+            ('-N', NEW_CHAIN),
             # Blacklist
-            ('-A', firewall.NEW_CHAIN, '-m', 'mac', '--mac-source',
+            ('-A', NEW_CHAIN, '-m', 'mac', '--mac-source',
              expected_rmac, '-j', 'DROP'),
-            ('-A', firewall.NEW_CHAIN, '-j', 'ACCEPT'),
+            ('-A', NEW_CHAIN, '-j', 'ACCEPT'),
             ('-I', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
-             '67', '-j', firewall.NEW_CHAIN),
+             '67', '-j', NEW_CHAIN),
             ('-D', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
              '67', '-j', CONF.firewall.firewall_chain),
             ('-F', CONF.firewall.firewall_chain),
             ('-X', CONF.firewall.firewall_chain),
-            ('-E', firewall.NEW_CHAIN, CONF.firewall.firewall_chain)
+            ('-E', NEW_CHAIN, CONF.firewall.firewall_chain)
         ]
 
         fileobj = mock.mock_open(read_data=IB_DATA)
@@ -419,21 +430,21 @@ class TestFirewall(test_base.NodeTest):
             ('-X', CONF.firewall.firewall_chain),
             ('-N', CONF.firewall.firewall_chain),
             ('-D', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
-             '67', '-j', firewall.NEW_CHAIN),
-            ('-F', firewall.NEW_CHAIN),
-            ('-X', firewall.NEW_CHAIN),
-            ('-N', firewall.NEW_CHAIN),
+             '67', '-j', NEW_CHAIN),
+            ('-F', NEW_CHAIN),
+            ('-X', NEW_CHAIN),
+            ('-N', NEW_CHAIN),
             # Blacklist
-            ('-A', firewall.NEW_CHAIN, '-m', 'mac', '--mac-source',
+            ('-A', NEW_CHAIN, '-m', 'mac', '--mac-source',
              '7c:fe:90:29:24:4f', '-j', 'DROP'),
-            ('-A', firewall.NEW_CHAIN, '-j', 'ACCEPT'),
+            ('-A', NEW_CHAIN, '-j', 'ACCEPT'),
             ('-I', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
-             '67', '-j', firewall.NEW_CHAIN),
+             '67', '-j', NEW_CHAIN),
             ('-D', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
              '67', '-j', CONF.firewall.firewall_chain),
             ('-F', CONF.firewall.firewall_chain),
             ('-X', CONF.firewall.firewall_chain),
-            ('-E', firewall.NEW_CHAIN, CONF.firewall.firewall_chain)
+            ('-E', NEW_CHAIN, CONF.firewall.firewall_chain)
         ]
 
         with mock.patch('six.moves.builtins.open', side_effect=IOError()):
@@ -443,3 +454,468 @@ class TestFirewall(test_base.NodeTest):
         for (args, call) in zip(update_filters_expected_args,
                                 call_args_list):
             self.assertEqual(args, call[0])
+
+    @mock.patch.object(iptables.IptablesRestoreDriver, '_iptables_restore')
+    def test_update_filters_iptables_restore(self, mock_restore, mock_call,
+                                             mock_get_client, mock_iptables):
+        CONF.set_override('driver', 'iptables_restore', 'firewall')
+        active_macs = ['11:22:33:44:55:66', '66:55:44:33:22:11']
+        inactive_mac = ['AA:BB:CC:DD:EE:FF']
+        self.macs = active_macs + inactive_mac
+        self.ports = [mock.Mock(address=m) for m in self.macs]
+        mock_get_client.port.list.return_value = self.ports
+        node_cache.add_node(self.node.uuid, mac=active_macs,
+                            state=istate.States.finished,
+                            bmc_address='1.2.3.4', foo=None)
+        firewall.init()
+        mock_iptables.reset_mock()
+
+        update_filters_expected_args = [
+            ('-D', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
+             '67', '-j', NEW_CHAIN),
+            ('-F', NEW_CHAIN),
+            ('-X', NEW_CHAIN),
+            ('-I', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
+             '67', '-j', NEW_CHAIN),
+            ('-D', 'INPUT', '-i', 'br-ctlplane', '-p', 'udp', '--dport',
+             '67', '-j', CONF.firewall.firewall_chain),
+            ('-F', CONF.firewall.firewall_chain),
+            ('-X', CONF.firewall.firewall_chain),
+            ('-E', NEW_CHAIN, CONF.firewall.firewall_chain)
+        ]
+
+        firewall.update_filters(mock_get_client)
+
+        self.assertEqual(update_filters_expected_args,
+                         [call[0] for call in mock_iptables.call_args_list])
+        mock_restore.assert_called_once_with([
+            ':%s - [0:0]' % NEW_CHAIN,
+            '-A %s -m mac --mac-source %s -j DROP' % (NEW_CHAIN,
+                                                      inactive_mac[0]),
+            '-A %s -j ACCEPT' % NEW_CHAIN,
+        ])
+
+
+@mock.patch.object(iptables.IpsetDriver, '_ipset_restore')
+@mock.patch.object(iptables.IptablesDriver, '_iptables')
+@mock.patch.object(ir_utils, 'get_client', autospec=True)
+@mock.patch.object(subprocess, 'check_call', autospec=True)
+class TestFirewallIpset(test_base.NodeTest):
+    def setUp(self):
+        super(TestFirewallIpset, self).setUp()
+        CONF.set_override('driver', 'ipset', 'firewall')
+        self.active_macs = ['11:22:33:44:55:66', '66:55:44:33:22:11']
+        self.inactive_macs = ['AA:BB:CC:DD:EE:FF', '12:12:21:12:21:12']
+        self.ironic = mock.Mock()
+        self.ironic.port.list.return_value = [
+            mock.Mock(address=m)
+            for m in self.active_macs + self.inactive_macs]
+        node_cache.add_node(self.node.uuid, mac=self.active_macs,
+                            state=istate.States.waiting,
+                            bmc_address='1.2.3.4')
+
+    def test_full_sync(self, mock_call, mock_get_client, mock_iptables,
+                       mock_ipset):
+        firewall.init()
+        mock_iptables.reset_mock()
+
+        firewall.update_filters(self.ironic)
+
+        lines = mock_ipset.call_args[0][0]
+        self.assertEqual(['create ironic-inspector hash:mac',
+                          'create ironic-inspector_temp hash:mac',
+                          'flush ironic-inspector_temp'], lines[:3])
+        self.assertEqual(['swap ironic-inspector_temp ironic-inspector',
+                          'destroy ironic-inspector_temp'], lines[-2:])
+        self.assertEqual(
+            sorted('add ironic-inspector_temp %s' % mac
+                   for mac in self.inactive_macs),
+            sorted(lines[3:-2]))
+        mock_iptables.assert_any_call('-A', NEW_CHAIN, '-m', 'set',
+                                      '--match-set', 'ironic-inspector',
+                                      'src', '-j', 'DROP')
+        mock_iptables.assert_any_call('-A', NEW_CHAIN,
+                                      '-j', 'ACCEPT')
+        self.assertEqual(set(self.inactive_macs), firewall._driver().cache)
+
+    def test_incremental(self, mock_call, mock_get_client, mock_iptables,
+                         mock_ipset):
+        firewall.init()
+        firewall.update_filters(self.ironic)
+        mock_iptables.reset_mock()
+        mock_ipset.reset_mock()
+
+        # One node leaves introspection, another port appears in Ironic
+        self.ironic.port.list.return_value = [
+            mock.Mock(address=m)
+            for m in self.active_macs[:1] + self.inactive_macs[1:] +
+            ['00:00:00:00:00:01']]
+        firewall.update_filters(self.ironic)
+
+        mock_ipset.assert_called_once_with(
+            ['add ironic-inspector 00:00:00:00:00:01',
+             'del ironic-inspector %s' % self.inactive_macs[0]])
+        self.assertFalse(mock_iptables.called)
+
+    def test_full_sync_after_failure(self, mock_call, mock_get_client,
+                                     mock_iptables, mock_ipset):
+        firewall.init()
+        firewall.update_filters(self.ironic)
+        mock_ipset.side_effect = subprocess.CalledProcessError(1, 'ipset')
+        self.ironic.port.list.return_value.append(
+            mock.Mock(address='00:00:00:00:00:01'))
+
+        self.assertRaises(subprocess.CalledProcessError,
+                          firewall.update_filters, self.ironic)
+        self.assertIsNone(firewall._driver().cache)
+        self.assertIsNone(firewall.BLACKLIST_CACHE)
+
+        mock_ipset.side_effect = None
+        mock_ipset.reset_mock()
+        firewall.update_filters(self.ironic)
+        self.assertEqual('create ironic-inspector hash:mac',
+                         mock_ipset.call_args[0][0][0])
+
+    def test_clean_up(self, mock_call, mock_get_client, mock_iptables,
+                      mock_ipset):
+        firewall.init()
+        firewall.clean_up()
+
+        mock_ipset.assert_called_once_with(['destroy ironic-inspector'])
+
+
+class TestFirewallRecordingDriver(test_base.NodeTest):
+    def setUp(self):
+        super(TestFirewallRecordingDriver, self).setUp()
+        CONF.set_override('driver', 'recording', 'firewall')
+        self.active_macs = ['11:22:33:44:55:66', '66:55:44:33:22:11']
+        self.inactive_macs = ['AA:BB:CC:DD:EE:FF']
+        self.ironic = mock.Mock()
+        self.ironic.port.list.return_value = [
+            mock.Mock(address=m)
+            for m in self.active_macs + self.inactive_macs]
+        firewall.init()
+        self.driver = firewall._driver()
+
+    def test_update_filters(self):
+        node_cache.add_node(self.node.uuid, mac=self.active_macs,
+                            state=istate.States.waiting,
+                            bmc_address='1.2.3.4')
+
+        firewall.update_filters(self.ironic)
+        # No changes - no driver call
+        firewall.update_filters(self.ironic)
+
+        self.assertEqual([('init',),
+                          ('update_filters', frozenset(self.inactive_macs))],
+                         self.driver.calls)
+        self.assertEqual(set(self.inactive_macs), self.driver.blacklist)
+        self.assertEqual(
+            len(self.inactive_macs),
+            metrics._VALUES['firewall_blacklisted_macs'][()])
+        self.assertEqual(
+            2, metrics._VALUES['firewall_update_duration_seconds'][()].count)
+
+    def test_disable_dhcp(self):
+        firewall.update_filters(self.ironic)
+        firewall.update_filters(self.ironic)
+
+        self.assertEqual([('init',), ('update_filters', None)],
+                         self.driver.calls)
+        self.assertIsNone(self.driver.blacklist)
+
+    def test_clean_up(self):
+        firewall.clean_up()
+
+        self.assertEqual([('init',), ('clean_up',)], self.driver.calls)
+        self.assertFalse(self.driver.enabled)
+
+    def test_driver_failure(self):
+        node_cache.add_node(self.node.uuid, mac=self.active_macs,
+                            state=istate.States.waiting,
+                            bmc_address='1.2.3.4')
+        with mock.patch.object(self.driver, 'update_filters',
+                               side_effect=RuntimeError('boom')):
+            self.assertRaises(RuntimeError, firewall.update_filters,
+                              self.ironic)
+        self.assertIsNone(firewall.BLACKLIST_CACHE)
+
+        # The next attempt is not skipped
+        firewall.update_filters(self.ironic)
+        self.assertEqual(set(self.inactive_macs), self.driver.blacklist)
+
+    def test_ports_pagination(self):
+        CONF.set_override('ports_page_size', 2, 'firewall')
+        node_cache.add_node(self.node.uuid, mac=self.active_macs,
+                            state=istate.States.waiting,
+                            bmc_address='1.2.3.4')
+        pages = [
+            [mock.Mock(address=self.active_macs[0], uuid='uuid1'),
+             mock.Mock(address=self.inactive_macs[0], uuid='uuid2')],
+            [mock.Mock(address='00:00:00:00:00:01', uuid='uuid3'),
+             mock.Mock(address='00:00:00:00:00:02', uuid='uuid4')],
+            [],
+        ]
+        self.ironic.port.list.side_effect = pages
+
+        firewall.update_filters(self.ironic)
+
+        self.assertEqual({self.inactive_macs[0], '00:00:00:00:00:01',
+                          '00:00:00:00:00:02'}, self.driver.blacklist)
+        self.ironic.port.list.assert_has_calls([
+            mock.call(limit=2, marker=None, fields=['address', 'uuid']),
+            mock.call(limit=2, marker='uuid2', fields=['address', 'uuid']),
+            mock.call(limit=2, marker='uuid4', fields=['address', 'uuid']),
+        ])
+        self.assertEqual(3, self.ironic.port.list.call_count)
+
+    def test_ports_no_pagination(self):
+        CONF.set_override('ports_page_size', 0, 'firewall')
+        node_cache.add_node(self.node.uuid, mac=self.active_macs,
+                            state=istate.States.waiting,
+                            bmc_address='1.2.3.4')
+
+        firewall.update_filters(self.ironic)
+
+        self.assertEqual(set(self.inactive_macs), self.driver.blacklist)
+        self.ironic.port.list.assert_called_once_with(limit=0,
+                                                      fields=['address'])
+
+    def test_ports_extra_with_infiniband(self):
+        CONF.set_override('ethoib_interfaces', ['eth0'], 'firewall')
+        node_cache.add_node(self.node.uuid, mac=self.active_macs,
+                            state=istate.States.waiting,
+                            bmc_address='1.2.3.4')
+        self.ironic.port.list.return_value = [
+            mock.Mock(address=m, extra={}, uuid='uuid')
+            for m in self.active_macs + self.inactive_macs]
+
+        with mock.patch('six.moves.builtins.open', side_effect=IOError()):
+            firewall.update_filters(self.ironic)
+
+        self.assertEqual(set(self.inactive_macs), self.driver.blacklist)
+        self.ironic.port.list.assert_called_once_with(
+            limit=1000, marker=None, fields=['address', 'extra', 'uuid'])
+
+
+@mock.patch.object(firewall, 'update_filters', autospec=True)
+@mock.patch.object(time, 'sleep', autospec=True)
+class TestMarkDirty(test_base.BaseTest):
+    def setUp(self):
+        super(TestMarkDirty, self).setUp()
+        CONF.set_override('update_on_change', True, 'firewall')
+        CONF.set_override('update_delay', 2.5, 'firewall')
+        self.useFixture(fixtures.MockPatchObject(firewall, '_UPDATE_PENDING',
+                                                 False))
+
+    def test_update(self, mock_sleep, mock_update):
+        firewall.mark_dirty()
+
+        mock_sleep.assert_called_once_with(2.5)
+        mock_update.assert_called_once_with()
+        self.assertFalse(firewall._UPDATE_PENDING)
+
+    def test_coalesce(self, mock_sleep, mock_update):
+        def _sleep(delay):
+            # Changes during the delay are covered by the pending update
+            firewall.mark_dirty()
+            firewall.mark_dirty()
+
+        mock_sleep.side_effect = _sleep
+
+        firewall.mark_dirty()
+
+        mock_sleep.assert_called_once_with(2.5)
+        mock_update.assert_called_once_with()
+
+    def test_change_during_update(self, mock_sleep, mock_update):
+        calls = []
+
+        def _update():
+            calls.append(None)
+            if len(calls) == 1:
+                # The change may be missed by the running update
+                firewall.mark_dirty()
+
+        mock_update.side_effect = _update
+
+        firewall.mark_dirty()
+
+        self.assertEqual(2, mock_update.call_count)
+
+    def test_update_failed(self, mock_sleep, mock_update):
+        mock_update.side_effect = RuntimeError('boom')
+
+        firewall.mark_dirty()
+        firewall.mark_dirty()
+
+        self.assertEqual(2, mock_update.call_count)
+        self.assertFalse(firewall._UPDATE_PENDING)
+
+    @mock.patch.object(utils, 'executor', autospec=True)
+    def test_submit_failed(self, mock_executor, mock_sleep, mock_update):
+        mock_executor.return_value.submit.side_effect = RuntimeError('boom')
+
+        self.assertRaises(RuntimeError, firewall.mark_dirty)
+
+        self.assertFalse(firewall._UPDATE_PENDING)
+        self.assertFalse(mock_update.called)
+
+    def test_disabled(self, mock_sleep, mock_update):
+        CONF.set_override('update_on_change', False, 'firewall')
+
+        firewall.mark_dirty()
+
+        self.assertFalse(mock_sleep.called)
+        self.assertFalse(mock_update.called)
+
+    def test_firewall_not_managed(self, mock_sleep, mock_update):
+        CONF.set_override('manage_firewall', False, 'firewall')
+
+        firewall.mark_dirty()
+
+        self.assertFalse(mock_update.called)
+
+
+class TestForwardUpdates(test_base.BaseTest):
+    def setUp(self):
+        super(TestForwardUpdates, self).setUp()
+        self.address = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                    'firewall.sock')
+        self.sock = eventlet.listen(self.address, family=socket.AF_UNIX)
+        self.addCleanup(self.sock.close)
+        self.useFixture(fixtures.MockPatchObject(
+            firewall, '_UPDATE_REQUESTS_ADDRESS', None))
+
+    def _serve(self):
+        server = eventlet.spawn(firewall.serve_update_requests, self.sock)
+        self.addCleanup(server.kill)
+
+    @mock.patch.object(firewall, '_driver', autospec=True)
+    @mock.patch.object(firewall, '_update_filters', autospec=True)
+    def test_update_forwarded(self, mock_update, mock_driver):
+        self._serve()
+        firewall.forward_updates(self.address)
+        firewall.update_filters()
+        firewall.update_filters()
+
+        self.assertEqual([mock.call(), mock.call()],
+                         mock_update.call_args_list)
+        self.assertFalse(mock_driver.called)
+
+    @mock.patch.object(firewall, '_update_filters', autospec=True)
+    def test_update_forwarded_failure(self, mock_update):
+        mock_update.side_effect = RuntimeError('boom')
+        self._serve()
+        firewall.forward_updates(self.address)
+
+        six.assertRaisesRegex(self, utils.Error, 'Firewall update failed',
+                              firewall.update_filters)
+        mock_update.assert_called_once_with()
+
+    def test_update_forwarded_timeout(self):
+        CONF.set_override('update_request_timeout', 42, 'firewall')
+        firewall.forward_updates(self.address)
+
+        with mock.patch.object(firewall.socket, 'socket',
+                               autospec=True) as mock_socket:
+            mock_sock = mock_socket.return_value
+            mock_sock.recv.side_effect = socket.timeout()
+            six.assertRaisesRegex(self, utils.Error,
+                                  'not finished in 42 seconds',
+                                  firewall.update_filters)
+
+        mock_sock.settimeout.assert_called_once_with(42)
+        mock_sock.connect.assert_called_once_with(self.address)
+        mock_sock.close.assert_called_once_with()
+
+    def test_update_forwarded_not_served(self):
+        firewall.forward_updates(self.address + '.missing')
+
+        six.assertRaisesRegex(self, utils.Error,
+                              'Failed to request a firewall update',
+                              firewall.update_filters)
+
+    @mock.patch.object(firewall, '_update_filters', autospec=True)
+    def test_requests_coalesced(self, mock_update):
+        conns = [mock.Mock(spec=['sendall', 'close']) for _i in range(3)]
+        requests = queue.LightQueue()
+        requests.put(conns[1])
+        # Accepted while the update is running
+        mock_update.side_effect = lambda: requests.put(conns[2])
+
+        # Stop the loop waiting for the next requests
+        with mock.patch.object(requests, 'get', autospec=True) as mock_get:
+            mock_get.side_effect = [conns[0], _Stop()]
+            self.assertRaises(_Stop, firewall._run_requested_updates,
+                              requests)
+
+        # The requests accepted before the update started are covered by it
+        mock_update.assert_called_once_with()
+        for conn in conns[:2]:
+            conn.sendall.assert_called_once_with(firewall._UPDATE_DONE)
+            conn.close.assert_called_once_with()
+        self.assertFalse(conns[2].sendall.called)
+
+    @mock.patch.object(firewall, '_update_filters', autospec=True)
+    def test_requests_failure(self, mock_update):
+        mock_update.side_effect = RuntimeError('boom')
+        conn = mock.Mock(spec=['sendall', 'close'])
+        requests = mock.Mock(spec=['get', 'get_nowait', 'empty'])
+        requests.get.side_effect = [conn, _Stop()]
+        requests.empty.return_value = True
+
+        self.assertRaises(_Stop, firewall._run_requested_updates, requests)
+
+        conn.sendall.assert_called_once_with(firewall._UPDATE_FAILED)
+        conn.close.assert_called_once_with()
+
+
+class _Stop(Exception):
+    pass
+
+
+class TestNeighs(test_base.BaseTest):
+    def setUp(self):
+        super(TestNeighs, self).setUp()
+        self.useFixture(fixtures.MockPatchObject(firewall, '_NEIGHS_CACHE',
+                                                 {}))
+
+    def test_parse(self):
+        self.assertEqual({'7c:fe:90:03:00:29:26:52': '02:00:02:97:00:01',
+                          '7c:fe:90:03:00:29:24:4f': '02:00:00:61:00:02'},
+                         firewall._parse_neighs(IB_DATA))
+
+    def test_parse_duplicate(self):
+        data = IB_DATA + ('EMAC=02:00:00:61:00:03 '
+                          'IMAC=61:fe:80:00:00:00:00:00:00:7c:fe:90:03:00:29:'
+                          '24:4f\n')
+        self.assertEqual('02:00:00:61:00:02',
+                         firewall._parse_neighs(data)[
+                             '7c:fe:90:03:00:29:24:4f'])
+
+    @mock.patch.object(firewall, '_parse_neighs', autospec=True,
+                       side_effect=firewall._parse_neighs)
+    def test_get_neighs_cached(self, mock_parse):
+        fileobj = mock.mock_open(read_data=IB_DATA)
+        with mock.patch('six.moves.builtins.open', fileobj, create=True):
+            first = firewall._get_neighs('eth0')
+            second = firewall._get_neighs('eth0')
+
+        self.assertEqual(first, second)
+        mock_parse.assert_called_once_with(IB_DATA)
+        fileobj.assert_called_with('/sys/class/net/eth0/eth/neighs', 'r')
+
+    def test_get_neighs_changed(self):
+        fileobj = mock.mock_open(read_data=IB_DATA)
+        with mock.patch('six.moves.builtins.open', fileobj, create=True):
+            firewall._get_neighs('eth0')
+        data = 'EMAC=02:00:00:61:00:03 IMAC=61:fe:7c:fe:90:03:00:29:24:4f\n'
+        fileobj = mock.mock_open(read_data=data)
+        with mock.patch('six.moves.builtins.open', fileobj, create=True):
+            self.assertEqual({'7c:fe:90:03:00:29:24:4f': '02:00:00:61:00:03'},
+                             firewall._get_neighs('eth0'))
+
+    def test_get_neighs_no_such_file(self):
+        with mock.patch('six.moves.builtins.open', side_effect=IOError()):
+            self.assertIsNone(firewall._get_neighs('eth0'))
@@ -0,0 +1,128 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+
+from oslo_config import cfg
+from oslo_utils import timeutils
+from oslo_utils import uuidutils
+
+from ironic_inspector import db
+from ironic_inspector import hash_ring
+from ironic_inspector.test import base as test_base
+
+
+CONF = cfg.CONF
+
+
+class TestHashRing(test_base.BaseTest):
+    def setUp(self):
+        super(TestHashRing, self).setUp()
+        self.keys = [uuidutils.generate_uuid() for _ in range(1000)]
+
+    def test_single_member(self):
+        ring = hash_ring.HashRing(['a'], 8)
+        self.assertEqual({'a'}, {ring.get_member(key) for key in self.keys})
+
+    def test_stable(self):
+        first = hash_ring.HashRing(['a', 'b', 'c'], 8)
+        second = hash_ring.HashRing(['c', 'b', 'a'], 8)
+        for key in self.keys:
+            self.assertEqual(first.get_member(key), second.get_member(key))
+
+    def test_even_split(self):
+        ring = hash_ring.HashRing(['a', 'b', 'c', 'd'], 64)
+        counts = {}
+        for key in self.keys:
+            member = ring.get_member(key)
+            counts[member] = counts.get(member, 0) + 1
+        self.assertEqual({'a', 'b', 'c', 'd'}, set(counts))
+        for count in counts.values():
+            self.assertGreater(count, 150)
+            self.assertLess(count, 350)
+
+    def test_new_member_only_takes_keys(self):
+        old = hash_ring.HashRing(['a', 'b', 'c'], 64)
+        new = hash_ring.HashRing(['a', 'b', 'c', 'd'], 64)
+        moved = [key for key in self.keys
+                 if old.get_member(key) != new.get_member(key)]
+        self.assertTrue(moved)
+        self.assertEqual({'d'}, {new.get_member(key) for key in moved})
+
+
+class TestMembership(test_base.BaseTest):
+    def setUp(self):
+        super(TestMembership, self).setUp()
+        CONF.set_override('partition_periodic_tasks', True, 'coordination')
+
+    def _add_member(self, heartbeat_at=None):
+        member_id = uuidutils.generate_uuid()
+        with db.ensure_transaction() as session:
+            db.Member(id=member_id, host='other',
+                      heartbeat_at=heartbeat_at or timeutils.utcnow()).save(
+                session)
+        return member_id
+
+    def _members(self):
+        return {row.id for row in db.model_query(db.Member)}
+
+    def test_heartbeat(self):
+        hash_ring.heartbeat()
+        self.assertEqual({hash_ring.MEMBER_ID}, self._members())
+        self.assertEqual({hash_ring.MEMBER_ID}, hash_ring._RING.members)
+
+        hash_ring.heartbeat()
+        self.assertEqual({hash_ring.MEMBER_ID}, self._members())
+
+    def test_heartbeat_updates_ring(self):
+        hash_ring.heartbeat()
+        live = self._add_member()
+        dead = self._add_member(timeutils.utcnow() - datetime.timedelta(
+            seconds=CONF.coordination.member_timeout + 1))
+
+        hash_ring.heartbeat()
+
+        self.assertEqual({hash_ring.MEMBER_ID, live}, self._members())
+        self.assertEqual({hash_ring.MEMBER_ID, live},
+                         hash_ring._RING.members)
+        self.assertNotIn(dead, self._members())
+
+    def test_owns(self):
+        other = self._add_member()
+        hash_ring.heartbeat()
+        owned = [key for key in (uuidutils.generate_uuid()
+                                 for _ in range(100))
+                 if hash_ring.owns(key)]
+        self.assertTrue(owned)
+        self.assertLess(len(owned), 100)
+        for key in owned:
+            self.assertNotEqual(other, hash_ring._RING.get_member(key))
+
+    def test_owns_disabled(self):
+        self._add_member()
+        hash_ring.heartbeat()
+        CONF.set_override('partition_periodic_tasks', False, 'coordination')
+        self.assertTrue(all(hash_ring.owns(uuidutils.generate_uuid())
+                            for _ in range(100)))
+
+    def test_owns_before_heartbeat(self):
+        self._add_member()
+        self.assertTrue(all(hash_ring.owns(uuidutils.generate_uuid())
+                            for _ in range(100)))
+
+    def test_leave(self):
+        other = self._add_member()
+        hash_ring.heartbeat()
+        hash_ring.leave()
+        self.assertEqual({other}, self._members())
+        self.assertIsNone(hash_ring._RING)
@@ -0,0 +1,37 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import subprocess
+import sys
+
+from ironic_inspector.common import entry_points
+from ironic_inspector.test import base as test_base
+
+
+def loaded_modules(module):
+    """Import a module in a new interpreter.
+
+    :returns: list of names of the modules loaded
+    """
+    output = subprocess.check_output(
+        [sys.executable, '-W', 'ignore', '-c',
+         'import sys, %s; print(" ".join(sys.modules))' % module])
+    return output.decode('utf-8').split()
+
+
+class TestImports(test_base.BaseTest):
+    def test_entry_points(self):
+        for module in entry_points.ENTRY_POINTS:
+            self.assertEqual([], entry_points.unexpected_imports(
+                module, loaded_modules(module)),
+                'Imported by %s' % module)
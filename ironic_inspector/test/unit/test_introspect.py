@@ -12,12 +12,16 @@
 # limitations under the License.
 
 import collections
+import os
+import socket
 import time
 
 import eventlet
+import fixtures
 from ironicclient import exceptions
 import mock
 from oslo_config import cfg
+from oslo_utils import uuidutils
 
 from ironic_inspector.common import ironic as ir_utils
 from ironic_inspector import firewall
@@ -337,6 +341,224 @@ class TestIntrospect(BaseTest):
         self.assertEqual(42, introspect._LAST_INTROSPECTION_TIME)
 
 
+@mock.patch.object(eventlet.greenthread, 'sleep', lambda _: None)
+@mock.patch.object(firewall, 'update_filters', autospec=True)
+@mock.patch.object(node_cache, 'start_introspection_many', autospec=True)
+@mock.patch.object(ir_utils, 'get_client', autospec=True)
+class TestIntrospectMany(BaseTest):
+    def setUp(self):
+        super(TestIntrospectMany, self).setUp()
+        self.uuid2 = uuidutils.generate_uuid()
+        self.node2 = mock.Mock(uuid=self.uuid2, driver='pxe_ipmitool',
+                               driver_info={'ipmi_address': '1.2.3.5'},
+                               provision_state='manageable')
+        self.node_info2 = mock.Mock(uuid=self.uuid2, options={})
+        self.node_info2.node.return_value = self.node2
+        self.nodes = {self.uuid: self.node, 'name2': self.node2,
+                      self.uuid2: self.node2}
+
+    def _prepare(self, client_mock):
+        cli = super(TestIntrospectMany, self)._prepare(client_mock)
+
+        def _get(node_id):
+            try:
+                return self.nodes[node_id]
+            except KeyError:
+                raise exceptions.NotFound()
+
+        cli.node.get.side_effect = _get
+        cli.node.list_ports.side_effect = lambda uuid, limit: (
+            self.ports if uuid == self.uuid else [])
+        return cli
+
+    def test_ok(self, client_mock, start_mock, filters_mock):
+        cli = self._prepare(client_mock)
+        start_mock.return_value = {self.uuid: self.node_info,
+                                   self.uuid2: self.node_info2}
+
+        results = introspect.introspect_many([self.uuid, 'name2'],
+                                             token='token')
+
+        self.assertEqual([{'node': self.uuid, 'uuid': self.uuid,
+                           'error': None},
+                          {'node': 'name2', 'uuid': self.uuid2,
+                           'error': None}], results)
+        client_mock.assert_called_once_with('token')
+        cli.node.validate.assert_has_calls([mock.call(self.uuid),
+                                            mock.call(self.uuid2)])
+        start_mock.assert_called_once_with(
+            {self.uuid: {'bmc_address': self.bmc_address,
+                         'mac': list(self.macs)},
+             self.uuid2: {'bmc_address': '1.2.3.5', 'mac': []}},
+            ironic=cli)
+        # MAC's are stored by start_introspection_many and whitelisted once
+        filters_mock.assert_called_once_with(cli)
+        for node_info in (self.node_info, self.node_info2):
+            self.assertFalse(node_info.ports.called)
+            self.assertFalse(node_info.add_attribute.called)
+            self.assertFalse(node_info.finished.called)
+            node_info.acquire_lock.assert_called_once_with()
+            node_info.release_lock.assert_called_once_with()
+        cli.node.set_power_state.assert_has_calls(
+            [mock.call(self.uuid, 'reboot'), mock.call(self.uuid2, 'reboot')])
+
+    def test_validation_failed(self, client_mock, start_mock, filters_mock):
+        cli = self._prepare(client_mock)
+        cli.node.validate.side_effect = lambda uuid: mock.Mock(
+            power={'result': uuid != self.uuid, 'reason': 'oops'})
+        start_mock.return_value = {self.uuid2: self.node_info2}
+
+        results = introspect.introspect_many([self.uuid, 'name2', 'foo'])
+
+        self.assertEqual(self.uuid, results[0]['uuid'])
+        self.assertIn('Failed validation of power interface',
+                      results[0]['error'])
+        self.assertEqual({'node': 'name2', 'uuid': self.uuid2,
+                          'error': None}, results[1])
+        self.assertEqual('foo', results[2]['node'])
+        self.assertIsNone(results[2]['uuid'])
+        self.assertIn('foo', results[2]['error'])
+        start_mock.assert_called_once_with(
+            {self.uuid2: {'bmc_address': '1.2.3.5', 'mac': []}}, ironic=cli)
+        filters_mock.assert_called_once_with(cli)
+        cli.node.set_power_state.assert_called_once_with(self.uuid2,
+                                                         'reboot')
+
+    def test_duplicate(self, client_mock, start_mock, filters_mock):
+        cli = self._prepare(client_mock)
+        start_mock.return_value = {self.uuid2: self.node_info2}
+
+        results = introspect.introspect_many([self.uuid2, 'name2'])
+
+        self.assertIsNone(results[0]['error'])
+        self.assertEqual(self.uuid2, results[1]['uuid'])
+        self.assertIn('more than once', results[1]['error'])
+        start_mock.assert_called_once_with(
+            {self.uuid2: {'bmc_address': '1.2.3.5', 'mac': []}}, ironic=cli)
+        cli.node.set_power_state.assert_called_once_with(self.uuid2,
+                                                         'reboot')
+
+    def test_start_failed(self, client_mock, start_mock, filters_mock):
+        cli = self._prepare(client_mock)
+        start_mock.return_value = {self.uuid: utils.Error('boom'),
+                                   self.uuid2: self.node_info2}
+
+        results = introspect.introspect_many([self.uuid, self.uuid2])
+
+        self.assertEqual([{'node': self.uuid, 'uuid': self.uuid,
+                           'error': 'boom'},
+                          {'node': self.uuid2, 'uuid': self.uuid2,
+                           'error': None}], results)
+        filters_mock.assert_called_once_with(cli)
+        cli.node.set_power_state.assert_called_once_with(self.uuid2,
+                                                         'reboot')
+
+    def test_nothing_started(self, client_mock, start_mock, filters_mock):
+        cli = self._prepare(client_mock)
+        start_mock.return_value = {self.uuid: utils.Error('boom')}
+
+        results = introspect.introspect_many([self.uuid])
+
+        self.assertEqual('boom', results[0]['error'])
+        self.assertFalse(filters_mock.called)
+        self.assertFalse(cli.node.set_power_state.called)
+
+    def test_firewall_failed(self, client_mock, start_mock, filters_mock):
+        cli = self._prepare(client_mock)
+        start_mock.return_value = {self.uuid: self.node_info,
+                                   self.uuid2: self.node_info2}
+        filters_mock.side_effect = RuntimeError('boom')
+
+        results = introspect.introspect_many([self.uuid, self.uuid2])
+
+        # Introspection is started, but fails in background
+        self.assertEqual([None, None], [r['error'] for r in results])
+        for node_info in (self.node_info, self.node_info2):
+            node_info.finished.assert_called_once_with(
+                error='Failed to update firewall filters: boom')
+        self.assertFalse(cli.node.set_power_state.called)
+
+    def test_power_failure(self, client_mock, start_mock, filters_mock):
+        cli = self._prepare(client_mock)
+        start_mock.return_value = {self.uuid: self.node_info,
+                                   self.uuid2: self.node_info2}
+        cli.node.set_power_state.side_effect = [exceptions.BadRequest(),
+                                                None]
+
+        introspect.introspect_many([self.uuid, self.uuid2])
+
+        self.node_info.finished.assert_called_once_with(error=mock.ANY)
+        self.assertFalse(self.node_info2.finished.called)
+
+
+@mock.patch.object(firewall, '_update_filters', autospec=True)
+@mock.patch.object(ir_utils, 'get_client', autospec=True)
+class TestForwardedFirewallUpdate(BaseTest):
+    """Introspection in an API worker not managing the firewall."""
+
+    def setUp(self):
+        super(TestForwardedFirewallUpdate, self).setUp()
+        address = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                               'firewall.sock')
+        sock = eventlet.listen(address, family=socket.AF_UNIX)
+        self.addCleanup(sock.close)
+        server = eventlet.spawn(firewall.serve_update_requests, sock)
+        self.addCleanup(server.kill)
+        self.useFixture(fixtures.MockPatchObject(
+            firewall, '_UPDATE_REQUESTS_ADDRESS', None))
+        firewall.forward_updates(address)
+        self.calls = []
+
+    def _prepare(self, client_mock, update_mock):
+        cli = super(TestForwardedFirewallUpdate, self)._prepare(client_mock)
+        cli.node.list_ports.return_value = self.ports
+        cli.node.set_power_state.side_effect = (
+            lambda *args: self.calls.append('power on'))
+
+        def _update():
+            self.calls.append('update started')
+            # Switch to the requesting greenthread, it must keep waiting
+            eventlet.sleep(0)
+            self.calls.append('update finished')
+
+        update_mock.side_effect = _update
+        return cli
+
+    @mock.patch.object(node_cache, 'start_introspection', autospec=True)
+    def test_introspect(self, start_mock, client_mock, update_mock):
+        self._prepare(client_mock, update_mock)
+        start_mock.return_value = self.node_info
+
+        introspect.introspect(self.uuid)
+
+        self.assertEqual(['update started', 'update finished', 'power on'],
+                         self.calls)
+        self.assertFalse(self.node_info.finished.called)
+
+    @mock.patch.object(node_cache, 'start_introspection_many',
+                       autospec=True)
+    def test_introspect_many(self, start_mock, client_mock, update_mock):
+        self._prepare(client_mock, update_mock)
+        start_mock.return_value = {self.uuid: self.node_info}
+
+        introspect.introspect_many([self.uuid])
+
+        self.assertEqual(['update started', 'update finished', 'power on'],
+                         self.calls)
+        self.assertFalse(self.node_info.finished.called)
+
+    @mock.patch.object(node_cache, 'start_introspection', autospec=True)
+    def test_update_failed(self, start_mock, client_mock, update_mock):
+        cli = self._prepare(client_mock, update_mock)
+        start_mock.return_value = self.node_info
+        update_mock.side_effect = RuntimeError('boom')
+
+        introspect.introspect(self.uuid)
+
+        self.assertFalse(cli.node.set_power_state.called)
+        self.node_info.finished.assert_called_once_with(error=mock.ANY)
+
+
 @mock.patch.object(firewall, 'update_filters', autospec=True)
 @mock.patch.object(node_cache, 'start_introspection', autospec=True)
 @mock.patch.object(ir_utils, 'get_client', autospec=True)
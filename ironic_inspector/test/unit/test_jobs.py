@@ -0,0 +1,206 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import json
+
+import mock
+from oslo_config import cfg
+from oslo_utils import timeutils
+
+from ironic_inspector import db
+from ironic_inspector import hash_ring
+from ironic_inspector import introspection_state as istate
+from ironic_inspector import jobs
+from ironic_inspector import node_cache
+from ironic_inspector.test import base as test_base
+
+
+CONF = cfg.CONF
+
+
+class BaseJobsTest(test_base.NodeTest):
+    def setUp(self):
+        super(BaseJobsTest, self).setUp()
+        CONF.set_override('durable_jobs', True, 'processing')
+        self.handler = mock.Mock(return_value=None)
+        jobs.register('test')(self.handler)
+        self.addCleanup(jobs._HANDLERS.pop, 'test')
+        node_cache.add_node(self.uuid, istate.States.processing)
+
+    def _jobs(self):
+        return db.model_query(db.Job).all()
+
+
+class TestSubmit(BaseJobsTest):
+    def setUp(self):
+        super(TestSubmit, self).setUp()
+        self.node_info = node_cache.get_node(self.uuid, locked=True)
+
+    def test_durable(self):
+        def _handler(node_info, foo):
+            job, = self._jobs()
+            self.assertEqual(self.uuid, job.uuid)
+            self.assertEqual('test', job.stage)
+            self.assertEqual({'foo': 'bar'}, json.loads(job.data))
+            self.assertEqual(jobs.OWNER, job.owner)
+            self.assertEqual(1, job.attempts)
+            self.assertGreater(job.lease_expires_at, timeutils.utcnow())
+
+        self.handler.side_effect = _handler
+        jobs.submit('test', self.node_info, foo='bar')
+
+        self.handler.assert_called_once_with(self.node_info, foo='bar')
+        self.assertEqual([], self._jobs())
+        self.assertFalse(self.node_info._locked)
+
+    def test_not_durable(self):
+        CONF.set_override('durable_jobs', False, 'processing')
+        self.handler.side_effect = lambda node_info, foo: self.assertEqual(
+            [], self._jobs())
+        jobs.submit('test', self.node_info, foo='bar')
+
+        self.handler.assert_called_once_with(self.node_info, foo='bar')
+        self.assertFalse(self.node_info._locked)
+
+    def test_local_kwargs(self):
+        def _handler(node_info, foo, data):
+            job, = self._jobs()
+            self.assertEqual({'foo': 'bar'}, json.loads(job.data))
+
+        self.handler.side_effect = _handler
+        jobs.submit('test', self.node_info, local_kwargs={'data': 'big'},
+                    foo='bar')
+
+        self.handler.assert_called_once_with(self.node_info, foo='bar',
+                                             data='big')
+
+    def test_failure(self):
+        self.handler.side_effect = RuntimeError('boom')
+        jobs.submit('test', self.node_info)
+
+        self.handler.assert_called_once_with(self.node_info)
+        self.assertEqual([], self._jobs())
+        self.assertFalse(self.node_info._locked)
+
+
+class TestLease(BaseJobsTest):
+    def test_renew(self):
+        job_id = jobs._create('test', self.uuid, {})
+        old = self._jobs()[0].lease_expires_at
+        with mock.patch.object(timeutils, 'utcnow', autospec=True) as now:
+            now.return_value = old + datetime.timedelta(seconds=10)
+            self.assertTrue(jobs._renew(job_id))
+        self.assertGreater(self._jobs()[0].lease_expires_at, old)
+
+    def test_renew_taken_over(self):
+        job_id = jobs._create('test', self.uuid, {})
+        db.model_query(db.Job).update({'owner': 'other'})
+        self.assertFalse(jobs._renew(job_id))
+
+    def test_claim_race(self):
+        jobs._create('test', self.uuid, {})
+        job = self._jobs()[0]
+        db.model_query(db.Job).update(
+            {'lease_expires_at': job.lease_expires_at +
+             datetime.timedelta(seconds=1)})
+        self.assertFalse(jobs._claim(job))
+
+
+class TestResume(BaseJobsTest):
+    def setUp(self):
+        super(TestResume, self).setUp()
+        self.expired = timeutils.utcnow() - datetime.timedelta(seconds=1)
+
+    def _add_job(self, stage='test', attempts=1, lease_expires_at=None):
+        with db.ensure_transaction() as session:
+            db.Job(uuid=self.uuid, stage=stage, data='{"foo": "bar"}',
+                   created_at=timeutils.utcnow(), owner='other',
+                   lease_expires_at=lease_expires_at or self.expired,
+                   attempts=attempts).save(session)
+
+    def test_resume(self):
+        self._add_job()
+
+        def _handler(node_info, foo):
+            self.assertTrue(node_info._locked)
+            job, = self._jobs()
+            self.assertEqual(jobs.OWNER, job.owner)
+            self.assertEqual(2, job.attempts)
+
+        self.handler.side_effect = _handler
+        self.assertEqual(1, jobs.resume())
+
+        self.handler.assert_called_once_with(mock.ANY, foo='bar')
+        self.assertEqual(self.uuid, self.handler.call_args[0][0].uuid)
+        self.assertEqual([], self._jobs())
+        self.assertTrue(node_cache._get_lock(self.uuid).acquire(
+            blocking=False))
+
+    @mock.patch.object(hash_ring, 'owns', autospec=True)
+    def test_other_process(self, owns_mock):
+        owns_mock.return_value = False
+        self._add_job()
+        self.assertEqual(0, jobs.resume())
+        self.assertFalse(self.handler.called)
+        job, = self._jobs()
+        self.assertEqual('other', job.owner)
+        owns_mock.assert_called_once_with(self.uuid)
+
+    def test_not_expired(self):
+        self._add_job(lease_expires_at=timeutils.utcnow() +
+                      datetime.timedelta(seconds=60))
+        self.assertEqual(0, jobs.resume())
+        self.assertFalse(self.handler.called)
+        self.assertEqual(1, len(self._jobs()))
+
+    def test_disabled(self):
+        CONF.set_override('durable_jobs', False, 'processing')
+        self._add_job()
+        self.assertEqual(0, jobs.resume())
+        self.assertFalse(self.handler.called)
+
+    def test_locked(self):
+        self._add_job()
+        node_info = node_cache.get_node(self.uuid, locked=True)
+        try:
+            self.assertEqual(0, jobs.resume())
+        finally:
+            node_info.release_lock()
+        self.assertFalse(self.handler.called)
+        job, = self._jobs()
+        self.assertEqual(1, job.attempts)
+
+    def test_unknown_stage(self):
+        self._add_job(stage='unknown')
+        self.assertEqual(0, jobs.resume())
+        self.assertEqual([], self._jobs())
+
+    def test_node_not_in_cache(self):
+        self._add_job()
+        db.model_query(db.Node).delete()
+        self.assertEqual(0, jobs.resume())
+        self.assertFalse(self.handler.called)
+        self.assertEqual([], self._jobs())
+
+    def test_too_many_attempts(self):
+        CONF.set_override('job_max_attempts', 2, 'processing')
+        self._add_job(attempts=2)
+        self.assertEqual(0, jobs.resume())
+
+        self.assertFalse(self.handler.called)
+        self.assertEqual([], self._jobs())
+        node_info = node_cache.get_node(self.uuid)
+        self.assertEqual(istate.States.error, node_info.state)
+        self.assertEqual('Background stage test was interrupted 2 times',
+                         node_info.error)
@@ -21,17 +21,22 @@ import mock
 from oslo_utils import uuidutils
 
 from ironic_inspector.common import ironic as ir_utils
+from ironic_inspector.common import swift
 from ironic_inspector import conf
 from ironic_inspector import db
 from ironic_inspector import firewall
+from ironic_inspector import hash_ring
 from ironic_inspector import introspect
 from ironic_inspector import main
+from ironic_inspector import metrics
 from ironic_inspector import node_cache
 from ironic_inspector.plugins import base as plugins_base
 from ironic_inspector.plugins import example as example_plugin
 from ironic_inspector import process
 from ironic_inspector import rules
+from ironic_inspector import server
 from ironic_inspector.test import base as test_base
+from ironic_inspector import timing
 from ironic_inspector import utils
 from oslo_config import cfg
 
@@ -115,6 +120,61 @@ class TestApiIntrospect(BaseAPITest):
         self.assertFalse(introspect_mock.called)
 
 
+@mock.patch.object(introspect, 'introspect_many', autospec=True)
+class TestApiIntrospectMany(BaseAPITest):
+    def setUp(self):
+        super(TestApiIntrospectMany, self).setUp()
+        self.headers = {conf.VERSION_HEADER: '1.10'}
+        self.results = [
+            {'node': self.uuid, 'uuid': self.uuid, 'error': None},
+            {'node': 'name', 'uuid': None, 'error': 'boom'},
+        ]
+
+    def _post(self, data, headers=None):
+        return self.app.post('/v1/introspection', data=json.dumps(data),
+                             headers=headers or self.headers)
+
+    def test_ok(self, introspect_mock):
+        introspect_mock.return_value = self.results
+        res = self._post({'nodes': [self.uuid, 'name']})
+        self.assertEqual(202, res.status_code)
+        self.assertEqual({'nodes': self.results},
+                         json.loads(res.data.decode('utf-8')))
+        introspect_mock.assert_called_once_with([self.uuid, 'name'],
+                                                token=None)
+
+    def test_old_api_version(self, introspect_mock):
+        res = self._post({'nodes': [self.uuid]},
+                         headers={conf.VERSION_HEADER: '1.9'})
+        self.assertEqual(400, res.status_code)
+        self.assertIn('1.10', _get_error(res))
+        self.assertFalse(introspect_mock.called)
+
+    def test_invalid_data(self, introspect_mock):
+        for data in ([self.uuid], {}, {'nodes': []}, {'nodes': self.uuid},
+                     {'nodes': [42]}):
+            res = self._post(data)
+            self.assertEqual(400, res.status_code)
+            self.assertIn('Invalid data', _get_error(res))
+        self.assertFalse(introspect_mock.called)
+
+    def test_too_many_nodes(self, introspect_mock):
+        CONF.set_override('api_max_limit', 1)
+        res = self._post({'nodes': [self.uuid, 'name']})
+        self.assertEqual(400, res.status_code)
+        self.assertIn('Too many nodes', _get_error(res))
+        self.assertFalse(introspect_mock.called)
+
+    @mock.patch.object(utils, 'check_auth', autospec=True)
+    def test_failed_authentication(self, auth_mock, introspect_mock):
+        CONF.set_override('auth_strategy', 'keystone')
+        auth_mock.side_effect = utils.Error('Boom', code=403)
+        headers = dict(self.headers, **{'X-Auth-Token': 'token'})
+        res = self._post({'nodes': [self.uuid]}, headers=headers)
+        self.assertEqual(403, res.status_code)
+        self.assertFalse(introspect_mock.called)
+
+
 @mock.patch.object(process, 'process', autospec=True)
 class TestApiContinue(BaseAPITest):
     def test_continue(self, process_mock):
@@ -123,14 +183,18 @@ class TestApiContinue(BaseAPITest):
         process_mock.return_value = {'result': 42}
         res = self.app.post('/v1/continue', data='{"foo": "bar"}')
         self.assertEqual(200, res.status_code)
-        process_mock.assert_called_once_with({"foo": "bar"})
+        process_mock.assert_called_once_with({"foo": "bar"},
+                                             raw_data=b'{"foo": "bar"}')
         self.assertEqual({"result": 42}, json.loads(res.data.decode()))
+        self.assertEqual(
+            1, metrics._VALUES['continue_duration_seconds'][()].count)
 
     def test_continue_failed(self, process_mock):
         process_mock.side_effect = utils.Error("boom")
         res = self.app.post('/v1/continue', data='{"foo": "bar"}')
         self.assertEqual(400, res.status_code)
-        process_mock.assert_called_once_with({"foo": "bar"})
+        process_mock.assert_called_once_with({"foo": "bar"},
+                                             raw_data=b'{"foo": "bar"}')
         self.assertEqual('boom', _get_error(res))
 
     def test_continue_wrong_type(self, process_mock):
@@ -141,6 +205,36 @@ class TestApiContinue(BaseAPITest):
         self.assertFalse(process_mock.called)
 
 
+@mock.patch.object(process, 'process_async', autospec=True)
+class TestApiContinueAsync(BaseAPITest):
+    def setUp(self):
+        super(TestApiContinueAsync, self).setUp()
+        CONF.set_override('async_continue', True, 'processing')
+
+    def test_queued(self, process_mock):
+        process_mock.return_value = {'uuid': self.uuid}, True
+        res = self.app.post('/v1/continue', data='{"foo": "bar"}')
+        self.assertEqual(202, res.status_code)
+        process_mock.assert_called_once_with({"foo": "bar"},
+                                             raw_data=b'{"foo": "bar"}')
+        self.assertEqual({'uuid': self.uuid}, json.loads(res.data.decode()))
+
+    def test_processed(self, process_mock):
+        process_mock.return_value = {'ipmi_setup_credentials': True}, False
+        res = self.app.post('/v1/continue', data='{"foo": "bar"}')
+        self.assertEqual(200, res.status_code)
+        self.assertEqual({'ipmi_setup_credentials': True},
+                         json.loads(res.data.decode()))
+
+    def test_queue_full(self, process_mock):
+        process_mock.side_effect = utils.ServiceUnavailable('full',
+                                                            retry_after=10)
+        res = self.app.post('/v1/continue', data='{"foo": "bar"}')
+        self.assertEqual(503, res.status_code)
+        self.assertEqual('10', res.headers['Retry-After'])
+        self.assertEqual('full', _get_error(res))
+
+
 @mock.patch.object(introspect, 'abort', autospec=True)
 class TestApiAbort(BaseAPITest):
     def test_ok(self, abort_mock):
@@ -244,6 +338,24 @@ class TestApiGetStatus(GetStatusAPIBaseTest):
         self.assertEqual(self.finished_node.status,
                          json.loads(res.data.decode('utf-8')))
 
+    def test_get_introspection_timings(self, get_mock):
+        CONF.set_override('store_timings', True, 'processing')
+        self.finished_node._options = {'timings': {'lookup': 0.5}}
+        get_mock.return_value = self.finished_node
+        res = self.app.get('/v1/introspection/%s' % self.uuid)
+        self.assertEqual(200, res.status_code)
+        expected = dict(self.finished_node.status, timings={'lookup': 0.5})
+        self.assertEqual(expected, json.loads(res.data.decode('utf-8')))
+
+    def test_get_introspection_no_timings(self, get_mock):
+        CONF.set_override('store_timings', True, 'processing')
+        self.unfinished_node._options = {}
+        get_mock.return_value = self.unfinished_node
+        res = self.app.get('/v1/introspection/%s' % self.uuid)
+        self.assertEqual(200, res.status_code)
+        expected = dict(self.unfinished_node.status, timings=None)
+        self.assertEqual(expected, json.loads(res.data.decode('utf-8')))
+
 
 @mock.patch.object(node_cache, 'get_node_list', autospec=True)
 class TestApiListStatus(GetStatusAPIBaseTest):
@@ -273,7 +385,7 @@ class TestApiListStatus(GetStatusAPIBaseTest):
 
 
 class TestApiGetData(BaseAPITest):
-    @mock.patch.object(main.swift, 'SwiftAPI', autospec=True)
+    @mock.patch.object(swift, 'SwiftAPI', autospec=True)
     def test_get_introspection_data(self, swift_mock):
         CONF.set_override('store_data', 'swift', 'processing')
         data = {
@@ -294,7 +406,7 @@ class TestApiGetData(BaseAPITest):
         self.assertEqual(200, res.status_code)
         self.assertEqual(data, json.loads(res.data.decode('utf-8')))
 
-    @mock.patch.object(main.swift, 'SwiftAPI', autospec=True)
+    @mock.patch.object(swift, 'SwiftAPI', autospec=True)
     def test_introspection_data_not_stored(self, swift_mock):
         CONF.set_override('store_data', 'none', 'processing')
         swift_conn = swift_mock.return_value
@@ -303,7 +415,7 @@ class TestApiGetData(BaseAPITest):
         self.assertEqual(404, res.status_code)
 
     @mock.patch.object(ir_utils, 'get_node', autospec=True)
-    @mock.patch.object(main.swift, 'SwiftAPI', autospec=True)
+    @mock.patch.object(swift, 'SwiftAPI', autospec=True)
     def test_with_name(self, swift_mock, get_mock):
         get_mock.return_value = mock.Mock(uuid=self.uuid)
         CONF.set_override('store_data', 'swift', 'processing')
@@ -505,6 +617,54 @@ class TestApiRules(BaseAPITest):
         delete_mock.assert_called_once_with(self.uuid)
 
 
+class TestApiTimings(BaseAPITest):
+    def test_empty(self):
+        res = self.app.get('/v1/timings')
+        self.assertEqual(200, res.status_code)
+        self.assertEqual({'timings': {}},
+                         json.loads(res.data.decode('utf-8')))
+
+    def test_ok(self):
+        timing.observe('lookup', 0.002)
+        timing.observe('lookup', 100)
+        res = self.app.get('/v1/timings')
+        self.assertEqual(200, res.status_code)
+        result = json.loads(res.data.decode('utf-8'))['timings']
+        self.assertEqual(['lookup'], list(result))
+        self.assertEqual(2, result['lookup']['count'])
+        self.assertEqual(0.002, result['lookup']['min'])
+        self.assertEqual(100, result['lookup']['max'])
+        self.assertEqual({'le': 0.005, 'count': 1},
+                         result['lookup']['buckets'][0])
+        self.assertEqual({'le': None, 'count': 2},
+                         result['lookup']['buckets'][-1])
+
+
+class TestApiMetrics(BaseAPITest):
+    def test_ok(self):
+        metrics.increment('introspection_started_total')
+        res = self.app.get('/metrics')
+        self.assertEqual(200, res.status_code)
+        self.assertEqual(metrics.CONTENT_TYPE, res.headers['Content-Type'])
+        self.assertIn('\nironic_inspector_introspection_started_total 1\n',
+                      res.data.decode('utf-8'))
+
+    @mock.patch.object(utils, 'check_auth', autospec=True)
+    def test_no_auth(self, auth_mock):
+        CONF.set_override('auth_strategy', 'keystone')
+        res = self.app.get('/metrics')
+        self.assertEqual(200, res.status_code)
+        self.assertFalse(auth_mock.called)
+
+    @mock.patch.object(utils, 'check_auth', autospec=True)
+    def test_auth_required(self, auth_mock):
+        CONF.set_override('auth_strategy', 'keystone')
+        CONF.set_override('metrics_require_auth', True)
+        auth_mock.side_effect = utils.Error('Boom', code=403)
+        res = self.app.get('/metrics')
+        self.assertEqual(403, res.status_code)
+
+
 class TestApiMisc(BaseAPITest):
     @mock.patch.object(node_cache, 'get_node', autospec=True)
     def test_404_expected(self, get_mock):
@@ -712,6 +872,79 @@ class TestInit(test_base.BaseTest):
         self.assertRaises(SystemExit, self.service.init)
         mock_log.assert_called_once_with(mock.ANY, "'foo!'")
 
+    @mock.patch.object(main.LOG, 'critical')
+    def test_init_failed_lock_backend(self, mock_log, mock_node_cache,
+                                      mock_get_client, mock_auth,
+                                      mock_firewall):
+        CONF.set_override('backend', 'file', 'locking')
+
+        self.assertRaises(SystemExit, self.service.init)
+        mock_log.assert_called_once_with(
+            mock.ANY, {'backend': 'file', 'error': mock.ANY})
+
+    @mock.patch.object(firewall, 'clean_up', autospec=True)
+    def test_init_without_background(self, mock_clean_up, mock_node_cache,
+                                     mock_get_client, mock_auth,
+                                     mock_firewall):
+        self.service.init(background=False)
+        mock_node_cache.assert_called_once_with()
+        self.assertFalse(mock_firewall.called)
+        self.assertIsNone(self.service._periodics_worker)
+
+        self.service.shutdown()
+        self.assertFalse(mock_clean_up.called)
+
+
+@mock.patch.object(main.Service, 'setup_logging', autospec=True)
+class TestRun(test_base.BaseTest):
+    def setUp(self):
+        super(TestRun, self).setUp()
+        self.service = main.Service()
+        self.application = mock.Mock(spec=['run'])
+
+    @mock.patch.object(main.Service, 'shutdown', autospec=True)
+    @mock.patch.object(main.Service, 'init', autospec=True)
+    def test_flask(self, mock_init, mock_shutdown, mock_logging):
+        self.service.run([], self.application)
+        mock_init.assert_called_once_with(self.service)
+        self.application.run.assert_called_once_with(
+            host=CONF.listen_address, port=CONF.listen_port)
+        mock_shutdown.assert_called_once_with(self.service)
+
+    @mock.patch.object(server, 'Launcher', autospec=True)
+    def test_api_workers(self, mock_launcher, mock_logging):
+        CONF.set_override('api_workers', 4)
+        self.service.run([], self.application)
+        mock_launcher.assert_called_once_with(self.service, self.application,
+                                              ssl_context=None)
+        mock_launcher.return_value.run.assert_called_once_with()
+        self.assertFalse(self.application.run.called)
+
+
+@mock.patch.object(node_cache, 'delete_nodes_not_in_list', autospec=True)
+@mock.patch.object(ir_utils, 'get_client', autospec=True)
+@mock.patch.object(hash_ring, 'owns', autospec=True)
+class TestSyncWithIronic(test_base.BaseTest):
+    def test_ok(self, mock_owns, mock_get_client, mock_delete):
+        mock_owns.return_value = True
+        mock_get_client.return_value.node.list.return_value = [
+            mock.Mock(uuid='uuid1'), mock.Mock(uuid='uuid2')]
+
+        main.sync_with_ironic()
+
+        mock_owns.assert_called_once_with('sync_with_ironic')
+        mock_get_client.return_value.node.list.assert_called_once_with(
+            limit=0)
+        mock_delete.assert_called_once_with({'uuid1', 'uuid2'})
+
+    def test_other_process(self, mock_owns, mock_get_client, mock_delete):
+        mock_owns.return_value = False
+
+        main.sync_with_ironic()
+
+        self.assertFalse(mock_get_client.called)
+        self.assertFalse(mock_delete.called)
+
 
 class TestCreateSSLContext(test_base.BaseTest):
 
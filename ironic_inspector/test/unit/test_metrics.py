@@ -0,0 +1,249 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+
+import eventlet
+from eventlet import event as eventlet_event
+import futurist
+from futurist import waiters
+
+from ironic_inspector import db
+from ironic_inspector import metrics
+from ironic_inspector.test import base as test_base
+from ironic_inspector import timing
+from ironic_inspector import utils
+
+
+class TestMetrics(test_base.BaseTest):
+    def _lines(self, name):
+        full_name = metrics.PREFIX + name
+        return [line for line in metrics.render().splitlines()
+                if line.startswith(full_name)]
+
+    def test_all_described(self):
+        result = metrics.render()
+        for name, (metric_type, _desc) in metrics.METRICS.items():
+            self.assertIn('# TYPE %s%s %s\n' % (metrics.PREFIX, name,
+                                                metric_type), result)
+
+    def test_counter(self):
+        metrics.increment('introspection_started_total')
+        metrics.increment('introspection_started_total', 2)
+        self.assertEqual(['ironic_inspector_introspection_started_total 3'],
+                         self._lines('introspection_started_total'))
+
+    def test_labels(self):
+        metrics.increment('introspection_errored_total', state='waiting')
+        metrics.increment('introspection_errored_total', state='processing')
+        metrics.increment('introspection_errored_total', state='waiting')
+        self.assertEqual(
+            ['ironic_inspector_introspection_errored_total'
+             '{state="processing"} 1',
+             'ironic_inspector_introspection_errored_total'
+             '{state="waiting"} 2'],
+            self._lines('introspection_errored_total'))
+
+    def test_labels_escaped(self):
+        metrics.increment('ironic_request_errors_total', call='a"b\\c\nd')
+        self.assertEqual(
+            ['ironic_inspector_ironic_request_errors_total'
+             '{call="a\\"b\\\\c\\nd"} 1'],
+            self._lines('ironic_request_errors_total'))
+
+    def test_gauge(self):
+        metrics.set_gauge('firewall_blacklisted_macs', 42)
+        metrics.set_gauge('firewall_blacklisted_macs', 2)
+        self.assertEqual(['ironic_inspector_firewall_blacklisted_macs 2'],
+                         self._lines('firewall_blacklisted_macs'))
+
+    def test_histogram(self):
+        metrics.observe('continue_duration_seconds', 0.001)
+        metrics.observe('continue_duration_seconds', 0.5)
+        lines = self._lines('continue_duration_seconds')
+        self.assertEqual(len(timing.BUCKETS) + 3, len(lines))
+        self.assertEqual('ironic_inspector_continue_duration_seconds_bucket'
+                         '{le="0.005"} 1', lines[0])
+        self.assertEqual('ironic_inspector_continue_duration_seconds_bucket'
+                         '{le="+Inf"} 2', lines[-3])
+        self.assertEqual('ironic_inspector_continue_duration_seconds_sum '
+                         '0.501', lines[-2])
+        self.assertEqual('ironic_inspector_continue_duration_seconds_count '
+                         '2', lines[-1])
+
+    def test_histogram_with_labels(self):
+        metrics.observe('db_query_duration_seconds', 0.001,
+                        statement='SELECT')
+        lines = self._lines('db_query_duration_seconds')
+        self.assertEqual('ironic_inspector_db_query_duration_seconds_bucket'
+                         '{statement="SELECT",le="0.005"} 1', lines[0])
+        self.assertEqual('ironic_inspector_db_query_duration_seconds_count'
+                         '{statement="SELECT"} 1', lines[-1])
+
+    def test_processing_phases(self):
+        timing.observe('lookup', 0.001)
+        lines = self._lines('processing_phase_duration_seconds')
+        self.assertEqual(
+            'ironic_inspector_processing_phase_duration_seconds_count'
+            '{phase="lookup"} 1', lines[-1])
+
+    def test_measure(self):
+        with metrics.measure('swift_request_duration_seconds',
+                             errors='swift_request_errors_total',
+                             call='get_object'):
+            pass
+        self.assertIn('ironic_inspector_swift_request_duration_seconds_count'
+                      '{call="get_object"} 1',
+                      self._lines('swift_request_duration_seconds'))
+        self.assertEqual([], self._lines('swift_request_errors_total'))
+
+    def test_measure_error(self):
+        def _fail():
+            with metrics.measure('swift_request_duration_seconds',
+                                 errors='swift_request_errors_total',
+                                 call='get_object'):
+                raise RuntimeError('boom')
+
+        self.assertRaises(RuntimeError, _fail)
+        self.assertIn('ironic_inspector_swift_request_duration_seconds_count'
+                      '{call="get_object"} 1',
+                      self._lines('swift_request_duration_seconds'))
+        self.assertEqual(['ironic_inspector_swift_request_errors_total'
+                          '{call="get_object"} 1'],
+                         self._lines('swift_request_errors_total'))
+
+    def test_reset(self):
+        metrics.increment('introspection_started_total')
+        metrics.reset()
+        self.assertEqual([], self._lines('introspection_started_total'))
+
+    def test_executor(self):
+        utils._EXECUTOR = None
+        self.addCleanup(lambda: utils._EXECUTOR.shutdown())
+        self.assertEqual(['ironic_inspector_executor_queued_tasks 0'],
+                         self._lines('executor_queued_tasks'))
+        self.assertEqual(['ironic_inspector_executor_active_workers 0'],
+                         self._lines('executor_active_workers'))
+
+    def test_executor_busy(self):
+        utils._EXECUTOR = utils._CountingExecutor(
+            futurist.GreenThreadPoolExecutor(max_workers=1))
+        self.addCleanup(utils._EXECUTOR.shutdown)
+        event = eventlet_event.Event()
+        futures = [utils.executor().submit(event.wait) for _ in range(3)]
+        eventlet.sleep(0)
+
+        self.assertEqual(['ironic_inspector_executor_queued_tasks 2'],
+                         self._lines('executor_queued_tasks'))
+        self.assertEqual(['ironic_inspector_executor_active_workers 1'],
+                         self._lines('executor_active_workers'))
+
+        event.send()
+        waiters.wait_for_all(futures)
+        self.assertEqual(['ironic_inspector_executor_queued_tasks 0'],
+                         self._lines('executor_queued_tasks'))
+        self.assertEqual(['ironic_inspector_executor_active_workers 0'],
+                         self._lines('executor_active_workers'))
+
+    def test_db_queries(self):
+        db.model_query(db.Node).all()
+        self.assertTrue(any(
+            line.startswith('ironic_inspector_db_query_duration_seconds_count'
+                            '{statement="SELECT"}')
+            for line in self._lines('db_query_duration_seconds')))
+
+
+class TestShared(test_base.BaseTest):
+    def setUp(self):
+        super(TestShared, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.addCleanup(setattr, metrics, '_SHARED', None)
+
+    def _other_worker(self):
+        # Values of another worker are recorded and dumped the same way
+        metrics.share(self.directory, 1)
+        metrics.increment('introspection_errored_total', 2, state='waiting')
+        timing.observe('lookup', 0.001)
+        metrics.dump()
+        metrics.reset()
+        timing.reset()
+        metrics.share(self.directory, 0)
+
+    def _lines(self, name):
+        full_name = metrics.PREFIX + name
+        return [line for line in metrics.render().splitlines()
+                if line.startswith(full_name)]
+
+    def test_share(self):
+        metrics.share(self.directory, 0)
+        self.assertEqual(['0.json'], os.listdir(self.directory))
+
+    def test_render(self):
+        self._other_worker()
+        metrics.increment('introspection_errored_total', state='waiting')
+
+        self.assertEqual(
+            ['ironic_inspector_introspection_errored_total'
+             '{state="waiting",worker="0"} 1',
+             'ironic_inspector_introspection_errored_total'
+             '{state="waiting",worker="1"} 2'],
+            self._lines('introspection_errored_total'))
+        self.assertEqual(
+            ['ironic_inspector_processing_phase_duration_seconds_count'
+             '{phase="lookup",worker="1"} 1'],
+            [line for line in self._lines('processing_phase_duration_seconds')
+             if '_count' in line])
+
+    def test_render_not_dumped(self):
+        metrics.share(self.directory, 0)
+        metrics.increment('introspection_started_total')
+        # Values of this worker are always current
+        self.assertEqual(
+            ['ironic_inspector_introspection_started_total{worker="0"} 1'],
+            self._lines('introspection_started_total'))
+
+    def test_phase_histograms(self):
+        self._other_worker()
+        timing.observe('lookup', 100)
+        timing.observe('finish', 0.5)
+
+        result = metrics.phase_histograms()
+        self.assertEqual({'lookup', 'finish'}, set(result))
+        self.assertEqual(2, result['lookup']['count'])
+        self.assertEqual(100.001, result['lookup']['sum'])
+        self.assertEqual(0.001, result['lookup']['min'])
+        self.assertEqual(100, result['lookup']['max'])
+        self.assertEqual({'le': 0.005, 'count': 1},
+                         result['lookup']['buckets'][0])
+        self.assertEqual({'le': None, 'count': 2},
+                         result['lookup']['buckets'][-1])
+        self.assertEqual(1, result['finish']['count'])
+
+    def test_phase_histograms_not_shared(self):
+        timing.observe('lookup', 0.001)
+        self.assertEqual(timing.histograms(), metrics.phase_histograms())
+
+    def test_remove_shared(self):
+        self._other_worker()
+        metrics.increment('introspection_started_total')
+
+        metrics.remove_shared(self.directory, 1)
+
+        self.assertEqual(['0.json'], os.listdir(self.directory))
+        self.assertEqual([], self._lines('introspection_errored_total'))
+        self.assertEqual(
+            ['ironic_inspector_introspection_started_total{worker="0"} 1'],
+            self._lines('introspection_started_total'))
@@ -395,6 +395,57 @@ class MigrationCheckersMixin(object):
             datetime.datetime.utcfromtimestamp(data['finished_at']),
             node['finished_at'])
 
+    def _check_8ae167f0065e(self, engine, data):
+        attributes = db_utils.get_table(engine, 'attributes')
+        indexes = {index.name: [column.name for column in index.columns]
+                   for index in attributes.indexes}
+        self.assertEqual(['name', 'value', 'uuid'],
+                         indexes['ix_attributes_name_value_uuid'])
+
+    def _check_3c7b6ea3a25e(self, engine, data):
+        jobs = db_utils.get_table(engine, 'jobs')
+        col_names = [column.name for column in jobs.c]
+        self.assertEqual(['id', 'uuid', 'stage', 'data', 'created_at',
+                          'owner', 'lease_expires_at', 'attempts'],
+                         col_names)
+        self.assertIsInstance(jobs.c.id.type, sqlalchemy.types.Integer)
+        self.assertIsInstance(jobs.c.stage.type, sqlalchemy.types.String)
+        self.assertIsInstance(jobs.c.lease_expires_at.type,
+                              sqlalchemy.types.DateTime)
+        indexes = {index.name: [column.name for column in index.columns]
+                   for index in jobs.indexes}
+        self.assertEqual(['lease_expires_at'],
+                         indexes['ix_jobs_lease_expires_at'])
+
+    def _check_e20e972ba7c0(self, engine, data):
+        locks = db_utils.get_table(engine, 'locks')
+        col_names = [column.name for column in locks.c]
+        self.assertEqual(['name', 'owner', 'expires_at'], col_names)
+        self.assertIsInstance(locks.c.name.type, sqlalchemy.types.String)
+        self.assertIsInstance(locks.c.owner.type, sqlalchemy.types.String)
+        self.assertIsInstance(locks.c.expires_at.type,
+                              sqlalchemy.types.DateTime)
+
+    def _check_c0cd6dacb7e9(self, engine, data):
+        members = db_utils.get_table(engine, 'members')
+        col_names = [column.name for column in members.c]
+        self.assertEqual(['id', 'host', 'heartbeat_at'], col_names)
+        self.assertIsInstance(members.c.id.type, sqlalchemy.types.String)
+        self.assertIsInstance(members.c.heartbeat_at.type,
+                              sqlalchemy.types.DateTime)
+
+    def _check_83f89b9fe572(self, engine, data):
+        generations = db_utils.get_table(engine, 'generations')
+        col_names = [column.name for column in generations.c]
+        self.assertEqual(['name', 'value'], col_names)
+        self.assertIsInstance(generations.c.name.type,
+                              sqlalchemy.types.String)
+        self.assertIsInstance(generations.c.value.type,
+                              sqlalchemy.types.Integer)
+        row = generations.select(
+            generations.c.name == 'rules').execute().first()
+        self.assertEqual(0, row['value'])
+
     def test_upgrade_and_version(self):
         with patch_with_engine(self.engine):
             self.migration_ext.upgrade('head')
@@ -18,6 +18,8 @@ import six
 import unittest
 
 import automaton
+import eventlet
+from ironicclient import exceptions
 import mock
 from oslo_config import cfg
 import oslo_db
@@ -26,7 +28,10 @@ from oslo_utils import uuidutils
 
 from ironic_inspector.common import ironic as ir_utils
 from ironic_inspector import db
+from ironic_inspector import firewall
+from ironic_inspector import hash_ring
 from ironic_inspector import introspection_state as istate
+from ironic_inspector import metrics
 from ironic_inspector import node_cache
 from ironic_inspector.test import base as test_base
 from ironic_inspector import utils
@@ -74,6 +79,34 @@ class TestNodeCache(test_base.NodeTest):
                           ('mac', self.macs[2], self.uuid)],
                          [(row.name, row.value, row.uuid) for row in res])
 
+    def test_add_node_duplicate(self):
+        node_cache.add_node(self.uuid, istate.States.starting,
+                            mac=self.macs[:1], bmc_address='1.2.3.4')
+        uuid2 = uuidutils.generate_uuid()
+        node_cache.add_node(uuid2, istate.States.starting,
+                            mac=self.macs[1:2])
+
+        self.assertRaisesRegex(utils.Error, 'already on introspection',
+                               node_cache.add_node, self.uuid,
+                               istate.States.starting, mac=self.macs[:2])
+
+        # Previous information is kept, as nothing was committed
+        res = (db.model_query(db.Attribute.name,
+                              db.Attribute.value, db.Attribute.uuid).
+               order_by(db.Attribute.name, db.Attribute.value).all())
+        self.assertEqual([('bmc_address', '1.2.3.4', self.uuid),
+                          ('mac', self.macs[0], self.uuid),
+                          ('mac', self.macs[1], uuid2)],
+                         [(row.name, row.value, row.uuid) for row in res])
+
+    @mock.patch.object(db.Attribute, 'save', autospec=True)
+    def test_add_node_bulk(self, mock_save):
+        node_cache.add_node(self.uuid, istate.States.starting,
+                            mac=self.macs, bmc_address='1.2.3.4')
+
+        self.assertFalse(mock_save.called)
+        self.assertEqual(4, db.model_query(db.Attribute).count())
+
     def test__delete_node(self):
         session = db.get_session()
         with session.begin():
@@ -194,6 +227,128 @@ class TestNodeCache(test_base.NodeTest):
                          node_info.attributes)
 
 
+@mock.patch.object(firewall, 'mark_dirty', autospec=True)
+class TestNodeCacheFirewallChanged(test_base.NodeTest):
+    def test_add_node(self, mock_mark_dirty):
+        node_cache.add_node(self.uuid, istate.States.starting,
+                            mac=self.macs)
+        self.assertTrue(mock_mark_dirty.called)
+
+    def test_delete_node(self, mock_mark_dirty):
+        node_cache._delete_node(self.uuid)
+        mock_mark_dirty.assert_called_once_with()
+
+    def test_create_ports(self, mock_mark_dirty):
+        ironic = mock.Mock()
+        self.node_info._ports = {}
+        self.node_info.create_ports(self.macs, ironic=ironic)
+        mock_mark_dirty.assert_called_once_with()
+
+    def test_create_ports_nothing_created(self, mock_mark_dirty):
+        ironic = mock.Mock()
+        ironic.port.create.side_effect = exceptions.Conflict()
+        self.node_info._ports = {}
+        self.node_info.create_ports(self.macs, ironic=ironic)
+        self.assertFalse(mock_mark_dirty.called)
+
+
+class TestLookupIndex(test_base.NodeTest):
+    def setUp(self):
+        super(TestLookupIndex, self).setUp()
+        CONF.set_override('lookup_index', True)
+        node_cache.add_node(self.uuid,
+                            istate.States.starting,
+                            bmc_address='1.2.3.4',
+                            mac=self.macs)
+        self.index = node_cache._LOOKUP_INDEX
+
+    def test_loaded_lazily(self):
+        self.assertIsNone(self.index._by_name)
+        self.assertEqual(set(self.macs), node_cache.active_macs())
+        self.assertEqual({self.uuid},
+                         self.index.find({'bmc_address': ['1.2.3.4']}))
+
+    def test_find_node(self):
+        node_cache.active_macs()
+        with mock.patch.object(self.index, '_load',
+                               autospec=True) as mock_load:
+            res = node_cache.find_node(mac=[self.macs[1]])
+        self.assertEqual(self.uuid, res.uuid)
+        self.assertFalse(mock_load.called)
+
+    def test_write_through(self):
+        node_cache.active_macs()
+        node_info = node_cache.add_node('uuid2', istate.States.starting,
+                                        mac=['00:00:00:00:00:00'])
+        self.assertEqual(set(self.macs) | {'00:00:00:00:00:00'},
+                         node_cache.active_macs())
+
+        node_info.add_attribute('bmc_address', '1.2.3.5')
+        self.assertEqual({'uuid2'},
+                         self.index.find({'bmc_address': ['1.2.3.5']}))
+
+        node_info.finished()
+        self.assertEqual(set(self.macs), node_cache.active_macs())
+        self.assertEqual(set(),
+                         self.index.find({'bmc_address': ['1.2.3.5']}))
+
+        node_cache._delete_node(self.uuid)
+        self.assertEqual(set(), node_cache.active_macs())
+
+    def test_duplicate_not_added(self):
+        node_cache.active_macs()
+        self.assertRaises(utils.Error, node_cache.add_node, 'uuid2',
+                          istate.States.starting, mac=self.macs[:1])
+        self.assertEqual({self.uuid},
+                         self.index.find({'mac': self.macs[:1]}))
+
+    def test_shared_value(self):
+        node_cache.active_macs()
+        # E.g. the index was not updated on removal of the first node
+        self.index.add('uuid2', 'bmc_address', ['1.2.3.4'])
+        self.assertEqual({self.uuid, 'uuid2'},
+                         self.index.find({'bmc_address': ['1.2.3.4']}))
+        six.assertRaisesRegex(self, utils.Error, 'Multiple matching nodes',
+                              node_cache.find_node, bmc_address='1.2.3.4')
+
+        self.index.remove('uuid2')
+        self.assertEqual({self.uuid},
+                         self.index.find({'bmc_address': ['1.2.3.4']}))
+        self.index.remove(self.uuid)
+        self.assertEqual(set(),
+                         self.index.find({'bmc_address': ['1.2.3.4']}))
+        self.assertNotIn('1.2.3.4', self.index.values('bmc_address'))
+
+    def test_miss_checked_in_database(self):
+        node_cache.active_macs()
+        session = db.get_session()
+        with session.begin():
+            db.Attribute(name='mac', value='00:00:00:00:00:00',
+                         uuid=self.uuid).save(session)
+
+        res = node_cache.find_node(mac=['00:00:00:00:00:00'])
+        self.assertEqual(self.uuid, res.uuid)
+
+    def test_reload(self):
+        node_cache.active_macs()
+        session = db.get_session()
+        with session.begin():
+            db.Attribute(name='mac', value='00:00:00:00:00:00',
+                         uuid=self.uuid).save(session)
+
+        node_cache.clean_up()
+        self.assertEqual(set(self.macs) | {'00:00:00:00:00:00'},
+                         node_cache.active_macs())
+
+    def test_disabled(self):
+        node_cache.active_macs()
+        CONF.set_override('lookup_index', False)
+        node_cache.clean_up()
+        self.assertIsNone(self.index._by_name)
+        node_cache._delete_node(self.uuid)
+        self.assertIsNone(self.index._by_name)
+
+
 class TestNodeCacheFind(test_base.NodeTest):
     def setUp(self):
         super(TestNodeCacheFind, self).setUp()
@@ -230,6 +385,16 @@ class TestNodeCacheFind(test_base.NodeTest):
                           mac=['11:22:33:33:33:33',
                                '66:66:44:33:22:11'])
 
+    def test_macs_quoted(self):
+        # Values are passed as parameters, not interpolated into SQL
+        self.assertRaises(utils.Error, node_cache.find_node,
+                          mac=["x' OR name='mac"])
+
+    def test_attribute_name_not_matched(self):
+        # A value is only matched for its own attribute name
+        self.assertRaises(utils.Error, node_cache.find_node,
+                          mac=['1.2.3.4'])
+
     def test_macs_multiple_found(self):
         node_cache.add_node('uuid2',
                             istate.States.starting,
@@ -339,6 +504,21 @@ class TestNodeCacheCleanUp(test_base.NodeTest):
         get_lock_mock.assert_called_once_with(self.uuid)
         get_lock_mock.return_value.acquire.assert_called_once_with()
 
+    @mock.patch.object(hash_ring, 'owns', autospec=True)
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_timeout_other_process(self, time_mock, owns_mock):
+        owns_mock.return_value = False
+        CONF.set_override('timeout', 99)
+        time_mock.return_value = (self.started_at +
+                                  datetime.timedelta(seconds=100))
+
+        self.assertEqual([], node_cache.clean_up())
+
+        res = [(row.state, row.finished_at) for row in
+               db.model_query(db.Node).all()]
+        self.assertEqual([(istate.States.waiting, None)], res)
+        owns_mock.assert_called_once_with(self.uuid)
+
     def test_old_status(self):
         CONF.set_override('node_status_keep_time', 42)
         session = db.get_session()
@@ -453,6 +633,36 @@ class TestNodeInfoFinished(test_base.NodeTest):
         self.node_info.finished()
         self.assertFalse(self.node_info._locked)
 
+    @mock.patch.object(firewall, 'mark_dirty', autospec=True)
+    def test_firewall_changed(self, mock_mark_dirty):
+        self.node_info.finished()
+        mock_mark_dirty.assert_called_once_with()
+
+    def test_metrics(self):
+        self.node_info.finished()
+        self.assertNotIn('introspection_finished_total', metrics._VALUES)
+        self.node_info.fsm_event(istate.Events.finish)
+
+        self.assertEqual(
+            {(('state', istate.States.finished),): 1},
+            metrics._VALUES['introspection_finished_total'])
+
+    def test_metrics_error(self):
+        self.node_info.finished(error='boom')
+        self.node_info.fsm_event(istate.Events.error)
+
+        self.assertEqual(
+            {(('state', istate.States.error),): 1},
+            metrics._VALUES['introspection_errored_total'])
+
+    def test_metrics_after_transition(self):
+        self.node_info.fsm_event(istate.Events.error)
+        self.node_info.finished(error='boom')
+
+        self.assertEqual(
+            {(('state', istate.States.error),): 1},
+            metrics._VALUES['introspection_errored_total'])
+
 
 class TestNodeInfoOptions(test_base.NodeTest):
     def setUp(self):
@@ -557,6 +767,85 @@ class TestNodeCacheIronicObjects(unittest.TestCase):
             self.uuid, limit=0)
 
 
+class TestSharedIronicCache(test_base.NodeTest):
+    def setUp(self):
+        super(TestSharedIronicCache, self).setUp()
+        CONF.set_override('cache_ttl', 60, 'ironic')
+        self.ironic = mock.Mock()
+        self.node.updated_at = None
+        self.ironic.node.get.return_value = self.node
+        self.port = mock.Mock(address=self.macs[0], uuid='port-uuid')
+        self.ironic.node.list_ports.return_value = [self.port]
+
+    def _node_info(self):
+        return node_cache.NodeInfo(uuid=self.uuid, started_at=0,
+                                   ironic=self.ironic)
+
+    def test_shared(self):
+        for _i in range(3):
+            node_info = self._node_info()
+            self.assertIs(self.node, node_info.node())
+            self.assertEqual({self.macs[0]: self.port}, node_info.ports())
+            node_info.invalidate_cache()
+            self.assertIs(self.node, node_info.node(ironic=self.ironic))
+
+        self.ironic.node.get.assert_called_once_with(self.uuid)
+        self.ironic.node.list_ports.assert_called_once_with(self.uuid,
+                                                            limit=0)
+
+    def test_disabled(self):
+        CONF.set_override('cache_ttl', 0, 'ironic')
+        self._node_info().node()
+        self._node_info().node()
+        self.assertEqual(2, self.ironic.node.get.call_count)
+
+    def test_update(self):
+        new_node = mock.Mock(uuid=self.uuid, updated_at=None)
+        self.ironic.node.update.return_value = new_node
+        self._node_info().node()
+        self._node_info().patch([{'op': 'add', 'path': '/extra/foo',
+                                  'value': 'bar'}])
+        self.assertIs(new_node, self._node_info().node())
+        self.ironic.node.get.assert_called_once_with(self.uuid)
+
+    def test_patch_port(self):
+        new_port = mock.Mock(address=self.macs[0], uuid='port-uuid')
+        self.ironic.port.update.return_value = new_port
+        self._node_info().patch_port(self.macs[0], [])
+        self.assertEqual({self.macs[0]: new_port}, self._node_info().ports())
+        self.ironic.node.list_ports.assert_called_once_with(self.uuid,
+                                                            limit=0)
+
+    def test_delete_port(self):
+        self._node_info().delete_port(self.macs[0])
+        self.assertEqual({}, self._node_info().ports())
+        self.ironic.node.list_ports.assert_called_once_with(self.uuid,
+                                                            limit=0)
+
+    def test_create_ports(self):
+        new_port = mock.Mock(address=self.macs[1])
+        self.ironic.port.create.return_value = new_port
+        self._node_info().create_ports([self.macs[1]])
+        self.assertEqual({self.macs[0]: self.port, self.macs[1]: new_port},
+                         self._node_info().ports())
+        self.ironic.node.list_ports.assert_called_once_with(self.uuid,
+                                                            limit=0)
+
+    def test_create_ports_conflict(self):
+        self.ironic.port.create.side_effect = exceptions.Conflict()
+        self._node_info().create_ports([self.macs[1]])
+        self._node_info().ports()
+        self.assertEqual(2, self.ironic.node.list_ports.call_count)
+
+    def test_finished(self):
+        node_cache.add_node(self.uuid, istate.States.processing)
+        node_info = self._node_info()
+        node_info.node()
+        node_info.finished()
+        self._node_info().node()
+        self.assertEqual(2, self.ironic.node.get.call_count)
+
+
 class TestUpdate(test_base.NodeTest):
     def setUp(self):
         super(TestUpdate, self).setUp()
@@ -685,6 +974,221 @@ class TestUpdate(test_base.NodeTest):
         self.assertEqual(['mac1'], list(self.node_info.ports()))
 
 
+class TestBatchPatches(test_base.NodeTest):
+    def setUp(self):
+        super(TestBatchPatches, self).setUp()
+        self.ironic = mock.Mock()
+        self.ironic.node.update.return_value = mock.sentinel.node
+        self.node.properties['capabilities'] = 'foo:bar'
+        self.node_info = node_cache.NodeInfo(uuid=self.uuid,
+                                             started_at=0,
+                                             node=self.node,
+                                             ironic=self.ironic)
+
+    def test_one_request(self):
+        with self.node_info.batch_patches():
+            self.node_info.update_properties(cpus=2)
+            self.node_info.update_capabilities(x='1')
+            self.node_info.update_capabilities(y='2')
+            self.node_info.patch([{'op': 'add', 'path': 'extra/foo',
+                                   'value': 'bar'}])
+            self.node_info.replace_field('/extra/foo', lambda v: v + '1')
+            self.assertFalse(self.ironic.node.update.called)
+
+        self.ironic.node.update.assert_called_once_with(self.uuid, mock.ANY)
+        patch = self.ironic.node.update.call_args[0][1]
+        self.assertEqual(
+            ['/properties/cpus', '/properties/capabilities',
+             '/properties/capabilities', '/extra/foo', '/extra/foo'],
+            [item['path'] for item in patch])
+        self.assertEqual({'foo': 'bar', 'x': '1', 'y': '2'},
+                         ir_utils.capabilities_to_dict(patch[2]['value']))
+        self.assertEqual({'op': 'replace', 'path': '/extra/foo',
+                          'value': 'bar1'}, patch[4])
+        self.assertIs(mock.sentinel.node, self.node_info.node())
+
+    def test_pending_state(self):
+        with self.node_info.batch_patches():
+            self.node_info.patch([
+                {'op': 'add', 'path': '/extra/foo', 'value': {'a': 1}},
+                {'op': 'add', 'path': '/extra/foo/b', 'value': 2},
+                {'op': 'remove', 'path': '/properties/local_gb'},
+                {'op': 'add', 'path': '/name', 'value': 'node'}])
+
+            self.assertEqual({'a': 1, 'b': 2},
+                             self.node_info.get_by_path('/extra/foo'))
+            self.assertRaises(KeyError, self.node_info.get_by_path,
+                              '/properties/local_gb')
+            self.assertEqual('node', self.node_info.node().name)
+            self.assertEqual('pxe_ipmitool', self.node_info.node().driver)
+            self.assertEqual({'foo': {'a': 1, 'b': 2}},
+                             self.node_info.node().to_dict()['extra'])
+
+        # The original node is not changed
+        self.assertEqual({}, self.node.extra)
+        self.assertEqual(40, self.node.properties['local_gb'])
+
+    def test_list_operations(self):
+        fields = {'extra': {'list': [1, 2]}}
+        for patch in ({'op': 'add', 'path': '/extra/list/-', 'value': 3},
+                      {'op': 'add', 'path': '/extra/list/0', 'value': 0},
+                      {'op': 'replace', 'path': '/extra/list/1', 'value': 5},
+                      {'op': 'remove', 'path': '/extra/list/2'}):
+            node_cache._apply_patch(self.node, fields, patch)
+        self.assertEqual({'extra': {'list': [0, 5, 3]}}, fields)
+
+    def test_nothing_to_update(self):
+        with self.node_info.batch_patches():
+            pass
+        self.assertFalse(self.ironic.node.update.called)
+
+    def test_nested(self):
+        with self.node_info.batch_patches():
+            with self.node_info.batch_patches():
+                self.node_info.update_properties(cpus=2)
+            self.assertFalse(self.ironic.node.update.called)
+        self.ironic.node.update.assert_called_once_with(
+            self.uuid, [{'op': 'add', 'path': '/properties/cpus',
+                         'value': 2}])
+
+    def test_sent_on_exception(self):
+        def _fail():
+            with self.node_info.batch_patches():
+                self.node_info.update_properties(cpus=2)
+                raise RuntimeError('boom')
+
+        self.assertRaises(RuntimeError, _fail)
+        self.ironic.node.update.assert_called_once_with(
+            self.uuid, [{'op': 'add', 'path': '/properties/cpus',
+                         'value': 2}])
+        # Batching is over
+        self.node_info.update_properties(cpus=2)
+        self.assertEqual(2, self.ironic.node.update.call_count)
+
+    def test_sending_failed_on_exception(self):
+        self.ironic.node.update.side_effect = exceptions.Conflict()
+
+        def _fail():
+            with self.node_info.batch_patches():
+                self.node_info.update_properties(cpus=2)
+                raise RuntimeError('boom')
+
+        # The original exception is raised
+        self.assertRaisesRegex(RuntimeError, 'boom', _fail)
+        self.assertEqual(1, self.ironic.node.update.call_count)
+        self.assertIsNone(self.node_info._node)
+        self.assertIsNone(self.node_info._pending_patches)
+
+    def test_invalid_patch(self):
+        self.ironic.node.update.side_effect = [
+            exceptions.BadRequest(), mock.sentinel.node,
+            exceptions.BadRequest('invalid memory_mb')]
+
+        def _update():
+            with self.node_info.batch_patches():
+                self.node_info.update_properties(cpus=2)
+                self.node_info.update_properties(memory_mb='x')
+
+        self.assertRaisesRegex(exceptions.BadRequest, 'invalid memory_mb',
+                               _update)
+        self.ironic.node.update.assert_has_calls([
+            mock.call(self.uuid, [{'op': 'add', 'path': '/properties/cpus',
+                                   'value': 2},
+                                  {'op': 'add',
+                                   'path': '/properties/memory_mb',
+                                   'value': 'x'}]),
+            mock.call(self.uuid, [{'op': 'add', 'path': '/properties/cpus',
+                                   'value': 2}]),
+            mock.call(self.uuid, [{'op': 'add',
+                                   'path': '/properties/memory_mb',
+                                   'value': 'x'}]),
+        ])
+
+
+class TestCreatePorts(test_base.NodeTest):
+    def setUp(self):
+        super(TestCreatePorts, self).setUp()
+        self.ironic = mock.Mock()
+        self.existing = mock.Mock(address=self.macs[0])
+        self.node_info._ports = {self.macs[0]: self.existing}
+        self.new_macs = ['11:22:33:44:55:%02x' % i for i in range(4)]
+        self.ironic.port.create.side_effect = (
+            lambda node_uuid, address, extra: mock.Mock(address=address))
+
+    def test_create(self):
+        self.node_info.create_ports(
+            [{'mac': self.macs[0]},
+             {'mac': self.new_macs[0], 'client_id': 'id'}] +
+            self.new_macs[1:], ironic=self.ironic)
+
+        self.assertEqual(len(self.new_macs),
+                         self.ironic.port.create.call_count)
+        self.ironic.port.create.assert_any_call(
+            node_uuid=self.uuid, address=self.new_macs[0],
+            extra={'client-id': 'id'})
+        self.ironic.port.create.assert_any_call(
+            node_uuid=self.uuid, address=self.new_macs[1], extra={})
+        self.assertEqual(set(self.new_macs) | {self.macs[0]},
+                         set(self.node_info.ports()))
+        self.assertFalse(self.ironic.node.list_ports.called)
+
+    def test_duplicates(self):
+        self.node_info.create_ports([self.new_macs[0], self.new_macs[0]],
+                                    ironic=self.ironic)
+        self.ironic.port.create.assert_called_once_with(
+            node_uuid=self.uuid, address=self.new_macs[0], extra={})
+
+    def test_concurrency_limit(self):
+        CONF.set_override('max_concurrency', 2, 'ironic')
+        running = []
+        peak = []
+
+        def _create(node_uuid, address, extra):
+            running.append(address)
+            peak.append(len(running))
+            eventlet.sleep(0)
+            running.remove(address)
+            return mock.Mock(address=address)
+
+        self.ironic.port.create.side_effect = _create
+        self.node_info.create_ports(self.new_macs, ironic=self.ironic)
+        self.assertEqual(2, max(peak))
+        self.assertEqual(len(self.new_macs),
+                         self.ironic.port.create.call_count)
+
+    def test_conflicts_reload_once(self):
+        def _create(node_uuid, address, extra):
+            if address in self.new_macs[:2]:
+                raise exceptions.Conflict()
+            return mock.Mock(address=address)
+
+        self.ironic.port.create.side_effect = _create
+        self.ironic.node.list_ports.return_value = [
+            mock.Mock(address=mac) for mac in [self.macs[0]] + self.new_macs]
+
+        self.node_info.create_ports(self.new_macs, ironic=self.ironic)
+        self.assertEqual(set(self.new_macs) | {self.macs[0]},
+                         set(self.node_info.ports(ironic=self.ironic)))
+        self.ironic.node.list_ports.assert_called_once_with(self.uuid,
+                                                            limit=0)
+
+    def test_error(self):
+        def _create(node_uuid, address, extra):
+            if address == self.new_macs[0]:
+                raise RuntimeError('boom')
+            return mock.Mock(address=address)
+
+        self.ironic.port.create.side_effect = _create
+        six.assertRaisesRegex(self, RuntimeError, 'boom',
+                              self.node_info.create_ports, self.new_macs,
+                              ironic=self.ironic)
+        # Other ports are still created and recorded
+        self.assertEqual(len(self.new_macs),
+                         self.ironic.port.create.call_count)
+        self.assertEqual(set(self.new_macs[1:]) | {self.macs[0]},
+                         set(self.node_info.ports()))
+
+
 class TestNodeCacheGetByPath(test_base.NodeTest):
     def setUp(self):
         super(TestNodeCacheGetByPath, self).setUp()
@@ -1116,6 +1620,8 @@ class TestStartIntrospection(test_base.NodeTest):
         node_cache.start_introspection(self.node_info.uuid)
         add_node_mock.assert_called_once_with(self.node_info.uuid,
                                               istate.States.starting)
+        self.assertEqual(
+            1, metrics._VALUES['introspection_started_total'][()])
 
     @prepare_mocks
     def test_custom_exc_fsm_event(self, fsm_event_mock, add_node_mock):
@@ -1127,3 +1633,118 @@ class TestStartIntrospection(test_base.NodeTest):
                               node_cache.start_introspection,
                               self.node_info.uuid)
         self.assertFalse(add_node_mock.called)
+
+
+@mock.patch.object(node_cache, '_firewall_changed', autospec=True)
+class TestStartIntrospectionMany(test_base.NodeTest):
+    def setUp(self):
+        super(TestStartIntrospectionMany, self).setUp()
+        self.uuid2 = uuidutils.generate_uuid()
+        self.nodes = {
+            self.uuid: {'bmc_address': self.bmc_address,
+                        'mac': list(self.macs)},
+            self.uuid2: {'bmc_address': '1.2.3.5', 'mac': []},
+        }
+
+    def _attributes(self, uuid):
+        return sorted((row.name, row.value) for row in
+                      db.model_query(db.Attribute).filter_by(uuid=uuid))
+
+    def test_new_nodes(self, fw_mock):
+        result = node_cache.start_introspection_many(self.nodes,
+                                                     ironic=mock.sentinel.cli)
+
+        self.assertEqual({self.uuid, self.uuid2}, set(result))
+        for uuid in (self.uuid, self.uuid2):
+            self.assertEqual(uuid, result[uuid].uuid)
+            self.assertEqual(istate.States.starting, result[uuid].state)
+            self.assertIs(mock.sentinel.cli, result[uuid].ironic)
+            row = db.model_query(db.Node).get(uuid)
+            self.assertEqual(istate.States.starting, row.state)
+            self.assertEqual(result[uuid].started_at, row.started_at)
+        self.assertEqual(
+            sorted([('bmc_address', self.bmc_address)] +
+                   [('mac', mac) for mac in self.macs]),
+            self._attributes(self.uuid))
+        self.assertEqual([('bmc_address', '1.2.3.5')],
+                         self._attributes(self.uuid2))
+        fw_mock.assert_called_once_with()
+        self.assertEqual(
+            2, metrics._VALUES['introspection_started_total'][()])
+
+    def test_existing_nodes(self, fw_mock):
+        node_cache.add_node(self.uuid, istate.States.finished,
+                            bmc_address='1.1.1.1', mac=['11:22:11:22:11:22'])
+        node_cache.NodeInfo(self.uuid).set_option('foo', 'bar')
+        node_cache.add_node(self.uuid2, istate.States.processing)
+
+        result = node_cache.start_introspection_many(self.nodes)
+
+        self.assertEqual(istate.States.starting, result[self.uuid].state)
+        self.assertEqual(
+            sorted([('bmc_address', self.bmc_address)] +
+                   [('mac', mac) for mac in self.macs]),
+            self._attributes(self.uuid))
+        self.assertEqual({}, node_cache.NodeInfo(self.uuid).options)
+        # processing -> start is not a valid transition
+        self.assertIsInstance(result[self.uuid2],
+                              utils.NodeStateInvalidEvent)
+        self.assertEqual(istate.States.processing,
+                         db.model_query(db.Node).get(self.uuid2).state)
+
+    @mock.patch.object(node_cache, '_find_attribute_conflicts',
+                       autospec=True)
+    def test_changed_concurrently(self, mock_conflicts, fw_mock):
+        node_cache.add_node(self.uuid, istate.States.finished)
+
+        def _change(attributes):
+            # E.g. another start of the same node
+            node_cache.NodeInfo(self.uuid).commit()
+            return {}
+
+        mock_conflicts.side_effect = _change
+
+        result = node_cache.start_introspection_many(self.nodes)
+
+        self.assertIsInstance(result[self.uuid],
+                              utils.NodeStateRaceCondition)
+        self.assertEqual(409, result[self.uuid].http_code)
+        self.assertEqual(istate.States.finished,
+                         db.model_query(db.Node).get(self.uuid).state)
+        self.assertEqual([], self._attributes(self.uuid))
+        self.assertEqual(istate.States.starting, result[self.uuid2].state)
+        self.assertEqual([('bmc_address', '1.2.3.5')],
+                         self._attributes(self.uuid2))
+
+    def test_attribute_conflicts(self, fw_mock):
+        uuid3 = uuidutils.generate_uuid()
+        node_cache.add_node(uuid3, istate.States.waiting,
+                            mac=[self.macs[0]])
+        uuid4 = uuidutils.generate_uuid()
+        self.nodes[uuid4] = {'bmc_address': '1.2.3.5'}
+        winner, loser = sorted([self.uuid2, uuid4])
+
+        result = node_cache.start_introspection_many(self.nodes)
+
+        # Conflicts with a node on introspection
+        self.assertIsInstance(result[self.uuid], utils.Error)
+        self.assertIn('mac\'s %s' % self.macs[0], str(result[self.uuid]))
+        self.assertIsNone(db.model_query(db.Node).get(self.uuid))
+        self.assertEqual([('mac', self.macs[0])], self._attributes(uuid3))
+        # Conflicts between new nodes, the smallest UUID wins
+        self.assertIsInstance(result[loser], utils.Error)
+        self.assertEqual(istate.States.starting, result[winner].state)
+        self.assertEqual([('bmc_address', '1.2.3.5')],
+                         self._attributes(winner))
+        self.assertEqual([], self._attributes(loser))
+
+    def test_empty(self, fw_mock):
+        self.assertEqual({}, node_cache.start_introspection_many({}))
+        self.assertFalse(fw_mock.called)
+
+    def test_lookup_index(self, fw_mock):
+        CONF.set_override('lookup_index', True)
+        node_cache.start_introspection_many(self.nodes)
+        self.assertEqual(self.uuid,
+                         node_cache.find_node(mac=[self.macs[1]]).uuid)
+        self.assertEqual(set(self.macs), node_cache.active_macs())
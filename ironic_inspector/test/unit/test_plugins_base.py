@@ -42,3 +42,38 @@ class TestWithValidation(test_base.BaseTest):
     def test_unexpected(self):
         self.assertRaisesRegex(ValueError, 'unexpected parameter\(s\): foo',
                                self.test.validate, {'foo': 'bar', 'x': 42})
+
+
+class FakeHook(base.ProcessingHook):
+    def __init__(self, reads=None, writes=None):
+        self.reads = reads
+        self.writes = writes
+
+
+class TestProcessingHooksDependencies(test_base.BaseTest):
+    def test_independent(self):
+        hooks = [FakeHook(['data.a'], ['data.b']),
+                 FakeHook(['data.a'], ['data.c']),
+                 FakeHook([], ['ports'])]
+        self.assertEqual([set(), set(), set()],
+                         base.processing_hooks_dependencies(hooks))
+
+    def test_conflicts(self):
+        hooks = [FakeHook(['data.a'], ['data.b']),
+                 # reads what the first one writes
+                 FakeHook(['data.b'], []),
+                 # writes what the first one reads
+                 FakeHook([], ['data.a']),
+                 # writes what the first one writes
+                 FakeHook([], ['data.b', 'node.extra']),
+                 FakeHook(['node.extra'], ['node.properties'])]
+        self.assertEqual([set(), {0}, {0}, {0, 1}, {3}],
+                         base.processing_hooks_dependencies(hooks))
+
+    def test_undeclared(self):
+        hooks = [FakeHook(['data.a'], []),
+                 FakeHook(),
+                 FakeHook(['data.b'], []),
+                 FakeHook([], None)]
+        self.assertEqual([set(), {0}, {1}, {0, 1, 2}],
+                         base.processing_hooks_dependencies(hooks))
@@ -0,0 +1,72 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import subprocess
+
+import mock
+
+from ironic_inspector.plugins import iptables
+from ironic_inspector.test import base as test_base
+
+
+@mock.patch.object(subprocess, 'Popen', autospec=True)
+class TestIptablesRestore(test_base.BaseTest):
+    def setUp(self):
+        super(TestIptablesRestore, self).setUp()
+        self.driver = iptables.IptablesRestoreDriver()
+        self.driver.restore_command = ('sudo', 'ironic-inspector-rootwrap',
+                                       '/path', 'iptables-restore')
+
+    def test_ok(self, mock_popen):
+        mock_popen.return_value.communicate.return_value = ('', None)
+        mock_popen.return_value.returncode = 0
+
+        self.driver._iptables_restore([':chain - [0:0]',
+                                       '-A chain -j ACCEPT'])
+
+        mock_popen.assert_called_once_with(
+            self.driver.restore_command + ('--noflush',),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, universal_newlines=True)
+        mock_popen.return_value.communicate.assert_called_once_with(
+            '*filter\n:chain - [0:0]\n-A chain -j ACCEPT\nCOMMIT\n')
+
+    def test_failure(self, mock_popen):
+        mock_popen.return_value.communicate.return_value = ('boom\n', None)
+        mock_popen.return_value.returncode = 1
+
+        self.assertRaises(subprocess.CalledProcessError,
+                          self.driver._iptables_restore,
+                          ['-A chain -j ACCEPT'])
+
+
+@mock.patch.object(subprocess, 'Popen', autospec=True)
+class TestIpsetRestore(test_base.BaseTest):
+    def setUp(self):
+        super(TestIpsetRestore, self).setUp()
+        self.driver = iptables.IpsetDriver()
+        self.driver.ipset_command = ('sudo', 'ironic-inspector-rootwrap',
+                                     '/path', 'ipset')
+
+    def test_ok(self, mock_popen):
+        mock_popen.return_value.communicate.return_value = ('', None)
+        mock_popen.return_value.returncode = 0
+
+        self.driver._ipset_restore(['add set 11:22:33:44:55:66'])
+
+        mock_popen.assert_called_once_with(
+            self.driver.ipset_command + ('-exist', 'restore'),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, universal_newlines=True)
+        mock_popen.return_value.communicate.assert_called_once_with(
+            'add set 11:22:33:44:55:66\n')
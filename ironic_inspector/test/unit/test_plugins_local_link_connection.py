@@ -11,10 +11,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from ironicclient import exc as client_exc
 import mock
-
 from oslo_config import cfg
 
+from ironic_inspector.common import ironic as ir_utils
 from ironic_inspector import node_cache
 from ironic_inspector.plugins import local_link_connection
 from ironic_inspector.test import base as test_base
@@ -143,3 +144,52 @@ class TestGenericLocalLinkConnectionHook(test_base.NodeTest):
         ]
         self.hook.before_update(self.data, self.node_info)
         self.assertCalledWithPatch(patches, mock_patch)
+
+    @mock.patch.object(ir_utils, 'get_client', autospec=True)
+    @mock.patch.object(node_cache.NodeInfo, 'patch_port')
+    def test_several_ports(self, mock_patch, mock_client):
+        macs = ['11:11:11:11:11:%02x' % i for i in range(1, 9)]
+        lldp = self.data['inventory']['interfaces'][0]['lldp']
+        self.data['inventory']['interfaces'] = [
+            {'name': 'em%d' % i, 'mac_address': mac, 'lldp': lldp}
+            for i, mac in enumerate(macs)]
+        self.data['all_interfaces'] = {'em%d' % i: {}
+                                       for i in range(len(macs))}
+        self.node_info._ports = {
+            mac: mock.Mock(spec=['address', 'uuid', 'local_link_connection'],
+                           address=mac, local_link_connection={})
+            for mac in macs}
+
+        self.hook.before_update(self.data, self.node_info)
+
+        mock_client.assert_called_once_with(
+            api_version=local_link_connection.REQUIRED_IRONIC_VERSION)
+        self.assertEqual(len(macs), mock_patch.call_count)
+        self.assertEqual(
+            sorted(macs),
+            sorted(call[0][0].address for call in mock_patch.call_args_list))
+        for call in mock_patch.call_args_list:
+            self.assertIs(mock_client.return_value, call[1]['ironic'])
+
+    @mock.patch.object(ir_utils, 'get_client', autospec=True)
+    @mock.patch.object(node_cache.NodeInfo, 'patch_port')
+    def test_no_patches(self, mock_patch, mock_client):
+        self.data['inventory']['interfaces'][0]['lldp'] = [(0, '')]
+        self.hook.before_update(self.data, self.node_info)
+        self.assertFalse(mock_patch.called)
+        self.assertFalse(mock_client.called)
+
+    @mock.patch.object(local_link_connection.LOG, 'error', autospec=True)
+    @mock.patch.object(ir_utils, 'get_client', autospec=True)
+    @mock.patch.object(node_cache.NodeInfo, 'patch_port')
+    def test_not_acceptable(self, mock_patch, mock_client, mock_log):
+        mock_patch.side_effect = client_exc.NotAcceptable()
+        self.hook.before_update(self.data, self.node_info)
+        self.assertEqual(1, mock_log.call_count)
+
+    @mock.patch.object(ir_utils, 'get_client', autospec=True)
+    @mock.patch.object(node_cache.NodeInfo, 'patch_port')
+    def test_error(self, mock_patch, mock_client):
+        mock_patch.side_effect = RuntimeError('boom')
+        self.assertRaisesRegex(RuntimeError, 'boom', self.hook.before_update,
+                               self.data, self.node_info)
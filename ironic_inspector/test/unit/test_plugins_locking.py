@@ -0,0 +1,228 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import os
+import shutil
+import tempfile
+
+import mock
+from oslo_config import cfg
+from oslo_utils import timeutils
+
+from ironic_inspector import db
+from ironic_inspector import introspection_state as istate
+from ironic_inspector import node_cache
+from ironic_inspector.plugins import base as plugins_base
+from ironic_inspector.plugins import locking
+from ironic_inspector.test import base as test_base
+from ironic_inspector import utils
+
+
+CONF = cfg.CONF
+
+
+class TestInternalLockBackend(test_base.BaseTest):
+    def setUp(self):
+        super(TestInternalLockBackend, self).setUp()
+        self.backend = locking.InternalLockBackend()
+
+    def test_lock(self):
+        lock = self.backend.get_lock('name')
+        self.assertTrue(lock.acquire())
+        self.assertFalse(self.backend.get_lock('name').acquire(False))
+        self.assertTrue(self.backend.get_lock('other').acquire(False))
+        lock.release()
+        self.assertTrue(self.backend.get_lock('name').acquire(False))
+
+    def test_not_shared(self):
+        self.assertTrue(self.backend.get_lock('name').acquire(False))
+        self.assertTrue(
+            locking.InternalLockBackend().get_lock('name').acquire(False))
+
+
+class TestCombinedLock(test_base.BaseTest):
+    def setUp(self):
+        super(TestCombinedLock, self).setUp()
+        self.local = mock.Mock(spec=['acquire', 'release'])
+        self.remote = mock.Mock(spec=['acquire', 'release'])
+        self.lock = locking._CombinedLock(self.local, self.remote)
+
+    def test_acquire_release(self):
+        self.assertTrue(self.lock.acquire())
+        self.local.acquire.assert_called_once_with(True)
+        self.remote.acquire.assert_called_once_with(True)
+        self.lock.release()
+        self.local.release.assert_called_once_with()
+        self.remote.release.assert_called_once_with()
+
+    def test_local_busy(self):
+        self.local.acquire.return_value = False
+        self.assertFalse(self.lock.acquire(False))
+        self.assertFalse(self.remote.acquire.called)
+
+    def test_remote_busy(self):
+        self.remote.acquire.return_value = False
+        self.assertFalse(self.lock.acquire(False))
+        self.local.release.assert_called_once_with()
+
+    def test_remote_failure(self):
+        self.remote.acquire.side_effect = RuntimeError('boom')
+        self.assertRaises(RuntimeError, self.lock.acquire)
+        self.local.release.assert_called_once_with()
+
+    def test_remote_release_failure(self):
+        self.remote.release.side_effect = RuntimeError('boom')
+        self.assertRaises(RuntimeError, self.lock.release)
+        self.local.release.assert_called_once_with()
+
+
+class TestFileLockBackend(test_base.BaseTest):
+    def setUp(self):
+        super(TestFileLockBackend, self).setUp()
+        self.lock_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.lock_path)
+        CONF.set_override('lock_path', self.lock_path, 'oslo_concurrency')
+
+    def test_lock(self):
+        backend = locking.FileLockBackend()
+        lock = backend.get_lock('name')
+        self.assertTrue(lock.acquire())
+        self.assertTrue(os.path.exists(
+            os.path.join(self.lock_path, 'ironic-inspector-name')))
+        self.assertFalse(backend.get_lock('name').acquire(False))
+        lock.release()
+        self.assertTrue(backend.get_lock('name').acquire(False))
+
+    def test_lock_path_required(self):
+        CONF.clear_override('lock_path', 'oslo_concurrency')
+        self.assertRaises(utils.Error, locking.FileLockBackend)
+
+
+class TestDatabaseLockBackend(test_base.BaseTest):
+    def setUp(self):
+        super(TestDatabaseLockBackend, self).setUp()
+        self.backend = locking.DatabaseLockBackend()
+        self.other = locking.DatabaseLockBackend()
+        spawn_patch = mock.patch.object(locking.eventlet, 'spawn',
+                                        autospec=True)
+        self.spawn_mock = spawn_patch.start()
+        self.addCleanup(spawn_patch.stop)
+
+    def _rows(self):
+        return {row.name: row.owner for row in db.model_query(db.Lock)}
+
+    def test_acquire_release(self):
+        lock = self.backend.get_lock('name')
+        self.assertTrue(lock.acquire())
+        self.assertEqual({'name': self.backend.owner}, self._rows())
+        self.spawn_mock.assert_called_once_with(self.backend._renew)
+
+        lock.release()
+        self.assertEqual({}, self._rows())
+        self.assertEqual(set(), self.backend._held)
+
+    def test_held_by_other_process(self):
+        self.assertTrue(self.other.try_acquire('name'))
+        self.assertFalse(self.backend.get_lock('name').acquire(False))
+        self.assertEqual({'name': self.other.owner}, self._rows())
+        # The local lock is not left acquired
+        self.assertTrue(self.backend._internal.get_lock('name').acquire(
+            False))
+
+    @mock.patch.object(locking.eventlet, 'sleep', autospec=True)
+    def test_blocking(self, sleep_mock):
+        self.assertTrue(self.other.try_acquire('name'))
+        sleep_mock.side_effect = lambda _: self.other.release('name')
+
+        self.assertTrue(self.backend.get_lock('name').acquire())
+        sleep_mock.assert_called_once_with(CONF.locking.retry_interval)
+        self.assertEqual({'name': self.backend.owner}, self._rows())
+
+    def test_take_over_expired(self):
+        self.assertTrue(self.other.try_acquire('name'))
+        db.model_query(db.Lock).update(
+            {'expires_at': timeutils.utcnow() - datetime.timedelta(
+                seconds=1)})
+
+        self.assertTrue(self.backend.try_acquire('name'))
+        self.assertEqual({'name': self.backend.owner}, self._rows())
+        # The previous owner does not release the lock it lost
+        self.other.release('name')
+        self.assertEqual({'name': self.backend.owner}, self._rows())
+
+    @mock.patch.object(locking.eventlet, 'sleep', autospec=True)
+    def test_renew(self, sleep_mock):
+        self.assertTrue(self.backend.try_acquire('name'))
+        self.assertTrue(self.other.try_acquire('other'))
+        db.model_query(db.Lock).update({'expires_at': timeutils.utcnow()})
+        self.backend._heartbeat = mock.Mock()
+
+        def _sleep(interval):
+            if sleep_mock.call_count > 1:
+                self.backend.release('name')
+
+        sleep_mock.side_effect = _sleep
+        self.backend._renew()
+
+        sleep_mock.assert_called_with(CONF.locking.lease_time / 3.0)
+        self.assertEqual(2, sleep_mock.call_count)
+        self.assertIsNone(self.backend._heartbeat)
+        self.assertEqual({'other': self.other.owner}, self._rows())
+
+    @mock.patch.object(locking.eventlet, 'sleep', autospec=True)
+    def test_renew_extends_lease(self, sleep_mock):
+        self.assertTrue(self.backend.try_acquire('name'))
+        db.model_query(db.Lock).update({'expires_at': timeutils.utcnow()})
+        sleep_mock.side_effect = [None, RuntimeError('stop')]
+
+        self.assertRaises(RuntimeError, self.backend._renew)
+        row = db.model_query(db.Lock).one()
+        self.assertGreater(row.expires_at, timeutils.utcnow() +
+                           datetime.timedelta(
+                               seconds=CONF.locking.lease_time - 5))
+
+    @mock.patch.object(db, 'model_query', autospec=True)
+    def test_release_failure(self, query_mock):
+        self.backend._held.add('name')
+        query_mock.side_effect = RuntimeError('boom')
+        self.backend.release('name')
+        self.assertEqual(set(), self.backend._held)
+
+
+class TestNodeLocks(test_base.NodeTest):
+    def setUp(self):
+        super(TestNodeLocks, self).setUp()
+        CONF.set_override('backend', 'database', 'locking')
+        plugins_base._LOCK_BACKEND_MGR = None
+        node_cache.add_node(self.uuid, istate.States.waiting)
+        spawn_patch = mock.patch.object(locking.eventlet, 'spawn',
+                                        autospec=True)
+        spawn_patch.start()
+        self.addCleanup(spawn_patch.stop)
+
+    def test_get_node_locked(self):
+        node_info = node_cache.get_node(self.uuid, locked=True)
+        owner = plugins_base.lock_backend_manager().driver.owner
+        self.assertEqual(owner, db.model_query(db.Lock).one().owner)
+        self.assertEqual('node-%s' % self.uuid,
+                         db.model_query(db.Lock).one().name)
+
+        node_info.release_lock()
+        self.assertEqual([], db.model_query(db.Lock).all())
+
+    def test_acquire_lock_held_by_other_process(self):
+        self.assertTrue(locking.DatabaseLockBackend().try_acquire(
+            'node-%s' % self.uuid))
+        node_info = node_cache.get_node(self.uuid)
+        self.assertFalse(node_info.acquire_lock(blocking=False))
@@ -91,6 +91,9 @@ class TestReConditions(test_base.BaseTest):
                                 (r'^(foo|bar)$', 'foo', True),
                                 (r'fo', 'foo', False)]:
             self.assertEqual(res, cond.check(None, field, {'value': reg}))
+            self.assertEqual(res, cond.check(
+                None, field, {'value': reg},
+                compiled=cond.compile({'value': reg})))
 
     def test_contains(self):
         cond = rules_plugins.ContainsCondition()
@@ -100,6 +103,9 @@ class TestReConditions(test_base.BaseTest):
                                 (r'[1-9]*', 42, True),
                                 (r'bar', 'foo', False)]:
             self.assertEqual(res, cond.check(None, field, {'value': reg}))
+            self.assertEqual(res, cond.check(
+                None, field, {'value': reg},
+                compiled=cond.compile({'value': reg})))
 
 
 class TestNetCondition(test_base.BaseTest):
@@ -115,6 +121,14 @@ class TestNetCondition(test_base.BaseTest):
         self.assertFalse(self.cond.check(None, '192.1.2.4',
                                          {'value': '192.0.2.1/24'}))
 
+    def test_check_compiled(self):
+        params = {'value': '192.0.2.1/24'}
+        compiled = self.cond.compile(params)
+        self.assertTrue(self.cond.check(None, '192.0.2.4', params,
+                                        compiled=compiled))
+        self.assertFalse(self.cond.check(None, '192.1.2.4', params,
+                                         compiled=compiled))
+
 
 class TestEmptyCondition(test_base.BaseTest):
     cond = rules_plugins.EmptyCondition()
@@ -12,6 +12,7 @@
 # limitations under the License.
 
 import copy
+import datetime
 import functools
 import json
 import os
@@ -28,14 +29,18 @@ from oslo_utils import timeutils
 from oslo_utils import uuidutils
 
 from ironic_inspector.common import ironic as ir_utils
+from ironic_inspector.common import swift
 from ironic_inspector import db
 from ironic_inspector import firewall
 from ironic_inspector import introspection_state as istate
+from ironic_inspector import jobs
+from ironic_inspector import metrics
 from ironic_inspector import node_cache
 from ironic_inspector.plugins import base as plugins_base
 from ironic_inspector.plugins import example as example_plugin
 from ironic_inspector import process
 from ironic_inspector.test import base as test_base
+from ironic_inspector import timing
 from ironic_inspector import utils
 
 CONF = cfg.CONF
@@ -88,7 +93,8 @@ class TestProcess(BaseProcessTest):
         self.assertEqual(sorted(self.all_macs), sorted(actual_macs))
         self.cli.node.get.assert_called_once_with(self.uuid)
         self.process_mock.assert_called_once_with(
-            self.node_info, self.node, self.data)
+            self.node_info, self.node, self.data, timings=mock.ANY,
+            finish_in_background=True)
 
     def test_no_ipmi(self):
         del self.inventory['bmc_address']
@@ -99,7 +105,8 @@ class TestProcess(BaseProcessTest):
         self.assertEqual(sorted(self.all_macs), sorted(actual_macs))
         self.cli.node.get.assert_called_once_with(self.uuid)
         self.process_mock.assert_called_once_with(self.node_info, self.node,
-                                                  self.data)
+                                                  self.data, timings=mock.ANY,
+                                                  finish_in_background=True)
 
     def test_not_found_in_cache(self):
         self.find_mock.side_effect = utils.Error('not found')
@@ -183,6 +190,157 @@ class TestProcess(BaseProcessTest):
                                process.process, self.data)
 
 
+class TestProcessAsync(BaseProcessTest):
+    def setUp(self):
+        super(TestProcessAsync, self).setUp()
+        self.queue = process._ContinueQueue()
+        self.useFixture(fixtures.MockPatchObject(process, '_CONTINUE_QUEUE',
+                                                 self.queue))
+        self.node_info._options = {}
+        self.node_info.release_lock = mock.Mock()
+
+        def _finished(error=None):
+            self.node_info.finished_at = self.started_at
+
+        self.node_info.finished.side_effect = _finished
+
+    def test_ok(self):
+        res = process.process_async(self.data)
+
+        self.assertEqual(({'uuid': self.uuid}, True), res)
+        self.process_mock.assert_called_once_with(
+            self.node_info, self.node, self.data, timings=mock.ANY,
+            finish_in_background=False)
+        self.node_info.release_lock.assert_called_once_with()
+        self.assertEqual(0, self.queue.length)
+
+    def test_timings(self):
+        process.process_async(self.data)
+
+        phases = self.process_mock.call_args[1]['timings'].phases
+        self.assertIn('lookup', phases)
+        self.assertIn('pre_hook.scheduler', phases)
+
+    @mock.patch.object(process, '_resume_process_node', autospec=True)
+    def test_resume(self, resume_mock):
+        self.node_info._state = istate.States.processing
+        process._process_in_background(self.node_info, self.data)
+
+        resume_mock.assert_called_once_with(
+            self.node_info, self.node, self.data, timings=mock.ANY,
+            finish_in_background=False)
+        self.assertFalse(self.process_mock.called)
+
+    def test_resume_already_finished(self):
+        self.node_info.finished_at = self.started_at
+        process._process_in_background(self.node_info, self.data)
+        self.assertFalse(self.process_mock.called)
+        self.assertFalse(self.node_info.finished.called)
+
+    @mock.patch.object(utils, 'executor', autospec=True)
+    def test_queued(self, mock_executor):
+        res = process.process_async(self.data)
+
+        self.assertEqual(({'uuid': self.uuid}, True), res)
+        mock_executor.return_value.submit.assert_called_once_with(
+            jobs._run, None, 'process', self.node_info,
+            {'introspection_data': self.data, 'timings': mock.ANY})
+        self.assertFalse(self.process_mock.called)
+        self.assertEqual(1, self.queue.length)
+        self.assertIn('ironic_inspector_continue_queue_length 1',
+                      metrics.render())
+
+    @mock.patch.object(jobs, '_create', autospec=True)
+    @mock.patch.object(process, '_store_unprocessed_data', autospec=True)
+    def test_durable_only_reference(self, mock_store, mock_create):
+        CONF.set_override('durable_jobs', True, 'processing')
+        CONF.set_override('store_data', 'swift', 'processing')
+        mock_create.return_value = None
+
+        process.process_async(self.data)
+
+        mock_create.assert_called_once_with(
+            'process', self.uuid,
+            {'timings': mock.ANY,
+             'unprocessed_data': 'inspector_data-%s-UNPROCESSED' % self.uuid})
+        self.process_mock.assert_called_once_with(
+            self.node_info, self.node, self.data, timings=mock.ANY,
+            finish_in_background=False)
+
+    @mock.patch.object(swift, 'SwiftAPI', autospec=True)
+    def test_resumed_reloads_data(self, swift_mock):
+        swift_mock.return_value.get_object.return_value = json.dumps(
+            self.data)
+
+        process._process_in_background(self.node_info,
+                                       unprocessed_data='object')
+
+        swift_mock.return_value.get_object.assert_called_once_with('object')
+        self.process_mock.assert_called_once_with(
+            self.node_info, self.node, mock.ANY, timings=mock.ANY,
+            finish_in_background=False)
+        # Pre-processing hooks were run on the reloaded data
+        self.assertIn('all_interfaces', self.process_mock.call_args[0][2])
+
+    def test_resumed_without_data(self):
+        self.node_info.fsm_event = mock.Mock()
+
+        process._process_in_background(self.node_info)
+
+        self.assertFalse(self.process_mock.called)
+        self.node_info.fsm_event.assert_called_once_with(istate.Events.error)
+        self.node_info.finished.assert_called_once_with(error=mock.ANY)
+        self.assertIn('store_data = swift',
+                      self.node_info.finished.call_args[1]['error'])
+
+    def test_queue_full(self):
+        CONF.set_override('continue_queue_size', 2, 'processing')
+        CONF.set_override('continue_retry_after', 42, 'processing')
+        self.queue.length = 2
+
+        exc = self.assertRaises(utils.ServiceUnavailable,
+                                process.process_async, self.data)
+        self.assertEqual(503, exc.http_code)
+        self.assertEqual(42, exc.retry_after)
+        self.assertFalse(self.find_mock.called)
+        self.assertEqual(2, self.queue.length)
+
+    def test_lookup_failure(self):
+        self.find_mock.side_effect = utils.Error('boom')
+        self.assertRaisesRegex(utils.Error, 'boom',
+                               process.process_async, self.data)
+        self.assertFalse(self.process_mock.called)
+        self.assertEqual(0, self.queue.length)
+
+    def test_new_ipmi_credentials(self):
+        self.node_info._options = {'new_ipmi_credentials': ['user', 'pwd']}
+        res = process.process_async(self.data)
+
+        self.assertEqual((self.fake_result_json, False), res)
+        self.process_mock.assert_called_once_with(
+            self.node_info, self.node, self.data, timings=mock.ANY,
+            finish_in_background=True)
+        self.assertEqual(0, self.queue.length)
+
+    def test_processing_error(self):
+        self.process_mock.side_effect = utils.Error('boom')
+        res = process.process_async(self.data)
+
+        self.assertEqual(({'uuid': self.uuid}, True), res)
+        self.node_info.finished.assert_called_once_with(error='boom')
+        self.node_info.release_lock.assert_called_once_with()
+        self.assertEqual(0, self.queue.length)
+
+    def test_unexpected_error(self):
+        self.cli.node.get.side_effect = RuntimeError('boom')
+        res = process.process_async(self.data)
+
+        self.assertEqual(({'uuid': self.uuid}, True), res)
+        self.node_info.finished.assert_called_once_with(error='boom')
+        self.node_info.release_lock.assert_called_once_with()
+        self.assertEqual(0, self.queue.length)
+
+
 @mock.patch.object(example_plugin, 'example_not_found_hook',
                    autospec=True)
 class TestNodeNotFoundHook(BaseProcessTest):
@@ -226,7 +384,47 @@ class TestUnprocessedData(BaseProcessTest):
 
         process.process(self.data)
 
-        store_mock.assert_called_once_with(mock.ANY, expected)
+        store_mock.assert_called_once_with(mock.ANY, mock.ANY)
+        self.assertEqual(expected, json.loads(store_mock.call_args[0][1]))
+
+    @mock.patch.object(process, '_store_unprocessed_data', autospec=True)
+    def test_save_unprocessed_data_raw(self, store_mock):
+        CONF.set_override('store_data', 'swift', 'processing')
+        raw_data = json.dumps(self.data).encode('utf-8')
+
+        process.process(self.data, raw_data=raw_data)
+
+        store_mock.assert_called_once_with(mock.ANY, raw_data)
+
+    @mock.patch.object(process, '_store_unprocessed_data', autospec=True)
+    def test_unprocessed_data_not_stored(self, store_mock):
+        process.process(self.data)
+
+        self.assertFalse(store_mock.called)
+
+    @mock.patch.object(process, '_store_unprocessed_data', autospec=True)
+    def test_unprocessed_data_raw_not_stored(self, store_mock):
+        raw_data = json.dumps(self.data).encode('utf-8')
+
+        process.process(self.data, raw_data=raw_data)
+
+        self.assertFalse(store_mock.called)
+
+    @mock.patch.object(process.swift, 'SwiftAPI', autospec=True)
+    def test_store_unprocessed_data(self, swift_mock):
+        CONF.set_override('store_data', 'swift', 'processing')
+        self.data['logs'] = 'logs'
+        raw_data = json.dumps(self.data).encode('utf-8')
+        del self.data['logs']
+
+        process._store_unprocessed_data(self.node_info, raw_data)
+
+        name = 'inspector_data-%s-%s' % (
+            self.uuid, process._UNPROCESSED_DATA_STORE_SUFFIX)
+        swift_mock.return_value.create_object.assert_called_once_with(
+            name, mock.ANY)
+        stored = swift_mock.return_value.create_object.call_args[0][1]
+        self.assertEqual(self.data, json.loads(stored))
 
     @mock.patch.object(process.swift, 'SwiftAPI', autospec=True)
     def test_save_unprocessed_data_failure(self, swift_mock):
@@ -413,6 +611,78 @@ class TestProcessNode(BaseTest):
         post_hook_mock.assert_called_once_with(self.data, self.node_info)
         finished_mock.assert_called_once_with(mock.ANY)
 
+    @mock.patch.object(example_plugin.ExampleProcessingHook, 'before_update')
+    @mock.patch.object(jobs, '_create', autospec=True,
+                       side_effect=jobs._create)
+    def test_finish_durable(self, create_mock, post_hook_mock):
+        CONF.set_override('durable_jobs', True, 'processing')
+
+        process._process_node(self.node_info, self.node, self.data)
+
+        create_mock.assert_called_once_with('finish', self.uuid,
+                                            {'timings': mock.ANY})
+        self.cli.node.set_power_state.assert_called_once_with(self.uuid, 'off')
+        self.assertIsNotNone(self.node_info.finished_at)
+        self.assertEqual([], db.model_query(db.Job).all())
+
+    def test_finish_resumed(self):
+        CONF.set_override('durable_jobs', True, 'processing')
+        db.model_query(db.Node).filter_by(uuid=self.uuid).update(
+            {'state': istate.States.processing})
+        jobs._create('finish', self.uuid, {'timings': {'lookup': 1.0}})
+        db.model_query(db.Job).update(
+            {'owner': 'other',
+             'lease_expires_at': timeutils.utcnow() -
+             datetime.timedelta(seconds=1)})
+
+        self.assertEqual(1, jobs.resume())
+
+        self.cli.node.set_power_state.assert_called_once_with(self.uuid, 'off')
+        node_info = node_cache.get_node(self.uuid)
+        self.assertEqual(istate.States.finished, node_info.state)
+        self.assertIsNotNone(node_info.finished_at)
+        self.assertIsNone(node_info.error)
+        self.assertEqual([], db.model_query(db.Job).all())
+
+    def test_finish_resumed_already_finished(self):
+        CONF.set_override('durable_jobs', True, 'processing')
+        db.model_query(db.Node).filter_by(uuid=self.uuid).update(
+            {'state': istate.States.finished,
+             'finished_at': self.started_at})
+        jobs._create('finish', self.uuid, {})
+        db.model_query(db.Job).update(
+            {'owner': 'other',
+             'lease_expires_at': timeutils.utcnow() -
+             datetime.timedelta(seconds=1)})
+
+        self.assertEqual(1, jobs.resume())
+
+        self.assertFalse(self.cli.node.set_power_state.called)
+        self.assertEqual([], db.model_query(db.Job).all())
+
+    @mock.patch.object(example_plugin.ExampleProcessingHook, 'before_update')
+    def test_timings(self, post_hook_mock):
+        CONF.set_override('store_timings', True, 'processing')
+        process._process_node(self.node_info, self.node, self.data)
+
+        stored = node_cache.NodeInfo(uuid=self.uuid).options['timings']
+        self.assertIn('post_hook.example', stored)
+        self.assertEqual(['create_ports', 'store_data', 'firewall_update',
+                          'rules_apply', 'finish'],
+                         [phase for phase in stored
+                          if not phase.startswith('post_hook.')])
+        histograms = timing.histograms()
+        for phase in stored:
+            self.assertEqual(1, histograms[phase]['count'])
+
+    @mock.patch.object(example_plugin.ExampleProcessingHook, 'before_update')
+    def test_timings_not_stored(self, post_hook_mock):
+        process._process_node(self.node_info, self.node, self.data)
+
+        self.assertNotIn('timings',
+                         node_cache.NodeInfo(uuid=self.uuid).options)
+        self.assertEqual(1, timing.histograms()['finish']['count'])
+
     def test_port_failed(self):
         self.cli.port.create.side_effect = (
             [exceptions.Conflict()] + self.ports[1:])
@@ -426,6 +696,18 @@ class TestProcessNode(BaseTest):
                                              address=self.macs[1],
                                              extra={})
 
+    def test_firewall_updated(self):
+        process._process_node(self.node_info, self.node, self.data)
+        firewall.update_filters.assert_called_once_with(self.cli)
+
+    @mock.patch.object(firewall, 'mark_dirty', autospec=True)
+    def test_firewall_update_on_change(self, mock_mark_dirty):
+        CONF.set_override('update_on_change', True, 'firewall')
+        process._process_node(self.node_info, self.node, self.data)
+        self.assertFalse(firewall.update_filters.called)
+        # Ports created and introspection finished
+        self.assertTrue(mock_mark_dirty.called)
+
     def test_set_ipmi_credentials(self):
         self.node_info.set_option('new_ipmi_credentials', self.new_creds)
 
@@ -544,10 +826,113 @@ class TestProcessNode(BaseTest):
         swift_conn.create_object.assert_called_once_with(name, mock.ANY)
         self.assertEqual(expected,
                          json.loads(swift_conn.create_object.call_args[0][1]))
-        self.cli.node.update.assert_any_call(self.uuid, patch)
+        # All node updates are sent at once
+        self.cli.node.update.assert_called_once_with(self.uuid, mock.ANY)
+        self.assertEqual(patch, [
+            item for item in self.cli.node.update.call_args[0][1]
+            if item['path'].startswith('/extra/')])
+
+    @mock.patch.object(process.rules, 'apply', autospec=True)
+    @mock.patch.object(process.swift, 'SwiftAPI', autospec=True)
+    def test_store_data_location_rules_failed(self, swift_mock, apply_mock):
+        CONF.set_override('store_data', 'swift', 'processing')
+        CONF.set_override('store_data_location', 'inspector_data_object',
+                          'processing')
+        apply_mock.side_effect = utils.Error('boom')
+        name = 'inspector_data-%s' % self.uuid
+
+        self.assertRaisesRegex(utils.Error, 'boom', process._process_node,
+                               self.node_info, self.node, self.data)
+
+        # The pointer to the stored data is not lost
+        self.cli.node.update.assert_called_once_with(self.uuid, mock.ANY)
+        self.assertIn({'path': '/extra/inspector_data_object',
+                       'value': name, 'op': 'add'},
+                      self.cli.node.update.call_args[0][1])
+
+
+class FakeHook(plugins_base.ProcessingHook):
+    def __init__(self, name, events, reads=None, writes=None, error=None):
+        self.name = name
+        self.events = events
+        self.reads = reads
+        self.writes = writes
+        self.error = error
+
+    def before_update(self, introspection_data, node_info, **kwargs):
+        self.events.append(('start', self.name))
+        # Simulate a blocking call, e.g. to Ironic
+        eventlet.sleep(0)
+        if self.error is not None:
+            raise self.error
+        self.events.append(('end', self.name))
+
+
+@mock.patch.object(plugins_base, 'processing_hooks_manager', autospec=True)
+class TestRunPostHooks(BaseTest):
+    def setUp(self):
+        super(TestRunPostHooks, self).setUp()
+        self.events = []
+
+    def _hooks(self, mgr_mock, *hooks):
+        exts = []
+        for hook in hooks:
+            ext = mock.Mock(obj=hook)
+            ext.name = hook.name
+            exts.append(ext)
+        mgr_mock.return_value = exts
+
+    def test_concurrent(self, mgr_mock):
+        self._hooks(mgr_mock,
+                    FakeHook('a', self.events, ['data.a'], ['data.b']),
+                    FakeHook('b', self.events, ['data.a'], ['ports']))
+
+        process._run_post_hooks(self.node_info, self.data)
+
+        self.assertEqual([('start', 'a'), ('start', 'b'),
+                          ('end', 'a'), ('end', 'b')], self.events)
+
+    def test_dependencies(self, mgr_mock):
+        self._hooks(mgr_mock,
+                    FakeHook('a', self.events, [], ['data.a']),
+                    FakeHook('b', self.events, ['data.a'], []),
+                    FakeHook('c', self.events, [], []))
+
+        process._run_post_hooks(self.node_info, self.data)
+
+        self.assertEqual([('start', 'a'), ('start', 'c'),
+                          ('end', 'a'), ('end', 'c'),
+                          ('start', 'b'), ('end', 'b')], self.events)
+
+    def test_undeclared_sequential(self, mgr_mock):
+        self._hooks(mgr_mock,
+                    FakeHook('a', self.events, [], []),
+                    FakeHook('b', self.events),
+                    FakeHook('c', self.events, [], []))
+
+        process._run_post_hooks(self.node_info, self.data)
+
+        self.assertEqual([('start', 'a'), ('end', 'a'),
+                          ('start', 'b'), ('end', 'b'),
+                          ('start', 'c'), ('end', 'c')], self.events)
+
+    def test_failure(self, mgr_mock):
+        self._hooks(mgr_mock,
+                    FakeHook('a', self.events, [], ['data.a'],
+                             error=utils.Error('boom')),
+                    FakeHook('b', self.events, [], [],
+                             error=RuntimeError('crash')),
+                    FakeHook('c', self.events, ['data.a'], []),
+                    FakeHook('d', self.events))
+
+        self.assertRaisesRegex(utils.Error, 'boom', process._run_post_hooks,
+                               self.node_info, self.data)
+
+        # Hooks already running are not interrupted, no new hooks are run
+        self.assertEqual([('start', 'a'), ('start', 'b')], self.events)
 
 
-@mock.patch.object(process, '_reapply', autospec=True)
+@mock.patch.object(jobs, 'submit', autospec=True)
 @mock.patch.object(node_cache, 'get_node', autospec=True)
 class TestReapply(BaseTest):
     def prepare_mocks(func):
@@ -567,17 +952,18 @@ class TestReapply(BaseTest):
         CONF.set_override('store_data', 'swift', 'processing')
 
     @prepare_mocks
-    def test_ok(self, pop_mock, reapply_mock):
+    def test_ok(self, pop_mock, submit_mock):
         process.reapply(self.uuid)
         pop_mock.assert_called_once_with(self.uuid, locked=False)
         pop_mock.return_value.acquire_lock.assert_called_once_with(
             blocking=False
         )
 
-        reapply_mock.assert_called_once_with(pop_mock.return_value)
+        submit_mock.assert_called_once_with('reapply', pop_mock.return_value)
+        self.assertIs(process._reapply, jobs._HANDLERS['reapply'])
 
     @prepare_mocks
-    def test_locking_failed(self, pop_mock, reapply_mock):
+    def test_locking_failed(self, pop_mock, submit_mock):
         pop_mock.return_value.acquire_lock.return_value = False
         self.assertRaisesRegex(utils.Error,
                                'Node locked, please, try again later',
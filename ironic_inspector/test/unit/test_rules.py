@@ -14,6 +14,7 @@
 
 """Tests for introspection rules."""
 
+import jsonpath_rw
 import mock
 from oslo_utils import uuidutils
 
@@ -130,6 +131,31 @@ class TestCreateRule(BaseTest):
                                self.conditions_json, self.actions_json)
 
 
+class TestParseJsonPath(test_base.BaseTest):
+    @mock.patch.object(jsonpath_rw, 'parse', autospec=True)
+    def test_reused(self, mock_parse):
+        cache = {}
+        for _ in range(2):
+            self.assertIs(mock_parse.return_value,
+                          rules._parse_json_path('inventory.cpu.count',
+                                                 cache))
+        mock_parse.assert_called_once_with('inventory.cpu.count')
+        self.assertEqual({'inventory.cpu.count': mock_parse.return_value},
+                         cache)
+
+    @mock.patch.object(jsonpath_rw, 'parse', autospec=True)
+    def test_no_cache(self, mock_parse):
+        for _ in range(2):
+            rules._parse_json_path('inventory.cpu.count')
+        self.assertEqual(2, mock_parse.call_count)
+
+    def test_invalid(self):
+        cache = {}
+        self.assertRaises(jsonpath_rw.lexer.JsonPathLexerError,
+                          rules._parse_json_path, '!*!', cache)
+        self.assertEqual({}, cache)
+
+
 class TestGetRule(BaseTest):
     def setUp(self):
         super(TestGetRule, self).setUp()
@@ -190,6 +216,7 @@ class TestCheckConditions(BaseTest):
                                  actions_json=self.actions_json)
         self.cond_mock = mock.Mock(spec=plugins_base.RuleConditionPlugin)
         self.cond_mock.ALLOW_NONE = False
+        self.cond_mock.compile.return_value = None
         self.ext_mock = mock.Mock(spec=['obj'], obj=self.cond_mock)
 
     def test_ok(self, mock_ext_mgr):
@@ -260,6 +287,31 @@ class TestCheckConditions(BaseTest):
                                                      {'value': 1024})
         self.assertFalse(res)
 
+    def test_compiled(self, mock_ext_mgr):
+        mock_ext_mgr.return_value.__getitem__.return_value = self.ext_mock
+        self.cond_mock.compile.return_value = mock.sentinel.compiled
+
+        def _check(node_info, field, params, **kwargs):
+            # Changes to params do not affect other nodes
+            params['value'] = 'changed'
+            return True
+
+        self.cond_mock.check.side_effect = _check
+
+        for _ in range(2):
+            self.assertTrue(self.rule.check_conditions(self.node_info,
+                                                       self.data))
+
+        self.assertEqual(len(self.conditions_json),
+                         self.cond_mock.compile.call_count)
+        self.cond_mock.compile.assert_any_call({'value': 1024})
+        self.cond_mock.check.assert_any_call(
+            self.node_info, 1024, mock.ANY, compiled=mock.sentinel.compiled)
+        self.assertEqual(2 * len(self.conditions_json),
+                         self.cond_mock.check.call_count)
+        self.assertEqual(self.conditions_json, self.rule.as_dict()[
+            'conditions'])
+
 
 class TestCheckConditionsMultiple(BaseTest):
     def setUp(self):
@@ -406,6 +458,26 @@ class TestApplyActions(BaseTest):
         self.assertEqual(1, self.act_mock.apply.call_count)
         self.assertFalse(self.act_mock.rollback.called)
 
+    def test_apply_data_format_value_rule_not_changed(self, mock_ext_mgr):
+        self.rule = rules.create(actions_json=[
+            {'action': 'set-attribute',
+             'path': '/driver_info/ipmi_address',
+             'value': '{data[memory_mb]}'}],
+            conditions_json=self.conditions_json
+        )
+        mock_ext_mgr.return_value.__getitem__.return_value = self.ext_mock
+
+        self.rule.apply_actions(self.node_info, data=self.data)
+        self.rule.apply_actions(self.node_info, data={'memory_mb': 2048})
+
+        self.act_mock.apply.assert_has_calls([
+            mock.call(self.node_info, {'path': '/driver_info/ipmi_address',
+                                       'value': '1024'}),
+            mock.call(self.node_info, {'path': '/driver_info/ipmi_address',
+                                       'value': '2048'})])
+        self.assertEqual('{data[memory_mb]}',
+                         self.rule.as_dict()['actions'][0]['value'])
+
     def test_apply_data_format_value_fail(self, mock_ext_mgr):
         self.rule = rules.create(
             actions_json=[
@@ -509,3 +581,84 @@ class TestApply(BaseTest):
                                                           self.data)
             rule.apply_actions.assert_called_once_with(
                 self.node_info, rollback=True, data=self.data)
+
+
+@mock.patch.object(rules, 'get_all', autospec=True, side_effect=rules.get_all)
+class TestRulesCache(BaseTest):
+    def setUp(self):
+        super(TestRulesCache, self).setUp()
+        self.rule = rules.create(self.conditions_json, self.actions_json,
+                                 uuid=self.uuid)
+        self.data['local_gb'] = 60
+        self.node_info.patch = mock.Mock()
+
+    def _generation(self):
+        return db.model_query(db.Generation.value).filter_by(
+            name='rules').scalar()
+
+    def test_reused(self, mock_get_all):
+        for _ in range(3):
+            self.assertRaisesRegex(utils.Error, 'boom!', rules.apply,
+                                   self.node_info, self.data)
+        mock_get_all.assert_called_once_with(json_paths={})
+
+    def test_create(self, mock_get_all):
+        rules.apply(self.node_info, {})
+        self.assertEqual(1, self._generation())
+
+        rules.create([], [{'action': 'set-attribute', 'path': '/extra/foo',
+                           'value': 'bar'}])
+        self.assertEqual(2, self._generation())
+        rules.apply(self.node_info, {})
+
+        self.assertEqual(2, mock_get_all.call_count)
+        self.node_info.patch.assert_called_once_with(
+            [{'op': 'add', 'path': '/extra/foo', 'value': 'bar'}])
+
+    def test_delete(self, mock_get_all):
+        self.assertRaises(utils.Error, rules.apply, self.node_info,
+                          self.data)
+
+        rules.delete(self.uuid)
+        self.assertEqual(2, self._generation())
+        rules.apply(self.node_info, self.data)
+
+        self.assertEqual(2, mock_get_all.call_count)
+
+    def test_delete_non_existing(self, mock_get_all):
+        self.assertRaises(utils.Error, rules.delete, 'foo')
+        self.assertEqual(1, self._generation())
+
+    def test_delete_all(self, mock_get_all):
+        self.assertRaises(utils.Error, rules.apply, self.node_info,
+                          self.data)
+
+        rules.delete_all()
+        self.assertEqual(2, self._generation())
+        rules.apply(self.node_info, self.data)
+
+        self.assertEqual(2, mock_get_all.call_count)
+
+    def test_json_paths_dropped(self, mock_get_all):
+        self.assertRaises(utils.Error, rules.apply, self.node_info,
+                          self.data)
+        json_paths = mock_get_all.call_args[1]['json_paths']
+        self.assertEqual({'memory_mb', 'local_gb'}, set(json_paths))
+
+        rules.delete(self.uuid)
+        rules.apply(self.node_info, self.data)
+
+        self.assertEqual({}, mock_get_all.call_args[1]['json_paths'])
+
+    def test_changed_by_other_process(self, mock_get_all):
+        self.assertRaises(utils.Error, rules.apply, self.node_info,
+                          self.data)
+
+        with db.ensure_transaction() as session:
+            db.model_query(db.RuleAction, session=session).delete()
+            db.model_query(db.RuleCondition, session=session).delete()
+            db.model_query(db.Rule, session=session).delete()
+            rules._bump_generation(session)
+        rules.apply(self.node_info, self.data)
+
+        self.assertEqual(2, mock_get_all.call_count)
@@ -0,0 +1,469 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import errno
+import os
+import signal
+import time
+
+import eventlet
+import mock
+from oslo_config import cfg
+
+from ironic_inspector import firewall
+from ironic_inspector import metrics
+from ironic_inspector import server
+from ironic_inspector.test import base as test_base
+
+
+CONF = cfg.CONF
+
+
+class BaseLauncherTest(test_base.BaseTest):
+    def setUp(self):
+        super(BaseLauncherTest, self).setUp()
+        CONF.set_override('api_workers', 3)
+        CONF.set_override('backend', 'database', 'locking')
+        self.service = mock.Mock(spec=['init', 'shutdown'])
+        self.application = mock.Mock()
+        self.launcher = server.Launcher(self.service, self.application)
+        self.launcher._socket = mock.sentinel.socket
+        self.launcher._firewall_socket = mock.sentinel.firewall_socket
+        self.launcher._firewall_address = mock.sentinel.firewall_address
+        self.launcher._metrics_dir = mock.sentinel.metrics_dir
+
+
+class TestCheckConfig(BaseLauncherTest):
+    def test_ok(self):
+        CONF.set_override('lookup_index', False)
+        server.Launcher.check_config()
+
+    def test_one_worker(self):
+        CONF.set_override('api_workers', 1)
+        CONF.set_override('backend', 'internal', 'locking')
+        CONF.set_override('lookup_index', True)
+        server.Launcher.check_config()
+        self.assertTrue(CONF.lookup_index)
+
+    @mock.patch.object(server.LOG, 'critical', autospec=True)
+    def test_internal_locks(self, mock_log):
+        CONF.set_override('backend', 'internal', 'locking')
+        self.assertRaises(SystemExit, server.Launcher.check_config)
+        self.assertTrue(mock_log.called)
+
+    def test_lookup_index(self):
+        CONF.set_override('lookup_index', True)
+        server.Launcher.check_config()
+        self.assertFalse(CONF.lookup_index)
+
+
+@mock.patch.object(os, '_exit', autospec=True)
+@mock.patch.object(os, 'fork', autospec=True)
+class TestStartWorker(BaseLauncherTest):
+    def test_parent(self, mock_fork, mock_exit):
+        mock_fork.return_value = 42
+        self.launcher.generation = 2
+        with mock.patch.object(self.launcher, '_run_worker',
+                               autospec=True) as mock_run:
+            self.launcher._start_worker(1)
+
+        self.assertEqual({42: (1, 2, mock.ANY)}, self.launcher.workers)
+        self.assertFalse(mock_run.called)
+        self.assertFalse(mock_exit.called)
+
+    def _test_child(self, mock_fork, mock_exit, side_effect=None):
+        mock_fork.return_value = 0
+        with mock.patch.object(self.launcher, '_run_worker',
+                               autospec=True) as mock_run, \
+                mock.patch.object(server.hubs, 'use_hub',
+                                  autospec=True) as mock_use_hub:
+            mock_run.side_effect = side_effect
+            self.launcher._start_worker(1)
+
+        mock_use_hub.assert_called_once_with()
+        mock_run.assert_called_once_with(1)
+        self.assertEqual({}, self.launcher.workers)
+
+    def test_child(self, mock_fork, mock_exit):
+        self._test_child(mock_fork, mock_exit)
+        mock_exit.assert_called_once_with(0)
+
+    def test_child_system_exit(self, mock_fork, mock_exit):
+        self._test_child(mock_fork, mock_exit, SystemExit(2))
+        mock_exit.assert_called_once_with(2)
+
+    def test_child_system_exit_no_code(self, mock_fork, mock_exit):
+        self._test_child(mock_fork, mock_exit, SystemExit())
+        mock_exit.assert_called_once_with(0)
+
+    def test_child_failure(self, mock_fork, mock_exit):
+        self._test_child(mock_fork, mock_exit, RuntimeError('boom'))
+        mock_exit.assert_called_once_with(1)
+
+
+@mock.patch.object(time, 'sleep', autospec=True)
+@mock.patch.object(os, 'waitpid', autospec=True)
+class TestReap(BaseLauncherTest):
+    def setUp(self):
+        super(TestReap, self).setUp()
+        self.launcher.generation = 1
+        self.launcher.workers = {42: (0, 1, time.time() - 60),
+                                 43: (1, 1, time.time() - 60)}
+        start_patch = mock.patch.object(self.launcher, '_start_worker',
+                                        autospec=True)
+        self.mock_start = start_patch.start()
+        self.addCleanup(start_patch.stop)
+
+    def test_restart(self, mock_waitpid, mock_sleep):
+        mock_waitpid.side_effect = [(42, 256), (0, 0)]
+        self.launcher._reap()
+
+        self.mock_start.assert_called_once_with(0)
+        self.assertEqual([43], list(self.launcher.workers))
+        self.assertFalse(mock_sleep.called)
+
+    def test_restart_delayed(self, mock_waitpid, mock_sleep):
+        self.launcher.workers[42] = (0, 1, time.time())
+        mock_waitpid.side_effect = [(42, 256), (0, 0)]
+        self.launcher._reap()
+
+        self.mock_start.assert_called_once_with(0)
+        mock_sleep.assert_called_once_with(server._MIN_WORKER_LIFETIME)
+
+    def test_stopping(self, mock_waitpid, mock_sleep):
+        self.launcher._stopping = True
+        mock_waitpid.side_effect = [(42, 0), (43, 0),
+                                    OSError(errno.ECHILD, 'no children')]
+        self.launcher._reap()
+
+        self.assertFalse(self.mock_start.called)
+        self.assertEqual({}, self.launcher.workers)
+
+    def test_old_generation(self, mock_waitpid, mock_sleep):
+        self.launcher.workers[42] = (0, 0, time.time())
+        mock_waitpid.side_effect = [(42, 0), (0, 0)]
+        self.launcher._reap()
+
+        self.assertFalse(self.mock_start.called)
+        self.assertEqual([43], list(self.launcher.workers))
+
+    def test_replaced_designated(self, mock_waitpid, mock_sleep):
+        self.launcher.workers[44] = (0, 0, time.time())
+        self.launcher._replaced_designated = (44, time.time() + 60)
+        mock_waitpid.side_effect = [(44, 0), (0, 0)]
+        self.launcher._reap()
+
+        self.mock_start.assert_called_once_with(server.DESIGNATED_WORKER)
+        self.assertIsNone(self.launcher._replaced_designated)
+        self.assertFalse(mock_sleep.called)
+
+    def test_replaced_designated_stopping(self, mock_waitpid, mock_sleep):
+        self.launcher._stopping = True
+        self.launcher.workers[44] = (0, 0, time.time())
+        self.launcher._replaced_designated = (44, time.time() + 60)
+        mock_waitpid.side_effect = [(44, 0), (0, 0)]
+        self.launcher._reap()
+
+        self.assertFalse(self.mock_start.called)
+        self.assertIsNone(self.launcher._replaced_designated)
+
+    def test_unknown_pid(self, mock_waitpid, mock_sleep):
+        mock_waitpid.side_effect = [(44, 0), (0, 0)]
+        self.launcher._reap()
+
+        self.assertFalse(self.mock_start.called)
+        self.assertEqual({42, 43}, set(self.launcher.workers))
+
+    def test_error(self, mock_waitpid, mock_sleep):
+        mock_waitpid.side_effect = OSError(errno.EINTR, 'interrupted')
+        self.assertRaises(OSError, self.launcher._reap)
+
+
+@mock.patch.object(metrics, 'remove_shared', autospec=True)
+@mock.patch.object(CONF, 'reload_config_files', autospec=True)
+@mock.patch.object(server, '_kill', autospec=True)
+class TestReload(BaseLauncherTest):
+    def setUp(self):
+        super(TestReload, self).setUp()
+        CONF.set_override('api_workers', 2)
+        self.launcher.workers = {42: (1, 0, 0), 43: (0, 0, 0)}
+        self.calls = []
+
+        def _start(index):
+            self.calls.append(('start', index))
+            self.launcher.workers[100 + index] = (
+                index, self.launcher.generation, 0)
+
+        start_patch = mock.patch.object(self.launcher, '_start_worker',
+                                        autospec=True)
+        self.mock_start = start_patch.start()
+        self.addCleanup(start_patch.stop)
+        self.mock_start.side_effect = _start
+
+    @mock.patch.object(time, 'time', autospec=True)
+    def test_reload(self, mock_time, mock_kill, mock_reload_config,
+                    mock_remove_shared):
+        mock_time.return_value = 1000
+        mock_kill.side_effect = lambda pid: self.calls.append(('kill', pid))
+
+        self.launcher._reload()
+
+        mock_reload_config.assert_called_once_with()
+        self.assertEqual(1, self.launcher.generation)
+        # The other old workers serve requests until the new ones are
+        # started, the new designated worker is started by _reap() once the
+        # old one exits
+        self.assertEqual(('start', 1), self.calls[0])
+        self.assertEqual({('kill', 42), ('kill', 43)}, set(self.calls[1:]))
+        self.assertEqual(3, len(self.calls))
+        self.assertEqual({42: (1, 0, 0), 43: (0, 0, 0), 101: (1, 1, 0)},
+                         self.launcher.workers)
+        self.assertEqual((43, 1060 + server._DESIGNATED_EXIT_GRACE),
+                         self.launcher._replaced_designated)
+        mock_remove_shared.assert_called_once_with(
+            mock.sentinel.metrics_dir, 2)
+
+    def test_reload_without_timeout(self, mock_kill, mock_reload_config,
+                                    mock_remove_shared):
+        CONF.set_override('graceful_shutdown_timeout', 0)
+
+        self.launcher._reload()
+
+        self.assertEqual((43, float('inf')),
+                         self.launcher._replaced_designated)
+
+    def test_replacement_pending(self, mock_kill, mock_reload_config,
+                                 mock_remove_shared):
+        self.launcher._replaced_designated = (43, 500)
+
+        self.launcher._reload()
+
+        self.mock_start.assert_called_once_with(1)
+        mock_kill.assert_any_call(43)
+        # The deadline is not extended
+        self.assertEqual((43, 500), self.launcher._replaced_designated)
+
+    def test_no_designated(self, mock_kill, mock_reload_config,
+                           mock_remove_shared):
+        del self.launcher.workers[43]
+
+        self.launcher._reload()
+
+        self.assertEqual([mock.call(1), mock.call(0)],
+                         self.mock_start.call_args_list)
+        self.assertIsNone(self.launcher._replaced_designated)
+
+
+@mock.patch.object(signal, 'signal', autospec=True)
+@mock.patch.object(metrics, 'share', autospec=True)
+@mock.patch.object(firewall, 'forward_updates', autospec=True)
+@mock.patch.object(eventlet, 'spawn_n', autospec=True)
+@mock.patch.object(server.Launcher, '_serve', autospec=True)
+class TestRunWorker(BaseLauncherTest):
+    def test_designated(self, mock_serve, mock_spawn_n, mock_forward,
+                        mock_share, mock_signal):
+        self.launcher._run_worker(server.DESIGNATED_WORKER)
+
+        self.service.init.assert_called_once_with(background=True)
+        self.assertEqual(
+            [mock.call(self.launcher._dump_metrics),
+             mock.call(firewall.serve_update_requests,
+                       mock.sentinel.firewall_socket)],
+            mock_spawn_n.call_args_list)
+        mock_share.assert_called_once_with(mock.sentinel.metrics_dir,
+                                           server.DESIGNATED_WORKER)
+        self.assertFalse(mock_forward.called)
+        mock_serve.assert_called_once_with(self.launcher)
+        self.service.shutdown.assert_called_once_with()
+        mock_signal.assert_any_call(signal.SIGTERM,
+                                    self.launcher._request_worker_stop)
+        mock_signal.assert_any_call(signal.SIGHUP, signal.SIG_IGN)
+
+    def test_designated_without_manage_firewall(self, mock_serve,
+                                                mock_spawn_n, mock_forward,
+                                                mock_share, mock_signal):
+        CONF.set_override('manage_firewall', False, 'firewall')
+        self.launcher._run_worker(server.DESIGNATED_WORKER)
+
+        self.service.init.assert_called_once_with(background=True)
+        mock_spawn_n.assert_called_once_with(self.launcher._dump_metrics)
+
+    def test_other(self, mock_serve, mock_spawn_n, mock_forward,
+                   mock_share, mock_signal):
+        self.launcher._run_worker(1)
+
+        self.service.init.assert_called_once_with(background=False)
+        mock_forward.assert_called_once_with(
+            mock.sentinel.firewall_address)
+        mock_spawn_n.assert_called_once_with(self.launcher._dump_metrics)
+        mock_share.assert_called_once_with(mock.sentinel.metrics_dir, 1)
+        mock_serve.assert_called_once_with(self.launcher)
+        self.service.shutdown.assert_called_once_with()
+
+    def test_serve_failure(self, mock_serve, mock_spawn_n, mock_forward,
+                           mock_share, mock_signal):
+        mock_serve.side_effect = RuntimeError('boom')
+        self.assertRaises(RuntimeError, self.launcher._run_worker, 1)
+        self.service.shutdown.assert_called_once_with()
+
+
+@mock.patch.object(metrics, 'dump', autospec=True)
+@mock.patch.object(eventlet, 'sleep', autospec=True)
+class TestDumpMetrics(BaseLauncherTest):
+    def test_dump(self, mock_sleep, mock_dump):
+        def _dump():
+            if mock_dump.call_count == 2:
+                self.launcher._server_stop_requested = True
+
+        mock_dump.side_effect = _dump
+        self.launcher._dump_metrics()
+
+        mock_sleep.assert_called_with(server._METRICS_DUMP_INTERVAL)
+        self.assertEqual(3, mock_sleep.call_count)
+        self.assertEqual(2, mock_dump.call_count)
+
+    def test_failure(self, mock_sleep, mock_dump):
+        def _dump():
+            self.launcher._server_stop_requested = True
+            raise OSError('boom')
+
+        mock_dump.side_effect = _dump
+        self.launcher._dump_metrics()
+
+        self.assertEqual(1, mock_dump.call_count)
+
+
+@mock.patch.object(eventlet, 'spawn_after', autospec=True)
+@mock.patch.object(eventlet, 'sleep', autospec=True)
+@mock.patch.object(eventlet, 'spawn', autospec=True)
+class TestServe(BaseLauncherTest):
+    def test_stop(self, mock_spawn, mock_sleep, mock_spawn_after):
+        server_thread = mock_spawn.return_value
+        server_thread.dead = False
+        mock_sleep.side_effect = lambda _: self.launcher._request_worker_stop(
+            signal.SIGTERM, None)
+
+        self.launcher._serve()
+
+        mock_spawn.assert_called_once_with(
+            server.wsgi.server, mock.sentinel.socket, self.application,
+            log=server.LOG, custom_pool=mock.ANY, keepalive=True,
+            socket_timeout=CONF.client_socket_timeout, debug=False)
+        mock_sleep.assert_called_once_with(server._STOP_POLL_INTERVAL)
+        mock_spawn_after.assert_called_once_with(
+            CONF.graceful_shutdown_timeout, server._force_exit)
+        server_thread.kill.assert_called_once_with(SystemExit)
+        server_thread.wait.assert_called_once_with()
+        self.assertEqual(CONF.max_header_line, server.wsgi.MAX_HEADER_LINE)
+
+    def test_stop_without_timeout(self, mock_spawn, mock_sleep,
+                                  mock_spawn_after):
+        CONF.set_override('graceful_shutdown_timeout', 0)
+        CONF.set_override('client_socket_timeout', 0)
+        mock_spawn.return_value.dead = False
+        self.launcher._server_stop_requested = True
+
+        self.launcher._serve()
+
+        self.assertIsNone(mock_spawn.call_args[1]['socket_timeout'])
+        self.assertFalse(mock_sleep.called)
+        self.assertFalse(mock_spawn_after.called)
+        mock_spawn.return_value.kill.assert_called_once_with(SystemExit)
+
+    def test_server_failure(self, mock_spawn, mock_sleep, mock_spawn_after):
+        server_thread = mock_spawn.return_value
+        server_thread.dead = True
+        server_thread.wait.side_effect = RuntimeError('boom')
+
+        self.assertRaises(RuntimeError, self.launcher._serve)
+        self.assertFalse(server_thread.kill.called)
+        self.assertFalse(mock_spawn_after.called)
+
+
+@mock.patch.object(time, 'sleep', autospec=True)
+@mock.patch.object(server, '_kill', autospec=True)
+class TestWait(BaseLauncherTest):
+    def setUp(self):
+        super(TestWait, self).setUp()
+        self.launcher.workers = {42: (0, 0, 0), 43: (1, 0, 0)}
+
+    def test_stop(self, mock_kill, mock_sleep):
+        self.launcher._stop_requested = True
+
+        def _reap():
+            self.launcher.workers.popitem()
+
+        with mock.patch.object(self.launcher, '_reap',
+                               autospec=True) as mock_reap:
+            mock_reap.side_effect = _reap
+            self.launcher._wait()
+
+        # Workers are only signaled once
+        self.assertEqual({42, 43},
+                         {c[0][0] for c in mock_kill.call_args_list})
+        self.assertEqual(2, mock_kill.call_count)
+        self.assertEqual(2, mock_reap.call_count)
+
+    def test_reload(self, mock_kill, mock_sleep):
+        self.launcher._reload_requested = True
+
+        with mock.patch.object(self.launcher, '_reap',
+                               autospec=True) as mock_reap, \
+                mock.patch.object(self.launcher, '_reload',
+                                  autospec=True) as mock_reload:
+            mock_reap.side_effect = self.launcher.workers.clear
+            self.launcher._wait()
+
+        mock_reload.assert_called_once_with()
+        self.assertFalse(self.launcher._reload_requested)
+        self.assertFalse(mock_kill.called)
+
+    @mock.patch.object(time, 'time', autospec=True)
+    def test_replaced_designated_not_exiting(self, mock_time, mock_kill,
+                                             mock_sleep):
+        self.launcher.workers[44] = (0, 0, 0)
+        self.launcher._replaced_designated = (44, 1000)
+        mock_time.side_effect = lambda: 1001 if mock_reap.called else 999
+
+        def _reap():
+            if mock_reap.call_count == 3:
+                self.launcher.workers.clear()
+
+        with mock.patch.object(self.launcher, '_reap',
+                               autospec=True) as mock_reap:
+            mock_reap.side_effect = _reap
+            self.launcher._wait()
+
+        # The old designated worker is only killed once after the deadline
+        mock_kill.assert_called_once_with(44, signal.SIGKILL)
+        self.assertEqual((44, None), self.launcher._replaced_designated)
+        self.assertEqual(3, mock_reap.call_count)
+
+
+@mock.patch.object(os, 'kill', autospec=True)
+class TestKill(test_base.BaseTest):
+    def test_kill(self, mock_kill):
+        server._kill(42)
+        mock_kill.assert_called_once_with(42, signal.SIGTERM)
+
+    def test_signal(self, mock_kill):
+        server._kill(42, signal.SIGKILL)
+        mock_kill.assert_called_once_with(42, signal.SIGKILL)
+
+    def test_already_exited(self, mock_kill):
+        mock_kill.side_effect = OSError(errno.ESRCH, 'no such process')
+        server._kill(42)
+
+    def test_error(self, mock_kill):
+        mock_kill.side_effect = OSError(errno.EPERM, 'not permitted')
+        self.assertRaises(OSError, server._kill, 42)
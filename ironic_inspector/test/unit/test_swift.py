@@ -23,6 +23,7 @@ from swiftclient import exceptions as swift_exception
 
 from ironic_inspector.common import keystone
 from ironic_inspector.common import swift
+from ironic_inspector import metrics
 from ironic_inspector.test import base as test_base
 from ironic_inspector import utils
 
@@ -106,6 +107,8 @@ class SwiftTestCase(BaseTest):
         connection_obj_mock.put_container.assert_called_once_with('ironic-'
                                                                   'inspector')
         self.assertFalse(connection_obj_mock.put_object.called)
+        self.assertEqual(1, metrics._VALUES['swift_request_errors_total'][
+            (('call', 'put_container'),)])
 
     def test_create_object_put_object_fails(self, connection_mock, load_mock,
                                             opts_mock):
@@ -131,6 +134,9 @@ class SwiftTestCase(BaseTest):
         connection_obj_mock.get_object.assert_called_once_with(
             'ironic-inspector', 'object')
         self.assertEqual(expected_obj, swift_obj)
+        self.assertEqual(1, metrics._VALUES['swift_request_duration_seconds'][
+            (('call', 'get_object'),)].count)
+        self.assertNotIn('swift_request_errors_total', metrics._VALUES)
 
     def test_get_object_fails(self, connection_mock, load_mock, opts_mock):
         swiftapi = swift.SwiftAPI()
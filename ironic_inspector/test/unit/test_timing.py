@@ -0,0 +1,92 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mock
+from oslo_utils import timeutils
+
+from ironic_inspector.test import base as test_base
+from ironic_inspector import timing
+
+
+class TestHistogram(test_base.BaseTest):
+    def test_empty(self):
+        result = timing.Histogram(buckets=(1, 2)).as_dict()
+        self.assertEqual({'count': 0, 'sum': 0.0, 'min': None, 'max': None,
+                          'buckets': [{'le': 1, 'count': 0},
+                                      {'le': 2, 'count': 0},
+                                      {'le': None, 'count': 0}]},
+                         result)
+
+    def test_observe(self):
+        histogram = timing.Histogram(buckets=(1, 2))
+        for value in (0.5, 1, 1.5, 3):
+            histogram.observe(value)
+        self.assertEqual({'count': 4, 'sum': 6.0, 'min': 0.5, 'max': 3,
+                          'buckets': [{'le': 1, 'count': 2},
+                                      {'le': 2, 'count': 3},
+                                      {'le': None, 'count': 4}]},
+                         histogram.as_dict())
+
+
+class TestHistograms(test_base.BaseTest):
+    def test_observe(self):
+        timing.observe('lookup', 0.001)
+        timing.observe('lookup', 0.003)
+        timing.observe('finish', 2)
+        result = timing.histograms()
+        self.assertEqual({'lookup', 'finish'}, set(result))
+        self.assertEqual(2, result['lookup']['count'])
+        self.assertAlmostEqual(0.004, result['lookup']['sum'])
+        self.assertEqual(1, result['finish']['count'])
+        self.assertEqual(len(timing.BUCKETS) + 1,
+                         len(result['finish']['buckets']))
+
+    def test_reset(self):
+        timing.observe('lookup', 0.001)
+        timing.reset()
+        self.assertEqual({}, timing.histograms())
+
+
+@mock.patch.object(timeutils.StopWatch, 'elapsed', autospec=True,
+                   return_value=0.5)
+class TestNodeTimings(test_base.BaseTest):
+    def test_measure(self, elapsed_mock):
+        timings = timing.NodeTimings()
+        with timings.measure('lookup'):
+            pass
+        with timings.measure('finish'):
+            pass
+        with timings.measure('lookup'):
+            pass
+        self.assertEqual([('lookup', 1.0), ('finish', 0.5)],
+                         list(timings.phases.items()))
+        self.assertEqual(2, timing.histograms()['lookup']['count'])
+
+    def test_measure_exception(self, elapsed_mock):
+        timings = timing.NodeTimings()
+
+        def _fail():
+            with timings.measure('lookup'):
+                raise RuntimeError('boom')
+
+        self.assertRaises(RuntimeError, _fail)
+        self.assertEqual({'lookup': 0.5}, timings.phases)
+        self.assertEqual(1, timing.histograms()['lookup']['count'])
+
+    def test_measure_with_phases(self, elapsed_mock):
+        timings = timing.NodeTimings({'lookup': 2.0})
+        with timings.measure('lookup'):
+            pass
+        self.assertEqual({'lookup': 2.5}, timings.phases)
+        # Durations passed in are not recorded again
+        self.assertEqual(1, timing.histograms()['lookup']['count'])
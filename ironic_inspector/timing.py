@@ -0,0 +1,126 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Latency histograms of introspection data processing phases."""
+
+import collections
+import contextlib
+import threading
+
+from oslo_utils import timeutils
+
+
+# Upper bounds of histogram buckets in seconds, the last bucket is unbounded
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+           30.0, 60.0)
+
+_HISTOGRAMS = {}
+_LOCK = threading.Lock()
+
+
+class Histogram(object):
+    """Distribution of durations of one phase."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        """Record one duration, must be called with the module lock held."""
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def as_dict(self):
+        """Return the histogram as a dictionary.
+
+        Bucket counts are cumulative: every bucket contains the number of
+        durations less than or equal to its upper bound ``le``, the last
+        bucket has ``le`` set to None and contains all durations.
+        """
+        buckets = []
+        total = 0
+        for bound, count in zip(self.buckets + (None,), self.counts):
+            total += count
+            buckets.append({'le': bound, 'count': total})
+        return {'count': self.count, 'sum': self.sum, 'min': self.min,
+                'max': self.max, 'buckets': buckets}
+
+
+def observe(phase, value):
+    """Record duration of a phase.
+
+    :param phase: phase name
+    :param value: duration in seconds
+    """
+    with _LOCK:
+        try:
+            histogram = _HISTOGRAMS[phase]
+        except KeyError:
+            histogram = _HISTOGRAMS[phase] = Histogram()
+        histogram.observe(value)
+
+
+def histograms():
+    """Get all histograms.
+
+    :returns: dict phase name -> histogram as returned by Histogram.as_dict
+    """
+    with _LOCK:
+        return {phase: histogram.as_dict()
+                for phase, histogram in _HISTOGRAMS.items()}
+
+
+def reset():
+    """Drop all histograms."""
+    with _LOCK:
+        _HISTOGRAMS.clear()
+
+
+class NodeTimings(object):
+    """Durations of processing phases of one node.
+
+    Every measured duration is also recorded in the histogram of its phase.
+
+    :param phases: durations of phases already measured and recorded, e.g.
+                   by another process, as a dict phase name -> seconds
+    """
+
+    def __init__(self, phases=None):
+        self.phases = collections.OrderedDict(phases or ())
+
+    @contextlib.contextmanager
+    def measure(self, phase):
+        """Context manager measuring duration of a phase.
+
+        The duration is recorded even if an exception is raised. Durations of
+        a phase measured several times are summed up.
+        """
+        watch = timeutils.StopWatch().start()
+        try:
+            yield
+        finally:
+            elapsed = watch.elapsed()
+            observe(phase, elapsed)
+            self.phases[phase] = self.phases.get(phase, 0) + elapsed
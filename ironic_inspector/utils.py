@@ -13,15 +13,13 @@
 
 import datetime
 import logging as pylog
+import sys
+import threading
 
-import futurist
-from keystonemiddleware import auth_token
 from oslo_config import cfg
 from oslo_log import log
-from oslo_middleware import cors as cors_middleware
 import pytz
 
-from ironicclient.v1 import node
 from ironic_inspector.common.i18n import _, _LE, _LI
 from ironic_inspector import conf  # noqa
 
@@ -46,6 +44,16 @@ def get_pxe_mac(introspection_data):
     return pxe_mac
 
 
+def _is_ironic_node(obj):
+    """Check if an object is an Ironic node without importing ironicclient.
+
+    ironicclient is kept out of processes not talking to Ironic, e.g. the
+    database migration tool. If it is not loaded, no object is its node.
+    """
+    module = sys.modules.get('ironicclient.v1.node')
+    return module is not None and isinstance(obj, module.Node)
+
+
 def processing_logger_prefix(data=None, node_info=None):
     """Calculate prefix for logging.
 
@@ -63,7 +71,7 @@ def processing_logger_prefix(data=None, node_info=None):
     data = data or {}
 
     if node_info is not None:
-        if isinstance(node_info, node.Node):
+        if _is_ironic_node(node_info):
             parts.append(str(node_info.uuid))
         else:
             parts.append(str(node_info))
@@ -122,6 +130,16 @@ class NotFoundInCacheError(Error):
                                                    log_level='info', **kwargs)
 
 
+class ServiceUnavailable(Error):
+    """Exception when a request cannot be handled right now."""
+
+    def __init__(self, msg, retry_after, code=503, **kwargs):
+        super(ServiceUnavailable, self).__init__(msg, code,
+                                                 log_level='warning',
+                                                 **kwargs)
+        self.retry_after = retry_after
+
+
 class NodeStateRaceCondition(Error):
     """State mismatch between the DB and a node_info."""
     def __init__(self, *args, **kwargs):
@@ -135,12 +153,60 @@ class NodeStateInvalidEvent(Error):
     """Invalid event attempted."""
 
 
+class _CountingExecutor(object):
+    """Futures executor wrapper counting queued and running tasks.
+
+    Futurist does not expose these numbers, they are reported as metrics.
+    All other attributes are taken from the wrapped executor.
+    """
+
+    def __init__(self, executor):
+        self._executor = executor
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            self.queued += 1
+        try:
+            future = self._executor.submit(self._run, fn, *args, **kwargs)
+        except Exception:
+            with self._lock:
+                self.queued -= 1
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _run(self, fn, *args, **kwargs):
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def _done(self, future):
+        # Cancelled tasks are never run
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    def __getattr__(self, name):
+        return getattr(self._executor, name)
+
+
 def executor():
     """Return the current futures executor."""
     global _EXECUTOR
     if _EXECUTOR is None:
-        _EXECUTOR = futurist.GreenThreadPoolExecutor(
-            max_workers=CONF.max_concurrency)
+        # Not needed by the database migrations importing this module
+        import futurist
+
+        _EXECUTOR = _CountingExecutor(futurist.GreenThreadPoolExecutor(
+            max_workers=CONF.max_concurrency))
     return _EXECUTOR
 
 
@@ -149,6 +215,8 @@ def add_auth_middleware(app):
 
     :param app: application.
     """
+    from keystonemiddleware import auth_token
+
     auth_conf = dict(CONF.keystone_authtoken)
     auth_conf['delay_auth_decision'] = True
     app.wsgi_app = auth_token.AuthProtocol(app.wsgi_app, auth_conf)
@@ -162,6 +230,8 @@ def add_cors_middleware(app):
 
     :param app: application
     """
+    from oslo_middleware import cors as cors_middleware
+
     app.wsgi_app = cors_middleware.CORS(app.wsgi_app, CONF)
 
 
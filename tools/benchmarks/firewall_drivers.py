@@ -0,0 +1,85 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark rebuilding the firewall chain with different drivers.
+
+Real iptables is never touched: every command is replaced by a stand-in
+executable (``true`` for iptables, a shell discarding its standard input for
+iptables-restore by default),
+so the numbers reflect the cost of spawning processes, which dominates
+the chain rebuild. Use ``--command`` and ``--restore-command`` to try a more
+realistic stand-in, e.g. a Python interpreter to mimic rootwrap.
+
+Usage: python tools/benchmarks/firewall_drivers.py [--macs 100 1000 10000]
+"""
+
+import argparse
+import shlex
+import time
+
+from oslo_config import cfg
+
+from ironic_inspector.plugins import iptables
+
+
+CONF = cfg.CONF
+
+
+def _random_macs(count):
+    return ['02:%02x:%02x:%02x:%02x:%02x' % (
+        (i >> 32) & 0xff, (i >> 24) & 0xff, (i >> 16) & 0xff,
+        (i >> 8) & 0xff, i & 0xff) for i in range(count)]
+
+
+def rebuild(driver, macs):
+    start = time.time()
+    driver.update_filters(set(macs))
+    return time.time() - start
+
+
+def _driver(cls, args):
+    driver = cls()
+    driver.interface = 'br-ctlplane'
+    driver.chain = 'ironic-inspector'
+    driver.new_chain = driver.chain + '_temp'
+    driver.base_command = tuple(shlex.split(args.command))
+    driver.restore_command = tuple(shlex.split(args.restore_command))
+    return driver
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--macs', type=int, nargs='+',
+                        default=[100, 1000, 10000])
+    parser.add_argument('--command', default='true',
+                        help='stand-in for iptables')
+    parser.add_argument('--restore-command', default="sh -c 'cat >/dev/null'",
+                        help='stand-in for iptables-restore')
+    args = parser.parse_args()
+
+    CONF([], project='ironic-inspector')
+    per_rule_driver = _driver(iptables.IptablesDriver, args)
+    batched_driver = _driver(iptables.IptablesRestoreDriver, args)
+
+    print('%8s %14s %20s %10s' % ('MACs', 'iptables, s',
+                                  'iptables_restore, s', 'speed-up'))
+    for count in args.macs:
+        macs = _random_macs(count)
+        per_rule = rebuild(per_rule_driver, macs)
+        batched = rebuild(batched_driver, macs)
+        print('%8d %14.3f %20.3f %9.0fx' % (count, per_rule, batched,
+                                            per_rule / batched))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark mapping InfiniBand ports to EoIB MAC's.
+
+Compares the previous approach (a regular expression compiled and searched
+through the whole neighbours file for every blacklisted port) with parsing
+the file once into a GUID -> EMAC dictionary, using a synthetic neighbours
+file.
+
+Usage: python tools/benchmarks/ib_neighs.py [--entries 10000] [--ports 1000]
+"""
+
+import argparse
+import re
+import time
+
+from ironic_inspector import firewall
+
+
+EMAC_REGEX = 'EMAC=([0-9a-f]{2}(:[0-9a-f]{2}){5}) IMAC=.*'
+
+
+def _guid(index):
+    return '7c:fe:90:03:00:%02x:%02x:%02x' % (
+        (index >> 16) & 0xff, (index >> 8) & 0xff, index & 0xff)
+
+
+def _neighs(count):
+    return ''.join(
+        'EMAC=02:00:00:%02x:%02x:%02x IMAC=97:fe:80:00:00:00:00:00:00:%s\n' %
+        ((i >> 16) & 0xff, (i >> 8) & 0xff, i & 0xff, _guid(i))
+        for i in range(count))
+
+
+def legacy(data, client_ids):
+    result = {}
+    for client_id in client_ids:
+        match = re.compile(EMAC_REGEX + client_id[-23:]).search(data)
+        if match:
+            result[client_id] = match.group(1)
+    return result
+
+
+def parsed(data, client_ids):
+    guid_to_emac = firewall._parse_neighs(data)
+    result = {}
+    for client_id in client_ids:
+        emac = guid_to_emac.get(client_id[-23:])
+        if emac:
+            result[client_id] = emac
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--entries', type=int, default=10000,
+                        help='number of entries in the neighbours file')
+    parser.add_argument('--ports', type=int, nargs='+',
+                        default=[10, 100, 1000],
+                        help='number of blacklisted InfiniBand ports')
+    args = parser.parse_args()
+
+    data = _neighs(args.entries)
+    print('%8s %8s %12s %12s %10s' % ('entries', 'ports', 'legacy, s',
+                                      'parsed, s', 'speed-up'))
+    for count in args.ports:
+        # Take ports evenly from the file, so that the legacy search does
+        # not always stop early
+        step = max(args.entries // count, 1)
+        client_ids = ['ff:00:00:00:00:00:02:00:00:02:c9:00:' + _guid(i)
+                      for i in range(0, args.entries, step)][:count]
+
+        start = time.time()
+        expected = legacy(data, client_ids)
+        legacy_time = time.time() - start
+
+        start = time.time()
+        result = parsed(data, client_ids)
+        parsed_time = time.time() - start
+
+        assert result == expected
+        print('%8d %8d %12.3f %12.3f %9.0fx' % (
+            args.entries, count, legacy_time, parsed_time,
+            legacy_time / parsed_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark import time of the ironic-inspector entry points.
+
+Imports every entry point module in a new interpreter with
+``python -X importtime`` (Python 3.7 or newer), prints the best total time
+of several runs and the top-level packages taking most of it. Exits with
+status 1 if a module imports one of the dependencies it is expected to load
+only on first use. The same check is run by the unit tests, see
+ironic_inspector/common/entry_points.py.
+
+Usage: python tools/benchmarks/import_time.py [--repeat 5] [--top 8] \\
+    [module ...]
+"""
+
+import argparse
+import collections
+import subprocess
+import sys
+
+from ironic_inspector.common import entry_points
+
+
+def _import_times(module):
+    """Import a module in a new interpreter.
+
+    :returns: list of tuples (depth, name, cumulative time in us)
+    """
+    output = subprocess.check_output(
+        [sys.executable, '-W', 'ignore', '-X', 'importtime', '-c',
+         'import %s' % module], stderr=subprocess.STDOUT)
+    result = []
+    for line in output.decode('utf-8').splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _self, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        result.append((depth, name.strip(), int(cumulative)))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=8)
+    parser.add_argument('modules', nargs='*',
+                        default=list(entry_points.ENTRY_POINTS))
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        runs = [_import_times(module) for _ in range(args.repeat)]
+        best = min(runs, key=lambda times: times[-1][2])
+        total = best[-1][2]
+
+        # Packages are attributed to the first module importing them
+        packages = collections.Counter()
+        for depth, name, cumulative in best:
+            if depth > 0 and not name.startswith('ironic_inspector'):
+                packages[name.split('.')[0]] = max(
+                    packages[name.split('.')[0]], cumulative)
+
+        print('%s: %.1f ms' % (module, total / 1000.0))
+        for name, cumulative in packages.most_common(args.top):
+            print('  %-24s %8.1f ms' % (name, cumulative / 1000.0))
+
+        unexpected = entry_points.unexpected_imports(
+            module, [name for _depth, name, _time in best])
+        if unexpected:
+            print('  ERROR: imports %s' % ', '.join(unexpected))
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
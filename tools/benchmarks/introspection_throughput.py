@@ -0,0 +1,217 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark the introspection start -> process path.
+
+Runs introspection of a number of nodes followed by processing of their
+ramdisk data fully in-process: Ironic is replaced by a trivial in-memory
+fake, the database is an SQLite database (in memory by default), background
+work is run synchronously and the "recording" firewall driver is used, so
+neither root access nor netfilter is required and the results are
+deterministic apart from the timing itself.
+
+With --bulk introspection of all nodes is started with one introspect_many()
+call instead of calling introspect() for every node. The number of node
+updates is affected by the enabled processing hooks (--hooks) and by
+introspection rules setting node fields (--rules). --cache-ttl enables the
+cache of Ironic nodes and ports.
+
+Usage: python tools/benchmarks/introspection_throughput.py [--nodes 100] \\
+    [--bulk] [--hooks '$processing.default_processing_hooks,capabilities'] \\
+    [--rules 0] [--cache-ttl 0]
+"""
+
+import argparse
+import logging
+import time
+
+import futurist
+from oslo_config import cfg
+
+from ironic_inspector.common import ironic as ir_utils
+from ironic_inspector import db
+from ironic_inspector import firewall
+from ironic_inspector import introspect
+from ironic_inspector import process
+from ironic_inspector import rules
+from ironic_inspector import utils
+
+
+CONF = cfg.CONF
+
+
+class FakeObject(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+class FakeNodeManager(object):
+    def __init__(self, nodes, ports):
+        self.nodes = nodes
+        self.ports = ports
+        self.updates = 0
+        self.gets = 0
+        self.port_lists = 0
+
+    def get(self, node_id, **kwargs):
+        self.gets += 1
+        return self.nodes[node_id]
+
+    def validate(self, node_id):
+        return FakeObject(power={'result': True})
+
+    def list_ports(self, node_id, **kwargs):
+        self.port_lists += 1
+        return [p for p in self.ports if p.node_uuid == node_id]
+
+    def update(self, node_id, patch):
+        # Patches are not applied, processing does not depend on them
+        self.updates += 1
+        return self.nodes[node_id]
+
+    def set_boot_device(self, node_id, device, persistent=True):
+        pass
+
+    def set_power_state(self, node_id, state):
+        pass
+
+
+class FakePortManager(object):
+    def __init__(self, ports):
+        self.ports = ports
+
+    def list(self, **kwargs):
+        return list(self.ports)
+
+    def create(self, node_uuid, address, extra=None):
+        port = FakeObject(uuid='port-%s' % address, node_uuid=node_uuid,
+                          address=address, extra=extra or {})
+        self.ports.append(port)
+        return port
+
+
+class FakeIronic(object):
+    def __init__(self, count):
+        nodes = {}
+        ports = []
+        for i in range(count):
+            uuid = '00000000-0000-0000-0000-%012d' % i
+            nodes[uuid] = FakeObject(
+                uuid=uuid, name=None, driver='fake',
+                driver_info={'ipmi_address': _bmc_address(i)},
+                properties={}, extra={}, instance_uuid=None,
+                power_state='power off', provision_state='manageable',
+                maintenance=False)
+            ports.append(FakeObject(uuid='port-%d' % i, node_uuid=uuid,
+                                    address=_mac(i, 0), extra={}))
+        self.node = FakeNodeManager(nodes, ports)
+        self.port = FakePortManager(ports)
+
+
+def _mac(index, nic):
+    return '52:54:%02x:%02x:%02x:%02x' % (
+        nic, (index >> 16) & 0xff, (index >> 8) & 0xff, index & 0xff)
+
+
+def _bmc_address(index):
+    return '10.%d.%d.%d' % ((index >> 16) & 0xff, (index >> 8) & 0xff,
+                            index & 0xff)
+
+
+def _ramdisk_data(index):
+    return {
+        'boot_interface': '01-' + _mac(index, 0).replace(':', '-'),
+        'inventory': {
+            'interfaces': [
+                {'name': 'eth%d' % nic, 'mac_address': _mac(index, nic),
+                 'ipv4_address': '192.168.%d.%d' % (nic, index % 250 + 1)}
+                for nic in range(2)
+            ],
+            'disks': [
+                {'name': '/dev/sda', 'model': 'Big Data Disk',
+                 'size': 1000 * 1024 ** 3},
+                {'name': '/dev/sdb', 'model': 'Small OS Disk',
+                 'size': 20 * 1024 ** 3},
+            ],
+            'cpu': {'count': 4, 'architecture': 'x86_64',
+                    'flags': ['vmx']},
+            'memory': {'physical_mb': 12288},
+            'bmc_address': _bmc_address(index),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--nodes', type=int, default=100)
+    parser.add_argument('--connection', default='sqlite://',
+                        help='database connection string')
+    parser.add_argument('--bulk', action='store_true',
+                        help='start introspection with one bulk call')
+    parser.add_argument('--hooks', help='processing hooks to enable')
+    parser.add_argument('--rules', type=int, default=0,
+                        help='number of rules setting node fields')
+    parser.add_argument('--cache-ttl', type=int, default=0,
+                        help='TTL of the Ironic object cache, 0 disables it')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    CONF([], project='ironic-inspector')
+    CONF.set_override('connection', args.connection, 'database')
+    CONF.set_override('introspection_delay', 0)
+    CONF.set_override('manage_firewall', True, 'firewall')
+    CONF.set_override('driver', 'recording', 'firewall')
+    CONF.set_override('cache_ttl', args.cache_ttl, 'ironic')
+    if args.hooks:
+        CONF.set_override('processing_hooks', args.hooks, 'processing')
+    db.Base.metadata.create_all(db.get_engine())
+    utils._EXECUTOR = futurist.SynchronousExecutor()
+
+    ironic = FakeIronic(args.nodes)
+    ir_utils.get_client = lambda *args, **kwargs: ironic
+    firewall.init()
+    for i in range(args.rules):
+        rules.create([], [{'action': 'set-attribute',
+                           'path': '/extra/rule%d' % i, 'value': i}])
+
+    start = time.time()
+    if args.bulk:
+        results = introspect.introspect_many(sorted(ironic.node.nodes))
+        assert not any(result['error'] for result in results)
+    else:
+        for uuid in sorted(ironic.node.nodes):
+            introspect.introspect(uuid)
+    started = time.time()
+    for i in range(args.nodes):
+        process.process(_ramdisk_data(i))
+    finished = time.time()
+
+    calls = len(firewall._driver().calls)
+    print('nodes:               %d' % args.nodes)
+    print('introspect, s:       %.3f (%.1f nodes/s)' % (
+        started - start, args.nodes / (started - start)))
+    print('process, s:          %.3f (%.1f nodes/s)' % (
+        finished - started, args.nodes / (finished - started)))
+    print('total, s:            %.3f (%.1f nodes/s)' % (
+        finished - start, args.nodes / (finished - start)))
+    print('firewall updates:    %d' % (calls - 1))
+    print('node updates:        %d' % ironic.node.updates)
+    print('node GETs:           %d' % ironic.node.gets)
+    print('port lists:          %d' % ironic.node.port_lists)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark updating port local link connection from LLDP data.
+
+Compares the previous implementation of the generic LLDP hook (a new Ironic
+client and a port update for every interface, one after another) with the
+current one (one cached client, port updates sent concurrently). Ironic is
+replaced by a fake client sleeping for --latency on every request.
+
+Usage: python tools/benchmarks/lldp_port_updates.py [--nics 2 8 32] \\
+    [--latency 0.02]
+"""
+
+import argparse
+import time
+
+import eventlet
+from oslo_config import cfg
+
+from ironic_inspector.common import ironic as ir_utils
+from ironic_inspector import node_cache
+from ironic_inspector.plugins import local_link_connection
+
+
+CONF = cfg.CONF
+LLDP = [(1, '04885a92ec5459'), (2, '0545746865726e6574312f3138')]
+
+
+class FakeObject(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakePortManager(object):
+    def __init__(self, latency):
+        self.latency = latency
+        self.requests = 0
+
+    def update(self, port_id, patch):
+        self.requests += 1
+        eventlet.sleep(self.latency)
+        return FakeObject(uuid=port_id, address=port_id,
+                          local_link_connection={})
+
+
+class FakeIronic(object):
+    def __init__(self, port):
+        self.port = port
+
+
+def legacy(hook, data, node_info, get_client):
+    """Previous implementation of the hook."""
+    ports = node_info.ports()
+    for iface in data['inventory']['interfaces']:
+        port = ports[iface['mac_address']]
+        patches = [hook._get_local_link_patch(tlv_type, tlv_value, port)
+                   for (tlv_type, tlv_value) in iface['lldp']]
+        cli = get_client(
+            api_version=local_link_connection.REQUIRED_IRONIC_VERSION)
+        node_info.patch_port(port, patches, ironic=cli)
+
+
+def _node_info(nics):
+    ports = [FakeObject(uuid='%02x' % i, address='%02x' % i,
+                        local_link_connection={})
+             for i in range(nics)]
+    return node_cache.NodeInfo(uuid='uuid', started_at=0, ports=ports)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--nics', type=int, nargs='+', default=[2, 8, 32])
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='latency of one Ironic request in seconds')
+    args = parser.parse_args()
+
+    CONF([], project='ironic-inspector')
+    hook = local_link_connection.GenericLocalLinkConnectionHook()
+    manager = FakePortManager(args.latency)
+    clients = []
+
+    def get_client(api_version=None, **kwargs):
+        # Building a client costs nothing here, only count them
+        clients.append(api_version)
+        return FakeIronic(manager)
+
+    print('%6s %12s %12s %10s %16s %16s' % (
+        'NICs', 'legacy, s', 'current, s', 'speed-up', 'clients (l/c)',
+        'requests (l/c)'))
+    for nics in args.nics:
+        data = {
+            'inventory': {
+                'interfaces': [{'name': 'eth%d' % i,
+                                'mac_address': '%02x' % i,
+                                'lldp': LLDP} for i in range(nics)],
+                'cpu': {'count': 4}, 'memory': {'physical_mb': 4096},
+                'disks': [{'name': '/dev/sda', 'size': 10 * 1024 ** 3}],
+            },
+            'all_interfaces': {'eth%d' % i: {} for i in range(nics)},
+        }
+
+        del clients[:]
+        manager.requests = 0
+        start = time.time()
+        legacy(hook, data, _node_info(nics), get_client)
+        legacy_time = time.time() - start
+        legacy_counts = (len(clients), manager.requests)
+
+        del clients[:]
+        manager.requests = 0
+        original = ir_utils.get_client
+        ir_utils.get_client = get_client
+        try:
+            start = time.time()
+            hook.before_update(data, _node_info(nics))
+            current_time = time.time() - start
+        finally:
+            ir_utils.get_client = original
+
+        print('%6d %12.3f %12.3f %9.1fx %16s %16s' % (
+            nics, legacy_time, current_time, legacy_time / current_time,
+            '%d/%d' % (legacy_counts[0], len(clients)),
+            '%d/%d' % (legacy_counts[1], manager.requests)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark splitting of periodic work on nodes between processes.
+
+For a growing number of ironic-inspector processes prints how many nodes
+every process handles in periodic tasks without partitioning (all of them)
+and with [coordination]partition_periodic_tasks (its slice of the hash
+ring), and the share of nodes moved to the new process when one is added.
+
+Usage: python tools/benchmarks/periodic_partitioning.py [--nodes 10000] \\
+    [--processes 1 2 4 8 16] [--vnodes 64]
+"""
+
+import argparse
+import time
+
+from oslo_utils import uuidutils
+
+from ironic_inspector import hash_ring
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--nodes', type=int, default=10000)
+    parser.add_argument('--processes', type=int, nargs='+',
+                        default=[1, 2, 4, 8, 16])
+    parser.add_argument('--vnodes', type=int, default=64)
+    args = parser.parse_args()
+
+    nodes = [uuidutils.generate_uuid() for _ in range(args.nodes)]
+    print('%9s %16s %16s %12s %12s %10s' % (
+        'processes', 'total (legacy)', 'total (ring)', 'min/process',
+        'max/process', 'moved, %'))
+    previous = None
+    for count in args.processes:
+        members = ['member-%d' % index for index in range(count)]
+        ring = hash_ring.HashRing(members, args.vnodes)
+        start = time.time()
+        owners = {node: ring.get_member(node) for node in nodes}
+        lookup_time = time.time() - start
+        per_member = [list(owners.values()).count(member)
+                      for member in members]
+        moved = ''
+        if previous is not None:
+            moved = '%.1f' % (100.0 * sum(
+                1 for node in nodes if owners[node] != previous[node]) /
+                len(nodes))
+        previous = owners
+
+        print('%9d %16d %16d %12d %12d %10s' % (
+            count, count * len(nodes), sum(per_member), min(per_member),
+            max(per_member), moved))
+    print('ring look up: %.1f us per node' % (
+        lookup_time * 1e6 / len(nodes)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark creating ports for a node with many NICs.
+
+Compares the previous implementation of NodeInfo.create_ports (ports created
+one after another, port list reloaded after every conflict) with the current
+one (ports created concurrently, one reload for all conflicts). Ironic is
+replaced by a fake client sleeping for --latency on every request. With
+--conflicts this share of the ports already exists in Ironic without being
+known to the node cache.
+
+Usage: python tools/benchmarks/port_creation.py [--nics 2 8 32] \\
+    [--latency 0.02] [--conflicts 0.25]
+"""
+
+import argparse
+import logging
+import time
+
+import eventlet
+from ironicclient import exceptions
+from oslo_config import cfg
+
+from ironic_inspector import node_cache
+
+
+CONF = cfg.CONF
+
+
+class FakeObject(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakeIronic(object):
+    def __init__(self, latency, existing):
+        self.latency = latency
+        self.existing = existing
+        self.requests = 0
+        self.node = self.port = self
+
+    def _request(self):
+        self.requests += 1
+        eventlet.sleep(self.latency)
+
+    def create(self, node_uuid, address, extra=None):
+        self._request()
+        if address in self.existing:
+            raise exceptions.Conflict()
+        return FakeObject(address=address, extra=extra)
+
+    def list_ports(self, node_uuid, limit=None):
+        self._request()
+        return [FakeObject(address=mac) for mac in self.existing]
+
+
+def legacy(node_info, macs, ironic):
+    """Previous implementation of NodeInfo.create_ports."""
+    for mac in macs:
+        if mac not in node_info.ports(ironic=ironic):
+            try:
+                port = ironic.port.create(node_uuid=node_info.uuid,
+                                          address=mac, extra={})
+            except exceptions.Conflict:
+                node_info._ports = None
+            else:
+                node_info._ports[mac] = port
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--nics', type=int, nargs='+', default=[2, 8, 32])
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='latency of one Ironic request in seconds')
+    parser.add_argument('--conflicts', type=float, default=0.25,
+                        help='share of ports already existing in Ironic')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    CONF([], project='ironic-inspector')
+    print('%6s %12s %12s %10s %16s' % (
+        'NICs', 'legacy, s', 'current, s', 'speed-up', 'requests (l/c)'))
+    for nics in args.nics:
+        macs = ['52:54:00:00:%02x:%02x' % (i >> 8, i & 0xff)
+                for i in range(nics)]
+        existing = set(macs[:int(nics * args.conflicts)])
+        results = []
+        for func in (legacy, None):
+            ironic = FakeIronic(args.latency, existing)
+            node_info = node_cache.NodeInfo(uuid='uuid', started_at=0,
+                                            ports=[])
+            start = time.time()
+            if func is None:
+                node_info.create_ports(macs, ironic=ironic)
+            else:
+                func(node_info, macs, ironic)
+            # Conflicts are resolved by reloading ports on next access
+            node_info.ports(ironic=ironic)
+            results.append((time.time() - start, ironic.requests))
+
+        print('%6d %12.3f %12.3f %9.1fx %16s' % (
+            nics, results[0][0], results[1][0],
+            results[0][0] / results[1][0],
+            '%d/%d' % (results[0][1], results[1][1])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark keeping a pristine copy of the ramdisk data for storing.
+
+Times process.process() as called by /v1/continue with the previous
+approach (a deep copy of the parsed data on every call) and with keeping
+the request body, which is parsed in the background only if the
+unprocessed data is stored in Swift. Processing hooks, node look up and the
+rest of processing are replaced by no-ops and nothing is stored, so only
+the cost of keeping the unprocessed data is measured. A synthetic payload
+with eDeploy data, base64 encoded logs and LLDP TLVs is used.
+
+Usage: python tools/benchmarks/unprocessed_data.py [--size 2] [--repeat 20]
+"""
+
+import argparse
+import base64
+import binascii
+import copy
+import json
+import os
+import time
+
+import mock
+from oslo_config import cfg
+
+from ironic_inspector import process
+from ironic_inspector import utils
+
+
+CONF = cfg.CONF
+
+
+class FakeNodeInfo(object):
+    uuid = '00000000-0000-0000-0000-000000000000'
+    finished_at = None
+    options = {}
+
+    def acquire_lock(self):
+        pass
+
+
+def _payload(size):
+    interfaces = {}
+    lldp = {}
+    for i in range(48):
+        name = 'eth%d' % i
+        interfaces[name] = {'mac_address': '52:54:00:00:00:%02x' % i,
+                            'ipv4_address': '192.168.0.%d' % (i + 1)}
+        # Hundreds of TLVs with hex encoded values
+        lldp[name] = [[t % 128, binascii.hexlify(os.urandom(64)).decode()]
+                      for t in range(200)]
+    data = {
+        'inventory': {
+            'interfaces': [{'name': iface, 'mac_address': v['mac_address'],
+                            'ipv4_address': v['ipv4_address'],
+                            'lldp': lldp[iface]}
+                           for (iface, v) in interfaces.items()],
+            'cpu': {'count': 64, 'architecture': 'x86_64'},
+            'memory': {'physical_mb': 262144},
+            'disks': [{'name': '/dev/sd%s' % chr(ord('a') + disk),
+                       'size': 1000 * 1024 ** 3} for disk in range(24)],
+            'bmc_address': '10.0.0.1',
+        },
+        'data': [['disk', 'sd%d' % disk, 'key%d' % j, 'value%d' % j]
+                 for disk in range(24) for j in range(100)],
+        'interfaces': interfaces,
+    }
+    current = len(json.dumps(data))
+    # Fill the rest up with logs
+    data['logs'] = base64.b64encode(
+        os.urandom(max(size - current, 0) * 3 // 4)).decode()
+    return data
+
+
+def _process_before(data, raw_data):
+    # process() before the change, the copy was made for any store_data
+    copy.deepcopy(data)
+    process.process(data)
+
+
+def _process_after(data, raw_data):
+    process.process(data, raw_data=raw_data)
+
+
+def _process_after_no_body(data, raw_data):
+    process.process(data)
+
+
+def _measure(func, data, raw_data, repeat, store_data):
+    CONF.set_override('store_data', store_data, 'processing')
+    start = time.time()
+    for _ in range(repeat):
+        func(data, raw_data)
+    return (time.time() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', type=float, default=2,
+                        help='payload size in MiB')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    CONF([], project='ironic-inspector')
+    raw = json.dumps(_payload(int(args.size * 1024 * 1024))).encode('utf-8')
+    data = json.loads(raw.decode('utf-8'))
+    print('payload: %.2f MiB' % (len(raw) / 1024.0 / 1024.0))
+
+    with mock.patch.object(process.plugins_base, 'processing_hooks_manager',
+                           return_value=[]), \
+            mock.patch.object(process, '_find_node_info',
+                              return_value=FakeNodeInfo()), \
+            mock.patch.object(process, '_process_prepared',
+                              return_value={}), \
+            mock.patch.object(utils, 'executor'):
+        results = [
+            ('before, deep copy',
+             _measure(_process_before, data, raw, args.repeat, 'none')),
+            ('after, store_data=none',
+             _measure(_process_after, data, raw, args.repeat, 'none')),
+            ('after, store_data=swift',
+             _measure(_process_after, data, raw, args.repeat, 'swift')),
+            ('after, store_data=swift, no body',
+             _measure(_process_after_no_body, data, raw, args.repeat,
+                      'swift')),
+        ]
+
+    start = time.time()
+    for _ in range(args.repeat):
+        process._filter_data_excluded_keys(json.loads(raw.decode('utf-8')))
+    parse_time = (time.time() - start) / args.repeat
+
+    print('process() in /v1/continue, ms:')
+    for name, result in results:
+        print('  %-36s %8.2f' % (name + ':', result * 1000))
+    print('in background, only with store_data=swift, ms:')
+    print('  %-36s %8.2f' % ('parsing the request body:', parse_time * 1000))
+
+
+if __name__ == '__main__':
+    main()